@@ -0,0 +1,1043 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Benchmarks of the SmartGraph API.
+#
+# Usage: python benchmark.py <benchmark_name> [argument]
+#
+# Benchmarks:
+#
+#   - plan_cache: executes a random workload of every graph endpoint twice against the Neo4j instance configured in
+#                 the environment (see neo4j_utils.py); first with the user supplied values inlined into the query
+#                 text (as the API did before the introduction of cypher_queries.py), then with the parameterised
+#                 templates. Reports the number of distinct query texts, the resulting plan cache hit rate
+#                 (Neo4j caches execution plans per query text) and p50/p99 latencies. Argument: number of calls
+#                 per endpoint (default: 50).
+#
+#   - graphml: serialises synthetic SmartGraph graphs of 10k, 100k and 1M edges to GraphML, with the networkx based
+#              serialiser (to_graphml_networkx) and with graphml_writer.py . Every case runs in a fresh
+#              process, reports the wall time and the peak RSS of the process above the RSS after building the
+#              graph. Does not need Neo4j. Argument: maximal number of edges (default: 1000000).
+#
+#   - response_size: encodes synthetic results of the graph endpoints at 1k, 10k and 100k edges as indented JSON
+#                    (the previous default), compact JSON, GraphML, and compact JSON compressed with every encoding
+#                    offered by response_encoding.py . Reports the body size, the ratio to indented JSON and the
+#                    encoding latency. Does not need Neo4j. Argument: number of repetitions per case (default: 5).
+#
+#   - graph_builder: converts a synthetic Neo4j graph result (hydrated by the driver's own hydrator, paths returned
+#                    with their nodes) into a SmartGraph JSON graph, with the previous extract/aggregate pipeline
+#                    (graph_to_json_aggregate) and with graph_builder.py . Reports wall time and the peak
+#                    RSS above the RSS after building the result, every case in a fresh process. Does not need Neo4j.
+#                    Argument: number of relationships (default: 1000000).
+#
+#   - graph_records: memory footprint of the SmartGraph JSON graph built from a synthetic Neo4j graph result (see
+#                    graph_builder), with dict records (the graphs of the responses) and with the compact records of
+#                    graph_records.py (the graphs kept in memory). Reports the deep size of the graph (every object
+#                    reachable from it counted once, the Neo4j result dropped), the peak RSS above the RSS after
+#                    building the result, and the time of the JSON and GraphML serialisation of the graph. Every case
+#                    in a fresh process. Does not need Neo4j. Argument: number of relationships (default: 1000000).
+#
+#   - path_c2t_plans: /path_c2t for random panels of 1, 10 and 50 compounds (with bioactivities) and 20 targets
+#                     against the Neo4j instance configured in the environment, with the single Cypher query
+#                     (cypher_queries.path_c2t) and with the two-phase plan of smartgraph_async.py (bioactivities once,
+#                     target-target paths once per tested target, joined in Python). Reports the p50/p99 latencies, the
+#                     rows returned by Neo4j and the distinct paths, and checks that both plans find the same
+#                     (compound, start target, end target, length) paths. Argument: number of calls per panel size
+#                     (default: 10).
+#
+#   - subgraph_frontier: /subgraph_target_induced (undirected, any end node) and /subgraph_compound_induced for random
+#                        single targets and compounds, max_length 2 and 3, against the Neo4j instance configured in
+#                        the environment: with the path queries (cypher_queries.subgraph_target_induced /
+#                        subgraph_compound_induced) and with the frontier expansion of frontier_subgraph.py (one
+#                        UNWIND query per level). Reports the p50/p99 latencies, the rows returned by Neo4j and the
+#                        nodes and edges of the subgraphs, and checks that the frontier subgraph of the all-paths
+#                        searches holds every edge of the path queries. Argument: number of calls per case (default: 10).
+#
+#   - graph_snapshot: loads the snapshot of the whole graph of graph_snapshot.py from the Neo4j instance configured in
+#                     the environment, then answers /bioactivity_target, /bioactivity_compound, /patterns_of_compounds,
+#                     /potent_patterns and the all-paths /subgraph_target_induced (max_length 2) for random targets and
+#                     compounds with the Cypher queries and from the snapshot. Reports the load time and size of the
+#                     snapshot, the p50/p99 latencies and the nodes and edges of the results, and checks that both
+#                     return the same nodes and edges. Argument: number of calls per endpoint (default: 50).
+#
+#   - regulatory_paths: shortest paths between a panel of sources and targets (4 targets per source) in a synthetic
+#                       regulatory network of 5000 targets and 40000 relationships with hub targets, held by
+#                       regulatory_network.py: with a bidirectional BFS per source-target pair (as `shortestPath` runs
+#                       per pair in Neo4j), with one BFS per source (`multi_source`) and with the mode chosen from the
+#                       number of targets of a source (auto), without and with the pruning by the k-hop index. Reports the build time and size of the index, the wall time and the
+#                       number of paths, and checks that all searches find paths of the same lengths. Does not need
+#                       Neo4j. Argument: number of sources (default: 50).
+#
+#   - confidence_paths: all paths of up to 3 relationships from a panel of sources (to any target, as
+#                       /path_regulatory_open) in the synthetic regulatory network of regulatory_paths, at several
+#                       confidence cutoffs: expanding every relationship and filtering the paths afterwards (as the
+#                       Cypher queries do), with the relationships sorted by confidence (any cutoff) and with the view
+#                       of the confidence band of the cutoff. Reports the wall time and the number of paths, and checks
+#                       that the paths are the same.
+#                       Does not need Neo4j. Argument: number of sources (default: 50).
+#
+#
+# References
+#
+# Ref: https://neo4j.com/docs/cypher-manual/current/query-tuning/#cypher-query-caching
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#neo4j.ResultSummary.result_available_after
+# Ref: https://docs.python.org/3/library/statistics.html#statistics.quantiles
+# Ref: https://docs.python.org/3/library/resource.html#resource.getrusage
+# Ref: https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+# Ref: https://docs.python.org/3/library/sys.html#sys.getsizeof
+#
+
+import gc
+import multiprocessing
+import random
+import re
+import resource
+import statistics
+import sys
+import time
+
+import networkx as nx
+import orjson
+
+import neo4j_utils
+import cypher_queries as cq
+import frontier_subgraph
+import graphml_writer
+import graph_builder
+import graph_records
+import graph_snapshot
+import regulatory_network
+import response_encoding
+import smartgraph as sg
+
+
+###
+### Helpers
+###
+
+def percentiles (values):
+    if len(values) < 2:
+        return ({'p50': values[0] if values else None, 'p99': values[0] if values else None})
+
+    q = statistics.quantiles (values, n = 100, method = 'inclusive')
+
+    return ({'p50': q[49], 'p99': q[98]})
+
+
+def cypher_literal (value):
+    if value is None:
+        return ('null')
+
+    if isinstance (value, bool):
+        return (str(value).lower())
+
+    if isinstance (value, (int, float)):
+        return (str(value))
+
+    if isinstance (value, (list, tuple)):
+        return ('[' + ', '.join ([cypher_literal(v) for v in value]) + ']')
+
+    return ("'" + str(value).replace("'", "\\'") + "'")
+
+
+def inline_parameters (query, parameters):
+    # Reproduces the query texts of the string concatenation based implementation, i.e. one text per input.
+
+    return (re.sub (r'\$(\w+)', lambda m: cypher_literal(parameters[m.group(1)]), query))
+
+
+def sample_ids (session, query, size):
+    ids = [record['id'] for record in session.run (query, limit = size)]
+
+    if len(ids) == 0:
+        raise Exception ("[ERROR]: Benchmark could not sample IDs with query: %s" % (query))
+
+    return (ids)
+
+
+def random_subset (ids, max_size = 3):
+    return (random.sample (ids, random.randint (1, min(max_size, len(ids)))))
+
+
+
+###
+### Plan cache benchmark
+###
+
+def plan_cache_workload (session, n_calls):
+    targets = sample_ids (session, "MATCH (t:Target)-[:REGULATES]-() RETURN DISTINCT t.uniprot_id AS id LIMIT $limit", 200)
+    compounds = sample_ids (session, "MATCH (c:Compound)-[:TESTED_ON]->() RETURN DISTINCT c.hash AS id LIMIT $limit", 200)
+
+    builders = {
+        'bioactivity_target': lambda: cq.bioactivity_target (random_subset(targets), random.choice([0.0, 0.1, 1.0, 10.0])),
+        'bioactivity_compound': lambda: cq.bioactivity_compound (random_subset(compounds)),
+        'potent_compounds': lambda: cq.potent_compounds (random_subset(targets)),
+        'path_regulatory': lambda: cq.path_regulatory (random_subset(targets), random_subset(targets), True, 4, random.choice([0.0, 0.1, 0.5])),
+        'path_regulatory_open': lambda: cq.path_regulatory_open (random_subset(targets), True, 2, 'undirected', random.choice([0.0, 0.1, 0.5])),
+        'path_c2t': lambda: cq.path_c2t (random_subset(compounds), random_subset(targets), True, True, 2),
+        'subgraph_target_induced': lambda: cq.subgraph_target_induced (random_subset(targets, 1), 'target', True, 2, 'undirected'),
+        'subgraph_compound_induced': lambda: cq.subgraph_compound_induced (random_subset(compounds, 1), True, True, 2),
+        'patterns_of_compounds': lambda: cq.patterns_of_compounds (random_subset(compounds)),
+        'potent_patterns': lambda: cq.potent_patterns (random_subset(targets)),
+        'predict': lambda: cq.predict (random.choice(targets), 300)
+    }
+
+    workload = {}
+
+    for endpoint, builder in builders.items():
+        workload[endpoint] = [builder() for i in range(n_calls)]
+
+    return (workload)
+
+
+def run_workload (session, calls, inline):
+    latencies = []
+    available_after = []
+    query_texts = set()
+
+    for query, parameters in calls:
+        if inline:
+            query = inline_parameters (query, parameters)
+            parameters = {}
+
+        query_texts.add (query)
+
+        start = time.perf_counter()
+        summary = session.run (query, parameters).consume()
+        latencies.append ((time.perf_counter() - start) * 1000.0)
+        available_after.append (summary.result_available_after)
+
+    stats = {}
+    stats['calls'] = len(calls)
+    stats['distinct_query_texts'] = len(query_texts)
+    stats['plan_cache_hit_rate'] = (len(calls) - len(query_texts)) / len(calls)
+    stats['latency_ms'] = percentiles (latencies)
+    stats['result_available_after_ms'] = percentiles (available_after)
+
+    return (stats)
+
+
+def plan_cache (n_calls = 50):
+    results = {}
+
+    with neo4j_utils.neo4j_session() as session:
+        workload = plan_cache_workload (session, n_calls)
+
+        for endpoint, calls in workload.items():
+            results[endpoint] = {
+                'inlined': run_workload (session, calls, inline = True),
+                'parameterised': run_workload (session, calls, inline = False)
+            }
+
+    neo4j_utils.close_neo4j_driver ()
+
+    print ('%-28s %-14s %6s %8s %9s %10s %10s' % ('endpoint', 'mode', 'texts', 'hit_rate', 'p50_ms', 'p99_ms', 'avail_p99'))
+
+    for endpoint, modes in results.items():
+        for mode, stats in modes.items():
+            print ('%-28s %-14s %6d %8.2f %9.2f %10.2f %10.2f' % (endpoint, mode, stats['distinct_query_texts'], stats['plan_cache_hit_rate'],
+                    stats['latency_ms']['p50'], stats['latency_ms']['p99'], stats['result_available_after_ms']['p99']))
+
+    return (results)
+
+
+###
+### path_c2t plans benchmark
+###
+
+def c2t_signature (start_element_id, length, compound_element_id, end_uniprot_id):
+    return ((compound_element_id, start_element_id, end_uniprot_id, length))
+
+
+def path_c2t_single_query (session, inchikeys, uniprot_ids, max_length):
+    records = list (session.run (*cq.path_c2t (inchikeys, uniprot_ids, True, True, max_length)))
+    found = set ()
+
+    for record in records:
+        p1 = record['p1']
+        found.add (c2t_signature (p1.start_node.element_id, len(p1), record['p2'].start_node.element_id, p1.end_node['uniprot_id']))
+
+    return (len(records), found)
+
+
+def path_c2t_two_phase (session, inchikeys, uniprot_ids, max_length):
+    records = list (session.run (*cq.bioactivity_compound (inchikeys)))
+    legs = graph_builder.bioactivity_legs (graph_builder.bioactivities (records))
+    path_records = []
+
+    if len(legs) > 0:
+        path_records = list (session.run (*cq.path_c2t_targets (legs.keys(), uniprot_ids, True, max_length)))
+
+    found = set ()
+
+    for key, nodes, edges in graph_builder.c2t_rows (legs, path_records):
+        path, leg = key.split ('|')
+        path = path.split (',')
+        found.add (c2t_signature (path[0], len(path) - 1, leg.split (',')[0], nodes[-2]['node_id']))
+
+    return (len(records) + len(path_records), found)
+
+
+def path_c2t_plans (n_calls = 10):
+    plans = {'single_query': path_c2t_single_query, 'two_phase': path_c2t_two_phase}
+    results = {}
+
+    with neo4j_utils.neo4j_session() as session:
+        targets = sample_ids (session, "MATCH (t:Target)-[:REGULATES]-() RETURN DISTINCT t.uniprot_id AS id LIMIT $limit", 200)
+        compounds = sample_ids (session, "MATCH (c:Compound)-[:TESTED_ON]->() RETURN DISTINCT c.hash AS id LIMIT $limit", 1000)
+
+        for n_compounds in [1, 10, 50]:
+            calls = [(random.sample (compounds, min(n_compounds, len(compounds))), random.sample (targets, min(20, len(targets)))) for i in range(n_calls)]
+            found = {}
+
+            for plan, run in plans.items():
+                latencies = []
+                neo4j_rows = 0
+                found[plan] = []
+
+                for inchikeys, uniprot_ids in calls:
+                    start = time.perf_counter()
+                    rows, paths = run (session, inchikeys, uniprot_ids, 2)
+                    latencies.append ((time.perf_counter() - start) * 1000.0)
+
+                    neo4j_rows += rows
+                    found[plan].append (paths)
+
+                results[(n_compounds, plan)] = {'latency_ms': percentiles (latencies), 'neo4j_rows': neo4j_rows, 'paths': sum ([len(paths) for paths in found[plan]])}
+
+            if found['single_query'] != found['two_phase']:
+                raise Exception ("[ERROR]: The path_c2t plans found different paths.")
+
+    neo4j_utils.close_neo4j_driver ()
+
+    print ('%-10s %-14s %9s %10s %11s %8s' % ('compounds', 'plan', 'p50_ms', 'p99_ms', 'neo4j_rows', 'paths'))
+
+    for (n_compounds, plan), stats in results.items():
+        print ('%-10d %-14s %9.2f %10.2f %11d %8d' % (n_compounds, plan, stats['latency_ms']['p50'], stats['latency_ms']['p99'], stats['neo4j_rows'], stats['paths']))
+
+    return (results)
+
+
+
+###
+### Subgraph frontier benchmark
+###
+
+def subgraph_paths (session, query, parameters, start, rel_types, direction, endpoint_label, shortest_paths, max_length):
+    records = list (session.run (query, parameters))
+    builder = graph_builder.GraphBuilder ()
+
+    for record in records:
+        builder.add_values (record.values())
+
+    return (len(records), builder.to_json ())
+
+
+def subgraph_frontier_expansion (session, query, parameters, start, rel_types, direction, endpoint_label, shortest_paths, max_length):
+    records = list (session.run (*start))
+    rows = len(records)
+
+    extractor = frontier_subgraph.FrontierSubgraph.from_nodes ([record['n'] for record in records], direction, max_length, endpoint_label, shortest_paths)
+
+    while len(extractor.pending ()) > 0:
+        for batch in frontier_subgraph.batches (extractor.pending ()):
+            records = list (session.run (*cq.frontier_expansion (batch, rel_types, direction)))
+            rows += len(records)
+            extractor.add (records)
+
+        extractor.next_level ()
+
+    return (rows, extractor.to_json ())
+
+
+def subgraph_frontier_cases (targets, compounds, max_length, shortest_paths):
+    target = [random.choice (targets)]
+    compound = [random.choice (compounds)]
+
+    cases = {
+        'target_induced': cq.subgraph_target_induced (target, 'both', shortest_paths, max_length, 'undirected') + (cq.frontier_start_targets (target), ':TESTED_ON|REGULATES', 'both', None),
+        'compound_induced': cq.subgraph_compound_induced (compound, True, shortest_paths, max_length) + (cq.frontier_start_compounds (compound), '', 'out', 'Target')
+    }
+
+    return (cases)
+
+
+def subgraph_frontier (n_calls = 10):
+    plans = {'paths': subgraph_paths, 'frontier': subgraph_frontier_expansion}
+    results = {}
+
+    with neo4j_utils.neo4j_session() as session:
+        targets = sample_ids (session, "MATCH (t:Target)-[:REGULATES]-() RETURN DISTINCT t.uniprot_id AS id LIMIT $limit", 200)
+        compounds = sample_ids (session, "MATCH (c:Compound)-[:TESTED_ON]->() RETURN DISTINCT c.hash AS id LIMIT $limit", 1000)
+
+        for max_length in [2, 3]:
+            for shortest_paths in [True, False]:
+                calls = [subgraph_frontier_cases (targets, compounds, max_length, shortest_paths) for i in range(n_calls)]
+
+                for endpoint in ['target_induced', 'compound_induced']:
+                    edges = {}
+
+                    for plan, run in plans.items():
+                        latencies = []
+                        stats = {'neo4j_rows': 0, 'nodes': 0, 'edges': 0}
+                        edges[plan] = []
+
+                        for cases in calls:
+                            query, parameters, start, rel_types, direction, endpoint_label = cases[endpoint]
+
+                            begin = time.perf_counter()
+                            rows, G_json = run (session, query, parameters, start, rel_types, direction, endpoint_label, shortest_paths, max_length)
+                            latencies.append ((time.perf_counter() - begin) * 1000.0)
+
+                            stats['neo4j_rows'] += rows
+                            stats['nodes'] += len(G_json['nodes'])
+                            stats['edges'] += len(G_json['edges'])
+                            edges[plan].append (set ([edge['uuid'] for edge in G_json['edges']]))
+
+                        stats['latency_ms'] = percentiles (latencies)
+                        results[(endpoint, max_length, shortest_paths, plan)] = stats
+
+                    # Shortest paths are arbitrary among several ones, only the all-paths subgraphs are compared
+                    if not shortest_paths and any ([not frontier_edges >= path_edges for path_edges, frontier_edges in zip (edges['paths'], edges['frontier'])]):
+                        raise Exception ("[ERROR]: The frontier subgraph of %s misses edges of the path query." % (endpoint))
+
+    neo4j_utils.close_neo4j_driver ()
+
+    print ('%-18s %4s %9s %-9s %9s %10s %11s %8s %8s' % ('endpoint', 'max', 'shortest', 'plan', 'p50_ms', 'p99_ms', 'neo4j_rows', 'nodes', 'edges'))
+
+    for (endpoint, max_length, shortest_paths, plan), stats in results.items():
+        print ('%-18s %4d %9s %-9s %9.2f %10.2f %11d %8d %8d' % (endpoint, max_length, shortest_paths, plan, stats['latency_ms']['p50'], stats['latency_ms']['p99'],
+                stats['neo4j_rows'], stats['nodes'], stats['edges']))
+
+    return (results)
+
+
+
+###
+### Graph snapshot benchmark
+###
+
+def graph_snapshot_cases (targets, compounds):
+    target = [random.choice (targets)]
+    compound = [random.choice (compounds)]
+
+    cases = {
+        'bioactivity_target': cq.bioactivity_target (target, 0.0, None) + (graph_snapshot.bioactivity_target, ()),
+        'bioactivity_compound': cq.bioactivity_compound (compound, True, 0.0, None) + (graph_snapshot.bioactivity_compound, (True,)),
+        'patterns_of_compounds': cq.patterns_of_compounds (compound, True, 'scaffold', 0.0, None) + (graph_snapshot.patterns_of_compounds, (True,)),
+        'potent_patterns': cq.potent_patterns (target, 'scaffold') + (graph_snapshot.potent_patterns, ()),
+        'subgraph_target_induced': cq.subgraph_target_induced (target, 'both', False, 2, 'undirected') + (graph_snapshot.subgraph_target_induced, ('both', 'undirected', False, 2))
+    }
+
+    return (cases)
+
+
+def graph_snapshot_benchmark (n_calls = 50):
+    begin = time.perf_counter()
+    graph_snapshot.load ({'enabled': True, 'reload_interval': 0})
+    load_seconds = time.perf_counter() - begin
+
+    results = {}
+
+    with neo4j_utils.neo4j_session() as session:
+        targets = sample_ids (session, "MATCH (t:Target)<-[:TESTED_ON]-() RETURN DISTINCT t.uniprot_id AS id LIMIT $limit", 200)
+        compounds = sample_ids (session, "MATCH (c:Compound)-[:TESTED_ON]->() RETURN DISTINCT c.hash AS id LIMIT $limit", 1000)
+
+        calls = [graph_snapshot_cases (targets, compounds) for i in range(n_calls)]
+
+        for endpoint in calls[0].keys():
+            graphs = {'neo4j': [], 'snapshot': []}
+
+            for plan in graphs.keys():
+                latencies = []
+                stats = {'nodes': 0, 'edges': 0}
+
+                for cases in calls:
+                    query, parameters, compute, options = cases[endpoint]
+
+                    begin = time.perf_counter()
+
+                    if plan == 'neo4j':
+                        builder = graph_builder.GraphBuilder ()
+
+                        for record in session.run (query, parameters):
+                            builder.add_values (record.values())
+                    else:
+                        builder = graph_builder.GraphBuilder ()
+
+                        for key, nodes, edges in compute (parameters, *options):
+                            builder.add_records (nodes, edges)
+
+                    G_json = builder.to_json ()
+                    latencies.append ((time.perf_counter() - begin) * 1000.0)
+
+                    stats['nodes'] += len(G_json['nodes'])
+                    stats['edges'] += len(G_json['edges'])
+                    graphs[plan].append ((set ([node['node_id'] for node in G_json['nodes']]), set ([edge['uuid'] for edge in G_json['edges']])))
+
+                stats['latency_ms'] = percentiles (latencies)
+                results[(endpoint, plan)] = stats
+
+            if graphs['neo4j'] != graphs['snapshot']:
+                raise Exception ("[ERROR]: The graph snapshot and Neo4j return different graphs for %s." % (endpoint))
+
+    neo4j_utils.close_neo4j_driver ()
+
+    print ('snapshot loaded in %.1f s: %s' % (load_seconds, graph_snapshot.get_metrics ()))
+    print ('%-24s %-9s %9s %10s %8s %8s' % ('endpoint', 'plan', 'p50_ms', 'p99_ms', 'nodes', 'edges'))
+
+    for (endpoint, plan), stats in results.items():
+        print ('%-24s %-9s %9.2f %10.2f %8d %8d' % (endpoint, plan, stats['latency_ms']['p50'], stats['latency_ms']['p99'], stats['nodes'], stats['edges']))
+
+    return (results)
+
+
+
+###
+### GraphML benchmark
+###
+
+def to_graphml_networkx (G_json):
+    # Previous serialiser of the API (an nx.DiGraph and its GraphML lines), graphml_writer.py writes the same document
+    # (see tests/test_graphml_writer.py)
+    G = sg.parse_graph (G_json)
+
+    return (''.join (nx.generate_graphml (G)))
+
+
+def synthetic_graph (n_edges, seed = 42):
+    # Compound-target bioactivities and target-target regulations with the properties of the SmartGraph JSON graphs
+    rng = random.Random (seed)
+
+    n_targets = max (2, n_edges // 20)
+    n_compounds = max (1, n_edges // 5)
+
+    nodes = []
+
+    for i in range(n_targets):
+        nodes.append ({'uniprot_id': 'P%05d' % (i), 'fullname': 'Protein %d' % (i), 'synonyms': ['GENE%d' % (i), 'ALT%d' % (i)],
+                       'uuid': 'target-%d' % (i), 'node_type': 'target', 'node_id': 'P%05d' % (i)})
+
+    for i in range(n_compounds):
+        inchikey = 'CMPD%010d-UHFFFAOYSA-N' % (i)
+        nodes.append ({'hash': inchikey, 'nostereo_hash': inchikey[:14], 'smiles': 'C' * (i % 30 + 1), 'uuid': 'compound-%d' % (i),
+                       'node_type': 'compound', 'node_id': inchikey, 'inchikey': inchikey, 'nsinchikey': inchikey[:14]})
+
+    edges = []
+
+    for i in range(n_edges):
+        if i % 4 == 0:
+            start_node = 'P%05d' % (rng.randrange (n_targets))
+            end_node = 'P%05d' % (rng.randrange (n_targets))
+            edges.append ({'uuid': 'ppi-%d_l%d' % (i, i), 'edge_label': 'l%d' % (i), 'action_type': 'activation', 'source': 'SIGNOR',
+                           'max_confidence_value': rng.random (), 'edge_type': 'regulates', 'start_node': start_node, 'end_node': end_node})
+        else:
+            start_node = 'CMPD%010d-UHFFFAOYSA-N' % (rng.randrange (n_compounds))
+            end_node = 'P%05d' % (rng.randrange (n_targets))
+            edges.append ({'uuid': 'act-%d_a%d' % (i, i), 'edge_label': 'a%d' % (i), 'activity': rng.random () * 10.0, 'activity_type': 'IC50',
+                           'edge_type': 'tested_on', 'start_node': start_node, 'end_node': end_node})
+
+    return ({'nodes': nodes, 'edges': edges})
+
+
+def max_rss_mb ():
+    # ru_maxrss is in kilobytes on Linux
+    return (resource.getrusage (resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+
+def graphml_case (serialiser, n_edges):
+    G_json = synthetic_graph (n_edges)
+    rss_graph = max_rss_mb ()
+
+    start = time.perf_counter()
+
+    if serialiser == 'networkx':
+        size = len(to_graphml_networkx (G_json).encode ('utf-8'))
+    else:
+        size = sum([len(chunk) for chunk in graphml_writer.generate_graphml (G_json)])
+
+    elapsed = time.perf_counter() - start
+
+    return ({'seconds': elapsed, 'peak_rss_mb': max_rss_mb () - rss_graph, 'bytes': size})
+
+
+def graphml (max_edges = 1000000):
+    ctx = multiprocessing.get_context ('spawn')
+    results = {}
+
+    print ('%-10s %-18s %10s %14s %14s' % ('edges', 'serialiser', 'seconds', 'peak_rss_mb', 'size_mb'))
+
+    for n_edges in [10000, 100000, 1000000]:
+        if n_edges > max_edges:
+            continue
+
+        # streaming: the chunks are only counted, as they would be written to the socket by a StreamingResponse
+        for serialiser in ['networkx', 'streaming']:
+            with ctx.Pool (1) as pool:
+                stats = pool.apply (graphml_case, (serialiser, n_edges))
+
+            results[(n_edges, serialiser)] = stats
+
+            print ('%-10d %-18s %10.2f %14.1f %14.1f' % (n_edges, serialiser, stats['seconds'], stats['peak_rss_mb'], stats['bytes'] / 1024.0 / 1024.0))
+
+    return (results)
+
+
+###
+### Response size benchmark
+###
+
+def response_encoders ():
+    compression_par = response_encoding.read_compression_config ()
+
+    encoders = {}
+    encoders['json_indented'] = lambda G_json: orjson.dumps (G_json, option = orjson.OPT_INDENT_2)
+    encoders['json_compact'] = lambda G_json: orjson.dumps (G_json)
+    encoders['graphml'] = lambda G_json: b''.join (graphml_writer.generate_graphml (G_json))
+
+    for encoding in response_encoding.available_encodings ():
+        encoders['json_compact+' + encoding] = lambda G_json, encoding = encoding: response_encoding.compress (orjson.dumps (G_json), encoding, compression_par)
+
+    return (encoders)
+
+
+def response_size (repetitions = 5):
+    encoders = response_encoders ()
+    results = {}
+
+    print ('%-10s %-20s %12s %8s %10s %10s' % ('edges', 'encoding', 'bytes', 'ratio', 'p50_ms', 'p99_ms'))
+
+    for n_edges in [1000, 10000, 100000]:
+        G_json = synthetic_graph (n_edges)
+        reference = None
+
+        for name, encoder in encoders.items():
+            latencies = []
+
+            for i in range(repetitions):
+                start = time.perf_counter()
+                body = encoder (G_json)
+                latencies.append ((time.perf_counter() - start) * 1000.0)
+
+            if reference is None:
+                reference = len(body)
+
+            stats = percentiles (latencies)
+            stats['bytes'] = len(body)
+            stats['ratio'] = len(body) / reference
+            results[(n_edges, name)] = stats
+
+            print ('%-10d %-20s %12d %8.3f %10.1f %10.1f' % (n_edges, name, stats['bytes'], stats['ratio'], stats['p50'], stats['p99']))
+
+    return (results)
+
+
+###
+### Graph builder benchmark
+###
+
+# The previous conversion of Neo4j graph results (extract the properties of every node and relationship, then
+# aggregate the records by `node_id` / `uuid`), graph_builder.py returns the same graphs (see tests/test_graph_builder.py)
+
+def extract_node_properties (node, nodes):
+    node_properties = {}
+
+    node_type = list(node.labels)[0]
+
+    for k, v in node.items():
+        node_properties[k] = v
+
+    node_properties['node_type'] = node_type.lower()
+
+    if node_properties['node_type'] == 'compound':
+        node_properties['node_id'] = node_properties['hash']
+        node_properties['inchikey'] = node_properties['hash']
+        node_properties['nsinchikey'] = node_properties['nostereo_hash']
+
+    elif node_properties['node_type'] == 'pattern':
+        node_properties['node_id'] = node_properties['pattern_id']
+        node_properties['inchikey'] = node_properties['hash']
+
+    elif node_properties['node_type'] == 'target':
+        node_properties['node_id'] = node_properties['uniprot_id']
+    else:
+        raise Exception ("[ERROR] Invalid node type encountered in SmartGraph JSON.")
+
+    nodes.append (node_properties)
+
+    return (nodes)
+
+
+def extract_specific_node_property (node, spec_prop):
+    for k, v in node.items():
+        if k == spec_prop:
+            return (v)
+
+    return (None)
+
+
+def extract_edge_properties (edge, edges):
+    edge_properties = {}
+
+    for k, v in edge.items():
+        if k == 'edgeType':
+            edge_properties['action_type'] = v
+        elif k == 'unique_label':
+            edge_properties['edge_label'] = v
+        elif k == 'ppi_uid':
+            edge_properties['edge_label'] = v
+        elif k == 'edgeInfo':
+            edge_properties['mechanism_details'] = v
+        else:
+            edge_properties[k] = v
+
+    edge_properties['uuid'] = edge_properties['uuid'] + '_' + edge_properties['edge_label']
+    edge_properties['edge_type'] = edge.type.lower()
+
+    if edge_properties['edge_type'] == 'regulates':
+        start_node_id = extract_specific_node_property (edge.start_node, 'uniprot_id')
+        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
+    elif edge_properties['edge_type'] == 'tested_on':
+        start_node_id = extract_specific_node_property (edge.start_node, 'hash')
+        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
+    elif edge_properties['edge_type'] == 'pattern_of':
+        start_node_id = extract_specific_node_property (edge.start_node, 'pattern_id')
+        end_node_id = extract_specific_node_property (edge.end_node, 'hash')
+    elif edge_properties['edge_type'] == 'potent_pattern_of':
+        start_node_id = extract_specific_node_property (edge.start_node, 'pattern_id')
+        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
+    else:
+        raise Exception ('[ERROR] Invalid edge type encountered in SmartGraph JSON.')
+
+    edge_properties['start_node'] = start_node_id
+    edge_properties['end_node'] = end_node_id
+
+    edges.append (edge_properties)
+
+    return (edges)
+
+
+def aggregate_nodes (nodes):
+    aggregated_nodes = {}
+
+    for node in nodes:
+        aggregated_nodes[node['node_id']] = node
+
+    return (list (aggregated_nodes.values()))
+
+
+def aggregate_edges (edges):
+    aggregated_edges = {}
+
+    for edge in edges:
+        aggregated_edges[edge['uuid']] = edge
+
+    return (list (aggregated_edges.values()))
+
+
+def graph_to_json_aggregate (g):
+    all_nodes = []
+    all_edges = []
+
+    for n in g.nodes:
+        all_nodes = extract_node_properties (n, all_nodes)
+
+    for r in g.relationships:
+        all_edges = extract_edge_properties (r, all_edges)
+
+    G_json = {}
+    G_json['nodes'] = aggregate_nodes (all_nodes)
+    G_json['edges'] = aggregate_edges (all_edges)
+
+    return (G_json)
+
+
+def synthetic_neo4j_graph (n_relationships, seed = 42):
+    # Same shape as synthetic_graph, as nodes and relationships of the driver (element IDs as in Neo4j 5)
+    from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+    rng = random.Random (seed)
+    hydrator = _GraphHydrator ()
+
+    n_targets = max (2, n_relationships // 20)
+    n_compounds = max (1, n_relationships // 5)
+
+    def element_id (i):
+        return ('4:d1e1b1a0-0000-0000-0000-000000000000:%d' % (i))
+
+    for i in range(n_targets):
+        hydrator.hydrate_node (i, ['Target'], {'uniprot_id': 'P%05d' % (i), 'fullname': 'Protein %d' % (i),
+                               'synonyms': ['GENE%d' % (i), 'ALT%d' % (i)], 'uuid': 'target-%d' % (i)}, element_id (i))
+
+    for i in range(n_compounds):
+        inchikey = 'CMPD%010d-UHFFFAOYSA-N' % (i)
+        hydrator.hydrate_node (n_targets + i, ['Compound'], {'hash': inchikey, 'nostereo_hash': inchikey[:14], 'smiles': 'C' * (i % 30 + 1),
+                               'uuid': 'compound-%d' % (i)}, element_id (n_targets + i))
+
+    for i in range(n_relationships):
+        if i % 4 == 0:
+            start_node = rng.randrange (n_targets)
+            end_node = rng.randrange (n_targets)
+            hydrator.hydrate_relationship (i, start_node, end_node, 'REGULATES', {'uuid': 'ppi-%d' % (i), 'ppi_uid': 'l%d' % (i), 'edgeType': 'activation',
+                                           'source': 'SIGNOR', 'max_confidence_value': rng.random ()}, 'r%d' % (i), element_id (start_node), element_id (end_node))
+        else:
+            start_node = n_targets + rng.randrange (n_compounds)
+            end_node = rng.randrange (n_targets)
+            hydrator.hydrate_relationship (i, start_node, end_node, 'TESTED_ON', {'uuid': 'act-%d' % (i), 'unique_label': 'a%d' % (i), 'activity': rng.random () * 10.0,
+                                           'activity_type': 'IC50'}, 'r%d' % (i), element_id (start_node), element_id (end_node))
+
+    return (hydrator.graph)
+
+
+def graph_builder_case (builder, n_relationships):
+    g = synthetic_neo4j_graph (n_relationships)
+    rss_graph = max_rss_mb ()
+
+    start = time.perf_counter()
+
+    if builder == 'aggregate':
+        G_json = graph_to_json_aggregate (g)
+    else:
+        G_json = graph_builder.GraphBuilder().add_graph (g).to_json()
+
+    elapsed = time.perf_counter() - start
+
+    return ({'seconds': elapsed, 'peak_rss_mb': max_rss_mb () - rss_graph, 'nodes': len(G_json['nodes']), 'edges': len(G_json['edges'])})
+
+
+def graph_builder_benchmark (n_relationships = 1000000):
+    ctx = multiprocessing.get_context ('spawn')
+    results = {}
+
+    print ('%-14s %-12s %10s %14s %10s %10s' % ('relationships', 'builder', 'seconds', 'peak_rss_mb', 'nodes', 'edges'))
+
+    for builder in ['aggregate', 'single_pass']:
+        with ctx.Pool (1) as pool:
+            stats = pool.apply (graph_builder_case, (builder, n_relationships))
+
+        results[builder] = stats
+
+        print ('%-14d %-12s %10.2f %14.1f %10d %10d' % (n_relationships, builder, stats['seconds'], stats['peak_rss_mb'], stats['nodes'], stats['edges']))
+
+    return (results)
+
+
+
+###
+### Graph records benchmark
+###
+
+def deep_size (obj):
+    # Size of every object reachable from obj through containers and records, each counted once
+    seen = set()
+    stack = [obj]
+    size = 0
+
+    while len(stack) > 0:
+        o = stack.pop()
+
+        if id(o) in seen:
+            continue
+
+        seen.add (id(o))
+        size += sys.getsizeof (o)
+
+        if isinstance (o, dict):
+            stack.extend (o.keys())
+            stack.extend (o.values())
+
+        elif isinstance (o, (list, tuple)):
+            stack.extend (o)
+
+        elif isinstance (o, graph_records.Record):
+            stack.append (o.schema.names)
+            stack.append (o.values)
+
+    return (size)
+
+
+def graph_records_case (records, n_relationships):
+    g = synthetic_neo4j_graph (n_relationships)
+    rss_graph = max_rss_mb ()
+
+    G_json = graph_builder.GraphBuilder(compact = records == 'slotted').add_graph (g).to_json()
+
+    del g
+    gc.collect()
+
+    stats = {'size_mb': deep_size (G_json) / 1024.0 / 1024.0, 'peak_rss_mb': max_rss_mb () - rss_graph}
+
+    start = time.perf_counter()
+    orjson.dumps (G_json, default = graph_records.default)
+    stats['json_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    for chunk in graphml_writer.generate_graphml (G_json):
+        pass
+
+    stats['graphml_seconds'] = time.perf_counter() - start
+
+    return (stats)
+
+
+def graph_records_benchmark (n_relationships = 1000000):
+    ctx = multiprocessing.get_context ('spawn')
+    results = {}
+
+    print ('%-14s %-10s %10s %14s %14s %16s' % ('relationships', 'records', 'size_mb', 'peak_rss_mb', 'json_seconds', 'graphml_seconds'))
+
+    for records in ['dict', 'slotted']:
+        with ctx.Pool (1) as pool:
+            stats = pool.apply (graph_records_case, (records, n_relationships))
+
+        results[records] = stats
+
+        print ('%-14d %-10s %10.1f %14.1f %14.2f %16.2f' % (n_relationships, records, stats['size_mb'], stats['peak_rss_mb'],
+                                                            stats['json_seconds'], stats['graphml_seconds']))
+
+    return (results)
+
+
+
+###
+### Regulatory path benchmark
+###
+
+def synthetic_regulatory_network (n_targets = 5000, n_relationships = 40000, seed = 42):
+    # Regulatory network with a skewed degree distribution (hub targets): the ends of the relationships are chosen
+    # proportional to the number of relationships of a target so far (preferential attachment)
+    rng = random.Random (seed)
+
+    nodes = [{'node_id': 'P%05d' % (i), 'node_type': 'target'} for i in range (n_targets)]
+    ends = list (range (n_targets))
+    starts = []
+    stops = []
+
+    for e in range (n_relationships):
+        start = rng.choice (ends) if rng.random () < 0.8 else rng.randrange (n_targets)
+        stop = rng.choice (ends) if rng.random () < 0.8 else rng.randrange (n_targets)
+        starts.append (start)
+        stops.append (stop)
+        ends.extend ([start, stop])
+
+    edges = [{'uuid': 'ppi-%d' % (e), 'edge_type': 'regulates'} for e in range (n_relationships)]
+    confidence = [rng.random () for e in range (n_relationships)]
+
+    return (regulatory_network.RegulatoryNetwork (nodes, ['4:n:%d' % (i) for i in range (n_targets)], edges,
+                                                  ['5:r:%d' % (e) for e in range (n_relationships)], starts, stops, confidence))
+
+
+def regulatory_paths (n_sources = 50):
+    # Panel of n_sources x 4 * n_sources proteins, the pairs are searched per pair (as shortestPath per pair in Neo4j)
+    # and per source (multi_source), or as chosen by the network (auto)
+    network = synthetic_regulatory_network ()
+    rng = random.Random (7)
+
+    panel = rng.sample (range (len(network.nodes)), 5 * n_sources)
+    sources = sorted (panel[:n_sources])
+    targets = sorted (panel[n_sources:])
+
+    results = {}
+
+    start = time.perf_counter()
+    network.build_khop_index (4)
+    print ('k-hop index (k = 4): %.2f s, %.1f MB\n' % (time.perf_counter() - start, network.khop.size_bytes () / 1024.0 / 1024.0))
+
+    khop = network.khop
+
+    print ('%-8s %-8s %-11s %-10s %-14s %-6s %10s %8s' % ('sources', 'targets', 'direction', 'max_length', 'search', 'index', 'seconds', 'paths'))
+
+    for direction, max_length in [('out', 2), ('out', 4), ('both', 4)]:
+        lengths = {}
+
+        for search, multi_source in [('per_pair', False), ('multi_source', True), ('auto', None)]:
+            for index in ['none', 'khop']:
+                network.khop = khop if index == 'khop' else None
+
+                start = time.perf_counter()
+                paths = network.paths (sources, targets, direction, True, max_length, 0.0, multi_source)
+                elapsed = time.perf_counter() - start
+
+                lengths[(search, index)] = sorted ([(nodes[0], nodes[-1], len(edges)) for nodes, edges in paths])
+                results[(direction, max_length, search, index)] = {'seconds': elapsed, 'paths': len(paths)}
+
+                print ('%-8d %-8d %-11s %-10d %-14s %-6s %10.3f %8d' % (len(sources), len(targets), direction, max_length, search, index, elapsed, len(paths)))
+
+        if len(set ([tuple (l) for l in lengths.values()])) > 1:
+            raise Exception ("[ERROR]: The searches found paths of different lengths.")
+
+    return (results)
+
+
+
+def confidence_paths (n_sources = 50):
+    network = synthetic_regulatory_network ()
+    rng = random.Random (7)
+
+    sources = sorted (rng.sample (range (len(network.nodes)), n_sources))
+
+    cutoffs = [0.5, 0.7, 0.9]
+    network.build_confidence_views (cutoffs)
+    bands = network.bands
+
+    results = {}
+
+    print ('%-8s %-8s %-12s %10s %8s' % ('sources', 'cutoff', 'filter', 'seconds', 'paths'))
+
+    for cutoff in cutoffs:
+        found = {}
+
+        for mode in ['post_filter', 'sorted', 'band']:
+            network.bands = bands if mode == 'band' else {}
+
+            start = time.perf_counter()
+
+            if mode == 'post_filter':
+                paths = network.paths (sources, None, 'out', False, 3, 0.0)
+                paths = [path for path in paths if all ([network.confidence[e] >= cutoff for e in path[1]])]
+            else:
+                paths = network.paths (sources, None, 'out', False, 3, cutoff)
+
+            elapsed = time.perf_counter() - start
+
+            found[mode] = sorted ([tuple (edges) for nodes, edges in paths])
+            results[(cutoff, mode)] = {'seconds': elapsed, 'paths': len(paths)}
+
+            print ('%-8d %-8.1f %-12s %10.3f %8d' % (len(sources), cutoff, mode, elapsed, len(paths)))
+
+        if len(set ([tuple (paths) for paths in found.values()])) > 1:
+            raise Exception ("[ERROR]: The confidence filters found different paths.")
+
+    network.bands = bands
+
+    return (results)
+
+
+
+benchmarks = {
+    'plan_cache': plan_cache,
+    'path_c2t_plans': path_c2t_plans,
+    'subgraph_frontier': subgraph_frontier,
+    'graph_snapshot': graph_snapshot_benchmark,
+    'graphml': graphml,
+    'response_size': response_size,
+    'graph_builder': graph_builder_benchmark,
+    'graph_records': graph_records_benchmark,
+    'regulatory_paths': regulatory_paths,
+    'confidence_paths': confidence_paths
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        raise Exception ('\n\n[SYNTAX] python benchmark.py <' + ' | '.join(benchmarks.keys()) + '> [argument]\n\n')
+
+    if len(sys.argv) > 2:
+        benchmarks[sys.argv[1]] (int(sys.argv[2]))
+    else:
+        benchmarks[sys.argv[1]] ()
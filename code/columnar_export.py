@@ -0,0 +1,118 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://arrow.apache.org/docs/python/ipc.html#writing-and-reading-random-access-files
+# Ref: https://arrow.apache.org/docs/python/parquet.html
+# Ref: https://arrow.apache.org/docs/python/generated/pyarrow.array.html
+# Ref: https://docs.python.org/3/library/zipfile.html
+#
+#
+# Columnar export of the SmartGraph JSON graphs ({'nodes': [...], 'edges': [...]}).
+#
+# A graph is exported as two tables, `nodes` and `edges`, one column per property. The numeric and boolean properties
+# used as filters by the endpoints have fixed types (see COLUMN_TYPES), list properties (e.g. synonyms) become list
+# columns, the type of any other column is inferred by Arrow, falling back to strings for mixed values. Properties
+# missing from a record are nulls.
+#
+# The two tables are returned in a ZIP archive (nodes.arrow + edges.arrow, or nodes.parquet + edges.parquet), e.g.:
+#
+#   archive = zipfile.ZipFile (io.BytesIO (response.content))
+#   nodes = pd.read_feather (archive.open ('nodes.arrow'))
+#   edges = pd.read_parquet (archive.open ('edges.parquet'))
+#
+
+import io
+import zipfile
+
+import pyarrow as pa
+import pyarrow.feather
+import pyarrow.parquet
+
+
+COLUMN_TYPES = {
+    'activity': pa.float64(),
+    'max_confidence_value': pa.float64(),
+    'ratio': pa.float64(),
+    'islargest': pa.bool_()
+}
+
+
+def to_bool (v):
+    # `islargest` is a string in the original dataset (see neo4j/data_updates.cypher)
+    if isinstance (v, str):
+        return (v.strip().lower() == 'true')
+
+    return (v)
+
+
+def to_float (v):
+    if isinstance (v, str):
+        return (float(v) if v.strip() != '' else None)
+
+    return (v)
+
+
+def column_names (records):
+    names = {}
+
+    for r in records:
+        for k in r.keys():
+            names[k] = True
+
+    return (list(names.keys()))
+
+
+def column (records, name):
+    values = [r.get (name) for r in records]
+
+    col_type = COLUMN_TYPES.get (name)
+
+    if col_type == pa.bool_():
+        return (pa.array ([to_bool(v) for v in values], type = col_type))
+
+    if col_type is not None:
+        return (pa.array ([to_float(v) for v in values], type = col_type))
+
+    try:
+        return (pa.array (values))
+
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        return (pa.array ([None if v is None else str(v) for v in values], type = pa.string()))
+
+
+def to_table (records):
+    names = column_names (records)
+
+    return (pa.table ([column (records, name) for name in names], names = names))
+
+
+def to_tables (G_json):
+    return (to_table (G_json['nodes']), to_table (G_json['edges']))
+
+
+def write_table (table, format):
+    sink = io.BytesIO()
+
+    if format == 'parquet':
+        pyarrow.parquet.write_table (table, sink, compression = 'zstd')
+    else:
+        pyarrow.feather.write_feather (table, sink, compression = 'uncompressed')
+
+    return (sink.getvalue())
+
+
+def to_archive (G_json, format = 'arrow'):
+    nodes, edges = to_tables (G_json)
+
+    sink = io.BytesIO()
+
+    # The archive does not compress the tables again: Parquet pages are compressed, Arrow files are kept memory-mappable.
+    with zipfile.ZipFile (sink, 'w', compression = zipfile.ZIP_STORED) as archive:
+        archive.writestr ('nodes.' + format, write_table (nodes, format))
+        archive.writestr ('edges.' + format, write_table (edges, format))
+
+    return (sink.getvalue())
@@ -0,0 +1,860 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://neo4j.com/docs/cypher-manual/current/syntax/parameters/
+# Ref: https://neo4j.com/docs/cypher-manual/current/query-tuning/#cypher-query-caching
+# Ref: https://docs.python.org/3/library/functools.html#functools.lru_cache
+#
+#
+# Cypher query templates of the SmartGraph API.
+#
+# Every builder returns a (query, parameters) tuple. All user supplied values (ID lists, cutoffs, activity type, ...)
+# are passed as Cypher parameters, hence the query text only depends on structural options (direction, shortest paths,
+# max_length, ...). This keeps the number of distinct query texts small, and Neo4j can reuse the cached execution plans.
+#
+
+import os
+import re
+
+from functools import lru_cache
+
+import request_errors
+
+
+# Upper limit of variable length path patterns, it also bounds the number of distinct templates.
+MAX_PATH_LENGTH = int(os.environ.get('sg_max_path_length', 100))
+
+
+ACTIVITY_CUTOFF_FILTER = "($activity_cutoff <= 0.0 OR {rel}.activity <= $activity_cutoff)"
+ACTIVITY_TYPE_FILTER = "($activity_type IS NULL OR {rel}.activity_type = $activity_type)"
+
+# Path predicates are only added when they are in effect (i.e. they are part of the template structure), otherwise
+# Neo4j could not evaluate them during the shortestPath search.
+CONFIDENCE_FILTER = "ALL(rel IN r WHERE rel.max_confidence_value >= $confidence_cutoff)"
+
+
+###
+### Helpers
+###
+
+def check_max_length (max_length):
+    try:
+        max_length = int(max_length)
+
+    except (TypeError, ValueError):
+        max_length = 0
+
+    if max_length < 1 or max_length > MAX_PATH_LENGTH:
+        raise request_errors.InvalidRequest ("[ERROR]: `max_length` has to be between 1 and %d." % (MAX_PATH_LENGTH))
+
+    return (max_length)
+
+
+def compound_hash_field (stereo):
+    if stereo:
+        return ('hash')
+
+    return ('nostereo_hash')
+
+
+def plain_value (value):
+    # str based Enums of server.py (ExplorationMode, EndNodeType) are reduced to their values
+
+    return (getattr(value, 'value', value))
+
+
+def to_float (value):
+    if value is None:
+        return (0.0)
+
+    return (float(value))
+
+
+def relationship_pattern (rel_types, max_length, direction):
+    # direction: 'out', 'in' or 'both'
+    pattern = "-[r" + rel_types + "*.." + str(max_length) + "]-"
+
+    if direction == 'out':
+        pattern += ">"
+    elif direction == 'in':
+        pattern = "<" + pattern
+
+    return (pattern)
+
+
+def explore_mode_direction (explore_mode):
+    directions = {'undirected': 'both', 'source': 'out', 'target': 'in'}
+
+    return (directions[explore_mode])
+
+
+
+###
+### Bioactivities
+###
+
+@lru_cache(maxsize=None)
+def _bioactivity_target_template ():
+    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id IN $uniprot_ids"
+    query += " AND " + ACTIVITY_CUTOFF_FILTER.format(rel='rel')
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN c, t, rel"
+
+    return (query)
+
+
+def bioactivity_target (uniprot_ids, activity_cutoff = 0.0, activity_type = None):
+    parameters = {
+        'uniprot_ids': list(uniprot_ids),
+        'activity_cutoff': to_float(activity_cutoff),
+        'activity_type': activity_type
+    }
+
+    return (_bioactivity_target_template (), parameters)
+
+
+@lru_cache(maxsize=None)
+def _bioactivity_compound_template (stereo):
+    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c." + compound_hash_field(stereo) + " IN $inchikeys"
+    query += " AND " + ACTIVITY_CUTOFF_FILTER.format(rel='rel')
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN c, t, rel"
+
+    return (query)
+
+
+def bioactivity_compound (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None):
+    parameters = {
+        'inchikeys': list(inchikeys),
+        'activity_cutoff': to_float(activity_cutoff),
+        'activity_type': activity_type
+    }
+
+    return (_bioactivity_compound_template (bool(stereo)), parameters)
+
+
+@lru_cache(maxsize=None)
+def _bioactivity_c2t_template (stereo):
+    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c." + compound_hash_field(stereo) + " IN $inchikeys"
+    query += " AND t.uniprot_id IN $uniprot_ids"
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN c, t, rel"
+
+    return (query)
+
+
+def bioactivity_c2t (inchikeys, uniprot_ids, stereo = True, activity_type = None):
+    parameters = {
+        'inchikeys': list(inchikeys),
+        'uniprot_ids': list(uniprot_ids),
+        'activity_type': activity_type
+    }
+
+    return (_bioactivity_c2t_template (bool(stereo)), parameters)
+
+
+@lru_cache(maxsize=None)
+def _potent_compounds_template ():
+    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id IN $uniprot_ids AND rel.activity<=t.activity_cutoff"
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN c, t, rel"
+
+    return (query)
+
+
+def potent_compounds (uniprot_ids, activity_type = None):
+    parameters = {
+        'uniprot_ids': list(uniprot_ids),
+        'activity_type': activity_type
+    }
+
+    return (_potent_compounds_template (), parameters)
+
+
+
+###
+### Path search
+###
+
+@lru_cache(maxsize=None)
+def _path_regulatory_template (shortest_paths, max_length, directed, confidence_filter):
+    if directed:
+        rel_pattern = relationship_pattern (':REGULATES', max_length, 'out')
+    else:
+        rel_pattern = relationship_pattern (':REGULATES', max_length, 'both')
+
+    if shortest_paths:
+        query = "MATCH p=shortestPath((t1:Target)" + rel_pattern + "(t2:Target))"
+    else:
+        query = "MATCH p=(t1:Target)" + rel_pattern + "(t2:Target)"
+
+    query += " WHERE t1.uniprot_id IN $source_uniprot_ids AND t2.uniprot_id IN $target_uniprot_ids"
+
+    if shortest_paths:
+        query += " AND t1.uuid<>t2.uuid"
+
+    if confidence_filter:
+        query += " AND " + CONFIDENCE_FILTER
+
+    query += " RETURN p"
+
+    return (query)
+
+
+def path_regulatory (source_uniprot_ids, target_uniprot_ids, shortest_paths = True, max_length = 4, confidence_cutoff = 0.0, directed = True):
+    parameters = {
+        'source_uniprot_ids': list(source_uniprot_ids),
+        'target_uniprot_ids': list(target_uniprot_ids),
+        'confidence_cutoff': to_float(confidence_cutoff)
+    }
+
+    query = _path_regulatory_template (bool(shortest_paths), check_max_length(max_length), bool(directed), parameters['confidence_cutoff'] > 0.0)
+
+    return (query, parameters)
+
+
+@lru_cache(maxsize=None)
+def _path_c2t_template (stereo, shortest_paths, max_length, confidence_filter):
+    query = "MATCH (c:Compound)-[a:TESTED_ON]->(t1:Target)"
+    query += " WHERE " + ACTIVITY_CUTOFF_FILTER.format(rel='a')
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='a')
+    query += " AND c." + compound_hash_field(stereo) + " IN $inchikeys"
+    query += " WITH t1, COLLECT(c) as compounds, COLLECT(t1) as targets"
+
+    if shortest_paths:
+        query += " MATCH p1=shortestPath((t1)" + relationship_pattern ('', max_length, 'out') + "(q:Target))"
+    else:
+        query += " MATCH p1=(t1)" + relationship_pattern ('', max_length, 'out') + "(q:Target)"
+
+    query += " WHERE q.uniprot_id IN $uniprot_ids"
+    query += " AND t1.uuid<>q.uuid"
+
+    if confidence_filter:
+        query += " AND " + CONFIDENCE_FILTER
+
+    query += " UNWIND compounds as x"
+    query += " UNWIND targets as y"
+    query += " MATCH p2=shortestPath((x)-[z:TESTED_ON]-(y))"
+    query += " RETURN p1, p2"
+
+    return (query)
+
+
+def path_c2t (inchikeys, uniprot_ids, stereo = True, shortest_paths = True, max_length = 4, activity_cutoff = 0.0, activity_type = None, confidence_cutoff = 0.0):
+    parameters = {
+        'inchikeys': list(inchikeys),
+        'uniprot_ids': list(uniprot_ids),
+        'activity_cutoff': to_float(activity_cutoff),
+        'activity_type': activity_type,
+        'confidence_cutoff': to_float(confidence_cutoff)
+    }
+
+    query = _path_c2t_template (bool(stereo), bool(shortest_paths), check_max_length(max_length), parameters['confidence_cutoff'] > 0.0)
+
+    return (query, parameters)
+
+
+# Target-target leg of the two-phase /path_c2t (see smartgraph_async.py): the paths from the tested targets (by element
+# ID) are searched once per target, instead of once per compound
+
+@lru_cache(maxsize=None)
+def _path_c2t_targets_template (shortest_paths, max_length, confidence_filter):
+    if shortest_paths:
+        query = "MATCH p1=shortestPath((t1:Target)" + relationship_pattern ('', max_length, 'out') + "(q:Target))"
+    else:
+        query = "MATCH p1=(t1:Target)" + relationship_pattern ('', max_length, 'out') + "(q:Target)"
+
+    query += " WHERE elementId(t1) IN $source_element_ids AND q.uniprot_id IN $uniprot_ids"
+    query += " AND t1.uuid<>q.uuid"
+
+    if confidence_filter:
+        query += " AND " + CONFIDENCE_FILTER
+
+    query += " RETURN p1"
+
+    return (query)
+
+
+def path_c2t_targets (source_element_ids, uniprot_ids, shortest_paths = True, max_length = 4, confidence_cutoff = 0.0):
+    parameters = {
+        'source_element_ids': list(source_element_ids),
+        'uniprot_ids': list(uniprot_ids),
+        'confidence_cutoff': to_float(confidence_cutoff)
+    }
+
+    query = _path_c2t_targets_template (bool(shortest_paths), check_max_length(max_length), parameters['confidence_cutoff'] > 0.0)
+
+    return (query, parameters)
+
+
+@lru_cache(maxsize=None)
+def _path_regulatory_open_template (shortest_paths, max_length, explore_mode, confidence_filter):
+    rel_pattern = relationship_pattern (':REGULATES', max_length, explore_mode_direction(explore_mode))
+
+    if shortest_paths:
+        query = "MATCH p=shortestPath((t1:Target)" + rel_pattern + "(t2:Target)) WHERE t1.uniprot_id IN $uniprot_ids"
+        query += " AND t1.uuid<>t2.uuid"
+    else:
+        query = "MATCH p=(t1:Target)" + rel_pattern + "(t2:Target) WHERE t1.uniprot_id IN $uniprot_ids"
+
+    if confidence_filter:
+        query += " AND " + CONFIDENCE_FILTER
+
+    query += " RETURN p"
+
+    return (query)
+
+
+def path_regulatory_open (uniprot_ids, shortest_paths = True, max_length = 4, explore_mode = 'undirected', confidence_cutoff = 0.0):
+    parameters = {
+        'uniprot_ids': list(uniprot_ids),
+        'confidence_cutoff': to_float(confidence_cutoff)
+    }
+
+    query = _path_regulatory_open_template (bool(shortest_paths), check_max_length(max_length), plain_value(explore_mode), parameters['confidence_cutoff'] > 0.0)
+
+    return (query, parameters)
+
+
+
+###
+### Subgraphs
+###
+
+@lru_cache(maxsize=None)
+def _subgraph_target_induced_template (endpoint_type, shortest_paths, max_length, explore_mode, reachable_filter):
+    if endpoint_type == 'compound':
+        endpoint_constraint = 'c:Compound'
+        self_node_constraint = ''
+
+    elif endpoint_type == 'target':
+        endpoint_constraint = 't2:Target'
+        self_node_constraint = ' AND t1.uuid<>t2.uuid'
+
+    else:
+        endpoint_constraint = 'x'
+        self_node_constraint = ' AND t1.uuid<>x.uuid'
+
+    rel_pattern = relationship_pattern (':TESTED_ON|REGULATES', max_length, explore_mode_direction(explore_mode))
+
+    if shortest_paths:
+        query = "MATCH p=shortestPath((t1:Target)" + rel_pattern + "(" + endpoint_constraint + ")) WHERE t1.uniprot_id IN $uniprot_ids"
+        query += self_node_constraint
+
+        if reachable_filter:
+            # End targets within max_length of t1 (see regulatory_network.reachable_targets), no search for the others
+            query += " AND t2.uniprot_id IN $reachable[t1.uniprot_id]"
+    else:
+        query = "MATCH p=(t1:Target)" + rel_pattern + "(" + endpoint_constraint + ") WHERE t1.uniprot_id IN $uniprot_ids"
+
+    query += " RETURN p"
+
+    return (query)
+
+
+def subgraph_target_induced (uniprot_ids, endpoint_type = 'both', shortest_paths = True, max_length = 4, explore_mode = 'undirected', reachable = None):
+    # reachable: uniprot_id -> UniProt IDs of the end targets to search, only used with shortest paths to targets
+    parameters = {
+        'uniprot_ids': list(uniprot_ids)
+    }
+
+    reachable_filter = reachable is not None and bool(shortest_paths) and plain_value(endpoint_type) == 'target'
+
+    if reachable_filter:
+        parameters['reachable'] = reachable
+
+    query = _subgraph_target_induced_template (plain_value(endpoint_type), bool(shortest_paths), check_max_length(max_length), plain_value(explore_mode), reachable_filter)
+
+    return (query, parameters)
+
+
+@lru_cache(maxsize=None)
+def _subgraph_compound_induced_template (stereo, shortest_paths, max_length):
+    rel_pattern = relationship_pattern ('', max_length, 'out')
+
+    query = "MATCH (c:Compound)" + rel_pattern + "(t:Target) WHERE c." + compound_hash_field(stereo) + " IN $inchikeys"
+    query += " WITH COLLECT (DISTINCT t) AS targets, COLLECT (DISTINCT c) AS compounds"
+    query += " UNWIND compounds as compound"
+    query += " UNWIND targets as target"
+
+    if shortest_paths:
+        query += " MATCH p=shortestPath((compound)" + rel_pattern + "(target))"
+    else:
+        query += " MATCH p=(compound)" + rel_pattern + "(target)"
+
+    query += " RETURN p"
+
+    return (query)
+
+
+def subgraph_compound_induced (inchikeys, stereo = True, shortest_paths = True, max_length = 4):
+    parameters = {
+        'inchikeys': list(inchikeys)
+    }
+
+    query = _subgraph_compound_induced_template (bool(stereo), bool(shortest_paths), check_max_length(max_length))
+
+    return (query, parameters)
+
+
+# Frontier expansion of the subgraph endpoints (see frontier_subgraph.py): the start nodes, then the relationships
+# and neighbours of a batch of nodes of the frontier per query
+
+FRONTIER_START_TARGETS = "MATCH (n:Target) WHERE n.uniprot_id IN $uniprot_ids RETURN n"
+
+
+@lru_cache(maxsize=None)
+def _frontier_start_compounds_template (stereo):
+    return ("MATCH (n:Compound) WHERE n." + compound_hash_field(stereo) + " IN $inchikeys RETURN n")
+
+
+def frontier_start_targets (uniprot_ids):
+    return (FRONTIER_START_TARGETS, {'uniprot_ids': list(uniprot_ids)})
+
+
+def frontier_start_compounds (inchikeys, stereo = True):
+    return (_frontier_start_compounds_template (bool(stereo)), {'inchikeys': list(inchikeys)})
+
+
+@lru_cache(maxsize=None)
+def _frontier_expansion_template (rel_types, direction):
+    rel_pattern = "-[r" + rel_types + "]-"
+
+    if direction == 'out':
+        rel_pattern += ">"
+    elif direction == 'in':
+        rel_pattern = "<" + rel_pattern
+
+    query = "UNWIND $node_element_ids AS node_element_id MATCH (n) WHERE elementId(n) = node_element_id"
+    query += " MATCH (n)" + rel_pattern + "(m) RETURN node_element_id, r, m"
+
+    return (query)
+
+
+def frontier_expansion (node_element_ids, rel_types, direction):
+    # rel_types: relationship types of the pattern (e.g. ':TESTED_ON|REGULATES', '' for any); direction: 'out', 'in'
+    # or 'both'
+    return (_frontier_expansion_template (rel_types, direction), {'node_element_ids': list(node_element_ids)})
+
+
+@lru_cache(maxsize=None)
+def _patterns_of_compounds_template (stereo, ratio_filter, largest_filter):
+    query = "MATCH paths=shortestPath((c:Compound)<-[r:PATTERN_OF*..1]-(p:Pattern)) WHERE c." + compound_hash_field(stereo) + " IN $inchikeys"
+    query += " AND p.pattern_type = $pattern_type"
+
+    if ratio_filter:
+        query += " AND ALL(rel IN r WHERE rel.ratio >= $min_ratio)"
+
+    if largest_filter:
+        # `islargest` is a boolean after neo4j/data_updates.cypher, but a string in the original dataset
+        query += " AND ALL(rel IN r WHERE rel.islargest = $is_largest OR rel.islargest = toString($is_largest))"
+
+    query += " RETURN paths"
+
+    return (query)
+
+
+def patterns_of_compounds (inchikeys, stereo = True, pattern_type = 'scaffold', min_ratio = 0.0, is_largest = None):
+    parameters = {
+        'inchikeys': list(inchikeys),
+        'pattern_type': pattern_type,
+        'min_ratio': to_float(min_ratio),
+        'is_largest': is_largest
+    }
+
+    query = _patterns_of_compounds_template (bool(stereo), parameters['min_ratio'] > 0.0, is_largest is not None)
+
+    return (query, parameters)
+
+
+@lru_cache(maxsize=None)
+def _potent_patterns_template ():
+    query = "MATCH paths=shortestPath((p:Pattern)-[r:POTENT_PATTERN_OF*..1]->(t:Target)) WHERE t.uniprot_id IN $uniprot_ids"
+    query += " AND p.pattern_type = $pattern_type"
+    query += " RETURN paths"
+
+    return (query)
+
+
+def potent_patterns (uniprot_ids, pattern_type = 'scaffold'):
+    parameters = {
+        'uniprot_ids': list(uniprot_ids),
+        'pattern_type': pattern_type
+    }
+
+    return (_potent_patterns_template (), parameters)
+
+
+
+###
+### Prediction
+###
+
+# Predictions are ranked by the overlap ratio of the pattern and the compound (PATTERN_OF.ratio), ties are broken by
+# compound and pattern, so pages (offset, limit) are stable. The same ranking is used by prediction_store.py .
+PREDICTION_RANK = "coalesce(toFloat(r2.ratio), 0.0)"
+
+PREDICTION_MATCH = "MATCH (t:Target) WHERE t.uniprot_id = $uniprot_id MATCH (t)<-[r1:POTENT_PATTERN_OF]-(p:Pattern) MATCH (p)-[r2:PATTERN_OF]->(c:Compound) WHERE NOT ((c)-[:TESTED_ON]->(t))"
+
+
+@lru_cache(maxsize=None)
+def _predict_template (limited, paged):
+    query = PREDICTION_MATCH
+    query += " WITH r1, r2, " + PREDICTION_RANK + " AS ratio, c.hash AS compound_id, p.pattern_id AS pattern_id"
+    query += " ORDER BY ratio DESC, compound_id, pattern_id"
+    query += " WITH {segments:[{start: startNode(r1), relationship:r1, end: endNode(r1)},{start: startNode(r2), relationship:r2, end: endNode(r2)}]} AS ret RETURN ret"
+
+    if paged:
+        query += " SKIP $offset"
+
+    if limited:
+        query += " LIMIT $limit"
+
+    return (query)
+
+
+def predict (uniprot_id, limit = 300, offset = 0):
+    parameters = {
+        'uniprot_id': uniprot_id
+    }
+
+    if limit > 0:
+        parameters['limit'] = int(limit)
+
+    if offset > 0:
+        parameters['offset'] = int(offset)
+
+    return (_predict_template (limit > 0, offset > 0), parameters)
+
+
+# Offline prediction table (see prediction_store.py)
+
+# Targets with potent patterns, with their degrees as a cheap fingerprint to detect changed targets
+PREDICTION_TARGETS = "MATCH (t:Target) WHERE EXISTS { (t)<-[:POTENT_PATTERN_OF]-(:Pattern) } RETURN t.uniprot_id AS uniprot_id, COUNT { (t)<-[:POTENT_PATTERN_OF]-() } AS potent_patterns, COUNT { (t)<-[:TESTED_ON]-() } AS tested_compounds"
+
+PREDICTION_ROWS = PREDICTION_MATCH + " RETURN t, p, c, r1, r2, " + PREDICTION_RANK + " AS ratio"
+
+# Targets whose predictions depend on the given compounds or patterns
+PREDICTION_TARGETS_OF_COMPOUNDS = "MATCH (c:Compound)<-[:PATTERN_OF]-(:Pattern)-[:POTENT_PATTERN_OF]->(t:Target) WHERE c.hash IN $hashes RETURN DISTINCT t.uniprot_id AS uniprot_id"
+PREDICTION_TARGETS_OF_PATTERNS = "MATCH (p:Pattern)-[:POTENT_PATTERN_OF]->(t:Target) WHERE p.pattern_id IN $pattern_ids RETURN DISTINCT t.uniprot_id AS uniprot_id"
+
+
+
+###
+### Utilities
+###
+
+@lru_cache(maxsize=None)
+def _smiles_compound_template (stereo):
+    query = "MATCH (c:Compound) WHERE c." + compound_hash_field(stereo) + " = $inchikey RETURN c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey"
+
+    return (query)
+
+
+def smiles_compound (inchikey, stereo = True):
+    parameters = {
+        'inchikey': inchikey
+    }
+
+    return (_smiles_compound_template (bool(stereo)), parameters)
+
+
+@lru_cache(maxsize=None)
+def _smiles_pattern_template ():
+    query = "MATCH (p:Pattern) WHERE p.pattern_id = $pattern_id RETURN p.smiles as smiles, p.hash as inchikey, p.pattern_type as pattern_type, p.pattern_id as pattern_id, p.uuid as uuid"
+
+    return (query)
+
+
+def smiles_pattern (pattern_id):
+    parameters = {
+        'pattern_id': pattern_id
+    }
+
+    return (_smiles_pattern_template (), parameters)
+
+
+
+###
+### Pagination
+###
+
+# Keyset pagination of the endpoint queries (see pagination.py). The rows of a query are ordered by a key built from
+# the element IDs of the relationships they return: a bioactivity row by its relationship, a path by its start node and
+# its relationships (paths of undirected searches can have the same relationships from different start nodes).
+#
+# Ordering and limiting the complete result would enumerate and sort every row of the query for every page. The
+# queries starting from a list of IDs (MATCH ... WHERE t.uniprot_id IN $uniprot_ids ...) are paged per start node
+# instead: the start nodes are looked up by their (indexed) ID property and ordered by element ID, the rows of a start
+# node are computed, ordered and limited in a CALL subquery, and the outer LIMIT stops at the first start nodes filling
+# the page. The rows are thus ordered by the element ID of their start node, then by their key, and a page only
+# computes the rows of the start nodes it reaches. Start nodes before the one of the cursor are skipped.
+#
+# The other queries (the aggregating path_c2t and subgraph_compound_induced queries) are ordered and limited as a whole.
+
+PATH_CURSOR_KEY = "reduce(sg_key = elementId(nodes({path})[0]), sg_rel IN relationships({path}) | sg_key + ',' + elementId(sg_rel))"
+
+CURSOR_KEYS = {
+    'rel': "elementId(rel)",
+    'p': PATH_CURSOR_KEY.format(path='p'),
+    'paths': PATH_CURSOR_KEY.format(path='paths'),
+    'p1': PATH_CURSOR_KEY.format(path='p1'),
+    'p2': PATH_CURSOR_KEY.format(path='p2')
+}
+
+# A single MATCH whose WHERE clause starts with the ID list of the start node
+START_NODE_FILTER = re.compile (r"^MATCH (?P<pattern>[^ ].*?) WHERE (?P<variable>\w+)\.(?P<property>\w+) IN \$(?P<parameter>\w+) ")
+
+
+def start_node (query):
+    # (variable, label, ID property, ID list parameter) of the start node of a query paged per start node, None otherwise
+    m = START_NODE_FILTER.match (query)
+
+    if m is None or query.count ("MATCH ") > 1 or " WITH " in query:
+        return (None)
+
+    label = re.search (r"\(" + m.group('variable') + r":(\w+)\)", m.group('pattern'))
+
+    if label is None:
+        return (None)
+
+    return ((m.group('variable'), label.group(1), m.group('property'), m.group('parameter')))
+
+
+@lru_cache(maxsize=None)
+def _paged_template (query):
+    i = query.rindex (" RETURN ")
+    variables = ", ".join ([v.strip() for v in query[i + len(" RETURN "):].split(',')])
+    keys = [CURSOR_KEYS[v.strip()] for v in variables.split(',') if v.strip() in CURSOR_KEYS]
+
+    if len(keys) == 0:
+        raise Exception ("[ERROR]: The query can not be paged: %s" % (query))
+
+    cursor_key = " + '|' + ".join(keys)
+    start = start_node (query)
+
+    if start is None:
+        paged_query = query[:i] + " WITH " + variables + ", " + cursor_key + " AS sg_cursor"
+        paged_query += " WHERE $after IS NULL OR sg_cursor > $after"
+        paged_query += " RETURN " + variables + ", sg_cursor ORDER BY sg_cursor LIMIT $page_limit"
+
+        return (paged_query)
+
+    variable, label, id_property, parameter = start
+
+    # The '|' after the element ID orders the start nodes as the prefixes of the keys of their rows
+    paged_query = "MATCH (sg_start:" + label + ") WHERE sg_start." + id_property + " IN $" + parameter
+    paged_query += " WITH sg_start, elementId(sg_start) + '|' AS sg_start_key"
+    paged_query += " WHERE $after_start IS NULL OR sg_start_key >= $after_start"
+    paged_query += " WITH sg_start, sg_start_key ORDER BY sg_start_key"
+    paged_query += " CALL { WITH sg_start, sg_start_key WITH sg_start AS " + variable + ", sg_start_key "
+    paged_query += query[:i] + " WITH " + variables + ", sg_start_key + " + cursor_key + " AS sg_cursor"
+    paged_query += " WHERE $after IS NULL OR sg_cursor > $after"
+    paged_query += " RETURN " + variables + ", sg_cursor ORDER BY sg_cursor LIMIT $page_limit }"
+    paged_query += " RETURN " + variables + ", sg_cursor LIMIT $page_limit"
+
+    return (paged_query)
+
+
+def paged (query, parameters, after, page_size):
+    # One row more than the page size is read, to know whether there is a next page. after_start: the prefix of the
+    # start node of the cursor (queries paged per start node).
+    after_start = after[:after.index ('|') + 1] if after is not None and '|' in after else None
+    parameters = dict (parameters, after = after, after_start = after_start, page_limit = int(page_size) + 1)
+
+    return (_paged_template (query), parameters)
+
+
+
+###
+### Path budgets
+###
+
+# The all-paths queries with a budget read at most max_paths + 1 rows, the extra row only tells that the result is
+# truncated (see path_budget.py)
+
+@lru_cache(maxsize=None)
+def _limited_template (query):
+    return (query + " LIMIT $path_limit")
+
+
+def limited (query, parameters, max_paths):
+    parameters = dict (parameters, path_limit = int(max_paths) + 1)
+
+    return (_limited_template (query), parameters)
+
+
+
+###
+### Bulk queries
+###
+
+# Variants of the endpoint queries for many input IDs (see the bulk section of smartgraph_async.py). The IDs are
+# unwound, every result row starts with the input ID (`id`) it belongs to, so the results can be returned per input ID.
+# The `ids` parameter is set per chunk of IDs by the caller.
+
+@lru_cache(maxsize=None)
+def _bulk_bioactivity_target_template ():
+    query = "UNWIND $ids AS id MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id = id"
+    query += " AND " + ACTIVITY_CUTOFF_FILTER.format(rel='rel')
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN id, c, t, rel"
+
+    return (query)
+
+
+def bulk_bioactivity_target (activity_cutoff = 0.0, activity_type = None):
+    parameters = {
+        'activity_cutoff': to_float(activity_cutoff),
+        'activity_type': activity_type
+    }
+
+    return (_bulk_bioactivity_target_template (), parameters)
+
+
+@lru_cache(maxsize=None)
+def _bulk_bioactivity_compound_template (stereo):
+    query = "UNWIND $ids AS id MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c." + compound_hash_field(stereo) + " = id"
+    query += " AND " + ACTIVITY_CUTOFF_FILTER.format(rel='rel')
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN id, c, t, rel"
+
+    return (query)
+
+
+def bulk_bioactivity_compound (stereo = True, activity_cutoff = 0.0, activity_type = None):
+    parameters = {
+        'activity_cutoff': to_float(activity_cutoff),
+        'activity_type': activity_type
+    }
+
+    return (_bulk_bioactivity_compound_template (bool(stereo)), parameters)
+
+
+@lru_cache(maxsize=None)
+def _bulk_potent_compounds_template ():
+    query = "UNWIND $ids AS id MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id = id AND rel.activity<=t.activity_cutoff"
+    query += " AND " + ACTIVITY_TYPE_FILTER.format(rel='rel')
+    query += " RETURN id, c, t, rel"
+
+    return (query)
+
+
+def bulk_potent_compounds (activity_type = None):
+    parameters = {
+        'activity_type': activity_type
+    }
+
+    return (_bulk_potent_compounds_template (), parameters)
+
+
+@lru_cache(maxsize=None)
+def _bulk_patterns_of_compounds_template (stereo, ratio_filter, largest_filter):
+    query = "UNWIND $ids AS id MATCH paths=shortestPath((c:Compound)<-[r:PATTERN_OF*..1]-(p:Pattern)) WHERE c." + compound_hash_field(stereo) + " = id"
+    query += " AND p.pattern_type = $pattern_type"
+
+    if ratio_filter:
+        query += " AND ALL(rel IN r WHERE rel.ratio >= $min_ratio)"
+
+    if largest_filter:
+        query += " AND ALL(rel IN r WHERE rel.islargest = $is_largest OR rel.islargest = toString($is_largest))"
+
+    query += " RETURN id, paths"
+
+    return (query)
+
+
+def bulk_patterns_of_compounds (stereo = True, pattern_type = 'scaffold', min_ratio = 0.0, is_largest = None):
+    parameters = {
+        'pattern_type': pattern_type,
+        'min_ratio': to_float(min_ratio),
+        'is_largest': is_largest
+    }
+
+    query = _bulk_patterns_of_compounds_template (bool(stereo), parameters['min_ratio'] > 0.0, is_largest is not None)
+
+    return (query, parameters)
+
+
+@lru_cache(maxsize=None)
+def _bulk_smiles_compound_template (stereo):
+    query = "UNWIND $ids AS id MATCH (c:Compound) WHERE c." + compound_hash_field(stereo) + " = id RETURN id, c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey"
+
+    return (query)
+
+
+def bulk_smiles_compound (stereo = True):
+    return (_bulk_smiles_compound_template (bool(stereo)), {})
+
+
+@lru_cache(maxsize=None)
+def _bulk_smiles_pattern_template ():
+    query = "UNWIND $ids AS id MATCH (p:Pattern) WHERE p.pattern_id = id RETURN id, p.smiles as smiles, p.hash as inchikey, p.pattern_type as pattern_type, p.pattern_id as pattern_id, p.uuid as uuid"
+
+    return (query)
+
+
+def bulk_smiles_pattern ():
+    return (_bulk_smiles_pattern_template (), {})
+
+
+
+###
+### SMILES index export
+###
+
+# Tables of the local SMILES index (see smiles_index.py): key -> the columns of the SMILES queries above. Rows are
+# ordered by key, the first row of a key is kept (for non-stereo hashes shared by stereoisomers the one of the
+# smallest InChI-Key).
+
+SMILES_INDEX_TABLES = {
+    'compound_hash': "MATCH (c:Compound) WHERE c.hash IS NOT NULL RETURN c.hash AS key, c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey ORDER BY key",
+    'compound_nostereo_hash': "MATCH (c:Compound) WHERE c.nostereo_hash IS NOT NULL RETURN c.nostereo_hash AS key, c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey ORDER BY key, inchikey",
+    'pattern_id': "MATCH (p:Pattern) WHERE p.pattern_id IS NOT NULL RETURN p.pattern_id AS key, p.smiles as smiles, p.hash as inchikey, p.pattern_type as pattern_type, p.pattern_id as pattern_id, p.uuid as uuid ORDER BY key"
+}
+
+
+
+###
+### Regulatory network export
+###
+
+# Targets and REGULATES relationships, loaded into memory by regulatory_network.py . Relationships are ordered by
+# element ID so the adjacency lists (and the paths found) do not depend on the order Neo4j returns them in.
+
+REGULATORY_NETWORK_NODES = "MATCH (t:Target) RETURN t"
+REGULATORY_NETWORK_EDGES = "MATCH (:Target)-[r:REGULATES]->(:Target) RETURN r ORDER BY elementId(r)"
+
+
+
+###
+### Graph snapshot export
+###
+
+# Node tables per label and relationship tables per type, loaded into memory by graph_snapshot.py . Both are ordered by
+# element ID so the tables (and the results computed from them) do not depend on the order Neo4j returns them in.
+
+@lru_cache(maxsize=None)
+def snapshot_nodes (label):
+    return ("MATCH (n:" + label + ") RETURN n ORDER BY elementId(n)")
+
+
+@lru_cache(maxsize=None)
+def snapshot_relationships (rel_type, start_label, end_label):
+    return ("MATCH (:" + start_label + ")-[r:" + rel_type + "]->(:" + end_label + ") RETURN r ORDER BY elementId(r)")
+
+
+# Number of nodes / relationships, answered from the count store: the fingerprint of the data of a snapshot
+
+@lru_cache(maxsize=None)
+def snapshot_node_count (label):
+    return ("MATCH (n:" + label + ") RETURN count(n) AS count")
+
+
+@lru_cache(maxsize=None)
+def snapshot_relationship_count (rel_type):
+    return ("MATCH ()-[r:" + rel_type + "]->() RETURN count(r) AS count")
@@ -0,0 +1,283 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://en.wikipedia.org/wiki/Breadth-first_search
+# Ref: https://neo4j.com/docs/cypher-manual/current/clauses/unwind/
+# Ref: https://neo4j.com/docs/cypher-manual/current/patterns/reference/#graph-patterns-rules-relationship-uniqueness
+#
+#
+# Frontier expansion engine of /subgraph_target_induced and /subgraph_compound_induced.
+#
+# The Cypher queries of the subgraph endpoints enumerate every path of up to max_length relationships from the start
+# nodes and return their union (/subgraph_compound_induced even traverses twice: once to collect the targets, then a
+# `shortestPath` per compound x target). The number of paths grows exponentially with max_length through the hub
+# targets, while the result is a subgraph within max_length hops of the start nodes. Instead, the start nodes are
+# expanded by a breadth-first search, one level (hop) at a time: the frontier of a level is expanded by a single
+# `UNWIND` query per batch of nodes (see cypher_queries.frontier_expansion), and every node is expanded once. The
+# subgraph is then computed in memory from the relationships read:
+#
+#   - all paths (`shortest_paths=False`): the relationships of the paths of 1 .. max_length relationships from a start
+#     node to an end node of the endpoint type (any node for 'both'). A relationship a -> b (in the direction of the
+#     search) is on such a path if dist(start, a) + 1 + dist(b, end node) <= max_length, where the distances are
+#     computed by one BFS from the start nodes and one (backwards) from the end nodes, neither of which may reuse
+#     a -> b (the relationship uniqueness of Cypher: a compound tested on a single target does not connect the target
+#     to itself). Paths that could only reach the end node by reusing another relationship of the prefix are not
+#     excluded, the result may hold a few more relationships than the union of the Cypher paths in that case.
+#   - shortest paths: one BFS tree per start node, and the tree path of every node of the endpoint type within
+#     1 .. max_length relationships. As with `shortestPath`, one shortest path per pair of start and end node (among
+#     several shortest paths the one found first, Neo4j returns an arbitrary one).
+#
+# The engine is used for the unpaged requests without a path budget; pages, budgets and the streaming variants keep
+# the path queries, whose rows they need. With the graph snapshot (see graph_snapshot.py), the nodes are expanded in
+# memory instead of by the expansion queries, the streaming variants use the engine as well.
+#
+# Configuration (environment):
+#
+#   - sg_subgraph_frontier: answer the subgraph endpoints by frontier expansion. Default: false
+#   - sg_subgraph_frontier_batch: number of nodes per expansion query. Default: 1000
+#
+
+import os
+
+from collections import deque
+
+import graph_builder
+
+
+def read_frontier_config ():
+    frontier_par = {}
+    frontier_par['enabled'] = os.environ.get('sg_subgraph_frontier', 'false').strip().lower() in ['true', '1', 'yes']
+    frontier_par['batch_size'] = int(os.environ.get('sg_subgraph_frontier_batch', 1000))
+
+    return (frontier_par)
+
+
+frontier_par = read_frontier_config ()
+
+
+def is_enabled ():
+    return (frontier_par['enabled'])
+
+
+def batches (node_element_ids):
+    batch_size = max (1, frontier_par['batch_size'])
+
+    for i in range (0, len(node_element_ids), batch_size):
+        yield (node_element_ids[i:i + batch_size])
+
+
+def distances (seeds, adjacency, max_depth):
+    # BFS from the seeds up to max_depth. node -> up to two (distance, relationship) with distinct relationships: the
+    # distance of the node along paths arriving by the relationship (None for the seeds), so that the distance of a
+    # node without a given relationship is known. A path does not go back along the relationship it arrived by.
+    best = {}
+    queue = deque ()
+
+    for seed in seeds:
+        best[seed] = [(0, None)]
+        queue.append ((0, seed, None))
+
+    while queue:
+        d, i, arrived_by = queue.popleft ()
+
+        if d == max_depth:
+            continue
+
+        for e, j in adjacency.get (i, {}).items():
+            if e == arrived_by:
+                continue
+
+            entries = best.setdefault (j, [])
+
+            if len(entries) == 2 or any (e == f for dist, f in entries):
+                continue
+
+            entries.append ((d + 1, e))
+            queue.append ((d + 1, j, e))
+
+    return (best)
+
+
+def distance_without (entries, e):
+    # Shortest distance of distances () not using relationship e, None if there is none
+    for d, f in entries:
+        if f != e:
+            return (d)
+
+    return (None)
+
+
+
+class FrontierSubgraph:
+
+    # Level by level expansion of the start nodes: pending () returns the IDs of the nodes to expand, the records of
+    # the expansion query of these nodes are passed to add () (or their relationships to add_relationship ()), and
+    # next_level () moves to the next level. Once pending () is empty, edges () / to_json () return the subgraph.
+
+    def __init__ (self, sources, direction, max_length, endpoint_label, shortest_paths):
+        # sources: (ID, labels) of the start nodes; direction: 'out', 'in' or 'both'; endpoint_label: label of the end
+        # nodes, None for any node. Nodes and relationships are identified by their element IDs (Neo4j) or by any other
+        # IDs (e.g. the indices of graph_snapshot.py).
+        self.direction = direction
+        self.max_length = max_length
+        self.endpoint_label = endpoint_label
+        self.shortest_paths = shortest_paths
+
+        self.labels = {}
+        self.sources = []
+
+        for i, labels in sources:
+            if i not in self.labels:
+                self.labels[i] = labels
+                self.sources.append (i)
+
+        # node ID -> {relationship ID: neighbour ID}, in the direction of the search
+        self.adjacency = {}
+
+        # Entities of the Neo4j records, by element ID (see add)
+        self.nodes = {}
+        self.relationships = {}
+
+        self.depth = 0
+        self.frontier = list (self.sources)
+        self.seen = set (self.sources)
+
+
+    @classmethod
+    def from_nodes (cls, sources, direction, max_length, endpoint_label, shortest_paths):
+        # sources: start nodes (neo4j.graph.Node)
+        extractor = cls ([(n.element_id, n.labels) for n in sources], direction, max_length, endpoint_label, shortest_paths)
+
+        for n in sources:
+            extractor.nodes.setdefault (n.element_id, n)
+
+        return (extractor)
+
+
+    def pending (self):
+        # The nodes at depth max_length end the paths, they are not expanded
+        if self.depth >= self.max_length:
+            return ([])
+
+        return (self.frontier)
+
+
+    def add_relationship (self, i, e, j, labels):
+        # Relationship e from node i to its neighbour j (of the given labels), in the direction of the search. An
+        # undirected self-loop (returned twice by Neo4j) is kept once.
+        self.labels.setdefault (j, labels)
+        self.adjacency.setdefault (i, {})[e] = j
+
+
+    def add (self, records):
+        # records: node_element_id, r, m of cypher_queries.frontier_expansion
+        for record in records:
+            r = record['r']
+            m = record['m']
+
+            self.nodes.setdefault (m.element_id, m)
+            self.relationships.setdefault (r.element_id, r)
+
+            self.add_relationship (record['node_element_id'], r.element_id, m.element_id, m.labels)
+
+
+    def next_level (self):
+        next_frontier = []
+
+        for i in self.frontier:
+            for j in self.adjacency.setdefault (i, {}).values():
+                if j not in self.seen:
+                    self.seen.add (j)
+                    next_frontier.append (j)
+
+        self.frontier = next_frontier
+        self.depth += 1
+
+
+    def is_endpoint (self, i):
+        return (self.endpoint_label is None or self.endpoint_label in self.labels[i])
+
+
+    def shortest_path_edges (self):
+        edges = {}
+
+        for source in self.sources:
+            parents = {source: None}
+            frontier = [source]
+
+            for depth in range (self.max_length):
+                next_frontier = []
+
+                for i in frontier:
+                    for e, j in self.adjacency.get (i, {}).items():
+                        if j not in parents:
+                            parents[j] = (i, e)
+                            next_frontier.append (j)
+
+                frontier = next_frontier
+
+            # The tree paths to the end nodes, up to the first relationship already taken from this tree
+            taken = set ()
+
+            for j in parents:
+                if j == source or not self.is_endpoint (j):
+                    continue
+
+                while parents[j] is not None and parents[j][1] not in taken:
+                    i, e = parents[j]
+                    taken.add (e)
+                    edges[e] = (i, j)
+                    j = i
+
+        return (edges)
+
+
+    def all_path_edges (self):
+        reverse = {}
+
+        for i, neighbours in self.adjacency.items():
+            for e, j in neighbours.items():
+                reverse.setdefault (j, {})[e] = i
+
+        from_sources = distances (self.sources, self.adjacency, self.max_length - 1)
+        to_endpoints = distances ([i for i in self.labels if self.is_endpoint (i)], reverse, self.max_length - 1)
+
+        edges = {}
+
+        for i, neighbours in self.adjacency.items():
+            for e, j in neighbours.items():
+                d_start = distance_without (from_sources.get (i, []), e)
+                d_end = distance_without (to_endpoints.get (j, []), e)
+
+                if d_start is not None and d_end is not None and d_start + 1 + d_end <= self.max_length:
+                    edges[e] = (i, j)
+
+        return (edges)
+
+
+    def edges (self):
+        # Relationships of the subgraph: relationship ID -> (node ID, neighbour ID), in the direction of the search
+        if self.shortest_paths:
+            return (self.shortest_path_edges ())
+
+        return (self.all_path_edges ())
+
+
+    def to_json (self):
+        # The subgraph of the Neo4j records added. All ends first, so that the ends of the relationships are resolved
+        # by element ID.
+        edges = self.edges ()
+        builder = graph_builder.GraphBuilder ()
+
+        for e, (i, j) in edges.items():
+            builder.add_node (self.nodes[i])
+            builder.add_node (self.nodes[j])
+
+        for e in edges:
+            builder.add_relationship (self.relationships[e])
+
+        return (builder.to_json ())
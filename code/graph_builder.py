@@ -0,0 +1,355 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#graph
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#neo4j.graph.Node.element_id
+#
+#
+# Single-pass conversion of Neo4j graph results into the SmartGraph JSON graphs ({'nodes': [...], 'edges': [...]}).
+#
+# Replaces the extract_node_properties / extract_edge_properties / aggregate_nodes / aggregate_edges pipeline
+# previously in smartgraph.py (now in benchmark.py, compared in tests/test_graph_builder.py), with the same output:
+#
+#   - every node and edge is converted once: entities already seen (same element ID) are skipped before their
+#     properties are copied, and the records are de-duplicated on insert into dicts keyed on `node_id` / `uuid`,
+#   - the SmartGraph IDs of the start and end nodes of an edge are looked up by the element IDs of the nodes, instead
+#     of scanning the properties of the nodes,
+#   - the per-relationship work is a single pass over the properties of the relationship and two dict lookups, the
+#     edge type comes from a table instead of lower-casing and validating the type of every relationship,
+#   - the records are plain dicts, serialised natively by orjson. Builders of graphs kept in memory (the regulatory
+#     network, the graph snapshot) pass compact = True for compact graph_records.Node / Edge records.
+#
+# Nodes without labels (ends of relationships whose nodes were not returned by the query) carry no data and are skipped.
+#
+
+from neo4j.graph import Node, Relationship, Path
+
+import graph_records
+
+
+# Relationship property -> SmartGraph edge property
+EDGE_PROPERTY_NAMES = {
+    'edgeType': 'action_type',
+    'unique_label': 'edge_label',
+    'ppi_uid': 'edge_label',
+    'edgeInfo': 'mechanism_details'
+}
+
+# Edge type -> properties holding the IDs of the start and end nodes, used when an end node was not returned
+EDGE_END_PROPERTIES = {
+    'regulates': ('uniprot_id', 'uniprot_id'),
+    'tested_on': ('hash', 'uniprot_id'),
+    'pattern_of': ('pattern_id', 'hash'),
+    'potent_pattern_of': ('pattern_id', 'uniprot_id')
+}
+
+# Relationship type -> edge type, for the types of EDGE_END_PROPERTIES
+EDGE_TYPES = {edge_type.upper(): edge_type for edge_type in EDGE_END_PROPERTIES}
+
+
+def node_record (node):
+    properties = dict (node.items())
+
+    node_type = next (iter (node.labels)).lower()
+    properties['node_type'] = node_type
+
+    if node_type == 'compound':
+        properties['node_id'] = properties['hash']
+        properties['inchikey'] = properties['hash']
+        properties['nsinchikey'] = properties['nostereo_hash']
+
+    elif node_type == 'pattern':
+        properties['node_id'] = properties['pattern_id']
+        properties['inchikey'] = properties['hash']
+
+    elif node_type == 'target':
+        properties['node_id'] = properties['uniprot_id']
+
+    else:
+        raise Exception ("[ERROR] Invalid node type encountered in SmartGraph JSON.")
+
+    return (properties)
+
+
+class GraphBuilder:
+
+    def __init__ (self, keep_records = True, compact = False):
+        # With keep_records = False only the IDs are kept (streaming, see smartgraph_async.py), the records are
+        # returned by add_node / add_relationship and not stored. With compact = True the records are
+        # graph_records.Node / Edge records, dicts otherwise.
+        self.keep_records = keep_records
+        self.compact = compact
+
+        # element ID -> node_id / uuid
+        self.node_ids = {}
+        self.edge_ids = {}
+
+        self.nodes = {}
+        self.edges = {}
+
+
+    def insert_node (self, node, element_id = None):
+        record = node_record (node)
+        self.node_ids[element_id or node.element_id] = record['node_id']
+
+        if self.compact:
+            record = graph_records.Node.from_dict (record)
+
+        if self.keep_records:
+            self.nodes[record['node_id']] = record
+
+        return (record)
+
+
+    def add_node (self, node):
+        # Returns the record of the node if it was not seen before, None otherwise
+        element_id = node.element_id
+
+        if element_id in self.node_ids or len(node.labels) == 0:
+            return (None)
+
+        return (self.insert_node (node, element_id))
+
+
+    def end_node_id (self, node, edge_type, end):
+        # Only for the ends not added as nodes (not returned by the query)
+        return (node.get (EDGE_END_PROPERTIES[edge_type][end]))
+
+
+    def insert_relationship (self, relationship):
+        names = EDGE_PROPERTY_NAMES
+        record = {}
+
+        for k, v in relationship.items():
+            record[names.get (k, k)] = v
+
+        uuid = record['uuid'] = record['uuid'] + '_' + record['edge_label']
+
+        edge_type = EDGE_TYPES.get (relationship.type)
+
+        if edge_type is None:
+            raise Exception ('[ERROR] Invalid edge type encountered in SmartGraph JSON.')
+
+        record['edge_type'] = edge_type
+
+        start_node = relationship.start_node
+        end_node = relationship.end_node
+
+        start_node_id = self.node_ids.get (start_node.element_id)
+        end_node_id = self.node_ids.get (end_node.element_id)
+
+        if start_node_id is None:
+            start_node_id = self.end_node_id (start_node, edge_type, 0)
+
+        if end_node_id is None:
+            end_node_id = self.end_node_id (end_node, edge_type, 1)
+
+        record['start_node'] = start_node_id
+        record['end_node'] = end_node_id
+
+        if self.compact:
+            record = graph_records.Edge.from_dict (record)
+
+        if self.keep_records:
+            self.edges[uuid] = record
+
+        return (record)
+
+
+    def add_relationship (self, relationship):
+        # Returns the record of the relationship if it was not seen before, None otherwise
+        element_id = relationship.element_id
+
+        if element_id in self.edge_ids:
+            return (None)
+
+        record = self.insert_relationship (relationship)
+        self.edge_ids[element_id] = record['uuid']
+
+        return (record)
+
+
+    def add (self, value):
+        # Adds the nodes and relationships of a record value (node, relationship, path or list / map of those).
+        # Yields ('node' | 'edge', record) for the entities not seen before.
+        if isinstance (value, Node):
+            record = self.add_node (value)
+
+            if record is not None:
+                yield (('node', record))
+
+        elif isinstance (value, Relationship):
+            record = self.add_relationship (value)
+
+            if record is not None:
+                yield (('edge', record))
+
+        elif isinstance (value, Path):
+            for n in value.nodes:
+                record = self.add_node (n)
+
+                if record is not None:
+                    yield (('node', record))
+
+            for r in value.relationships:
+                record = self.add_relationship (r)
+
+                if record is not None:
+                    yield (('edge', record))
+
+        elif isinstance (value, list):
+            for v in value:
+                for item in self.add (v):
+                    yield (item)
+
+        elif isinstance (value, dict):
+            for v in value.values():
+                for item in self.add (v):
+                    yield (item)
+
+
+    def add_values (self, values):
+        # Adds the values of a result record, for builders that keep the records. As add, without its generators.
+        for value in values:
+            if isinstance (value, Path):
+                for n in value.nodes:
+                    self.add_node (n)
+
+                for r in value.relationships:
+                    self.add_relationship (r)
+
+            elif isinstance (value, Node):
+                self.add_node (value)
+
+            elif isinstance (value, Relationship):
+                self.add_relationship (value)
+
+            elif isinstance (value, list):
+                self.add_values (value)
+
+            elif isinstance (value, dict):
+                self.add_values (value.values())
+
+        return (self)
+
+
+    def add_records (self, nodes, edges):
+        # Adds records converted before (e.g. the ones of regulatory_network.py), as dicts unless the builder is compact
+        convert = graph_records.to_dict if not self.compact else None
+
+        for record in nodes:
+            if record['node_id'] not in self.nodes:
+                self.nodes[record['node_id']] = convert (record) if convert else record
+
+        for record in edges:
+            if record['uuid'] not in self.edges:
+                self.edges[record['uuid']] = convert (record) if convert else record
+
+        return (self)
+
+
+    def add_graph (self, g):
+        # The entities of a neo4j.graph.Graph are unique by element ID already. All nodes first, so that the ends of
+        # the relationships are resolved by element ID.
+        for n in g.nodes:
+            if len(n.labels) > 0:
+                self.insert_node (n)
+
+        for r in g.relationships:
+            self.insert_relationship (r)
+
+        return (self)
+
+
+    def to_json (self):
+        G_json = {}
+        G_json['nodes'] = list (self.nodes.values())
+        G_json['edges'] = list (self.edges.values())
+
+        return (G_json)
+
+
+
+###
+### Compound-target paths
+###
+
+# /path_c2t is answered in two phases (see smartgraph_async.py and regulatory_network.py): the bioactivities of the
+# compounds are read once, the target-target paths once per distinct tested target, and both are joined here. The rows
+# are (sort key, node records, edge records), the sort keys are the ones of the paged path_c2t query (see
+# cypher_queries.CURSOR_KEYS).
+
+def bioactivities (records):
+    # Bioactivity records (c, t, rel) -> [(element ID of the target, of the compound, of the relationship, compound
+    # record, bioactivity record)]
+    builder = GraphBuilder ()
+    rows = []
+
+    for record in records:
+        c = record['c']
+        t = record['t']
+        rel = record['rel']
+
+        builder.add_values ([c, t, rel])
+        rows.append ((t.element_id, c.element_id, rel.element_id, builder.nodes[builder.node_ids[c.element_id]], builder.edges[builder.edge_ids[rel.element_id]]))
+
+    return (rows)
+
+
+def bioactivity_legs (rows, sort_key = None):
+    # Rows of bioactivities () -> element ID of the target -> [(key, compound record, bioactivity record)], one
+    # bioactivity per compound and target (as the TESTED_ON shortestPath of the query, but of the bioactivities read,
+    # i.e. passing the activity filters): the first in sort_key order, by default the element ID of the relationship.
+    # The key is the cursor key of the path of the bioactivity (compound, relationship, see path_key).
+    legs = {}
+    seen = set ()
+
+    if sort_key is None:
+        sort_key = lambda row: row[2]
+
+    for target_element_id, compound_element_id, element_id, compound, bioactivity in sorted (rows, key = sort_key):
+        if (target_element_id, compound_element_id) in seen:
+            continue
+
+        seen.add ((target_element_id, compound_element_id))
+        legs.setdefault (target_element_id, []).append ((compound_element_id + ',' + element_id, compound, bioactivity))
+
+    return (legs)
+
+
+def path_key (path):
+    # PATH_CURSOR_KEY of cypher_queries.py
+    key = path.start_node.element_id
+
+    for r in path.relationships:
+        key += ',' + r.element_id
+
+    return (key)
+
+
+def c2t_rows (legs, path_records):
+    # Joins the target-target paths (records with p1, from the tested targets) with the bioactivity legs of their start
+    builder = GraphBuilder ()
+    rows = []
+
+    for record in path_records:
+        p1 = record['p1']
+        target_legs = legs.get (p1.start_node.element_id, [])
+
+        if len(target_legs) == 0:
+            continue
+
+        builder.add_values ([p1])
+
+        key = path_key (p1)
+        nodes = [builder.nodes[builder.node_ids[n.element_id]] for n in p1.nodes]
+        edges = [builder.edges[builder.edge_ids[r.element_id]] for r in p1.relationships]
+
+        for leg_key, compound, bioactivity in target_legs:
+            rows.append ((key + '|' + leg_key, nodes + [compound], edges + [bioactivity]))
+
+    return (rows)
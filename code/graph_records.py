@@ -0,0 +1,175 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://docs.python.org/3/reference/datamodel.html#slots
+# Ref: https://docs.python.org/3/library/sys.html#sys.intern
+# Ref: https://github.com/ijl/orjson#default
+#
+#
+# Compact node and edge records of the SmartGraph JSON graphs ({'nodes': [...], 'edges': [...]}).
+#
+# The properties of a node or an edge depend on its kind (compound, pattern and target nodes; tested_on, regulates,
+# pattern_of and potent_pattern_of edges, see graph_builder.py) and on the source data, so records are not a fixed set
+# of fields. A record keeps its values in a tuple, and a reference to a Schema, the tuple of its property names, which
+# is shared by all records with the same names (in practice a handful of schemas per result). Compared to one dict per
+# node/edge this saves the hash table of every record. Values of the properties repeated across records (node_type,
+# edge_type, activity_type, sourceDB, ...) are interned, so a large result holds one copy of each of these strings.
+#
+# Records are read-only mappings: the serialisers read them as they read the dicts (graphml_writer.py iterates
+# items(), columnar_export.py uses keys() and get()).
+#
+# Records are meant for the graphs kept in memory (the regulatory network of regulatory_network.py, the snapshot of
+# graph_snapshot.py). The graphs of the responses are released once serialised, they are built as plain dicts, which
+# orjson serialises natively (see graph_builder.py); the records of the kept graphs are turned into dicts when they
+# are added to a response (GraphBuilder.add_records). orjson.dumps (..., default = graph_records.default) remains for
+# the few records returned as they are.
+#
+# Schemas are shared through a weak-valued registry, a schema is dropped with the last record using it.
+#
+
+import sys
+import weakref
+
+
+# Properties with few distinct values across the records
+INTERNED_PROPERTIES = ['node_type', 'edge_type', 'activity_type', 'sourceDB', 'source', 'action_type']
+
+
+class Schema:
+
+    __slots__ = ('names', 'index', 'interned', '__weakref__')
+
+    def __init__ (self, names):
+        self.names = names
+        self.index = {name: i for i, name in enumerate (names)}
+        self.interned = [i for i, name in enumerate (names) if name in INTERNED_PROPERTIES]
+
+
+_schemas = weakref.WeakValueDictionary ()
+
+
+def get_schema (names):
+    schema = _schemas.get (names)
+
+    if schema is None:
+        schema = Schema (tuple ([sys.intern (name) for name in names]))
+        schema = _schemas.setdefault (schema.names, schema)
+
+    return (schema)
+
+
+
+class Record:
+
+    __slots__ = ('schema', 'values')
+
+    def __init__ (self, schema, values):
+        self.schema = schema
+        self.values = values
+
+
+    @classmethod
+    def from_dict (cls, properties):
+        schema = get_schema (tuple (properties.keys()))
+        values = tuple (properties.values())
+
+        if schema.interned:
+            values = list (values)
+
+            for i in schema.interned:
+                if isinstance (values[i], str):
+                    values[i] = sys.intern (values[i])
+
+            values = tuple (values)
+
+        return (cls (schema, values))
+
+
+    def __getitem__ (self, name):
+        return (self.values[self.schema.index[name]])
+
+
+    def get (self, name, default = None):
+        i = self.schema.index.get (name)
+
+        if i is None:
+            return (default)
+
+        return (self.values[i])
+
+
+    def __contains__ (self, name):
+        return (name in self.schema.index)
+
+
+    def __iter__ (self):
+        return (iter (self.schema.names))
+
+
+    def __len__ (self):
+        return (len(self.values))
+
+
+    def keys (self):
+        return (self.schema.names)
+
+
+    def items (self):
+        return (zip (self.schema.names, self.values))
+
+
+    def to_dict (self):
+        return (dict (zip (self.schema.names, self.values)))
+
+
+    def __eq__ (self, other):
+        if isinstance (other, Record):
+            return (self.schema.names == other.schema.names and self.values == other.values)
+
+        if isinstance (other, dict):
+            return (self.to_dict () == other)
+
+        return (NotImplemented)
+
+
+    def __hash__ (self):
+        # Consistent with __eq__ between records: equal records have the same names and values. Values that are not
+        # hashable (lists, e.g. synonyms) are left out of the hash.
+        return (hash ((self.schema.names,) + tuple ([v for v in self.values if isinstance (v, (str, int, float, bool)) or v is None])))
+
+
+    def __repr__ (self):
+        return ('%s(%r)' % (type(self).__name__, self.to_dict ()))
+
+
+
+class Node (Record):
+
+    __slots__ = ()
+
+
+
+class Edge (Record):
+
+    __slots__ = ()
+
+
+
+def to_dict (record):
+    # Plain dict of a record, dicts are returned as they are
+    if isinstance (record, Record):
+        return (record.to_dict ())
+
+    return (record)
+
+
+def default (obj):
+    # orjson default hook, for the records within a graph
+    if isinstance (obj, Record):
+        return (obj.to_dict ())
+
+    raise TypeError ("[ERROR]: Type is not JSON serializable: %s" % (type(obj).__name__))
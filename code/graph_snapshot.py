@@ -0,0 +1,846 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://en.wikipedia.org/wiki/Column-oriented_DBMS
+# Ref: https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+# Ref: https://neo4j.com/docs/cypher-manual/current/patterns/reference/#shortest-functions
+# Ref: https://neo4j.com/docs/operations-manual/current/performance/statistics-execution-plans/#statistics-execution-plans-count-store
+# Ref: https://docs.python.org/3/library/array.html
+#
+#
+# In-memory snapshot of the whole SmartGraph knowledge graph.
+#
+# The knowledge graph (~271k compounds, ~2k targets, ~64k patterns, ~420k bioactivities) is loaded from Neo4j at startup
+# and every endpoint is answered from memory (see the graph snapshot section of smartgraph_async.py), Neo4j is only read
+# to (re)load the snapshot. The snapshot is held in tables:
+#
+#   - a node table per label (Target, Compound, Pattern): the element IDs and the graph_records of the nodes, the
+#     indices of the properties the queries look the nodes up by (uniprot_id, hash, nostereo_hash, pattern_id), and
+#     the columns of the properties they filter on (activity_cutoff, pattern_type),
+#   - a relationship table per type (REGULATES, TESTED_ON, PATTERN_OF, POTENT_PATTERN_OF): the element IDs and the
+#     graph_records of the relationships, the rows of their start and end nodes in the node tables (arrays), the columns
+#     of the properties the queries filter on (activity, activity_type, max_confidence_value, ratio, islargest), and the
+#     compressed sparse row (CSR) indices of the relationships per start node and per end node.
+#
+# Numeric columns are arrays of doubles, NaN for a missing or non-numeric value, so that comparisons with NaN fail as
+# the comparisons with null do in Cypher. The results are the rows of the Cypher queries of cypher_queries.py (sort key,
+# node records, edge records), with the sort keys of their rows (cypher_queries.CURSOR_KEYS), so pages and cursors work
+# as with Neo4j:
+#
+#   - the bioactivity, pattern and prediction queries are answered from the CSR indices of the relationship tables,
+#     `shortestPath((c)<-[r:PATTERN_OF*..1]-(p))` (and the one of POTENT_PATTERN_OF) by the first relationship of the
+#     pair that passes the filters,
+#   - the regulatory path queries and the target-target leg of /path_c2t by the path engine of regulatory_network.py,
+#     on the targets and REGULATES relationships of the snapshot (instead of a separate load from Neo4j),
+#   - the subgraph queries by the same path engine, on the targets and compounds with their REGULATES and TESTED_ON
+#     relationships (every relationship followed by `-[r:TESTED_ON|REGULATES*..]-` and, in the SmartGraph schema, by the
+#     untyped outgoing pattern of /subgraph_compound_induced), or by frontier expansion (see frontier_subgraph.py),
+#   - the SMILES queries from the node records.
+#
+# Among several results where Neo4j returns an arbitrary one (shortest paths, the SMILES of a non-stereo InChIKey), the
+# snapshot returns the first one in element ID order (the one of the smallest InChIKey for the SMILES, as
+# smiles_index.py).
+#
+# The snapshot is read-only. With sg_graph_snapshot_reload_interval, the API checks the fingerprint of the data (number
+# of nodes per label and relationships per type, from the count store of Neo4j) at that interval, and loads a new
+# snapshot if it changed (see server.py); the old one answers the requests until the new one is swapped in. Changes
+# that keep the numbers of nodes and relationships need a restart of the API. A snapshot is read in a single read
+# transaction, and read again if the data changed meanwhile (see fetch_snapshot). The cursors of paged requests hold the
+# fingerprint of the snapshot they were issued from (see pagination.fingerprint), a reload invalidates them.
+#
+# Configuration (environment):
+#
+#   - sg_graph_snapshot: load the graph snapshot at startup and answer all endpoints from it. Default: false
+#   - sg_graph_snapshot_reload_interval: seconds between the checks of the fingerprint, 0 disables them. Default: 0
+#   - sg_graph_snapshot_load_attempts: number of reads of the snapshot while the data changes during the read (see
+#     fetch_snapshot). Default: 3
+#
+# The regulatory network of the snapshot uses the k-hop index and confidence bands of regulatory_network.py
+# (sg_khop_index_depth, sg_confidence_bands).
+#
+
+import math
+import os
+import sys
+import threading
+import time
+
+from array import array
+
+import cypher_queries as cq
+import frontier_subgraph
+import graph_builder
+import neo4j_utils
+import regulatory_network
+
+
+def read_graph_snapshot_config ():
+    snapshot_par = {}
+    snapshot_par['enabled'] = os.environ.get('sg_graph_snapshot', 'false').strip().lower() in ['true', '1', 'yes']
+    snapshot_par['reload_interval'] = float(os.environ.get('sg_graph_snapshot_reload_interval', 0))
+    snapshot_par['load_attempts'] = int(os.environ.get('sg_graph_snapshot_load_attempts', 3))
+
+    return (snapshot_par)
+
+
+# Label -> properties the nodes are looked up by
+NODE_KEYS = {
+    'Target': ['uniprot_id'],
+    'Compound': ['hash', 'nostereo_hash'],
+    'Pattern': ['pattern_id']
+}
+
+# Label -> properties kept as columns
+NODE_COLUMNS = {
+    'Target': ['activity_cutoff'],
+    'Compound': [],
+    'Pattern': ['pattern_type']
+}
+
+# Relationship type -> labels of the start and end nodes
+RELATIONSHIP_ENDS = {
+    'REGULATES': ('Target', 'Target'),
+    'TESTED_ON': ('Compound', 'Target'),
+    'PATTERN_OF': ('Pattern', 'Compound'),
+    'POTENT_PATTERN_OF': ('Pattern', 'Target')
+}
+
+# Relationship type -> properties kept as columns
+RELATIONSHIP_COLUMNS = {
+    'REGULATES': ['max_confidence_value'],
+    'TESTED_ON': ['activity', 'activity_type'],
+    'PATTERN_OF': ['ratio', 'islargest'],
+    'POTENT_PATTERN_OF': []
+}
+
+NUMERIC_COLUMNS = ['activity_cutoff', 'max_confidence_value', 'activity', 'ratio']
+
+# endpoint_type of /subgraph_target_induced -> label of the end nodes
+ENDPOINT_LABELS = {'compound': 'Compound', 'target': 'Target', 'both': None}
+
+
+def number (value):
+    # Numeric column value: NaN unless value is a number
+    if isinstance (value, bool) or not isinstance (value, (int, float)):
+        return (math.nan)
+
+    return (float (value))
+
+
+def cypher_float (value):
+    # toFloat() of Cypher: numbers and numeric strings, None otherwise
+    if isinstance (value, bool):
+        return (None)
+
+    try:
+        return (float (value))
+    except (TypeError, ValueError):
+        return (None)
+
+
+def nulls_last (value):
+    # Sort key of a value in ascending order with null last, as ORDER BY
+    return ((value is None, value if value is not None else ''))
+
+
+
+###
+### Tables section
+###
+
+class NodeTable:
+
+    def __init__ (self, label):
+        self.label = label
+        self.labels = frozenset ([label])
+
+        self.element_ids = []
+        self.records = []
+
+        # key -> value -> row, or list of rows if the value is not unique
+        self.index = {key: {} for key in NODE_KEYS[label]}
+        self.columns = {name: array ('d') if name in NUMERIC_COLUMNS else [] for name in NODE_COLUMNS[label]}
+
+
+    def __len__ (self):
+        return (len(self.records))
+
+
+    def append (self, node, record):
+        row = len(self.records)
+
+        self.element_ids.append (node.element_id)
+        self.records.append (record)
+
+        for key, index in self.index.items():
+            value = node.get (key)
+
+            if value is None:
+                continue
+
+            rows = index.get (value)
+
+            if rows is None:
+                index[value] = row
+            elif isinstance (rows, list):
+                rows.append (row)
+            else:
+                index[value] = [rows, row]
+
+        for name, column in self.columns.items():
+            value = node.get (name)
+
+            if name in NUMERIC_COLUMNS:
+                column.append (number (value))
+            else:
+                column.append (sys.intern (value) if isinstance (value, str) else value)
+
+
+    def rows (self, key, values):
+        # Rows of the nodes whose key is one of values, in row order
+        index = self.index[key]
+        rows = set ()
+
+        for value in values:
+            found = index.get (value)
+
+            if found is None:
+                continue
+
+            if isinstance (found, list):
+                rows.update (found)
+            else:
+                rows.add (found)
+
+        return (sorted (rows))
+
+
+
+class RelationshipTable:
+
+    def __init__ (self, rel_type, start_table, end_table):
+        self.rel_type = rel_type
+        self.start_table = start_table
+        self.end_table = end_table
+
+        self.element_ids = []
+        self.records = []
+
+        self.starts = array ('i')
+        self.ends = array ('i')
+        self.columns = {name: array ('d') if name in NUMERIC_COLUMNS else [] for name in RELATIONSHIP_COLUMNS[rel_type]}
+
+        # 'out': (offsets, relationships) per start node, 'in': per end node
+        self.csr = {}
+
+
+    def __len__ (self):
+        return (len(self.records))
+
+
+    def append (self, relationship, record, start, end):
+        self.element_ids.append (relationship.element_id)
+        self.records.append (record)
+        self.starts.append (start)
+        self.ends.append (end)
+
+        for name, column in self.columns.items():
+            value = relationship.get (name)
+
+            if name in NUMERIC_COLUMNS:
+                column.append (number (value))
+            else:
+                column.append (sys.intern (value) if isinstance (value, str) else value)
+
+
+    def build_csr (self):
+        self.csr = {
+            'out': regulatory_network.build_csr (len(self.start_table), self.starts),
+            'in': regulatory_network.build_csr (len(self.end_table), self.ends)
+        }
+
+
+    def outgoing (self, row):
+        # Relationships of the start node row, in element ID order
+        offsets, edges = self.csr['out']
+
+        return (edges[offsets[row]:offsets[row + 1]])
+
+
+    def incoming (self, row):
+        # Relationships of the end node row, in element ID order
+        offsets, edges = self.csr['in']
+
+        return (edges[offsets[row]:offsets[row + 1]])
+
+
+
+class GraphSnapshot:
+
+    def __init__ (self, fingerprint):
+        self.fingerprint = fingerprint
+
+        self.nodes = {label: NodeTable (label) for label in NODE_KEYS}
+        self.relationships = {rel_type: RelationshipTable (rel_type, self.nodes[start], self.nodes[end]) for rel_type, (start, end) in RELATIONSHIP_ENDS.items()}
+
+        self.regulatory = None
+        self.mixed = None
+
+
+    def build (self):
+        for table in self.relationships.values():
+            table.build_csr ()
+
+        targets = self.nodes['Target']
+        compounds = self.nodes['Compound']
+        regulates = self.relationships['REGULATES']
+        tested_on = self.relationships['TESTED_ON']
+
+        # Path engine of the regulatory path endpoints
+        self.regulatory = regulatory_network.RegulatoryNetwork (targets.records, targets.element_ids, regulates.records, regulates.element_ids,
+                                                                regulates.starts, regulates.ends, regulates.columns['max_confidence_value'])
+
+        # Path engine of the subgraph endpoints: the targets, then the compounds (node i >= number of targets is
+        # compound row i - number of targets); the REGULATES, then the TESTED_ON relationships
+        n_targets = len(targets)
+
+        self.mixed = regulatory_network.RegulatoryNetwork (targets.records + compounds.records, targets.element_ids + compounds.element_ids,
+                                                           regulates.records + tested_on.records, regulates.element_ids + tested_on.element_ids,
+                                                           list (regulates.starts) + [n_targets + c for c in tested_on.starts],
+                                                           list (regulates.ends) + list (tested_on.ends),
+                                                           list (regulates.columns['max_confidence_value']) + [math.nan] * len(tested_on))
+
+
+    def mixed_labels (self, i):
+        # Labels of node i of the subgraph path engine
+        if i < len(self.nodes['Target']):
+            return (self.nodes['Target'].labels)
+
+        return (self.nodes['Compound'].labels)
+
+
+    def size (self):
+        size = {}
+        size['nodes'] = {label: len(table) for label, table in self.nodes.items()}
+        size['relationships'] = {rel_type: len(table) for rel_type, table in self.relationships.items()}
+
+        return (size)
+
+
+
+###
+### Loading section
+###
+
+def fetch_fingerprint (tx):
+    # tx: a session or a transaction
+    counts = []
+
+    for label in NODE_KEYS:
+        counts.append (tx.run (cq.snapshot_node_count (label)).single ()['count'])
+
+    for rel_type in RELATIONSHIP_ENDS:
+        counts.append (tx.run (cq.snapshot_relationship_count (rel_type)).single ()['count'])
+
+    return (tuple (counts))
+
+
+def read_snapshot (tx):
+    # Transaction function reading the fingerprint, the nodes and the relationships in a single read transaction. The
+    # records are converted as in the graphs built from Neo4j (see graph_builder.py). Returns the snapshot (not built
+    # yet) and the number of relationships skipped since one of their ends was not read: Neo4j reads committed data,
+    # a load committed while the snapshot is read can add relationships to nodes created after their label was read.
+    builder = graph_builder.GraphBuilder (keep_records = False, compact = True)
+    snapshot = GraphSnapshot (fetch_fingerprint (tx))
+
+    # label -> element ID -> row, only while loading
+    element_index = {}
+
+    for label, table in snapshot.nodes.items():
+        for record in tx.run (cq.snapshot_nodes (label)):
+            node = record['n']
+            table.append (node, builder.insert_node (node))
+
+        element_index[label] = {element_id: row for row, element_id in enumerate (table.element_ids)}
+
+    skipped = 0
+
+    for rel_type, table in snapshot.relationships.items():
+        start_label, end_label = RELATIONSHIP_ENDS[rel_type]
+        start_index = element_index[start_label]
+        end_index = element_index[end_label]
+
+        for record in tx.run (cq.snapshot_relationships (rel_type, start_label, end_label)):
+            relationship = record['r']
+            start = start_index.get (relationship.start_node.element_id)
+            end = end_index.get (relationship.end_node.element_id)
+
+            if start is None or end is None:
+                skipped += 1
+                continue
+
+            table.append (relationship, builder.insert_relationship (relationship), start, end)
+
+    return ((snapshot, skipped))
+
+
+def fetch_snapshot ():
+    # A snapshot is kept if none of its relationships was skipped and the fingerprint did not change while it was read,
+    # otherwise it is read again, up to sg_graph_snapshot_load_attempts times
+    attempts = max (1, read_graph_snapshot_config ()['load_attempts'])
+
+    with neo4j_utils.neo4j_session() as session:
+        for attempt in range (attempts):
+            snapshot, skipped = session.execute_read (read_snapshot)
+
+            if skipped == 0 and fetch_fingerprint (session) == snapshot.fingerprint:
+                snapshot.build ()
+
+                return (snapshot)
+
+    raise Exception ("[ERROR]: The data changed while the graph snapshot was read (%d attempts)." % (attempts))
+
+
+def fetch_current_fingerprint ():
+    with neo4j_utils.neo4j_session() as session:
+        return (fetch_fingerprint (session))
+
+
+
+###
+### Process-wide snapshot section
+###
+
+_lock = threading.Lock()
+_snapshot = None
+
+_metrics = {
+    'loads': 0,
+    'load_seconds': None,
+    'loaded_at': None,
+    'queries': 0,
+    'rows': 0
+}
+
+
+def load (snapshot_par = None):
+    # Blocking, called at startup
+    if snapshot_par is None:
+        snapshot_par = read_graph_snapshot_config ()
+
+    if not snapshot_par['enabled']:
+        return (False)
+
+    load_snapshot ()
+
+    return (True)
+
+
+def load_snapshot ():
+    # Reads a new snapshot and swaps it in, the requests being answered keep the previous one. The regulatory path
+    # endpoints use the regulatory network of the snapshot (see regulatory_network.load).
+    global _snapshot
+
+    started = time.monotonic ()
+    snapshot = fetch_snapshot ()
+
+    regulatory_network.load (network = snapshot.regulatory)
+
+    with _lock:
+        _snapshot = snapshot
+        _metrics['loads'] += 1
+        _metrics['load_seconds'] = round (time.monotonic () - started, 3)
+        _metrics['loaded_at'] = time.time ()
+
+
+def refresh ():
+    # Blocking. Loads a new snapshot if the fingerprint of the data changed, returns whether it did.
+    snapshot = _snapshot
+
+    if snapshot is None or fetch_current_fingerprint () == snapshot.fingerprint:
+        return (False)
+
+    load_snapshot ()
+
+    return (True)
+
+
+def close ():
+    global _snapshot
+
+    with _lock:
+        _snapshot = None
+
+
+def is_enabled ():
+    return (_snapshot is not None)
+
+
+def loaded_fingerprint ():
+    # Fingerprint of the data of the current snapshot, None without snapshot
+    snapshot = _snapshot
+
+    return (snapshot.fingerprint if snapshot is not None else None)
+
+
+def count_query (rows):
+    with _lock:
+        _metrics['queries'] += 1
+        _metrics['rows'] += len(rows)
+
+    return (rows)
+
+
+def get_metrics ():
+    with _lock:
+        metrics = dict (_metrics)
+        metrics['enabled'] = _snapshot is not None
+        metrics.update (_snapshot.size () if _snapshot is not None else {})
+
+    return (metrics)
+
+
+
+###
+### Bioactivity queries section
+###
+
+# The rows of the queries of cypher_queries.py, from the parameters of these queries
+
+def bioactivity_filter (snapshot, activity_cutoff, activity_type):
+    # ACTIVITY_CUTOFF_FILTER and ACTIVITY_TYPE_FILTER of cypher_queries.py
+    tested_on = snapshot.relationships['TESTED_ON']
+    activity = tested_on.columns['activity']
+    activity_types = tested_on.columns['activity_type']
+
+    def keep (e):
+        if activity_cutoff > 0.0 and not activity[e] <= activity_cutoff:
+            return (False)
+
+        return (activity_type is None or activity_types[e] == activity_type)
+
+    return (keep)
+
+
+def bioactivity_row (snapshot, e):
+    tested_on = snapshot.relationships['TESTED_ON']
+    compound = snapshot.nodes['Compound'].records[tested_on.starts[e]]
+    target = snapshot.nodes['Target'].records[tested_on.ends[e]]
+
+    return ((tested_on.element_ids[e], [compound, target], [tested_on.records[e]]))
+
+
+def compound_rows (snapshot, inchikeys, stereo):
+    return (snapshot.nodes['Compound'].rows (cq.compound_hash_field (stereo), inchikeys))
+
+
+def bioactivity_target (parameters):
+    snapshot = _snapshot
+    tested_on = snapshot.relationships['TESTED_ON']
+    keep = bioactivity_filter (snapshot, parameters['activity_cutoff'], parameters['activity_type'])
+    rows = []
+
+    for t in snapshot.nodes['Target'].rows ('uniprot_id', parameters['uniprot_ids']):
+        rows.extend ([bioactivity_row (snapshot, e) for e in tested_on.incoming (t) if keep (e)])
+
+    return (count_query (rows))
+
+
+def bioactivity_compound (parameters, stereo = True):
+    snapshot = _snapshot
+    tested_on = snapshot.relationships['TESTED_ON']
+    keep = bioactivity_filter (snapshot, parameters['activity_cutoff'], parameters['activity_type'])
+    rows = []
+
+    for c in compound_rows (snapshot, parameters['inchikeys'], stereo):
+        rows.extend ([bioactivity_row (snapshot, e) for e in tested_on.outgoing (c) if keep (e)])
+
+    return (count_query (rows))
+
+
+def bioactivity_c2t (parameters, stereo = True):
+    snapshot = _snapshot
+    tested_on = snapshot.relationships['TESTED_ON']
+    keep = bioactivity_filter (snapshot, 0.0, parameters['activity_type'])
+    targets = set (snapshot.nodes['Target'].rows ('uniprot_id', parameters['uniprot_ids']))
+    rows = []
+
+    for c in compound_rows (snapshot, parameters['inchikeys'], stereo):
+        rows.extend ([bioactivity_row (snapshot, e) for e in tested_on.outgoing (c) if tested_on.ends[e] in targets and keep (e)])
+
+    return (count_query (rows))
+
+
+def potent_compounds (parameters):
+    # rel.activity <= t.activity_cutoff
+    snapshot = _snapshot
+    tested_on = snapshot.relationships['TESTED_ON']
+    activity = tested_on.columns['activity']
+    activity_cutoff = snapshot.nodes['Target'].columns['activity_cutoff']
+    keep = bioactivity_filter (snapshot, 0.0, parameters['activity_type'])
+    rows = []
+
+    for t in snapshot.nodes['Target'].rows ('uniprot_id', parameters['uniprot_ids']):
+        rows.extend ([bioactivity_row (snapshot, e) for e in tested_on.incoming (t) if activity[e] <= activity_cutoff[t] and keep (e)])
+
+    return (count_query (rows))
+
+
+def bioactivities (parameters, stereo = True):
+    # The bioactivities of the compounds of a /path_c2t query, as graph_builder.bioactivities
+    snapshot = _snapshot
+    tested_on = snapshot.relationships['TESTED_ON']
+    keep = bioactivity_filter (snapshot, parameters['activity_cutoff'], parameters['activity_type'])
+    rows = []
+
+    for c in compound_rows (snapshot, parameters['inchikeys'], stereo):
+        for e in tested_on.outgoing (c):
+            if keep (e):
+                key, (compound, target), (bioactivity,) = bioactivity_row (snapshot, e)
+                rows.append ((snapshot.nodes['Target'].element_ids[tested_on.ends[e]], snapshot.nodes['Compound'].element_ids[c], key, compound, bioactivity))
+
+    return (rows)
+
+
+
+###
+### Subgraph queries section
+###
+
+def subgraph_rows (snapshot, sources, direction, endpoint_label, shortest_paths, max_length, frontier = False, state = None):
+    # Paths of the subgraph path engine from the sources to the nodes of endpoint_label (any node if None), as the
+    # subgraph queries; with frontier, a single row with the subgraph of frontier_subgraph.py
+    network = snapshot.mixed
+    max_length = cq.check_max_length (max_length)
+
+    n_targets = len(snapshot.nodes['Target'])
+    ends = {'Target': range (n_targets), 'Compound': range (n_targets, len(network.nodes)), None: None}[endpoint_label]
+
+    if frontier:
+        return (frontier_rows (snapshot, sources, direction, endpoint_label, shortest_paths, max_length))
+
+    paths = []
+
+    for source in sources:
+        if state is not None and state.exhausted ():
+            break
+
+        if not shortest_paths:
+            paths.extend (network.trails (source, ends, direction, max_length, 0.0, state))
+            continue
+
+        # shortestPath to every end node but the source
+        parents = network.bfs (source, direction, max_length)
+
+        for j in parents.keys():
+            if j != source and (ends is None or j in ends):
+                paths.append (regulatory_network.tree_path (parents, j))
+
+    return (count_query (network.rows (paths)))
+
+
+def frontier_rows (snapshot, sources, direction, endpoint_label, shortest_paths, max_length):
+    network = snapshot.mixed
+    adjacency = network.adjacency (direction)
+
+    extractor = frontier_subgraph.FrontierSubgraph ([(i, snapshot.mixed_labels (i)) for i in sources], direction, max_length, endpoint_label, shortest_paths)
+
+    while len(extractor.pending ()) > 0:
+        for i in extractor.pending ():
+            for e, j in network.expand (i, adjacency):
+                extractor.add_relationship (i, e, j, snapshot.mixed_labels (j))
+
+        extractor.next_level ()
+
+    edges = extractor.edges ()
+    nodes = {}
+
+    for e, (i, j) in edges.items():
+        nodes.setdefault (i, network.nodes[i])
+        nodes.setdefault (j, network.nodes[j])
+
+    return (count_query ([(None, list (nodes.values()), [network.edges[e] for e in edges])]))
+
+
+def subgraph_target_induced (parameters, endpoint_type = 'both', explore_mode = 'undirected', shortest_paths = True, max_length = 4, frontier = False, state = None):
+    snapshot = _snapshot
+
+    # The targets are the first nodes of the subgraph path engine
+    sources = snapshot.nodes['Target'].rows ('uniprot_id', parameters['uniprot_ids'])
+    direction = cq.explore_mode_direction (cq.plain_value (explore_mode))
+
+    return (subgraph_rows (snapshot, sources, direction, ENDPOINT_LABELS[cq.plain_value (endpoint_type)], shortest_paths, max_length, frontier, state))
+
+
+def subgraph_compound_induced (parameters, stereo = True, shortest_paths = True, max_length = 4, frontier = False, state = None):
+    # Paths from every compound to the targets within max_length, i.e. the targets collected by the query
+    snapshot = _snapshot
+
+    n_targets = len(snapshot.nodes['Target'])
+    sources = [n_targets + c for c in compound_rows (snapshot, parameters['inchikeys'], stereo)]
+
+    return (subgraph_rows (snapshot, sources, 'out', 'Target', shortest_paths, max_length, frontier, state))
+
+
+
+###
+### Pattern queries section
+###
+
+def islargest_matches (value, is_largest):
+    # rel.islargest = $is_largest OR rel.islargest = toString($is_largest)
+    if isinstance (value, bool):
+        return (value == is_largest)
+
+    return (value == ('true' if is_largest else 'false'))
+
+
+def patterns_of_compounds (parameters, stereo = True):
+    snapshot = _snapshot
+    compounds = snapshot.nodes['Compound']
+    patterns = snapshot.nodes['Pattern']
+    pattern_of = snapshot.relationships['PATTERN_OF']
+
+    pattern_type = parameters['pattern_type']
+    min_ratio = parameters['min_ratio']
+    is_largest = parameters['is_largest']
+
+    pattern_types = patterns.columns['pattern_type']
+    ratio = pattern_of.columns['ratio']
+    islargest = pattern_of.columns['islargest']
+
+    rows = []
+
+    for c in compound_rows (snapshot, parameters['inchikeys'], stereo):
+        # shortestPath: one relationship per compound and pattern
+        seen = set ()
+
+        for e in pattern_of.incoming (c):
+            p = pattern_of.starts[e]
+
+            if p in seen or pattern_type is None or pattern_types[p] != pattern_type:
+                continue
+
+            if min_ratio > 0.0 and not ratio[e] >= min_ratio:
+                continue
+
+            if is_largest is not None and not islargest_matches (islargest[e], is_largest):
+                continue
+
+            seen.add (p)
+            rows.append ((compounds.element_ids[c] + ',' + pattern_of.element_ids[e], [compounds.records[c], patterns.records[p]], [pattern_of.records[e]]))
+
+    return (count_query (rows))
+
+
+def potent_patterns (parameters):
+    snapshot = _snapshot
+    targets = snapshot.nodes['Target']
+    patterns = snapshot.nodes['Pattern']
+    potent_pattern_of = snapshot.relationships['POTENT_PATTERN_OF']
+
+    pattern_type = parameters['pattern_type']
+    pattern_types = patterns.columns['pattern_type']
+
+    rows = []
+
+    for t in targets.rows ('uniprot_id', parameters['uniprot_ids']):
+        # shortestPath: one relationship per pattern and target
+        seen = set ()
+
+        for e in potent_pattern_of.incoming (t):
+            p = potent_pattern_of.starts[e]
+
+            if p in seen or pattern_type is None or pattern_types[p] != pattern_type:
+                continue
+
+            seen.add (p)
+            rows.append ((patterns.element_ids[p] + ',' + potent_pattern_of.element_ids[e], [patterns.records[p], targets.records[t]], [potent_pattern_of.records[e]]))
+
+    return (count_query (rows))
+
+
+def predict (parameters):
+    # Compounds of the potent patterns of the target that were not tested on it, ranked as cypher_queries.predict,
+    # from `offset` (default 0), at most `limit` (default all)
+    snapshot = _snapshot
+    targets = snapshot.nodes['Target']
+    compounds = snapshot.nodes['Compound']
+    patterns = snapshot.nodes['Pattern']
+    tested_on = snapshot.relationships['TESTED_ON']
+    pattern_of = snapshot.relationships['PATTERN_OF']
+    potent_pattern_of = snapshot.relationships['POTENT_PATTERN_OF']
+
+    ranked = []
+
+    for t in targets.rows ('uniprot_id', [parameters['uniprot_id']]):
+        tested = set ([tested_on.starts[e] for e in tested_on.incoming (t)])
+
+        for e1 in potent_pattern_of.incoming (t):
+            p = potent_pattern_of.starts[e1]
+
+            for e2 in pattern_of.outgoing (p):
+                c = pattern_of.ends[e2]
+
+                if c in tested:
+                    continue
+
+                ratio = cypher_float (pattern_of.records[e2].get ('ratio'))
+                rank = (-(ratio if ratio is not None else 0.0), nulls_last (compounds.records[c].get ('hash')), nulls_last (patterns.records[p].get ('pattern_id')), e1, e2)
+
+                ranked.append ((rank, (None, [patterns.records[p], targets.records[t], compounds.records[c]], [potent_pattern_of.records[e1], pattern_of.records[e2]])))
+
+    ranked.sort (key = lambda item: item[0])
+
+    offset = parameters.get ('offset', 0)
+    limit = parameters.get ('limit')
+    rows = [row for rank, row in ranked[offset:offset + limit if limit is not None else None]]
+
+    return (count_query (rows))
+
+
+
+###
+### SMILES section
+###
+
+# The rows of the SMILES queries, as the values of smiles_index.py (None for a key not found)
+
+def smiles_compounds (hashes, stereo = True):
+    snapshot = _snapshot
+    compounds = snapshot.nodes['Compound']
+    values = []
+
+    for compound_hash in hashes:
+        rows = compounds.rows (cq.compound_hash_field (stereo), [compound_hash])
+
+        if len(rows) == 0:
+            values.append (None)
+            continue
+
+        record = min ([compounds.records[c] for c in rows], key = lambda record: nulls_last (record.get ('hash')))
+        values.append ({'smiles': record.get ('smiles'), 'inchikey': record.get ('hash'), 'nsinchikey': record.get ('nostereo_hash')})
+
+    return (values)
+
+
+def smiles_patterns (pattern_ids):
+    snapshot = _snapshot
+    patterns = snapshot.nodes['Pattern']
+    values = []
+
+    for pattern_id in pattern_ids:
+        rows = patterns.rows ('pattern_id', [pattern_id])
+
+        if len(rows) == 0:
+            values.append (None)
+            continue
+
+        record = patterns.records[rows[0]]
+        values.append ({'smiles': record.get ('smiles'), 'inchikey': record.get ('hash'), 'pattern_type': record.get ('pattern_type'), 'pattern_id': record.get ('pattern_id'), 'uuid': record.get ('uuid')})
+
+    return (values)
@@ -0,0 +1,256 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: http://graphml.graphdrawing.org/specification.html
+# Ref: https://networkx.org/documentation/stable/reference/readwrite/generated/networkx.readwrite.graphml.generate_graphml.html
+# Ref: https://docs.python.org/3/library/xml.etree.elementtree.html
+#
+#
+# Incremental GraphML serialiser of the SmartGraph JSON graphs ({'nodes': [...], 'edges': [...]}).
+#
+# The document is written directly from the node and edge records as a sequence of byte chunks, i.e. without building
+# an nx.DiGraph and an XML tree first. The output is identical to the one of the networkx based serialisation used
+# before (benchmark.to_graphml_networkx, compared in tests/test_graphml_writer.py), including its DiGraph semantics:
+#
+#   - list properties are joined by commas,
+#   - edges with the same start and end node are merged into one edge (properties of later edges win),
+#   - nodes referenced by edges only are written without properties,
+#   - edges are ordered by their start node.
+#
+# Except for line breaks in text values: the networkx serialisation joined the lines of nx.generate_graphml without
+# separators, which dropped them. They are kept here.
+#
+# GraphML requires the <key> elements before the graph, so the records are read twice: first to collect the keys
+# and to find the merged edges, then to write the nodes and edges.
+#
+
+NS_GRAPHML = 'http://graphml.graphdrawing.org/xmlns'
+NS_XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+SCHEMA_LOCATION = 'http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd'
+
+XML_TYPES = {
+    bool: 'boolean',
+    int: 'long',
+    float: 'double',
+    str: 'string'
+}
+
+VALID_NODE_TYPES = ['target', 'compound', 'pattern']
+VALID_EDGE_TYPES = ['tested_on', 'regulates', 'pattern_of', 'potent_pattern_of']
+
+CHUNK_SIZE = 64 * 1024
+
+
+def escape_text (text):
+    if '&' not in text and '<' not in text and '>' not in text:
+        return (text)
+
+    return (text.replace ('&', '&amp;').replace ('<', '&lt;').replace ('>', '&gt;'))
+
+
+def escape_attribute (text):
+    text = escape_text (text).replace ('"', '&quot;')
+
+    return (text.replace ('\r', '&#13;').replace ('\n', '&#10;').replace ('\t', '&#09;'))
+
+
+def property_value (v):
+    if type(v) is list:
+        return (','.join ([str(x) for x in v]))
+
+    return (v)
+
+
+def node_properties (n):
+    if n['node_type'] not in VALID_NODE_TYPES:
+        raise Exception ("Invalid node type found: %s. Terminating ..." % (n['node_type']))
+
+    return ({str(k): property_value (v) for k, v in n.items()})
+
+
+def edge_properties (e):
+    if e['edge_type'] not in VALID_EDGE_TYPES:
+        raise Exception ("Invalid edge type found: %s. Terminating ..." % (e['edge_type']))
+
+    # Same attribute order as in smartgraph.process_edges, i.e. start_node and end_node first.
+    properties = {'start_node': e['start_node'], 'end_node': e['end_node']}
+
+    for k, v in e.items():
+        properties[str(k)] = property_value (v)
+
+    return (properties)
+
+
+def merge_properties (records, indices, properties_fn):
+    if len(indices) == 1:
+        return (properties_fn (records[indices[0]]))
+
+    properties = {}
+
+    for i in indices:
+        properties.update (properties_fn (records[i]))
+
+    return (properties)
+
+
+class KeyTable:
+
+    def __init__ (self):
+        self.keys = {}
+
+        # (name, Python type) -> (opening tag, empty element) of the data elements, per scope
+        self.tags = {'node': {}, 'edge': {}}
+
+
+    def tag (self, name, value, scope):
+        xml_type = XML_TYPES.get (type(value))
+
+        if xml_type is None:
+            raise Exception ("[ERROR]: GraphML writer does not support %s as data values." % (type(value)))
+
+        key_id = self.keys.get ((name, xml_type, scope))
+
+        if key_id is None:
+            key_id = 'd%d' % (len(self.keys))
+            self.keys[(name, xml_type, scope)] = key_id
+
+        tag = ('      <data key="%s">' % (key_id), '      <data key="%s" />' % (key_id))
+        self.tags[scope][(name, type(value))] = tag
+
+        return (tag)
+
+
+    def add (self, properties, scope):
+        tags = self.tags[scope]
+
+        for name, value in properties.items():
+            if (name, type(value)) not in tags:
+                self.tag (name, value, scope)
+
+
+    def elements (self):
+        # networkx inserts every new key in front of the previous ones
+        for (name, xml_type, scope), key_id in reversed (list (self.keys.items())):
+            yield ('  <key id="%s" for="%s" attr.name="%s" attr.type="%s" />' % (key_id, scope, escape_attribute (name), xml_type))
+
+
+def plan (G_json):
+    nodes = G_json['nodes']
+    edges = G_json['edges']
+
+    # Node ID -> indices of its records, in order of first appearance (records first, then edge ends)
+    node_records = {}
+
+    for i, n in enumerate (nodes):
+        node_records.setdefault (n['node_id'], []).append (i)
+
+    # (start, end) -> indices of the merged edge records, in order of first appearance
+    edge_records = {}
+
+    for i, e in enumerate (edges):
+        start_node = e['start_node']
+        end_node = e['end_node']
+
+        node_records.setdefault (start_node, [])
+        node_records.setdefault (end_node, [])
+        edge_records.setdefault ((start_node, end_node), []).append (i)
+
+    node_position = {node_id: i for i, node_id in enumerate (node_records.keys())}
+
+    # nx.DiGraph iterates the edges grouped by start node (in node order), then by first appearance
+    edge_order = sorted (edge_records.keys(), key = lambda pair: node_position[pair[0]])
+
+    return (node_records, edge_records, edge_order)
+
+
+def data_elements (properties, keys, scope):
+    tags = keys.tags[scope]
+    out = []
+
+    for name, value in properties.items():
+        tag = tags.get ((name, type(value)))
+
+        if tag is None:
+            tag = keys.tag (name, value, scope)
+
+        text = value if type(value) is str else str(value)
+
+        if text == '':
+            out.append (tag[1])
+        else:
+            out.append (tag[0] + escape_text (text) + '</data>')
+
+    return (''.join(out))
+
+
+def generate_graphml (G_json, chunk_size = CHUNK_SIZE):
+    nodes = G_json['nodes']
+    edges = G_json['edges']
+
+    node_records, edge_records, edge_order = plan (G_json)
+
+    keys = KeyTable ()
+
+    for node_id, indices in node_records.items():
+        keys.add (merge_properties (nodes, indices, node_properties), 'node')
+
+    for pair in edge_order:
+        keys.add (merge_properties (edges, edge_records[pair], edge_properties), 'edge')
+
+    buffer = []
+    size = 0
+
+    buffer.append ('<graphml xmlns="%s" xmlns:xsi="%s" xsi:schemaLocation="%s">' % (NS_GRAPHML, NS_XSI, SCHEMA_LOCATION))
+    buffer.extend (keys.elements ())
+
+    if len(node_records) == 0:
+        buffer.append ('  <graph edgedefault="directed" />')
+        buffer.append ('</graphml>')
+
+        yield (''.join(buffer).encode ('utf-8'))
+        return
+
+    buffer.append ('  <graph edgedefault="directed">')
+
+    for node_id, indices in node_records.items():
+        properties = merge_properties (nodes, indices, node_properties)
+
+        if len(properties) == 0:
+            element = '    <node id="%s" />' % (escape_attribute (str(node_id)))
+        else:
+            element = '    <node id="%s">%s    </node>' % (escape_attribute (str(node_id)), data_elements (properties, keys, 'node'))
+
+        buffer.append (element)
+        size += len(element)
+
+        if size >= chunk_size:
+            yield (''.join(buffer).encode ('utf-8'))
+            buffer = []
+            size = 0
+
+    for pair in edge_order:
+        properties = merge_properties (edges, edge_records[pair], edge_properties)
+
+        element = '    <edge source="%s" target="%s">%s    </edge>' % (escape_attribute (str(pair[0])), escape_attribute (str(pair[1])),
+                                                                      data_elements (properties, keys, 'edge'))
+
+        buffer.append (element)
+        size += len(element)
+
+        if size >= chunk_size:
+            yield (''.join(buffer).encode ('utf-8'))
+            buffer = []
+            size = 0
+
+    buffer.append ('  </graph>')
+    buffer.append ('</graphml>')
+
+    yield (''.join(buffer).encode ('utf-8'))
+
+
+def to_graphml (G_json):
+    return (b''.join (generate_graphml (G_json)).decode ('utf-8'))
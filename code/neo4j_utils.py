@@ -8,10 +8,15 @@
 #
 # References
 #
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#driver-configuration
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#sessions-transactions
+# Ref: https://docs.python.org/3/library/contextlib.html#contextlib.contextmanager
+# Ref: https://neo4j.com/docs/api/python-driver/current/async_api.html
 #
 
 import neo4j
 from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase
 
 
 ###
@@ -19,6 +24,12 @@ from neo4j import GraphDatabase
 ###
 
 import os
+import threading
+import time
+
+from contextlib import contextmanager
+from contextlib import asynccontextmanager
+
 
 def read_neo4j_config():
         db_par = {}
@@ -27,6 +38,11 @@ def read_neo4j_config():
         db_par['user'] = os.environ['neo4j_user']
         db_par['pwd'] = os.environ['neo4j_password']
 
+        # Connection pool settings, see template_config/.all_config_env for the deployment values
+        db_par['max_connection_pool_size'] = int(os.environ.get('neo4j_max_connection_pool_size', 100))
+        db_par['connection_acquisition_timeout'] = float(os.environ.get('neo4j_connection_acquisition_timeout', 60.0))
+        db_par['max_connection_lifetime'] = float(os.environ.get('neo4j_max_connection_lifetime', 1000))
+
         return (db_par)
 
 
@@ -34,7 +50,161 @@ def open_neo4j_connection ():
     conn_pars = read_neo4j_config ()
 
     neo4j_uri = "bolt://" + conn_pars['host'] + ":" + conn_pars['port']
-    
-    conn = GraphDatabase.driver(neo4j_uri, auth=(conn_pars['user'], conn_pars['pwd']), max_connection_lifetime=1000)
 
-    return (conn)
\ No newline at end of file
+    conn = GraphDatabase.driver(neo4j_uri, auth=(conn_pars['user'], conn_pars['pwd']),
+                                max_connection_lifetime=conn_pars['max_connection_lifetime'],
+                                max_connection_pool_size=conn_pars['max_connection_pool_size'],
+                                connection_acquisition_timeout=conn_pars['connection_acquisition_timeout'])
+
+    return (conn)
+
+
+def open_neo4j_async_connection ():
+    conn_pars = read_neo4j_config ()
+
+    neo4j_uri = "bolt://" + conn_pars['host'] + ":" + conn_pars['port']
+
+    conn = AsyncGraphDatabase.driver(neo4j_uri, auth=(conn_pars['user'], conn_pars['pwd']),
+                                max_connection_lifetime=conn_pars['max_connection_lifetime'],
+                                max_connection_pool_size=conn_pars['max_connection_pool_size'],
+                                connection_acquisition_timeout=conn_pars['connection_acquisition_timeout'])
+
+    return (conn)
+
+
+
+###
+### Process-wide driver section
+###
+
+# A single driver (and thus a single Bolt connection pool) is shared by all queries of the process.
+# The driver is created on first use and closed by the shutdown hook of the API (see server.py).
+# The API endpoints use the asyncio driver, the blocking driver serves smartgraph.py users (test.py, notebooks).
+
+_driver = None
+_driver_lock = threading.Lock()
+
+_async_driver = None
+
+_pool_metrics_lock = threading.Lock()
+_pool_metrics = {
+    'sessions_opened': 0,
+    'sessions_active': 0,
+    'sessions_peak': 0,
+    'session_errors': 0,
+    'session_time_total_s': 0.0
+}
+
+
+def get_neo4j_driver ():
+    global _driver
+
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = open_neo4j_connection ()
+
+    return (_driver)
+
+
+def close_neo4j_driver ():
+    global _driver
+
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+@contextmanager
+def neo4j_session (**session_config):
+    driver = get_neo4j_driver ()
+
+    with _pool_metrics_lock:
+        _pool_metrics['sessions_opened'] += 1
+        _pool_metrics['sessions_active'] += 1
+        _pool_metrics['sessions_peak'] = max (_pool_metrics['sessions_peak'], _pool_metrics['sessions_active'])
+
+    start = time.perf_counter()
+
+    try:
+        with driver.session(**session_config) as session:
+            yield (session)
+
+    except Exception:
+        with _pool_metrics_lock:
+            _pool_metrics['session_errors'] += 1
+        raise
+
+    finally:
+        with _pool_metrics_lock:
+            _pool_metrics['sessions_active'] -= 1
+            _pool_metrics['session_time_total_s'] += time.perf_counter() - start
+
+
+def get_neo4j_async_driver ():
+    # The asyncio driver is bound to the event loop it is used from, i.e. the one of the API process.
+    global _async_driver
+
+    if _async_driver is None:
+        with _driver_lock:
+            if _async_driver is None:
+                _async_driver = open_neo4j_async_connection ()
+
+    return (_async_driver)
+
+
+async def close_neo4j_async_driver ():
+    global _async_driver
+
+    # The driver is detached under the lock of get_neo4j_async_driver, and closed outside of it (awaiting while
+    # holding a threading.Lock would block the other threads)
+    with _driver_lock:
+        driver = _async_driver
+        _async_driver = None
+
+    if driver is not None:
+        await driver.close()
+
+
+@asynccontextmanager
+async def neo4j_async_session (**session_config):
+    driver = get_neo4j_async_driver ()
+
+    with _pool_metrics_lock:
+        _pool_metrics['sessions_opened'] += 1
+        _pool_metrics['sessions_active'] += 1
+        _pool_metrics['sessions_peak'] = max (_pool_metrics['sessions_peak'], _pool_metrics['sessions_active'])
+
+    start = time.perf_counter()
+
+    try:
+        async with driver.session(**session_config) as session:
+            yield (session)
+
+    except Exception:
+        with _pool_metrics_lock:
+            _pool_metrics['session_errors'] += 1
+        raise
+
+    finally:
+        with _pool_metrics_lock:
+            _pool_metrics['sessions_active'] -= 1
+            _pool_metrics['session_time_total_s'] += time.perf_counter() - start
+
+
+def get_pool_metrics ():
+    conn_pars = read_neo4j_config ()
+
+    with _pool_metrics_lock:
+        metrics = dict (_pool_metrics)
+
+    # A session holds at most one pooled connection at a time, so active sessions approximate the connections in use.
+    metrics['max_connection_pool_size'] = conn_pars['max_connection_pool_size']
+    metrics['connection_acquisition_timeout'] = conn_pars['connection_acquisition_timeout']
+    metrics['max_connection_lifetime'] = conn_pars['max_connection_lifetime']
+    metrics['pool_utilisation'] = metrics['sessions_active'] / conn_pars['max_connection_pool_size']
+    metrics['driver_initialised'] = _driver is not None
+    metrics['async_driver_initialised'] = _async_driver is not None
+
+    return (metrics)
@@ -0,0 +1,196 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://use-the-index-luke.com/no-offset
+# Ref: https://neo4j.com/docs/cypher-manual/current/functions/scalar/#functions-elementid
+# Ref: https://docs.python.org/3/library/base64.html#base64.urlsafe_b64encode
+#
+#
+# Cursor based pagination of the graph endpoints.
+#
+# A paged query returns the rows of the endpoint query (bioactivities, paths, ...) in a deterministic order, a page is
+# the graph of `page_size` consecutive rows (see the pagination section of cypher_queries.py). The next page starts
+# after the sort key of the last row of the previous one (keyset pagination), so every page is a bounded query in its
+# own transaction, and pages do not shift when earlier rows are skipped. A node reached by rows of several pages is in
+# each of these pages.
+#
+# Clients receive the position of the next page as an opaque cursor, `next_cursor` (null on the last page) in JSON
+# responses and the X-Next-Cursor header otherwise. A cursor encodes the sort key, the page size and a fingerprint of
+# the endpoint query and its parameters (and of the data of the graph snapshot, if loaded): it is only valid for the
+# request it was issued for.
+#
+# Configuration (environment):
+#
+#   - sg_page_size_default: page size if a cursor is requested without a page size. Default: 1000
+#   - sg_page_size_max: maximal page size (rows), larger page sizes are reduced to it. Default: 10000
+#   - sg_page_rows_entries: number of row lists of the row endpoints kept for their next pages (see below). Default: 16
+#   - sg_page_rows_ttl: seconds a row list is kept after it was computed. Default: 600
+#
+
+import base64
+import hashlib
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+import orjson
+
+import graph_snapshot
+import request_errors
+import result_cache
+
+
+def read_pagination_config ():
+    pagination_par = {}
+    pagination_par['page_size_default'] = int(os.environ.get('sg_page_size_default', 1000))
+    pagination_par['page_size_max'] = int(os.environ.get('sg_page_size_max', 10000))
+    pagination_par['page_rows_entries'] = int(os.environ.get('sg_page_rows_entries', 16))
+    pagination_par['page_rows_ttl'] = float(os.environ.get('sg_page_rows_ttl', 600.0))
+
+    return (pagination_par)
+
+
+pagination_par = read_pagination_config ()
+
+
+
+class PageRequest:
+
+    def __init__ (self, page_size = None, cursor = None):
+        self.page_size = page_size
+        self.cursor = cursor
+
+
+
+class Page:
+
+    # A page of a non-JSON export (GraphML, Arrow, Parquet), the next cursor is sent as a header (see server.py)
+
+    def __init__ (self, content, next_cursor):
+        self.content = content
+        self.next_cursor = next_cursor
+
+
+
+def page_request (page_size = None, cursor = None):
+    # None if the request is not paged
+    if page_size is None and cursor is None:
+        return (None)
+
+    return (PageRequest (page_size, cursor))
+
+
+def fingerprint (endpoint, query, parameters, *options):
+    # With the graph snapshot, the pages of a query are pages of the rows of one snapshot: the fingerprint of its data is
+    # part of the query fingerprint (not normalised as the options, the order of its counts matters), cursors issued
+    # before a reload are rejected
+    key = result_cache.make_key (endpoint, query, parameters, *options)
+
+    return (hashlib.sha256 (orjson.dumps ([key, graph_snapshot.loaded_fingerprint ()])).hexdigest()[:16])
+
+
+def encode_cursor (query_fingerprint, after, page_size):
+    token = orjson.dumps ([query_fingerprint, after, page_size])
+
+    return (base64.urlsafe_b64encode (token).decode ('ascii').rstrip ('='))
+
+
+def decode_cursor (cursor, query_fingerprint):
+    try:
+        token = orjson.loads (base64.urlsafe_b64decode (cursor + '=' * (-len(cursor) % 4)))
+        cursor_fingerprint, after, page_size = token
+
+    except Exception:
+        raise request_errors.InvalidRequest ("[ERROR]: Invalid cursor.")
+
+    if cursor_fingerprint != query_fingerprint:
+        raise request_errors.InvalidRequest ("[ERROR]: The cursor was issued for a different query.")
+
+    return (after, page_size)
+
+
+def page_size (requested):
+    if requested is None:
+        requested = pagination_par['page_size_default']
+
+    requested = int(requested)
+
+    if requested < 1:
+        raise request_errors.InvalidRequest ("[ERROR]: `page_size` has to be at least 1.")
+
+    return (min (requested, pagination_par['page_size_max']))
+
+
+def resolve (page, query_fingerprint):
+    # Returns the sort key to start after (None for the first page) and the page size of a page request
+    after = None
+    size = page.page_size
+
+    if page.cursor is not None:
+        after, cursor_size = decode_cursor (page.cursor, query_fingerprint)
+
+        if size is None:
+            size = cursor_size
+
+    return (after, page_size (size))
+
+
+
+###
+### Row lists section
+###
+
+# The row endpoints (see smartgraph_async.rows_graph_endpoint) compute all rows of a query locally, a page is a slice
+# of the sorted rows. The sorted rows are kept by query fingerprint, the next pages of the query are sliced from the
+# same list instead of computing and sorting the rows again. The least recently used lists are dropped.
+
+_rows_lock = threading.Lock()
+_rows = OrderedDict()
+
+
+def cached_rows (query_fingerprint):
+    # (sorted rows, their keys) of a query, None if not kept
+    with _rows_lock:
+        entry = _rows.get (query_fingerprint)
+
+        if entry is None:
+            return (None)
+
+        expires_at, rows, keys = entry
+
+        if expires_at <= time.monotonic():
+            del _rows[query_fingerprint]
+            return (None)
+
+        _rows.move_to_end (query_fingerprint)
+
+        return ((rows, keys))
+
+
+def store_rows (query_fingerprint, rows):
+    # rows: the rows of a query sorted by key. The keys are kept next to the rows, a page starts after the key of the
+    # cursor (bisect of the keys, bisect has no key function before Python 3.10). Returns (rows, keys).
+    keys = [row[0] for row in rows]
+
+    if pagination_par['page_rows_entries'] < 1:
+        return ((rows, keys))
+
+    with _rows_lock:
+        _rows[query_fingerprint] = (time.monotonic() + pagination_par['page_rows_ttl'], rows, keys)
+        _rows.move_to_end (query_fingerprint)
+
+        while len(_rows) > pagination_par['page_rows_entries']:
+            _rows.popitem (last = False)
+
+    return ((rows, keys))
+
+
+def clear_rows ():
+    with _rows_lock:
+        _rows.clear ()
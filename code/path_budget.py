@@ -0,0 +1,154 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#neo4j.unit_of_work
+# Ref: https://neo4j.com/docs/operations-manual/current/database-internals/transaction-management/#transaction-management-timeout
+# Ref: https://neo4j.com/docs/cypher-manual/current/clauses/limit/
+# Ref: https://docs.python.org/3/library/time.html#time.monotonic
+#
+#
+# Budgets of the all-paths searches (`shortest_paths=False`) of /path_regulatory, /path_c2t, /subgraph_target_induced
+# and /subgraph_compound_induced.
+#
+# Enumerating all paths of up to max_length relationships grows exponentially with max_length through the hub targets of
+# the network. A budget bounds the enumeration, the result holds the paths found until the budget ran out:
+#
+#   - max_paths: maximal number of result rows (paths). The Cypher queries get a `LIMIT` of max_paths + 1 rows, the
+#     extra row only tells that the result is truncated.
+#   - max_expanded_edges: maximal number of relationships followed by the search. Only enforced by the in-memory
+#     regulatory network (see regulatory_network.py), Cypher has no equivalent.
+#   - timeout: wall clock time of the search in seconds. The records of the Cypher queries are read until the deadline,
+#     and the transaction gets a timeout of a few seconds more, which ends the query on the server if no record
+#     arrives in time.
+#
+# Bounded results are JSON graphs with `truncated` (whether a budget ran out) and `path_stats` (number of paths,
+# relationships followed, seconds, the budget that ran out and the engine), or the X-Truncated and X-Path-Stats headers
+# of the other formats (see server.py). They are not cached, a truncated result depends on the load of the server.
+#
+# Configuration (environment):
+#
+#   - sg_path_budget_max_paths: max_paths of a budget that does not set it. Default: 10000
+#   - sg_path_budget_max_expanded_edges: max_expanded_edges of a budget that does not set it. Default: 10000000
+#   - sg_path_budget_timeout: timeout of a budget that does not set it (seconds). Default: 30
+#   - sg_path_budget_timeout_grace: seconds added to the transaction timeout of the Cypher queries. Default: 5
+#
+
+import os
+import time
+
+import request_errors
+
+
+def read_path_budget_config ():
+    budget_par = {}
+    budget_par['max_paths'] = int(os.environ.get('sg_path_budget_max_paths', 10000))
+    budget_par['max_expanded_edges'] = int(os.environ.get('sg_path_budget_max_expanded_edges', 10000000))
+    budget_par['timeout'] = float(os.environ.get('sg_path_budget_timeout', 30))
+    budget_par['timeout_grace'] = float(os.environ.get('sg_path_budget_timeout_grace', 5))
+
+    return (budget_par)
+
+
+budget_par = read_path_budget_config ()
+
+
+
+class PathBudget:
+
+    def __init__ (self, max_paths = None, max_expanded_edges = None, timeout = None):
+        try:
+            self.max_paths = int(max_paths) if max_paths is not None else budget_par['max_paths']
+            self.max_expanded_edges = int(max_expanded_edges) if max_expanded_edges is not None else budget_par['max_expanded_edges']
+            self.timeout = float(timeout) if timeout is not None else budget_par['timeout']
+
+            valid = self.max_paths >= 1 and self.max_expanded_edges >= 1 and self.timeout > 0.0
+
+        except (TypeError, ValueError):
+            valid = False
+
+        if not valid:
+            raise request_errors.InvalidRequest ("[ERROR]: `max_paths`, `max_expanded_edges` and `timeout` have to be positive.")
+
+
+    def options (self):
+        # The budget as options of the fingerprints and cache keys of the queries
+        return ((self.max_paths, self.max_expanded_edges, self.timeout))
+
+
+    def transaction_timeout (self):
+        return (self.timeout + budget_par['timeout_grace'])
+
+
+
+class BudgetState:
+
+    # Use of a budget by a search. exhausted () is checked by the search before every step.
+
+    def __init__ (self, budget, engine):
+        self.budget = budget
+        self.engine = engine
+
+        self.paths = 0
+        self.expanded_edges = 0
+        self.truncated_by = None
+
+        self.started = time.monotonic()
+        self.deadline = self.started + budget.timeout
+
+
+    def exhausted (self):
+        if self.truncated_by is not None:
+            return (True)
+
+        # As with the LIMIT of the Cypher queries, one path more than max_paths tells that the result is truncated
+        if self.paths > self.budget.max_paths:
+            self.truncated_by = 'max_paths'
+
+        elif self.expanded_edges >= self.budget.max_expanded_edges:
+            self.truncated_by = 'max_expanded_edges'
+
+        elif time.monotonic() > self.deadline:
+            self.truncated_by = 'timeout'
+
+        return (self.truncated_by is not None)
+
+
+    def truncate (self, truncated_by):
+        self.truncated_by = truncated_by
+
+
+    def stats (self):
+        stats = {
+            'paths': self.paths,
+            'expanded_edges': self.expanded_edges if self.engine != 'neo4j' else None,
+            'seconds': round (time.monotonic() - self.started, 3),
+            'truncated_by': self.truncated_by,
+            'engine': self.engine
+        }
+
+        return (stats)
+
+
+
+class Bounded:
+
+    # A bounded result of a non-JSON export (GraphML, Arrow, Parquet), the flag and statistics are sent as headers
+    # (see server.py)
+
+    def __init__ (self, content, truncated, stats):
+        self.content = content
+        self.truncated = truncated
+        self.stats = stats
+
+
+
+def path_budget (max_paths = None, max_expanded_edges = None, timeout = None):
+    # None if the request sets no budget
+    if max_paths is None and max_expanded_edges is None and timeout is None:
+        return (None)
+
+    return (PathBudget (max_paths, max_expanded_edges, timeout))
@@ -0,0 +1,357 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://docs.python.org/3/library/sqlite3.html
+# Ref: https://www.sqlite.org/withoutrowid.html
+# Ref: https://www.sqlite.org/wal.html
+# Ref: https://neo4j.com/docs/cypher-manual/current/subqueries/count/
+#
+#
+# Precomputed prediction table of the `/predict` endpoint.
+#
+# The "potent pattern"-based predictions of a target (pattern -[POTENT_PATTERN_OF]-> target, pattern -[PATTERN_OF]->
+# compound, the compound not tested on the target) are computed offline, ranked by the overlap ratio of the pattern and
+# the compound (see PREDICTION_RANK in cypher_queries.py) and stored in a SQLite database. The endpoint then reads a page
+# of a target (offset, limit) by its primary key, instead of running the traversal and the anti-join on every call.
+# Targets not in the table (e.g. not refreshed yet) are computed by Neo4j, with the same ranking.
+#
+# Tables:
+#
+#   - targets: uniprot_id, the fingerprint of the target (its numbers of potent patterns and tested compounds), the
+#              number of predictions and the time of the last refresh,
+#   - predictions: (uniprot_id, rank) -> pattern_id, compound_id, ratio, the uuids of the two edges,
+#   - nodes, edges: the SmartGraph JSON records of the nodes and edges referenced by the predictions.
+#
+# Refresh (offline job, run against the Neo4j instance configured in the environment, see neo4j_utils.py):
+#
+#   python prediction_store.py all                       all targets with potent patterns
+#   python prediction_store.py stale                     new targets, and targets whose fingerprint changed
+#   python prediction_store.py targets <uniprot_id> ...  the given targets
+#   python prediction_store.py compounds <hash> ...      targets whose predictions involve the given compounds
+#   python prediction_store.py patterns <pattern_id> ... targets of the given patterns
+#
+# Every target is replaced in one transaction, so the API can serve from the database while it is refreshed. Targets
+# that have no potent patterns anymore are removed from the table.
+#
+# Configuration (environment):
+#
+#   - sg_prediction_db: path of the SQLite database, empty disables the prediction table. Default: '' (disabled)
+#
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import orjson
+
+import cypher_queries as cq
+import graph_builder
+import graph_records
+import neo4j_utils
+
+
+def read_prediction_config ():
+    prediction_par = {}
+    prediction_par['db'] = os.environ.get('sg_prediction_db', '').strip()
+
+    return (prediction_par)
+
+
+
+###
+### Store section
+###
+
+class PredictionStore:
+
+    def __init__ (self, path):
+        self.path = path
+        self.local = threading.local()
+
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("CREATE TABLE IF NOT EXISTS targets (uniprot_id TEXT PRIMARY KEY, potent_patterns INTEGER, tested_compounds INTEGER, n_predictions INTEGER NOT NULL, refreshed_at REAL NOT NULL)")
+            conn.execute ("CREATE TABLE IF NOT EXISTS predictions (uniprot_id TEXT NOT NULL, rank INTEGER NOT NULL, pattern_id TEXT NOT NULL, compound_id TEXT NOT NULL, ratio REAL NOT NULL, "
+                          "potent_pattern_of TEXT NOT NULL, pattern_of TEXT NOT NULL, PRIMARY KEY (uniprot_id, rank)) WITHOUT ROWID")
+            conn.execute ("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, record BLOB NOT NULL) WITHOUT ROWID")
+            conn.execute ("CREATE TABLE IF NOT EXISTS edges (uuid TEXT PRIMARY KEY, record BLOB NOT NULL) WITHOUT ROWID")
+
+
+    def connection (self):
+        # sqlite3 connections can not be shared between threads, each thread opens its own one.
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect (self.path, timeout = 30.0)
+            conn.execute ("PRAGMA journal_mode=WAL")
+            conn.execute ("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return (conn)
+
+
+    def replace_target (self, uniprot_id, fingerprint, rows, nodes, edges):
+        # rows: (pattern_id, compound_id, ratio, potent_pattern_of uuid, pattern_of uuid) in rank order,
+        # nodes: node_id -> record, edges: uuid -> record
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("DELETE FROM predictions WHERE uniprot_id = ?", (uniprot_id,))
+            conn.executemany ("INSERT INTO predictions (uniprot_id, rank, pattern_id, compound_id, ratio, potent_pattern_of, pattern_of) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              [(uniprot_id, rank) + tuple (row) for rank, row in enumerate (rows)])
+            conn.executemany ("INSERT OR REPLACE INTO nodes (node_id, record) VALUES (?, ?)",
+                              [(node_id, orjson.dumps (record, default = graph_records.default)) for node_id, record in nodes.items()])
+            conn.executemany ("INSERT OR REPLACE INTO edges (uuid, record) VALUES (?, ?)",
+                              [(uuid, orjson.dumps (record, default = graph_records.default)) for uuid, record in edges.items()])
+            conn.execute ("INSERT OR REPLACE INTO targets (uniprot_id, potent_patterns, tested_compounds, n_predictions, refreshed_at) VALUES (?, ?, ?, ?, ?)",
+                          (uniprot_id, fingerprint[0], fingerprint[1], len(rows), time.time()))
+
+
+    def remove_target (self, uniprot_id):
+        # Targets without potent patterns: they are not in the table anymore, the API falls back to Neo4j for them
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("DELETE FROM predictions WHERE uniprot_id = ?", (uniprot_id,))
+            conn.execute ("DELETE FROM targets WHERE uniprot_id = ?", (uniprot_id,))
+
+
+    def remove_unreferenced (self):
+        # Nodes and edges of predictions that were replaced
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("DELETE FROM nodes WHERE node_id NOT IN (SELECT uniprot_id FROM targets UNION SELECT pattern_id FROM predictions UNION SELECT compound_id FROM predictions)")
+            conn.execute ("DELETE FROM edges WHERE uuid NOT IN (SELECT potent_pattern_of FROM predictions UNION SELECT pattern_of FROM predictions)")
+
+
+    def fingerprints (self):
+        conn = self.connection ()
+
+        return ({row[0]: (row[1], row[2]) for row in conn.execute ("SELECT uniprot_id, potent_patterns, tested_compounds FROM targets")})
+
+
+    def records (self, table, key_column, keys):
+        conn = self.connection ()
+        records = {}
+        keys = list (keys)
+
+        # Within the default limit of SQLite host parameters
+        for start in range (0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = "SELECT %s, record FROM %s WHERE %s IN (%s)" % (key_column, table, key_column, ','.join (['?'] * len(chunk)))
+
+            for key, record in conn.execute (query, chunk):
+                records[key] = orjson.loads (record)
+
+        return (records)
+
+
+    def size (self, uniprot_id):
+        # Number of predictions of a target, None if the target is not in the table
+        row = self.connection ().execute ("SELECT n_predictions FROM targets WHERE uniprot_id = ?", (uniprot_id,)).fetchone ()
+
+        return (row[0] if row is not None else None)
+
+
+    def page (self, uniprot_id, offset = 0, limit = 300):
+        # Returns the SmartGraph JSON graph of the predictions of rank offset .. offset + limit - 1 (all from offset if
+        # limit <= 0), None if the target is not in the table.
+        conn = self.connection ()
+
+        if conn.execute ("SELECT 1 FROM targets WHERE uniprot_id = ?", (uniprot_id,)).fetchone () is None:
+            return (None)
+
+        end = offset + limit if limit > 0 else sys.maxsize
+
+        rows = conn.execute ("SELECT pattern_id, compound_id, potent_pattern_of, pattern_of FROM predictions WHERE uniprot_id = ? AND rank >= ? AND rank < ? ORDER BY rank",
+                             (uniprot_id, offset, end)).fetchall ()
+
+        node_ids = {}
+        edge_ids = {}
+
+        for pattern_id, compound_id, potent_pattern_of, pattern_of in rows:
+            # Nodes and edges in order of appearance, as in the graphs built from Neo4j
+            node_ids[pattern_id] = True
+            node_ids[uniprot_id] = True
+            edge_ids[potent_pattern_of] = True
+            node_ids[compound_id] = True
+            edge_ids[pattern_of] = True
+
+        nodes = self.records ('nodes', 'node_id', node_ids.keys())
+        edges = self.records ('edges', 'uuid', edge_ids.keys())
+
+        G_json = {}
+        G_json['nodes'] = [nodes[node_id] for node_id in node_ids.keys() if node_id in nodes]
+        G_json['edges'] = [edges[uuid] for uuid in edge_ids.keys() if uuid in edges]
+
+        return (G_json)
+
+
+    def get_metrics (self):
+        conn = self.connection ()
+
+        metrics = {}
+        metrics['targets'], metrics['predictions'], metrics['last_refresh'] = conn.execute ("SELECT COUNT(*), COALESCE(SUM(n_predictions), 0), MAX(refreshed_at) FROM targets").fetchone ()
+
+        return (metrics)
+
+
+
+###
+### Refresh section
+###
+
+def compute_target (session, uniprot_id):
+    # Returns the ranked rows, nodes and edges of the predictions of a target
+    def work (tx):
+        builder = graph_builder.GraphBuilder ()
+        rows = []
+
+        for record in tx.run (cq.PREDICTION_ROWS, uniprot_id = uniprot_id):
+            builder.add_values ([record['t'], record['p'], record['c'], record['r1'], record['r2']])
+
+            rows.append ((builder.node_ids[record['p'].element_id], builder.node_ids[record['c'].element_id], record['ratio'],
+                          builder.edge_ids[record['r1'].element_id], builder.edge_ids[record['r2'].element_id]))
+
+        return (rows, builder.nodes, builder.edges)
+
+    rows, nodes, edges = session.execute_read (work)
+
+    # Same order as PREDICTION_RANK in cypher_queries.py: ratio (descending), compound, pattern
+    rows.sort (key = lambda row: (-row[2], row[1], row[0]))
+
+    return (rows, nodes, edges)
+
+
+def read_ids (session, query, **parameters):
+    return ([record['uniprot_id'] for record in session.run (query, **parameters)])
+
+
+def refresh (mode = 'stale', ids = None, store = None):
+    if store is None:
+        store = open_store ()
+
+    if store is None:
+        raise Exception ("[ERROR]: The prediction table is not configured (sg_prediction_db).")
+
+    with neo4j_utils.neo4j_session() as session:
+        fingerprints = {record['uniprot_id']: (record['potent_patterns'], record['tested_compounds']) for record in session.run (cq.PREDICTION_TARGETS)}
+
+        if mode in ['all', 'stale']:
+            stored = store.fingerprints ()
+            targets = [t for t, fingerprint in fingerprints.items() if mode == 'all' or stored.get (t) != fingerprint]
+
+            # Targets without potent patterns anymore, their predictions are removed
+            targets += [t for t in stored.keys() if t not in fingerprints]
+
+        elif mode == 'targets':
+            targets = list (ids)
+
+        elif mode == 'compounds':
+            targets = read_ids (session, cq.PREDICTION_TARGETS_OF_COMPOUNDS, hashes = list (ids))
+
+        elif mode == 'patterns':
+            targets = read_ids (session, cq.PREDICTION_TARGETS_OF_PATTERNS, pattern_ids = list (ids))
+
+        else:
+            raise Exception ("[ERROR]: Unknown refresh mode: %s." % (mode))
+
+        for i, uniprot_id in enumerate (targets):
+            if uniprot_id not in fingerprints:
+                # Kept in the table, the target would have no fingerprint to match and be recomputed by every refresh
+                store.remove_target (uniprot_id)
+
+                print ('[INFO]: %d/%d %s: no potent patterns, removed' % (i + 1, len(targets), uniprot_id))
+                continue
+
+            rows, nodes, edges = compute_target (session, uniprot_id)
+            store.replace_target (uniprot_id, fingerprints[uniprot_id], rows, nodes, edges)
+
+            print ('[INFO]: %d/%d %s: %d predictions' % (i + 1, len(targets), uniprot_id, len(rows)))
+
+    store.remove_unreferenced ()
+
+    return (targets)
+
+
+
+###
+### Process-wide store section
+###
+
+_store = None
+_store_lock = threading.Lock()
+
+_metrics = {
+    'served': 0,
+    'fallbacks': 0
+}
+
+
+def open_store ():
+    global _store
+
+    if _store is None:
+        prediction_par = read_prediction_config ()
+
+        if prediction_par['db'] == '':
+            return (None)
+
+        with _store_lock:
+            if _store is None:
+                _store = PredictionStore (prediction_par['db'])
+
+    return (_store)
+
+
+def is_enabled ():
+    return (read_prediction_config ()['db'] != '')
+
+
+def page (uniprot_id, offset = 0, limit = 300):
+    # None if the target is not in the table, i.e. it is computed by Neo4j
+    G_json = open_store ().page (uniprot_id, offset, limit)
+
+    with _store_lock:
+        _metrics['served' if G_json is not None else 'fallbacks'] += 1
+
+    return (G_json)
+
+
+def size (uniprot_id):
+    return (open_store ().size (uniprot_id))
+
+
+def get_metrics ():
+    with _store_lock:
+        metrics = dict (_metrics)
+
+    metrics['enabled'] = is_enabled ()
+
+    if metrics['enabled']:
+        metrics.update (open_store ().get_metrics ())
+
+    return (metrics)
+
+
+
+if __name__ == '__main__':
+    modes = ['all', 'stale', 'targets', 'compounds', 'patterns']
+
+    if len(sys.argv) < 2 or sys.argv[1] not in modes or (sys.argv[1] in ['targets', 'compounds', 'patterns'] and len(sys.argv) < 3):
+        raise Exception ('\n\n[SYNTAX] python prediction_store.py <' + ' | '.join(modes) + '> [IDs]\n\n')
+
+    try:
+        refreshed = refresh (sys.argv[1], sys.argv[2:])
+        print ('[INFO]: Refreshed the predictions of %d targets.' % (len(refreshed)))
+
+    finally:
+        neo4j_utils.close_neo4j_driver ()
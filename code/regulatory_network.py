@@ -0,0 +1,962 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+# Ref: https://en.wikipedia.org/wiki/Bidirectional_search
+# Ref: https://neo4j.com/docs/cypher-manual/current/patterns/reference/#shortest-functions
+# Ref: https://neo4j.com/docs/cypher-manual/current/patterns/reference/#graph-patterns-rules-relationship-uniqueness
+# Ref: https://docs.python.org/3/library/array.html
+# Ref: https://docs.python.org/3/library/heapq.html
+# Ref: https://en.wikipedia.org/wiki/Dijkstra%27s_algorithm
+# Ref: https://en.wikipedia.org/wiki/Yen%27s_algorithm
+#
+#
+# In-memory regulatory network of SmartGraph, the path engine of the regulatory path endpoints.
+#
+# The network (Target nodes and REGULATES relationships, a few thousand nodes) is loaded from Neo4j at startup and kept
+# as compressed sparse row (CSR) adjacency arrays, one for the outgoing and one for the incoming relationships of the
+# nodes, plus the `max_confidence_value` of every relationship. /path_regulatory, /path_regulatory_open and the
+# target-target leg of /path_c2t are then answered without traversing the network in Neo4j (see the regulatory network
+# section of smartgraph_async.py), with the paths of their Cypher queries (see cypher_queries.py):
+#
+#   - shortest paths (`shortestPath`): one shortest path of 1 .. max_length relationships per pair of distinct
+#     start and end nodes. Pairs are searched by bidirectional BFS, all end nodes of a start node (/path_regulatory_open,
+#     and the `multi_source` option of /path_regulatory and /path_c2t) by a single BFS that stops at max_length or once
+#     all end nodes are reached. Among several shortest paths the one found first is returned (Neo4j returns an
+#     arbitrary one). A bidirectional BFS only visits the neighbourhoods of the pair, a single BFS the neighbourhood of
+#     max_length of the start node: the single BFS only pays off for many end nodes per start node. Unless `multi_source`
+#     forces a mode, it is used for the start nodes with at least sg_multi_source_min_targets end nodes (within
+#     max_length, according to the k-hop index).
+#   - all paths: every path of 1 .. max_length relationships without repeated relationships (the relationship
+#     uniqueness of Cypher, nodes may repeat). With a budget (see path_budget.py) the enumeration stops once the
+#     budget runs out.
+#   - weighted paths (`weighted` option of /path_regulatory and /path_c2t, no Cypher equivalent): the top_k most
+#     confident paths of 1 .. max_length relationships without repeated nodes per pair of start and end nodes. The cost
+#     of a relationship is -log(max_confidence_value), the cost of a path the sum of the costs of its relationships
+#     (-log of the product of the confidences), relationships without a confidence value (or of confidence 0) are not
+#     followed. The cheapest path is found by Dijkstra's algorithm on (node, number of relationships) states, so that
+#     max_length is respected, the next ones by Yen's algorithm. Among paths of the same cost the shorter one wins.
+#     The TESTED_ON leg of /path_c2t costs log(1 + activity) (the most potent bioactivity of a compound on a target,
+#     bioactivities without activity value last).
+#
+# Directed searches follow the relationships from the start node ('out') or towards it ('in'), undirected ones both.
+# A confidence cutoff > 0 restricts the search to the relationships with max_confidence_value >= cutoff (relationships
+# without a confidence value are excluded, as by the Cypher filter). The cutoff is applied while expanding the nodes,
+# instead of filtering the paths afterwards as the Cypher queries do:
+#
+#   - for the configured confidence bands, the network keeps filtered CSR views holding only the relationships of the
+#     band, so the searches with one of these cutoffs never see the other relationships,
+#   - for any other cutoff, the relationships of every node are also kept sorted by decreasing confidence, and the
+#     expansion of a node stops at its first relationship below the cutoff.
+#
+# The k-hop index holds the targets within 1 .. k relationships of every target, per direction, as bitsets (Python
+# ints, bit i: node i): within(i, k) = neighbours(i) | OR of within(j, k - 1) over the neighbours j of i. It ignores
+# the confidence of the relationships, so it is a superset of the nodes reachable at any cutoff, and prunes the searches:
+# pairs without a path of max_length are skipped, the multi-source BFS only waits for the reachable targets, and the
+# all-paths search does not extend a path from a node that has no target within the remaining hops. It also narrows
+# the end nodes of the Cypher `shortestPath` of /subgraph_target_induced (see smartgraph_async.py).
+#
+# The network is read-only between data loads; after a data load the API has to be restarted to reload it. With the
+# graph snapshot (see graph_snapshot.py), the network is the one of the snapshot and is reloaded with it.
+#
+# Configuration (environment):
+#
+#   - sg_regulatory_network: load the regulatory network at startup and answer the regulatory path queries from it.
+#     Default: false
+#   - sg_khop_index_depth: number of hops k of the k-hop neighbourhood index, 0 disables the index. Default: 4
+#   - sg_confidence_bands: comma-separated confidence cutoffs with a filtered view of the network, empty for none.
+#     Default: 0.5,0.7,0.9
+#   - sg_multi_source_min_targets: number of end nodes of a start node from which its shortest (and weighted top 1)
+#     paths are searched at once, unless `multi_source` is given. Default: 64
+#
+
+import heapq
+import math
+import os
+import threading
+
+from array import array
+
+import cypher_queries as cq
+import graph_builder
+import neo4j_utils
+import request_errors
+
+
+def read_regulatory_network_config ():
+    network_par = {}
+    network_par['enabled'] = os.environ.get('sg_regulatory_network', 'false').strip().lower() in ['true', '1', 'yes']
+    network_par['khop_depth'] = int(os.environ.get('sg_khop_index_depth', 4))
+    network_par['confidence_bands'] = [float(band) for band in os.environ.get('sg_confidence_bands', '0.5,0.7,0.9').split(',') if band.strip() != '']
+    network_par['multi_source_min_targets'] = int(os.environ.get('sg_multi_source_min_targets', 64))
+
+    return (network_par)
+
+
+# Direction of a search -> direction of the same search from its end node
+REVERSE_DIRECTION = {'out': 'in', 'in': 'out', 'both': 'both'}
+
+# Maximal number of weighted paths per pair of start and end nodes
+MAX_TOP_K = 100
+
+
+def check_top_k (top_k):
+    try:
+        top_k = int(top_k)
+
+    except (TypeError, ValueError):
+        top_k = 0
+
+    if top_k < 1 or top_k > MAX_TOP_K:
+        raise request_errors.InvalidRequest ("[ERROR]: `top_k` has to be between 1 and %d." % (MAX_TOP_K))
+
+    return (top_k)
+
+
+def confidence_cost (confidence):
+    # -log(confidence) of a relationship, inf (not followed) without confidence
+    if not confidence > 0.0:
+        return (math.inf)
+
+    return (max (0.0, -math.log (confidence)))
+
+
+def activity_cost (activity):
+    # Cost of a bioactivity, the lower the activity value the more potent the compound
+    if activity is None or not float (activity) >= 0.0:
+        return (math.inf)
+
+    return (math.log1p (float (activity)))
+
+
+
+###
+### Network section
+###
+
+def build_csr (n_nodes, ends):
+    # ends: node index of every relationship. Returns the CSR of the relationships per node: offsets (n_nodes + 1) and
+    # the relationships, in relationship order within a node.
+    counts = [0] * (n_nodes + 1)
+
+    for i in ends:
+        counts[i + 1] += 1
+
+    for i in range (n_nodes):
+        counts[i + 1] += counts[i]
+
+    offsets = array ('i', counts)
+    position = list (counts[:-1])
+    edges = array ('i', bytes (4 * len(ends)))
+
+    for e, i in enumerate (ends):
+        edges[position[i]] = e
+        position[i] += 1
+
+    return (offsets, edges)
+
+
+def filter_csr (offsets, edges, keep):
+    # CSR of the relationships e with keep[e], in the order of the relationships within a node of the original CSR
+    counts = [0]
+    kept = array ('i')
+
+    for i in range (len(offsets) - 1):
+        kept.extend ([e for e in edges[offsets[i]:offsets[i + 1]] if keep[e]])
+        counts.append (len(kept))
+
+    return (array ('i', counts), kept)
+
+
+def sort_csr (offsets, edges, confidence):
+    # Relationships of every node by decreasing confidence, and their confidence in the same order (relationships
+    # without confidence last, as -inf)
+    ordered = array ('i')
+    ordered_confidence = array ('d')
+
+    for i in range (len(offsets) - 1):
+        values = [(confidence[e] if not math.isnan (confidence[e]) else -math.inf, e) for e in edges[offsets[i]:offsets[i + 1]]]
+        values.sort (key = lambda value: -value[0])
+
+        ordered.extend ([e for value, e in values])
+        ordered_confidence.extend ([value for value, e in values])
+
+    return (offsets, ordered, ordered_confidence)
+
+
+
+class KHopIndex:
+
+    def __init__ (self, network, depth):
+        self.depth = depth
+        self.levels = {}
+
+        for direction in ['out', 'in', 'both']:
+            adjacency = network.adjacency (direction)
+            neighbours = [set (j for e, j in network.expand (i, adjacency)) for i in range (len(network.nodes))]
+
+            first = [bitset (nodes) for nodes in neighbours]
+            levels = [first]
+
+            for k in range (1, depth):
+                previous = levels[-1]
+                level = []
+
+                for i, nodes in enumerate (neighbours):
+                    bits = first[i]
+
+                    for j in nodes:
+                        bits |= previous[j]
+
+                    level.append (bits)
+
+                levels.append (level)
+
+            self.levels[direction] = levels
+
+
+    def covers (self, max_length):
+        return (max_length <= self.depth)
+
+
+    def within (self, i, k, direction):
+        # Bitset of the nodes within 1 .. k relationships of node i, k <= depth
+        return (self.levels[direction][k - 1][i])
+
+
+    def size_bytes (self):
+        return (sum ([sum ([(bits.bit_length () + 7) // 8 for bits in level]) for levels in self.levels.values() for level in levels]))
+
+
+
+def bitset (nodes):
+    bits = 0
+
+    for i in nodes:
+        bits |= 1 << i
+
+    return (bits)
+
+
+def bitset_members (bits):
+    return ([i for i, bit in enumerate (bin (bits)[:1:-1]) if bit == '1'])
+
+
+
+class RegulatoryNetwork:
+
+    def __init__ (self, nodes, node_element_ids, edges, edge_element_ids, starts, ends, confidence):
+        # nodes, edges: graph_records of the Target nodes and REGULATES relationships; starts, ends: node indices of the
+        # relationships; confidence: max_confidence_value of the relationships (NaN if missing)
+        self.nodes = nodes
+        self.node_element_ids = node_element_ids
+        self.edges = edges
+        self.edge_element_ids = edge_element_ids
+
+        self.starts = array ('i', starts)
+        self.ends = array ('i', ends)
+        self.confidence = array ('d', confidence)
+        self.cost = array ('d', [confidence_cost (value) for value in confidence])
+
+        # uniprot_id -> node indices, element ID -> node index
+        self.index = {}
+
+        for i, record in enumerate (nodes):
+            self.index.setdefault (record['node_id'], []).append (i)
+
+        self.element_index = {element_id: i for i, element_id in enumerate (node_element_ids)}
+
+        # Outgoing relationships are followed to their end node, incoming ones to their start node
+        self.csr = {
+            'out': build_csr (len(nodes), self.starts) + (self.ends,),
+            'in': build_csr (len(nodes), self.ends) + (self.starts,)
+        }
+
+        # Relationships of the nodes by decreasing confidence, for any cutoff
+        self.sorted_csr = {direction: sort_csr (offsets, edges, self.confidence) for direction, (offsets, edges, neighbours) in self.csr.items()}
+
+        # cutoff -> direction -> CSR of the relationships with confidence >= cutoff
+        self.bands = {}
+
+        self.khop = None
+
+        # End nodes of a start node from which they are searched at once (see single_search)
+        self.multi_source_min_targets = 64
+
+
+    def build_confidence_views (self, bands):
+        self.bands = {}
+
+        for cutoff in bands:
+            if cutoff <= 0.0:
+                continue
+
+            keep = [value >= cutoff for value in self.confidence]
+            self.bands[cutoff] = {direction: filter_csr (offsets, edges, keep) for direction, (offsets, edges, neighbours) in self.csr.items()}
+
+
+    def build_khop_index (self, depth):
+        self.khop = KHopIndex (self, depth) if depth > 0 else None
+
+
+    def reachable (self, source, direction, max_length):
+        # Bitset of the nodes within max_length relationships of source, None if the k-hop index does not cover it
+        if self.khop is None or not self.khop.covers (max_length):
+            return (None)
+
+        return (self.khop.within (source, max_length, direction))
+
+
+    def single_search (self, multi_source, n_targets):
+        # Whether the paths from a start node to its n_targets end nodes are searched at once: as requested by
+        # multi_source (True / False), or if there are enough end nodes (None)
+        if multi_source is None:
+            return (n_targets >= self.multi_source_min_targets)
+
+        return (bool (multi_source))
+
+
+    def node_indices (self, uniprot_ids):
+        indices = []
+
+        for uniprot_id in uniprot_ids:
+            indices.extend (self.index.get (uniprot_id, []))
+
+        return (sorted (set (indices)))
+
+
+    def view (self, direction, cutoff):
+        # (offsets, relationships, confidence) of the relationships with confidence >= cutoff: the whole CSR, the view of
+        # a confidence band, or the CSR sorted by confidence (the expansion of a node stops below the cutoff)
+        if cutoff <= 0.0:
+            return (self.csr[direction][:2] + (None,))
+
+        if cutoff in self.bands:
+            return (self.bands[cutoff][direction] + (None,))
+
+        return (self.sorted_csr[direction])
+
+
+    def adjacency (self, direction, cutoff = 0.0):
+        # (view, neighbours, follow self-loops, cutoff) of the direction. Undirected searches follow a self-loop once,
+        # as Cypher does.
+        if direction == 'both':
+            return ([self.view ('out', cutoff) + (self.ends, True, cutoff), self.view ('in', cutoff) + (self.starts, False, cutoff)])
+
+        return ([self.view (direction, cutoff) + (self.csr[direction][2], True, cutoff)])
+
+
+    def expand (self, i, adjacency):
+        # (relationship, neighbour) pairs of node i
+        for offsets, edges, confidence, neighbours, loops, cutoff in adjacency:
+            for k in range (offsets[i], offsets[i + 1]):
+                if confidence is not None and confidence[k] < cutoff:
+                    break
+
+                e = edges[k]
+                j = neighbours[e]
+
+                if j == i and not loops:
+                    continue
+
+                yield ((e, j))
+
+
+    def bfs (self, source, direction, max_length, cutoff = 0.0, targets = None):
+        # Shortest path tree of the nodes within max_length relationships: node -> (parent node, relationship). With
+        # targets (a set), the search stops at the level where the last of them is reached.
+        adjacency = self.adjacency (direction, cutoff)
+        parents = {source: None}
+        frontier = [source]
+        remaining = len(targets - {source}) if targets is not None else -1
+
+        for depth in range (max_length):
+            next_frontier = []
+
+            for i in frontier:
+                for e, j in self.expand (i, adjacency):
+                    if j not in parents:
+                        parents[j] = (i, e)
+                        next_frontier.append (j)
+
+                        if targets is not None and j in targets:
+                            remaining -= 1
+
+            if len(next_frontier) == 0 or remaining == 0:
+                break
+
+            frontier = next_frontier
+
+        return (parents)
+
+
+    def expand_level (self, frontier, parents, depths, adjacency, other_depths):
+        # Expands a BFS level, returns the next frontier and the node of the level closest to the other side (or None)
+        next_frontier = []
+        depth = depths[frontier[0]] + 1
+        meeting = None
+
+        for i in frontier:
+            for e, j in self.expand (i, adjacency):
+                if j in parents:
+                    continue
+
+                parents[j] = (i, e)
+                depths[j] = depth
+                next_frontier.append (j)
+
+                if j in other_depths and (meeting is None or other_depths[j] < other_depths[meeting]):
+                    meeting = j
+
+        return (next_frontier, meeting)
+
+
+    def shortest_path (self, source, target, direction, max_length, cutoff = 0.0):
+        # Bidirectional BFS between two distinct nodes, the levels of the smaller frontier are expanded first
+        if source == target:
+            return (None)
+
+        forward_adjacency = self.adjacency (direction, cutoff)
+        backward_adjacency = self.adjacency (REVERSE_DIRECTION[direction], cutoff)
+
+        forward = {source: None}
+        backward = {target: None}
+        forward_depths = {source: 0}
+        backward_depths = {target: 0}
+        forward_frontier = [source]
+        backward_frontier = [target]
+        length = 0
+
+        while len(forward_frontier) > 0 and len(backward_frontier) > 0 and length < max_length:
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meeting = self.expand_level (forward_frontier, forward, forward_depths, forward_adjacency, backward_depths)
+            else:
+                backward_frontier, meeting = self.expand_level (backward_frontier, backward, backward_depths, backward_adjacency, forward_depths)
+
+            length += 1
+
+            if meeting is not None:
+                nodes, edges = tree_path (forward, meeting)
+                backward_nodes, backward_edges = tree_path (backward, meeting)
+
+                return ((nodes + backward_nodes[-2::-1], edges + backward_edges[::-1]))
+
+        return (None)
+
+
+    def trails (self, source, targets, direction, max_length, cutoff = 0.0, state = None):
+        # Paths of 1 .. max_length relationships from source without repeated relationships, ending in a node of
+        # targets (anywhere if targets is None). Depth-first, in adjacency order. state: path_budget.BudgetState of a
+        # bounded search, counts the paths and the relationships followed.
+        adjacency = self.adjacency (direction, cutoff)
+
+        # With the k-hop index, paths are only extended from nodes with a target within the remaining hops
+        target_bits = bitset (targets) if targets is not None and self.khop is not None and self.khop.covers (max_length) else None
+
+        if target_bits is not None and not self.khop.within (source, max_length, direction) & target_bits:
+            return
+
+        nodes = [source]
+        edges = []
+        used = set ()
+        stack = [self.expand (source, adjacency)]
+
+        while len(stack) > 0:
+            if state is not None and state.exhausted ():
+                return
+
+            step = next (stack[-1], None)
+
+            if step is None:
+                stack.pop ()
+
+                if len(edges) > 0:
+                    used.discard (edges.pop ())
+                    nodes.pop ()
+
+                continue
+
+            e, j = step
+
+            if e in used:
+                continue
+
+            edges.append (e)
+            nodes.append (j)
+            used.add (e)
+
+            if state is not None:
+                state.expanded_edges += 1
+
+            if targets is None or j in targets:
+                if state is not None:
+                    state.paths += 1
+
+                yield ((list (nodes), list (edges)))
+
+            if len(edges) < max_length and (target_bits is None or self.khop.within (j, max_length - len(edges), direction) & target_bits):
+                stack.append (self.expand (j, adjacency))
+            else:
+                used.discard (edges.pop ())
+                nodes.pop ()
+
+
+    def paths (self, sources, targets, direction, shortest_paths, max_length, cutoff = 0.0, multi_source = None, state = None):
+        # Paths from the source nodes to the target nodes (any node if targets is None), as the `MATCH p=...` patterns
+        # of the regulatory path queries. The shortest paths from a source to its targets are taken from a single BFS
+        # (O(V + E) per source) or from a bidirectional BFS per pair, see single_search. state: budget of the all-paths
+        # search (see trails).
+        paths = []
+        target_set = set (targets) if targets is not None else None
+
+        for source in sources:
+            if not shortest_paths:
+                paths.extend (self.trails (source, target_set, direction, max_length, cutoff, state))
+
+            elif targets is None:
+                parents = self.bfs (source, direction, max_length, cutoff)
+
+                for target in parents.keys():
+                    if target != source:
+                        paths.append (tree_path (parents, target))
+
+            else:
+                # Without a path of max_length (k-hop index), the targets are not searched
+                reachable = self.reachable (source, direction, max_length)
+                source_targets = [t for t in targets if t != source and (reachable is None or (reachable >> t) & 1)]
+
+                if self.single_search (multi_source, len(source_targets)):
+                    # The search stops once these targets are found
+                    parents = self.bfs (source, direction, max_length, cutoff, set (source_targets))
+
+                    for target in source_targets:
+                        if target in parents:
+                            paths.append (tree_path (parents, target))
+
+                else:
+                    for target in source_targets:
+                        path = self.shortest_path (source, target, direction, max_length, cutoff)
+
+                        if path is not None:
+                            paths.append (path)
+
+        return (paths)
+
+
+    def cheapest_paths (self, source, targets, direction, max_length, cutoff = 0.0, banned_nodes = frozenset (), banned_edges = frozenset ()):
+        # Cheapest path of 1 .. max_length relationships from source to every node of targets (source excluded), without
+        # repeated nodes and avoiding banned_nodes / banned_edges: target -> (cost, nodes, relationships). Dijkstra on
+        # (node, number of relationships) states, ordered by (cost, number of relationships): a state is dominated by a
+        # settled state of the same node with fewer relationships, so every node is settled at most max_length + 1
+        # times, and the cheapest path of a node is settled first. Stops once all targets are settled.
+        adjacency = self.adjacency (direction, cutoff)
+        cost = self.cost
+
+        remaining = set (targets) - {source}
+        found = {}
+        parents = {}
+        settled_length = {}
+
+        heap = [(0.0, 0, source, None, -1)]
+
+        while len(heap) > 0 and len(remaining) > 0:
+            path_cost, length, i, parent, e = heapq.heappop (heap)
+
+            if i in settled_length and settled_length[i] <= length:
+                continue
+
+            settled_length[i] = length
+            parents[(i, length)] = (parent, e) if parent is not None else None
+
+            if i in remaining:
+                remaining.discard (i)
+                nodes, edges = state_path (parents, (i, length))
+                found[i] = (path_cost, nodes, edges)
+
+            if length == max_length:
+                continue
+
+            for e, j in self.expand (i, adjacency):
+                if cost[e] == math.inf or j in banned_nodes or e in banned_edges:
+                    continue
+
+                if j in settled_length and settled_length[j] <= length + 1:
+                    continue
+
+                heapq.heappush (heap, (path_cost + cost[e], length + 1, j, (i, length), e))
+
+        return (found)
+
+
+    def top_paths (self, source, target, direction, max_length, top_k, cutoff = 0.0):
+        # The top_k cheapest paths from source to target (cost, nodes, relationships), cheapest first. Yen's algorithm:
+        # the next path deviates from one of the previous ones at a spur node, the paths of the same root are kept from
+        # taking the relationship they took at the spur node, and the nodes of the root are not revisited.
+        cost = self.cost
+        first = self.cheapest_paths (source, [target], direction, max_length, cutoff).get (target)
+
+        if first is None:
+            return ([])
+
+        paths = [first]
+        candidates = []
+        seen = {tuple (first[2])}
+
+        while len(paths) < top_k:
+            path_cost, nodes, edges = paths[-1]
+
+            for i in range (len(edges)):
+                root_nodes = nodes[:i + 1]
+                root_edges = edges[:i]
+                banned_edges = set ([p[2][i] for p in paths if len(p[2]) > i and p[2][:i] == root_edges and p[1][:i + 1] == root_nodes])
+
+                spur = self.cheapest_paths (nodes[i], [target], direction, max_length - i, cutoff, frozenset (root_nodes[:-1]), banned_edges).get (target)
+
+                if spur is None:
+                    continue
+
+                candidate_edges = root_edges + spur[2]
+
+                if tuple (candidate_edges) in seen:
+                    continue
+
+                seen.add (tuple (candidate_edges))
+                candidate_cost = sum ([cost[e] for e in root_edges]) + spur[0]
+                heapq.heappush (candidates, (candidate_cost, len(candidate_edges), candidate_edges, root_nodes[:-1] + spur[1]))
+
+            if len(candidates) == 0:
+                break
+
+            candidate_cost, length, candidate_edges, candidate_nodes = heapq.heappop (candidates)
+            paths.append ((candidate_cost, candidate_nodes, candidate_edges))
+
+        return (paths)
+
+
+    def weighted_paths (self, sources, targets, direction, max_length, top_k = 1, cutoff = 0.0, multi_source = None):
+        # The top_k cheapest paths from every source to every target (source excluded): (cost, nodes, relationships).
+        # With top_k 1, the paths of a source come from a single search or a search per target, see single_search.
+        paths = []
+
+        for source in sources:
+            reachable = self.reachable (source, direction, max_length)
+            source_targets = [t for t in targets if t != source and (reachable is None or (reachable >> t) & 1)]
+
+            if top_k == 1 and self.single_search (multi_source, len(source_targets)):
+                found = self.cheapest_paths (source, source_targets, direction, max_length, cutoff)
+                paths.extend ([found[target] for target in source_targets if target in found])
+                continue
+
+            for target in source_targets:
+                paths.extend (self.top_paths (source, target, direction, max_length, top_k, cutoff))
+
+        return (paths)
+
+
+    def path_key (self, path):
+        # Sort key of a path, the PATH_CURSOR_KEY of cypher_queries.py (see pagination.py)
+        nodes, edges = path
+        key = self.node_element_ids[nodes[0]]
+
+        for e in edges:
+            key += ',' + self.edge_element_ids[e]
+
+        return (key)
+
+
+    def rows (self, paths):
+        # Result rows of paths: (sort key, node records, edge records)
+        rows = []
+
+        for nodes, edges in paths:
+            rows.append ((self.path_key ((nodes, edges)), [self.nodes[i] for i in nodes], [self.edges[e] for e in edges]))
+
+        return (rows)
+
+
+    def size (self):
+        size = {'nodes': len(self.nodes), 'edges': len(self.edges)}
+        size['khop_index_depth'] = self.khop.depth if self.khop is not None else 0
+        size['khop_index_bytes'] = self.khop.size_bytes () if self.khop is not None else 0
+        size['confidence_bands'] = sorted (self.bands.keys())
+
+        return (size)
+
+
+
+def state_path (parents, state):
+    # Path from the source of a weighted search to state (node, number of relationships): (nodes, relationships)
+    nodes = [state[0]]
+    edges = []
+
+    while parents[state] is not None:
+        state, e = parents[state]
+        nodes.append (state[0])
+        edges.append (e)
+
+    return ((nodes[::-1], edges[::-1]))
+
+
+def tree_path (parents, node):
+    # Path from the root of a BFS tree to node: (nodes, relationships)
+    nodes = [node]
+    edges = []
+
+    while parents[node] is not None:
+        node, e = parents[node]
+        nodes.append (node)
+        edges.append (e)
+
+    return ((nodes[::-1], edges[::-1]))
+
+
+
+###
+### Loading section
+###
+
+def fetch_network ():
+    # Reads the network from Neo4j, the records are converted as in the graphs built from Neo4j (see graph_builder.py)
+    builder = graph_builder.GraphBuilder (compact = True)
+
+    nodes = []
+    node_element_ids = []
+    edges = []
+    edge_element_ids = []
+    starts = []
+    ends = []
+    confidence = []
+
+    def work (tx):
+        for record in tx.run (cq.REGULATORY_NETWORK_NODES):
+            node = record['t']
+
+            nodes.append (builder.insert_node (node))
+            node_element_ids.append (node.element_id)
+
+        element_index = {element_id: i for i, element_id in enumerate (node_element_ids)}
+
+        for record in tx.run (cq.REGULATORY_NETWORK_EDGES):
+            relationship = record['r']
+            value = relationship.get ('max_confidence_value')
+
+            edges.append (builder.insert_relationship (relationship))
+            edge_element_ids.append (relationship.element_id)
+            starts.append (element_index[relationship.start_node.element_id])
+            ends.append (element_index[relationship.end_node.element_id])
+            confidence.append (float (value) if value is not None else math.nan)
+
+    with neo4j_utils.neo4j_session() as session:
+        session.execute_read (work)
+
+    return (RegulatoryNetwork (nodes, node_element_ids, edges, edge_element_ids, starts, ends, confidence))
+
+
+
+###
+### Process-wide network section
+###
+
+_lock = threading.Lock()
+_network = None
+
+_metrics = {
+    'queries': 0,
+    'rows': 0
+}
+
+
+def load (network_par = None, network = None):
+    # Blocking, called at startup. network: the network of the graph snapshot (see graph_snapshot.py), used whether or
+    # not sg_regulatory_network is enabled; read from Neo4j if None.
+    global _network
+
+    if network_par is None:
+        network_par = read_regulatory_network_config ()
+
+    if network is None:
+        if not network_par['enabled']:
+            return (False)
+
+        network = fetch_network ()
+
+    network.build_confidence_views (network_par['confidence_bands'])
+    network.build_khop_index (network_par['khop_depth'])
+    network.multi_source_min_targets = network_par['multi_source_min_targets']
+
+    with _lock:
+        _network = network
+
+    return (True)
+
+
+def close ():
+    global _network
+
+    with _lock:
+        _network = None
+
+
+def is_enabled ():
+    return (_network is not None)
+
+
+def count_query (rows):
+    with _lock:
+        _metrics['queries'] += 1
+        _metrics['rows'] += len(rows)
+
+
+def get_metrics ():
+    with _lock:
+        metrics = dict (_metrics)
+        metrics['enabled'] = _network is not None
+        metrics.update (_network.size () if _network is not None else {})
+
+    return (metrics)
+
+
+
+###
+### Path queries section
+###
+
+# The rows of the regulatory path queries of cypher_queries.py, from the parameters of these queries
+
+def path_regulatory (parameters, shortest_paths = True, max_length = 4, directed = True, multi_source = None, weighted = False, top_k = 1, state = None):
+    network = _network
+    direction = 'out' if directed else 'both'
+
+    sources = network.node_indices (parameters['source_uniprot_ids'])
+    targets = network.node_indices (parameters['target_uniprot_ids'])
+
+    if weighted:
+        paths = network.weighted_paths (sources, targets, direction, cq.check_max_length (max_length), check_top_k (top_k), parameters['confidence_cutoff'], multi_source)
+        paths = [(nodes, edges) for cost, nodes, edges in paths]
+    else:
+        paths = network.paths (sources, targets, direction, shortest_paths, cq.check_max_length (max_length), parameters['confidence_cutoff'], multi_source, state)
+
+    rows = network.rows (paths)
+    count_query (rows)
+
+    return (rows)
+
+
+def path_regulatory_open (parameters, shortest_paths = True, max_length = 4, explore_mode = 'undirected'):
+    network = _network
+    direction = cq.explore_mode_direction (cq.plain_value (explore_mode))
+
+    sources = network.node_indices (parameters['uniprot_ids'])
+
+    rows = network.rows (network.paths (sources, None, direction, shortest_paths, cq.check_max_length (max_length), parameters['confidence_cutoff']))
+    count_query (rows)
+
+    return (rows)
+
+
+def reachable_targets (uniprot_ids, explore_mode, max_length):
+    # uniprot_id -> UniProt IDs of the targets within max_length relationships, from the k-hop index (None if the
+    # network or the index are not available, or max_length exceeds the index)
+    network = _network
+
+    if network is None or network.khop is None or not network.khop.covers (max_length):
+        return (None)
+
+    direction = cq.explore_mode_direction (cq.plain_value (explore_mode))
+    reachable = {}
+
+    for uniprot_id in uniprot_ids:
+        bits = 0
+
+        for i in network.index.get (uniprot_id, []):
+            bits |= network.khop.within (i, max_length, direction)
+
+        reachable[uniprot_id] = sorted (set ([network.nodes[j]['node_id'] for j in bitset_members (bits)]))
+
+    return (reachable)
+
+
+def path_c2t (bioactivities, parameters, shortest_paths = True, max_length = 4, multi_source = None, weighted = False, top_k = 1, state = None):
+    # bioactivities: the bioactivities of the compounds (see graph_builder.bioactivities), read from Neo4j or the graph
+    # snapshot. The paths are searched once per tested target and joined with the bioactivities of the target, one per
+    # compound (the TESTED_ON shortestPath of the query).
+    network = _network
+
+    if weighted:
+        return (weighted_path_c2t (bioactivities, parameters, max_length, multi_source, top_k))
+
+    legs = graph_builder.bioactivity_legs (bioactivities)
+    targets = network.node_indices (parameters['uniprot_ids'])
+    rows = []
+
+    for target_element_id, source_legs in legs.items():
+        source = network.element_index.get (target_element_id)
+
+        if source is None:
+            continue
+
+        if state is not None and state.exhausted ():
+            break
+
+        # t1 <> q
+        paths = network.paths ([source], [i for i in targets if i != source], 'out', shortest_paths, cq.check_max_length (max_length), parameters['confidence_cutoff'], multi_source, state)
+
+        for key, nodes, edges in network.rows (paths):
+            for leg_key, compound, bioactivity in source_legs:
+                rows.append ((key + '|' + leg_key, nodes + [compound], edges + [bioactivity]))
+
+    count_query (rows)
+
+    return (rows)
+
+
+def weighted_path_c2t (bioactivities, parameters, max_length = 4, multi_source = None, top_k = 1):
+    # The top_k cheapest compound-target paths per compound and target: the cost of a path is the cost of its
+    # target-target leg plus the cost of the most potent bioactivity of the compound on the start target of the leg
+    network = _network
+    max_length = cq.check_max_length (max_length)
+    top_k = check_top_k (top_k)
+
+    legs = {}
+
+    for target_element_id, target_legs in graph_builder.bioactivity_legs (bioactivities, lambda row: (activity_cost (row[4].get ('activity')), row[2])).items():
+        source = network.element_index.get (target_element_id)
+
+        if source is not None:
+            legs[source] = target_legs
+
+    targets = network.node_indices (parameters['uniprot_ids'])
+    sources = sorted (legs.keys())
+
+    # t1 <> q
+    paths_of_source = {}
+
+    for cost, nodes, edges in network.weighted_paths (sources, targets, 'out', max_length, top_k, parameters['confidence_cutoff'], multi_source):
+        paths_of_source.setdefault (nodes[0], []).append ((cost, nodes, edges))
+
+    # (compound, q) -> [(cost, key, nodes, edges)]
+    candidates = {}
+
+    for source, target_legs in legs.items():
+        for leg_key, compound, bioactivity in target_legs:
+            leg_cost = activity_cost (bioactivity.get ('activity'))
+
+            for cost, nodes, edges in paths_of_source.get (source, []):
+                key = network.path_key ((nodes, edges)) + '|' + leg_key
+                candidates.setdefault ((compound['node_id'], nodes[-1]), []).append ((cost + leg_cost, len(edges), key, nodes, edges, compound, bioactivity))
+
+    rows = []
+
+    for paths in candidates.values():
+        paths.sort (key = lambda path: path[:3])
+
+        for cost, length, key, nodes, edges, compound, bioactivity in paths[:top_k]:
+            rows.append ((key, [network.nodes[i] for i in nodes] + [compound], [network.edges[e] for e in edges] + [bioactivity]))
+
+    count_query (rows)
+
+    return (rows)
@@ -0,0 +1,21 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://fastapi.tiangolo.com/tutorial/handling-errors/#install-custom-exception-handlers
+#
+#
+# Errors of the requests to the SmartGraph API.
+#
+# The arguments of a request are checked by the modules answering it (page sizes and cursors, path lengths, budgets,
+# ...), which raise InvalidRequest for invalid ones. server.py answers InvalidRequest with HTTP 400 and the message of
+# the error, any other exception remains a server error.
+#
+
+
+class InvalidRequest (Exception):
+    # Invalid arguments of a request, answered with HTTP 400 (see server.py)
+    pass
@@ -0,0 +1,354 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://asgi.readthedocs.io/en/latest/specs/www.html
+# Ref: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Accept-Encoding
+# Ref: https://github.com/encode/starlette/blob/master/starlette/middleware/gzip.py
+# Ref: https://docs.python.org/3/library/zlib.html#zlib.compressobj
+# Ref: https://github.com/google/brotli/blob/master/python/brotli.py
+# Ref: https://python-zstandard.readthedocs.io/en/latest/compressor.html#zstdcompressionobj
+# Ref: https://docs.python.org/3/library/contextvars.html
+#
+#
+# Encoding of the API responses.
+#
+#   - JSON responses are compact, unless the request has the `pretty=true` query parameter (see CustomORJSONResponse
+#     in server.py, which reads `pretty_json`).
+#
+#   - Responses are compressed according to the Accept-Encoding header of the request, zstd, br and gzip in this
+#     order of preference (at equal q-values). zstd and br are only offered if the zstandard / brotli packages are
+#     installed. Streamed responses (see smartgraph_async.py) are compressed chunk by chunk, and every chunk is flushed,
+#     so the client receives the data as it is produced. ZIP archives (Arrow/Parquet export) and bodies smaller than
+#     `sg_compression_min_size` bytes are sent as they are.
+#
+#   - Bodies (or streamed chunks) of at least `sg_compression_thread_min_size` bytes are compressed in a worker thread,
+#     compressing a large graph takes hundreds of milliseconds during which the event loop would serve no other
+#     request. zlib, brotli and zstandard release the GIL while they compress.
+#
+# Configuration (environment):
+#
+#   - sg_compression_min_size: minimal size of a (non-streamed) body to compress in bytes. Default: 1024
+#   - sg_compression_thread_min_size: minimal size of a body to compress outside of the event loop in bytes.
+#     Default: 262144
+#   - sg_compression_level_gzip, sg_compression_level_br, sg_compression_level_zstd: compression levels.
+#     Default: 6, 4, 3
+#
+
+import asyncio
+import contextvars
+import os
+import zlib
+
+from urllib.parse import parse_qs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+pretty_json = contextvars.ContextVar ('pretty_json', default = False)
+
+
+COMPRESSIBLE_MEDIA_TYPES = ['application/json', 'application/x-ndjson', 'application/xml', 'text/']
+
+
+def read_compression_config ():
+    compression_par = {}
+    compression_par['min_size'] = int(os.environ.get('sg_compression_min_size', 1024))
+    compression_par['thread_min_size'] = int(os.environ.get('sg_compression_thread_min_size', 256 * 1024))
+    compression_par['level_gzip'] = int(os.environ.get('sg_compression_level_gzip', 6))
+    compression_par['level_br'] = int(os.environ.get('sg_compression_level_br', 4))
+    compression_par['level_zstd'] = int(os.environ.get('sg_compression_level_zstd', 3))
+
+    return (compression_par)
+
+
+
+###
+### Compressors section
+###
+
+# Compressors implement compress (data) -> bytes, flush () -> bytes (end of the data written so far) and finish () -> bytes.
+
+class GzipCompressor:
+
+    def __init__ (self, level = 6):
+        # wbits = 31: gzip container
+        self.c = zlib.compressobj (level, zlib.DEFLATED, 31)
+
+
+    def compress (self, data):
+        return (self.c.compress (data))
+
+
+    def flush (self):
+        return (self.c.flush (zlib.Z_SYNC_FLUSH))
+
+
+    def finish (self):
+        return (self.c.flush (zlib.Z_FINISH))
+
+
+
+class BrotliCompressor:
+
+    def __init__ (self, level = 4):
+        self.c = brotli.Compressor (quality = level)
+
+
+    def compress (self, data):
+        return (self.c.process (data))
+
+
+    def flush (self):
+        return (self.c.flush ())
+
+
+    def finish (self):
+        return (self.c.finish ())
+
+
+
+class ZstdCompressor:
+
+    def __init__ (self, level = 3):
+        self.c = zstandard.ZstdCompressor (level = level).compressobj ()
+
+
+    def compress (self, data):
+        return (self.c.compress (data))
+
+
+    def flush (self):
+        return (self.c.flush (zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+
+    def finish (self):
+        return (self.c.flush (zstandard.COMPRESSOBJ_FLUSH_FINISH))
+
+
+
+def available_encodings ():
+    # In order of preference
+    encodings = []
+
+    if zstandard is not None:
+        encodings.append ('zstd')
+
+    if brotli is not None:
+        encodings.append ('br')
+
+    encodings.append ('gzip')
+
+    return (encodings)
+
+
+def new_compressor (encoding, compression_par):
+    if encoding == 'zstd':
+        return (ZstdCompressor (compression_par['level_zstd']))
+
+    if encoding == 'br':
+        return (BrotliCompressor (compression_par['level_br']))
+
+    return (GzipCompressor (compression_par['level_gzip']))
+
+
+def compress (data, encoding, compression_par = None):
+    if compression_par is None:
+        compression_par = read_compression_config ()
+
+    c = new_compressor (encoding, compression_par)
+
+    return (c.compress (data) + c.finish ())
+
+
+def negotiate_encoding (accept_encoding, encodings):
+    # Returns the preferred encoding accepted by the client, or None for the identity encoding.
+    accepted = {}
+
+    for item in accept_encoding.split (','):
+        parts = item.strip().split (';')
+        name = parts[0].strip().lower()
+
+        if name == '':
+            continue
+
+        q = 1.0
+
+        for p in parts[1:]:
+            p = p.strip()
+
+            if p.startswith ('q='):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+
+        accepted[name] = q
+
+    best = None
+    best_q = 0.0
+
+    for encoding in encodings:
+        q = accepted.get (encoding, accepted.get ('*', 0.0))
+
+        if q > best_q:
+            best = encoding
+            best_q = q
+
+    return (best)
+
+
+
+###
+### Middleware section
+###
+
+class ResponseEncodingMiddleware:
+
+    def __init__ (self, app):
+        self.app = app
+        self.compression_par = read_compression_config ()
+        self.encodings = available_encodings ()
+
+
+    async def __call__ (self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app (scope, receive, send)
+            return
+
+        query = parse_qs (scope.get('query_string', b'').decode ('latin-1'))
+        pretty = query.get('pretty', ['false'])[-1].strip().lower() in ['true', '1', 'yes']
+
+        accept_encoding = ''
+
+        for name, value in scope['headers']:
+            if name == b'accept-encoding':
+                accept_encoding += value.decode ('latin-1') + ','
+
+        encoding = negotiate_encoding (accept_encoding, self.encodings)
+
+        token = pretty_json.set (pretty)
+
+        try:
+            await self.app (scope, receive, CompressingSender (send, encoding, self.compression_par).send)
+
+        finally:
+            pretty_json.reset (token)
+
+
+
+class CompressingSender:
+
+    def __init__ (self, send, encoding, compression_par):
+        self.downstream = send
+        self.encoding = encoding
+        self.compression_par = compression_par
+
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+
+    def compressible (self, headers):
+        content_type = ''
+
+        for name, value in headers:
+            if name.lower() == b'content-encoding':
+                return (False)
+
+            if name.lower() == b'content-type':
+                content_type = value.decode ('latin-1').lower()
+
+        return (any ([content_type.startswith (t) for t in COMPRESSIBLE_MEDIA_TYPES]))
+
+
+    def start (self, compressed, length = None):
+        # The response depends on the Accept-Encoding of the request, also when it is not compressed
+        headers = list (self.start_message['headers'])
+        headers.append ((b'vary', b'Accept-Encoding'))
+
+        if not compressed:
+            return (dict (self.start_message, headers = headers))
+
+        headers = [(k, v) for k, v in headers if k.lower() != b'content-length']
+
+        if compressed:
+            headers.append ((b'content-encoding', self.encoding.encode ('latin-1')))
+
+        if length is not None:
+            headers.append ((b'content-length', str(length).encode ('latin-1')))
+
+        message = dict (self.start_message)
+        message['headers'] = headers
+
+        return (message)
+
+
+    async def run (self, function, *args, size = 0):
+        # Small bodies are compressed faster than a thread hand-off
+        if size < self.compression_par['thread_min_size']:
+            return (function (*args))
+
+        return (await asyncio.to_thread (function, *args))
+
+
+    def compress_chunk (self, body, more_body):
+        if more_body:
+            return (self.compressor.compress (body) + self.compressor.flush ())
+
+        return (self.compressor.compress (body) + self.compressor.finish ())
+
+
+    async def send (self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            self.passthrough = not self.compressible (message.get('headers', []))
+
+            if self.passthrough:
+                await self.downstream (message)
+
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.downstream (message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.compressor is None:
+            if self.encoding is None or (not more_body and len(body) < self.compression_par['min_size']):
+                # Sent as it is
+                self.passthrough = True
+                await self.downstream (self.start (False))
+                await self.downstream (message)
+                return
+
+            if not more_body:
+                # Complete body in one message
+
+                body = await self.run (compress, body, self.encoding, self.compression_par, size = len(body))
+
+                await self.downstream (self.start (True, len(body)))
+                await self.downstream ({'type': 'http.response.body', 'body': body, 'more_body': False})
+                return
+
+            # Streamed body: the length is not known, the response is sent chunked
+            self.compressor = new_compressor (self.encoding, self.compression_par)
+            await self.downstream (self.start (True))
+
+        # The chunks of a response are sent one after the other, the compressor is never used by two threads at once
+        data = await self.run (self.compress_chunk, body, more_body, size = len(body))
+
+        await self.downstream ({'type': 'http.response.body', 'body': data, 'more_body': more_body})
@@ -0,0 +1,632 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://docs.python.org/3/library/collections.html#collections.OrderedDict.move_to_end
+# Ref: https://docs.python.org/3/library/time.html#time.monotonic
+# Ref: https://docs.python.org/3/library/sqlite3.html
+# Ref: https://www.sqlite.org/wal.html
+# Ref: https://redis.io/docs/reference/protocol-spec/
+# Ref: https://redis.io/docs/reference/eviction/
+# Ref: https://github.com/ijl/orjson#serialize
+#
+#
+# Result cache of the SmartGraph endpoints.
+#
+# The knowledge graph is read-only between data loads, hence the result of an endpoint only depends on its query and
+# parameters. Entries are keyed on the endpoint, the query template, the normalised parameters (ID lists sorted and
+# de-duplicated, cutoffs as floats) and the export format. The cache is bounded in size (least recently used entries
+# are evicted) and entries expire after a TTL. Caching can be switched on/off per endpoint.
+#
+# Configuration (environment):
+#
+#   - sg_cache_max_entries: maximal number of cached results, 0 disables the cache. Default: 1024
+#   - sg_cache_max_bytes: maximal size of the results cached in memory, in bytes of their encoding. Default: 268435456
+#   - sg_cache_ttl: time to live of the cached results in seconds. Default: 3600
+#   - sg_cache_endpoints: comma-separated list of endpoints to cache, or 'all'. Default: all
+#
+
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+import orjson
+
+import graph_records
+
+
+###
+### Backends section
+###
+
+# Backends map string keys to bytes and implement get (key), set (key, value, ttl), clear () and info ().
+# `in_process` tells the asyncio endpoints whether the backend can be called from the event loop without blocking it,
+# `stores_values` that the backend keeps the results themselves rather than their encoding.
+
+
+class MemoryBackend:
+
+    in_process = True
+
+    # The entries are kept decoded: a hit returns the cached object itself, without paying for a decode. The size of an
+    # entry is the length of its encoding, which is what the shared backends store.
+    stores_values = True
+
+    def __init__ (self, max_entries = 1024, max_bytes = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+
+        self.counters = {'evictions': 0, 'expirations': 0}
+
+
+    def get (self, key):
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get (key)
+
+            if entry is None:
+                return (None)
+
+            if entry[0] < now:
+                self.remove (key)
+                self.counters['expirations'] += 1
+                return (None)
+
+            self.entries.move_to_end (key)
+
+            return (entry[1])
+
+
+    def set (self, key, value, ttl, size = None):
+        expires_at = time.monotonic() + ttl
+
+        if size is None:
+            size = len(value)
+
+        with self.lock:
+            if key in self.entries:
+                self.remove (key)
+
+            # A result larger than the whole cache would evict every other entry and then itself
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (expires_at, value, size)
+            self.bytes += size
+
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                evicted = self.entries.popitem (last = False)
+                self.bytes -= evicted[1][2]
+                self.counters['evictions'] += 1
+
+
+    def remove (self, key):
+        # Callers hold the lock
+        entry = self.entries.pop (key)
+        self.bytes -= entry[2]
+
+
+    def clear (self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+    def info (self):
+        with self.lock:
+            info = dict (self.counters)
+            info['entries'] = len(self.entries)
+            info['bytes'] = self.bytes
+
+        info['backend'] = 'memory'
+        info['max_bytes'] = self.max_bytes
+
+        return (info)
+
+
+
+class SQLiteBackend:
+
+    in_process = False
+    stores_values = False
+
+    # Number of writes between two LRU trims of the table
+    trim_interval = 64
+
+    def __init__ (self, path, max_entries = 1024):
+        self.path = path
+        self.max_entries = max_entries
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.writes = 0
+
+        self.counters = {'evictions': 0, 'expirations': 0}
+
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("CREATE TABLE IF NOT EXISTS result_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            conn.execute ("CREATE INDEX IF NOT EXISTS result_cache_accessed_at ON result_cache (accessed_at)")
+
+
+    def connection (self):
+        # sqlite3 connections can not be shared between threads, each thread opens its own one.
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect (self.path, timeout = 5.0)
+            conn.execute ("PRAGMA journal_mode=WAL")
+            conn.execute ("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return (conn)
+
+
+    def get (self, key):
+        now = time.time()
+        conn = self.connection ()
+
+        row = conn.execute ("SELECT value, expires_at FROM result_cache WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            return (None)
+
+        with conn:
+            if row[1] < now:
+                conn.execute ("DELETE FROM result_cache WHERE key = ?", (key,))
+                self.count ('expirations')
+                return (None)
+
+            conn.execute ("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return (bytes(row[0]))
+
+
+    def set (self, key, value, ttl):
+        now = time.time()
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("INSERT OR REPLACE INTO result_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)", (key, value, now + ttl, now))
+
+        with self.lock:
+            self.writes += 1
+            trim = self.writes % self.trim_interval == 0
+
+        if trim:
+            self.trim ()
+
+
+    def trim (self):
+        conn = self.connection ()
+
+        with conn:
+            expired = conn.execute ("DELETE FROM result_cache WHERE expires_at < ?", (time.time(),)).rowcount
+            evicted = conn.execute ("DELETE FROM result_cache WHERE key IN (SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+
+        self.count ('expirations', expired)
+        self.count ('evictions', evicted)
+
+
+    def count (self, counter, n = 1):
+        with self.lock:
+            self.counters[counter] += n
+
+
+    def clear (self):
+        conn = self.connection ()
+
+        with conn:
+            conn.execute ("DELETE FROM result_cache")
+
+
+    def info (self):
+        row = self.connection().execute ("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM result_cache").fetchone()
+
+        with self.lock:
+            info = dict (self.counters)
+
+        info['entries'] = row[0]
+        info['bytes'] = row[1]
+        info['backend'] = 'sqlite'
+        info['path'] = self.path
+
+        return (info)
+
+
+
+class RedisBackend:
+
+    in_process = False
+    stores_values = False
+
+    def __init__ (self, host = 'localhost', port = 6379, db = 0, password = None, timeout = 1.0, namespace = 'sg'):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.namespace = namespace
+
+        self.local = threading.local()
+
+
+    def connect (self):
+        sock = socket.create_connection ((self.host, self.port), timeout = self.timeout)
+        self.local.sock = sock
+        self.local.reader = sock.makefile ('rb')
+
+        if self.password:
+            self.command ('AUTH', self.password)
+
+        if self.db != 0:
+            self.command ('SELECT', self.db)
+
+
+    def disconnect (self):
+        sock = getattr(self.local, 'sock', None)
+        self.local.sock = None
+
+        if sock is not None:
+            try:
+                self.local.reader.close()
+                sock.close()
+            except OSError:
+                pass
+
+
+    def encode_command (self, args):
+        out = [b'*%d\r\n' % (len(args))]
+
+        for arg in args:
+            if not isinstance (arg, bytes):
+                arg = str(arg).encode ('utf-8')
+
+            out.append (b'$%d\r\n' % (len(arg)))
+            out.append (arg)
+            out.append (b'\r\n')
+
+        return (b''.join(out))
+
+
+    def read_reply (self):
+        reader = self.local.reader
+        line = reader.readline()
+
+        if not line.endswith (b'\r\n'):
+            raise ConnectionError ("[ERROR]: Connection to the Redis cache backend closed.")
+
+        prefix, payload = line[:1], line[1:-2]
+
+        if prefix == b'+':
+            return (payload)
+
+        if prefix == b'-':
+            raise Exception ("[ERROR]: Redis cache backend replied: %s" % (payload.decode ('utf-8', 'replace')))
+
+        if prefix == b':':
+            return (int(payload))
+
+        if prefix == b'$':
+            length = int(payload)
+
+            if length < 0:
+                return (None)
+
+            data = reader.read (length + 2)
+
+            return (data[:-2])
+
+        if prefix == b'*':
+            length = int(payload)
+
+            if length < 0:
+                return (None)
+
+            return ([self.read_reply () for i in range(length)])
+
+        raise Exception ("[ERROR]: Unexpected reply from the Redis cache backend: %s" % (line))
+
+
+    def command (self, *args):
+        if getattr(self.local, 'sock', None) is None:
+            self.connect ()
+
+        try:
+            self.local.sock.sendall (self.encode_command (args))
+
+            return (self.read_reply ())
+
+        except (OSError, ConnectionError):
+            # The connection is reopened by the next command
+            self.disconnect ()
+            raise
+
+
+    def get (self, key):
+        return (self.command ('GET', key))
+
+
+    def set (self, key, value, ttl):
+        self.command ('SET', key, value, 'PX', max(1, int(ttl * 1000)))
+
+
+    def clear (self):
+        # Only the keys of this API are removed, the server may be shared with other services.
+        cursor = b'0'
+
+        while True:
+            cursor, keys = self.command ('SCAN', cursor, 'MATCH', self.namespace + ':*', 'COUNT', 1000)
+
+            if len(keys) > 0:
+                self.command ('DEL', *keys)
+
+            if cursor == b'0':
+                break
+
+
+    def info (self):
+        info = {}
+        info['backend'] = 'redis'
+        info['address'] = '%s:%s/%s' % (self.host, self.port, self.db)
+
+        return (info)
+
+
+
+class ResultCache:
+
+    def __init__ (self, backend, ttl = 3600.0, namespace = 'sg'):
+        self.backend = backend
+        self.ttl = ttl
+        self.namespace = namespace
+
+        self.lock = threading.Lock()
+
+        self.counters = {'hits': 0, 'misses': 0, 'backend_errors': 0}
+        self.endpoint_counters = {}
+
+
+    def count (self, endpoint, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+            if endpoint not in self.endpoint_counters:
+                self.endpoint_counters[endpoint] = {'hits': 0, 'misses': 0}
+
+            if counter in self.endpoint_counters[endpoint]:
+                self.endpoint_counters[endpoint][counter] += 1
+
+
+    def backend_key (self, key):
+        # The keys are hashed so that they are short, and identical in every process sharing the backend.
+        return (self.namespace + ':' + hashlib.sha256 (orjson.dumps (key)).hexdigest())
+
+
+    def get (self, endpoint, key):
+        try:
+            value = self.backend.get (self.backend_key (key))
+
+        except Exception:
+            self.count (endpoint, 'backend_errors')
+            value = None
+
+        if value is None:
+            self.count (endpoint, 'misses')
+            return (False, None)
+
+        self.count (endpoint, 'hits')
+
+        if self.backend.stores_values:
+            return (True, value)
+
+        return (True, decode (value))
+
+
+    def put (self, endpoint, key, value):
+        try:
+            encoded = encode (value)
+
+            if self.backend.stores_values:
+                self.backend.set (self.backend_key (key), value, self.ttl, len(encoded))
+            else:
+                self.backend.set (self.backend_key (key), encoded, self.ttl)
+
+        except Exception:
+            self.count (endpoint, 'backend_errors')
+
+
+    def clear (self):
+        self.backend.clear ()
+
+
+    def metrics (self):
+        with self.lock:
+            metrics = dict (self.counters)
+            metrics['endpoints'] = {k: dict(v) for k, v in self.endpoint_counters.items()}
+
+        try:
+            metrics.update (self.backend.info ())
+
+        except Exception:
+            metrics['backend_available'] = False
+
+        lookups = metrics['hits'] + metrics['misses']
+
+        metrics['ttl'] = self.ttl
+        metrics['namespace'] = self.namespace
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups > 0 else 0.0
+
+        return (metrics)
+
+
+
+###
+### Serialisation section
+###
+
+# GraphML documents are stored as UTF-8 bytes, Arrow/Parquet archives as they are, everything else (JSON graphs, SMILES
+# records) as orjson bytes. The first byte of a stored value tells which one it is.
+
+def encode (value):
+    if isinstance (value, str):
+        return (b'x' + value.encode ('utf-8'))
+
+    if isinstance (value, bytes):
+        return (b'b' + value)
+
+    return (b'j' + orjson.dumps (value, default = graph_records.default))
+
+
+def decode (value):
+    if value[:1] == b'x':
+        return (value[1:].decode ('utf-8'))
+
+    if value[:1] == b'b':
+        return (value[1:])
+
+    return (orjson.loads (value[1:]))
+
+
+
+###
+### Process-wide cache section
+###
+
+def read_cache_config ():
+    cache_par = {}
+    cache_par['max_entries'] = int(os.environ.get('sg_cache_max_entries', 1024))
+    cache_par['max_bytes'] = int(os.environ.get('sg_cache_max_bytes', 256 * 1024 * 1024))
+    cache_par['ttl'] = float(os.environ.get('sg_cache_ttl', 3600))
+    cache_par['endpoints'] = os.environ.get('sg_cache_endpoints', 'all')
+    cache_par['backend'] = os.environ.get('sg_cache_backend', 'memory').strip().lower()
+    cache_par['namespace'] = os.environ.get('sg_cache_namespace', 'sg')
+    cache_par['sqlite_path'] = os.environ.get('sg_cache_sqlite_path', '/tmp/smartgraph_result_cache.sqlite')
+    cache_par['redis_host'] = os.environ.get('sg_cache_redis_host', 'localhost')
+    cache_par['redis_port'] = int(os.environ.get('sg_cache_redis_port', 6379))
+    cache_par['redis_db'] = int(os.environ.get('sg_cache_redis_db', 0))
+    cache_par['redis_password'] = os.environ.get('sg_cache_redis_password', None)
+    cache_par['redis_timeout'] = float(os.environ.get('sg_cache_redis_timeout', 1.0))
+
+    return (cache_par)
+
+
+def open_cache_backend (cache_par):
+    if cache_par['backend'] == 'memory':
+        return (MemoryBackend (cache_par['max_entries'], cache_par['max_bytes']))
+
+    if cache_par['backend'] == 'sqlite':
+        return (SQLiteBackend (cache_par['sqlite_path'], cache_par['max_entries']))
+
+    if cache_par['backend'] == 'redis':
+        return (RedisBackend (cache_par['redis_host'], cache_par['redis_port'], cache_par['redis_db'], cache_par['redis_password'],
+                              cache_par['redis_timeout'], cache_par['namespace']))
+
+    raise Exception ("[ERROR]: Unknown result cache backend: %s. Use one of: memory, sqlite, redis." % (cache_par['backend']))
+
+
+_cache_config = read_cache_config ()
+
+_cache = None
+
+if _cache_config['max_entries'] > 0:
+    _cache = ResultCache (open_cache_backend (_cache_config), _cache_config['ttl'], _cache_config['namespace'])
+
+_enabled_endpoints = None
+
+if _cache_config['endpoints'].strip().lower() != 'all':
+    _enabled_endpoints = set([e.strip() for e in _cache_config['endpoints'].split(',') if e.strip() != ''])
+
+_disabled_endpoints = set()
+
+
+def is_enabled (endpoint):
+    if _cache is None or endpoint in _disabled_endpoints:
+        return (False)
+
+    return (_enabled_endpoints is None or endpoint in _enabled_endpoints)
+
+
+def set_endpoint_enabled (endpoint, enabled = True):
+    if enabled:
+        _disabled_endpoints.discard (endpoint)
+
+        if _enabled_endpoints is not None:
+            _enabled_endpoints.add (endpoint)
+    else:
+        _disabled_endpoints.add (endpoint)
+
+
+def normalise_value (value):
+    value = getattr(value, 'value', value)
+
+    if isinstance (value, (list, tuple, set)):
+        # ID lists are only used in `IN` predicates, their order and duplicates do not affect the results. They are
+        # sorted on repr so that lists mixing types (['a', 1]) can be ordered too.
+        return (tuple(sorted(set([normalise_value(v) for v in value]), key = repr)))
+
+    if isinstance (value, dict):
+        return (tuple(sorted([(k, normalise_value(v)) for k, v in value.items()])))
+
+    return (value)
+
+
+def make_key (endpoint, query, parameters, *options):
+    normalised_parameters = []
+
+    if parameters is not None:
+        for k in sorted(parameters.keys()):
+            normalised_parameters.append ((k, normalise_value(parameters[k])))
+
+    normalised_options = tuple([normalise_value(o) for o in options])
+
+    return ((endpoint, query, tuple(normalised_parameters), normalised_options))
+
+
+def is_in_process ():
+    return (_cache is None or _cache.backend.in_process)
+
+
+def lookup (endpoint, key):
+    return (_cache.get (endpoint, key))
+
+
+def store (endpoint, key, value):
+    _cache.put (endpoint, key, value)
+
+
+def clear ():
+    if _cache is not None:
+        _cache.clear ()
+
+
+def get_cache_metrics ():
+    if _cache is None:
+        return ({'enabled': False})
+
+    metrics = _cache.metrics ()
+    metrics['enabled'] = True
+    metrics['max_entries'] = _cache_config['max_entries']
+
+    if _enabled_endpoints is None:
+        metrics['enabled_endpoints'] = 'all'
+    else:
+        metrics['enabled_endpoints'] = sorted(_enabled_endpoints)
+
+    metrics['disabled_endpoints'] = sorted(_disabled_endpoints)
+
+    return (metrics)
@@ -20,17 +20,26 @@
 # Ref: https://networkx.org/documentation/stable/reference/readwrite/generated/networkx.readwrite.graphml.generate_graphml.html#networkx.readwrite.graphml.generate_graphml
 # Ref: https://www.adamsmith.haus/python/answers/how-to-check-if-a-variable-is-a-list-in-python
 # Ref: https://fastapi.tiangolo.com/advanced/response-directly/
+# Ref: https://fastapi.tiangolo.com/async/
+# Ref: https://fastapi.tiangolo.com/advanced/custom-response/#streamingresponse
+# Ref: https://arrow.apache.org/docs/python/parquet.html
+# Ref: https://www.starlette.io/middleware/#pure-asgi-middleware
+# Ref: https://fastapi.tiangolo.com/tutorial/body/
 #
 
 
 
 from typing import Union
 from typing import Any
+from typing import List
 
 from fastapi import FastAPI, Response, APIRouter
+from fastapi.responses import StreamingResponse
 
 from enum import Enum
 
+from pydantic import BaseModel
+
 import orjson
 import uvicorn
 
@@ -38,15 +47,36 @@ import uvicorn
 #from endpoint import *
 
 import smartgraph as sg
-
-
+import smartgraph_async as sga
+import neo4j_utils
+import result_cache
+import graph_records
+import single_flight
+import response_encoding
+import pagination
+import path_budget
+import smiles_index
+import prediction_store
+import regulatory_network
+import graph_snapshot
+import request_errors
+
+
+import asyncio
+import logging
 import os
 import pandas as pd
 
 
+# Messages of the background tasks, through the error logger of uvicorn (stderr, configured by uvicorn)
+logger = logging.getLogger ('uvicorn.error')
+
+
 class ExportFormat(str, Enum):
     json = "json"
     graphml = "graphml"
+    arrow = "arrow"
+    parquet = "parquet"
 
 class ExplorationMode(str, Enum):
     source = "source"
@@ -61,12 +91,47 @@ class EndNodeType(str, Enum):
 
 
 
+# Request body of the bulk (POST) endpoints
+class BulkIds(BaseModel):
+    ids: List[str]
+
+
+
 class CustomORJSONResponse(Response):
     media_type = "application/json"
     
     def render(self, content: Any) -> bytes:
         assert orjson is not None, "orjson must be installed"
-        return orjson.dumps(content, option=orjson.OPT_INDENT_2)
+        # Compact by default, indented on `?pretty=true` (see response_encoding.py)
+        if response_encoding.pretty_json.get():
+            return orjson.dumps(content, default=graph_records.default, option=orjson.OPT_INDENT_2)
+
+        return orjson.dumps(content, default=graph_records.default)
+
+
+# GraphML is returned as an XML document, Arrow and Parquet as a ZIP archive of a nodes and an edges table (see columnar_export.py)
+# A page of a paged request (see pagination.py) carries the cursor of the next page in the X-Next-Cursor header
+def export_response (content, format, name = 'smartgraph'):
+    headers = {}
+
+    if isinstance (content, pagination.Page):
+        if content.next_cursor is not None:
+            headers['X-Next-Cursor'] = content.next_cursor
+
+        content = content.content
+
+    if isinstance (content, path_budget.Bounded):
+        headers['X-Truncated'] = 'true' if content.truncated else 'false'
+        headers['X-Path-Stats'] = orjson.dumps (content.stats).decode ()
+
+        content = content.content
+
+    if format == ExportFormat.graphml:
+        return (Response(content = content, media_type = 'application/xml', headers = headers))
+
+    headers['Content-Disposition'] = 'attachment; filename="%s_%s.zip"' % (name, format.value)
+
+    return (Response(content = content, media_type = 'application/zip', headers = headers))
 
 
 smartgraphUiUrl = os.environ['SMARTGRAPH_UI_URL'] or 'https://smartgraph-ui.ncats.nih.gov'
@@ -76,35 +141,108 @@ smartgraphApiSwaggerUrl = os.environ['SMARTGRAPH_API_SWAGGER_URL'] or 'https://s
 base_path = os.environ['SMARTGRAPH_API_BASE_PATH'] or '/'
 
 app = FastAPI(title='SmartGraph API',
-    description=f'API functionality for the SmartGraph network-pharmacology investigation platform.<BR><BR>Publication: [https://jcheminf.biomedcentral.com/articles/10.1186/s13321-020-0409-9](https://jcheminf.biomedcentral.com/articles/10.1186/s13321-020-0409-9)<BR><BR>SmartGraph Webapp: [{smartgraphUiUrl}]({smartgraphUiUrl})<BR><BR>SmartGraph API Swagger: [{smartgraphApiSwaggerUrl}]({smartgraphApiSwaggerUrl})',
+    description=f'API functionality for the SmartGraph network-pharmacology investigation platform.<BR><BR>Publication: [https://jcheminf.biomedcentral.com/articles/10.1186/s13321-020-0409-9](https://jcheminf.biomedcentral.com/articles/10.1186/s13321-020-0409-9)<BR><BR>SmartGraph Webapp: [{smartgraphUiUrl}]({smartgraphUiUrl})<BR><BR>SmartGraph API Swagger: [{smartgraphApiSwaggerUrl}]({smartgraphApiSwaggerUrl})<BR><BR>JSON responses are compact, add `pretty=true` to the query parameters for indented JSON. Responses are compressed according to the `Accept-Encoding` header of the request (zstd, br, gzip).<BR><BR>Graph endpoints with the `page_size` and `cursor` parameters return their result in pages of at most `page_size` rows (compound-target activities, paths, ...; at most 10000). A page holds the cursor of the next page (`next_cursor`, or the `X-Next-Cursor` header for non-JSON formats; none on the last page), pass it as `cursor` with the same arguments to get the next page.',
     docs_url=f'{base_path}/docs',
     redoc_url=f'{base_path}/redoc',
     openapi_url=f'{base_path}/openapi.json',
     debug=True
 )
 
+app.add_middleware(response_encoding.ResponseEncodingMiddleware)
+
 router = APIRouter(prefix=base_path)
 
 
+@app.exception_handler(request_errors.InvalidRequest)
+async def invalid_request (request, e):
+    return (CustomORJSONResponse (status_code = 400, content = {'detail': str (e)}))
+
+
+@app.on_event("startup")
+async def startup ():
+    # The Neo4j driver (and its connection pool) lives as long as the API process.
+    neo4j_utils.get_neo4j_async_driver ()
+
+    # Exports (if needed) and opens the local SMILES index, when configured
+    await asyncio.to_thread (smiles_index.load)
+
+    # Loads the snapshot of the whole graph, which also holds the regulatory network, or else the in-memory regulatory
+    # network of the path endpoints, when configured
+    if await asyncio.to_thread (graph_snapshot.load):
+        snapshot_par = graph_snapshot.read_graph_snapshot_config ()
+
+        if snapshot_par['reload_interval'] > 0:
+            app.state.snapshot_reload = asyncio.create_task (reload_graph_snapshot (snapshot_par['reload_interval']))
+    else:
+        await asyncio.to_thread (regulatory_network.load)
+
+
+async def reload_graph_snapshot (interval):
+    # Reloads the graph snapshot when the data changed, the cached results of the old snapshot are dropped
+    while True:
+        await asyncio.sleep (interval)
+
+        try:
+            if await asyncio.to_thread (graph_snapshot.refresh):
+                await asyncio.to_thread (result_cache.clear)
+                logger.info ('Reloaded the graph snapshot.')
+
+        except Exception as e:
+            # The current snapshot keeps answering, e.g. while Neo4j is not available
+            logger.warning ('Reload of the graph snapshot failed: %s', e)
+
+
+@app.on_event("shutdown")
+async def shutdown ():
+    snapshot_reload = getattr (app.state, 'snapshot_reload', None)
+
+    if snapshot_reload is not None:
+        snapshot_reload.cancel ()
+
+    await neo4j_utils.close_neo4j_async_driver ()
+    neo4j_utils.close_neo4j_driver ()
+    smiles_index.close ()
+    regulatory_network.close ()
+    graph_snapshot.close ()
+
+
 
 
 
 @router.get("/cite", response_class=CustomORJSONResponse, tags=["About"])
-def cite ():
+async def cite ():
 	return (sg.cite())
 
 
 @router.get("/bibtex", response_class=CustomORJSONResponse, tags=["About"])
-def cite ():
+async def cite ():
 	return (sg.bibtex())
     
 
 @router.get("/version", response_class=CustomORJSONResponse, tags=["About"])
-def version ():
+async def version ():
 	return ({'SmartGraph API v1'})
 
+@router.get("/metrics", response_class=CustomORJSONResponse, tags=["About"])
+async def metrics ():
+    """
+        Returns runtime metrics of the API, e.g. the utilisation of the Neo4j connection pool and the hit rate of the result cache and the number of coalesced identical requests.
+
+    """
+
+    res_json = {}
+    res_json['neo4j_pool'] = neo4j_utils.get_pool_metrics ()
+    res_json['result_cache'] = result_cache.get_cache_metrics ()
+    res_json['single_flight'] = single_flight.get_metrics ()
+    res_json['smiles_index'] = smiles_index.get_metrics ()
+    res_json['prediction_store'] = prediction_store.get_metrics ()
+    res_json['regulatory_network'] = regulatory_network.get_metrics ()
+    res_json['graph_snapshot'] = graph_snapshot.get_metrics ()
+
+    return (res_json)
+
 @router.get("/bioactivity_target/{target_uniprot_ids}", response_class=CustomORJSONResponse, tags=["Bioactivities"])
-def bioactivity_target (target_uniprot_ids: str, activity_cutoff: Union[float, None] = 0.0, activity_type: Union [str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
+async def bioactivity_target (target_uniprot_ids: str, activity_cutoff: Union[float, None] = 0.0, activity_type: Union [str, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
 		Returns a graph containing the requested target protein, and all compounds that have an activity value reported for the given target.
 
@@ -118,16 +256,16 @@ def bioactivity_target (target_uniprot_ids: str, activity_cutoff: Union[float, N
         - `activity_type`: only consider the provided type of bioactivity
 
     """
-    res_json = sg.bioactivity_target (target_uniprot_ids, activity_cutoff, activity_type, format)
+    res_json = await sga.bioactivity_target (target_uniprot_ids, activity_cutoff, activity_type, format, page = pagination.page_request (page_size, cursor))
     
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'bioactivity_target'))
     
     return (res_json)
 
 
 @router.get("/bioactivity_compound/{inchikeys}", response_class=CustomORJSONResponse, tags=["Bioactivities"])
-def bioactivity_compound (inchikeys: str, stereo: Union[bool, None] = True, activity_cutoff: Union[float, None] = 0.0, activity_type: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
+async def bioactivity_compound (inchikeys: str, stereo: Union[bool, None] = True, activity_cutoff: Union[float, None] = 0.0, activity_type: Union[str, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
 		Returns a graph containing the requested compound, and all target proteins that have an activity value reported for the given compound.
 
@@ -148,17 +286,17 @@ def bioactivity_compound (inchikeys: str, stereo: Union[bool, None] = True, acti
 
     """
 
-    res_json = sg.bioactivity_compound (inchikeys, stereo, activity_cutoff, activity_type, format)
+    res_json = await sga.bioactivity_compound (inchikeys, stereo, activity_cutoff, activity_type, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'bioactivity_compound'))
 
 
     return (res_json)
 
 
 @router.get("/bioactivity_c2t/{inchikeys}/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Bioactivities"])
-def bioactivity_c2t (inchikeys:str, uniprot_ids: str, stereo: Union[bool, None] = True, activity_type: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
+async def bioactivity_c2t (inchikeys:str, uniprot_ids: str, stereo: Union[bool, None] = True, activity_type: Union[str, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
 		Returns a graph containing the requested compound, and all target proteins that have an activity value reported for the given compound.
 
@@ -177,17 +315,17 @@ def bioactivity_c2t (inchikeys:str, uniprot_ids: str, stereo: Union[bool, None]
         - `activity_type`: only consider the provided type of bioactivity
     """
 
-    res_json = sg.bioactivity_c2t (inchikeys, uniprot_ids, stereo, activity_type, format)
+    res_json = await sga.bioactivity_c2t (inchikeys, uniprot_ids, stereo, activity_type, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'bioactivity_c2t'))
 
 
     return (res_json)
 
 
 @router.get("/potent_compounds/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Bioactivities"])
-def potent_compounds (uniprot_ids: str, activity_type: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
+async def potent_compounds (uniprot_ids: str, activity_type: Union[str, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
  		Returns the 'potent compounds' of the target. Potent compounds are defined within the scope of SmartGraph.
 
@@ -199,17 +337,17 @@ def potent_compounds (uniprot_ids: str, activity_type: Union[str, None] = None,
          - `activity_type`: only consider the provided type of bioactivity
     """
     
-    res_json = sg.potent_compounds (uniprot_ids, activity_type, format)
+    res_json = await sga.potent_compounds (uniprot_ids, activity_type, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'potent_compounds'))
 
 
     return (res_json)
 
 
 @router.get("/predict/{uniprot_id}", response_class=CustomORJSONResponse, tags=["Prediction"])
-def predict (uniprot_id: str, limit: Union [int, None]=300, format: Union[ExportFormat, None] = ExportFormat.json):
+async def predict (uniprot_id: str, limit: Union [int, None]=None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Computes "potent pattern"-based bioactivity predictions. This can be used in a drug repositioning setting.
 
@@ -217,12 +355,16 @@ def predict (uniprot_id: str, limit: Union [int, None]=300, format: Union[Export
 
         - `uniprot_id`: UniProt ID of the protein target to compute predictions for. Example UniProt ID: P49841 .
 
+        - `limit`: maximal number of predictions (pattern-compound pairs) returned, 0 for all. Can not be combined with `page_size` / `cursor`. Default: 300.
+
+        Predictions are ranked by the overlap ratio of the pattern and the compound (descending). To page through the ranked predictions, use `page_size` / `cursor` instead of `limit`.
+
     """
 
-    res_json = sg.predict (uniprot_id, limit = limit, format = format)
+    res_json = await sga.predict (uniprot_id, limit = limit, format = format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'predict'))
 
 
 
@@ -231,7 +373,7 @@ def predict (uniprot_id: str, limit: Union [int, None]=300, format: Union[Export
 
 
 @router.get("/path_c2t/{inchikeys}/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Path Search"])
-def path_c2t (inchikeys: str, uniprot_ids: str, stereo: Union [bool, None]=True, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=2, activity_cutoff: Union[float, None]=0.0, activity_type: Union[str, None]=None, confidence_cutoff: Union[float, None]=0.0, format: Union[ExportFormat, None] = ExportFormat.json):
+async def path_c2t (inchikeys: str, uniprot_ids: str, stereo: Union [bool, None]=True, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=2, activity_cutoff: Union[float, None]=0.0, activity_type: Union[str, None]=None, confidence_cutoff: Union[float, None]=0.0, multi_source: Union[bool, None] = None, weighted: Union[bool, None] = False, top_k: Union[int, None] = 1, max_paths: Union[int, None] = None, max_expanded_edges: Union[int, None] = None, timeout: Union[float, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
 		Finds paths (via compound-target bioactivity and target-target regulatory relationships) between a set of compounds and a set of target proteins.
 
@@ -255,16 +397,32 @@ def path_c2t (inchikeys: str, uniprot_ids: str, stereo: Union [bool, None]=True,
 
         - `activity_type`: only consider the provided type of bioactivity
 
+                    The compound-target edge of a path is one bioactivity of the compound on the target that passes `activity_cutoff` and `activity_type` (the first by internal ID). Earlier versions returned any bioactivity of the pair there, including ones not passing the filters.
+
         - `confidence_cutoff`: only consider regulatory edges of confidence greater than equal to the provided value
 
+        - `multi_source`:  Boolean. If `True`, the shortest paths from a source to all targets are found by a single breadth-first search, if `False` by a search per source-target pair. The search per pair only visits the neighbourhoods of the pair and is faster for a few targets, the single search visits every target within `max_length` of the source once and is faster for many targets (from about 64 targets per source). Only applies to `shortest_paths=True` (and weighted paths with `top_k=1`) with the in-memory regulatory network enabled (`sg_regulatory_network` or `sg_graph_snapshot`), otherwise ignored. Default: chosen per source from its number of targets.
+
+        - `weighted`:  Boolean. If `True`, the most confident paths are returned instead of the shortest ones: the cost of a path is the sum of -log(confidence) of its regulatory edges (edges without confidence are not followed), plus log(1 + activity) of the bioactivity of the compound, `shortest_paths` is ignored. Needs the in-memory regulatory network (`sg_regulatory_network` or `sg_graph_snapshot`). Default: `False`.
+
+        - `top_k`:  Integer. With `weighted=True`, the number of most confident paths returned per compound and target. Default: 1 .
+
+        - `max_paths`:  Integer. Budget of the all-paths search (`shortest_paths=False`): at most `max_paths` paths are returned. Setting any of `max_paths`, `max_expanded_edges` and `timeout` bounds the search (the others get server defaults), the response then holds `truncated` (whether the budget ran out) and `path_stats` (or the `X-Truncated` and `X-Path-Stats` headers for non-JSON formats). Can not be combined with `page_size` / `cursor`. Default: not bounded.
+
+        - `max_expanded_edges`:  Integer. Budget of the all-paths search: maximal number of relationships followed. Only enforced by the in-memory regulatory network (`sg_regulatory_network` or `sg_graph_snapshot`). Default: not bounded.
+
+        - `timeout`:  Float. Budget of the all-paths search: seconds after which the paths found so far are returned. Default: not bounded.
+
     """
 
-    res_json = sg.path_c2t (inchikeys, uniprot_ids, stereo, shortest_paths, max_length, activity_cutoff, activity_type, confidence_cutoff, format)
+    budget = path_budget.path_budget (max_paths, max_expanded_edges, timeout)
 
+    res_json = await sga.path_c2t (inchikeys, uniprot_ids, stereo, shortest_paths, max_length, activity_cutoff, activity_type, confidence_cutoff, format, page = pagination.page_request (page_size, cursor), multi_source = multi_source, weighted = weighted, top_k = top_k, budget = budget)
 
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'path_c2t'))
 
 
     return (res_json)
@@ -272,7 +430,7 @@ def path_c2t (inchikeys: str, uniprot_ids: str, stereo: Union [bool, None]=True,
 
 
 @router.get("/path_regulatory/{source_uniprot_ids}/{target_uniprot_ids}", response_class=CustomORJSONResponse, tags=["Path Search"])
-def path_regulatory (source_uniprot_ids: str, target_uniprot_ids: str, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, confidence_cutoff: Union[float, None]=0.0, directed: Union[bool, None]=True, format: Union[ExportFormat, None] = ExportFormat.json):
+async def path_regulatory (source_uniprot_ids: str, target_uniprot_ids: str, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, confidence_cutoff: Union[float, None]=0.0, directed: Union[bool, None]=True, multi_source: Union[bool, None] = None, weighted: Union[bool, None] = False, top_k: Union[int, None] = 1, max_paths: Union[int, None] = None, max_expanded_edges: Union[int, None] = None, timeout: Union[float, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Find regulatory pathway between two sets of protein (sources and targets).
 
@@ -292,20 +450,34 @@ def path_regulatory (source_uniprot_ids: str, target_uniprot_ids: str, shortest_
         - `directed`: Boolean. If set to `False`, the network will be treated as undirected . Default: directed network, i.e. `True`.
 
 
+        - `multi_source`:  Boolean. If `True`, the shortest paths from a source to all targets are found by a single breadth-first search, if `False` by a search per source-target pair. The search per pair only visits the neighbourhoods of the pair and is faster for a few targets, the single search visits every target within `max_length` of the source once and is faster for many targets (from about 64 targets per source). Only applies to `shortest_paths=True` (and weighted paths with `top_k=1`) with the in-memory regulatory network enabled (`sg_regulatory_network` or `sg_graph_snapshot`), otherwise ignored. Default: chosen per source from its number of targets.
+
+        - `weighted`:  Boolean. If `True`, the most confident paths are returned instead of the shortest ones: the cost of a path is the sum of -log(confidence) of its regulatory edges (edges without confidence are not followed), `shortest_paths` is ignored. Needs the in-memory regulatory network (`sg_regulatory_network` or `sg_graph_snapshot`). Default: `False`.
+
+        - `top_k`:  Integer. With `weighted=True`, the number of most confident paths returned per source and target. Default: 1 .
+
+        - `max_paths`:  Integer. Budget of the all-paths search (`shortest_paths=False`): at most `max_paths` paths are returned. Setting any of `max_paths`, `max_expanded_edges` and `timeout` bounds the search (the others get server defaults), the response then holds `truncated` (whether the budget ran out) and `path_stats` (or the `X-Truncated` and `X-Path-Stats` headers for non-JSON formats). Can not be combined with `page_size` / `cursor`. Default: not bounded.
+
+        - `max_expanded_edges`:  Integer. Budget of the all-paths search: maximal number of relationships followed. Only enforced by the in-memory regulatory network (`sg_regulatory_network` or `sg_graph_snapshot`). Default: not bounded.
+
+        - `timeout`:  Float. Budget of the all-paths search: seconds after which the paths found so far are returned. Default: not bounded.
+
     """
 
+    budget = path_budget.path_budget (max_paths, max_expanded_edges, timeout)
 
-    res_json = sg.path_regulatory (source_uniprot_ids, target_uniprot_ids, shortest_paths, max_length, confidence_cutoff, directed, format)
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    res_json = await sga.path_regulatory (source_uniprot_ids, target_uniprot_ids, shortest_paths, max_length, confidence_cutoff, directed, format, page = pagination.page_request (page_size, cursor), multi_source = multi_source, weighted = weighted, top_k = top_k, budget = budget)
+
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'path_regulatory'))
     
     return (res_json)
 
 
 
 @router.get("/path_regulatory_open/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Path Search"])
-def path_regulatory_open (uniprot_ids, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=2, explore_mode: Union[ExplorationMode, None]=ExplorationMode.undirected, confidence_cutoff: Union[float, None]=0.0, format: Union[ExportFormat, None] = ExportFormat.json):
+async def path_regulatory_open (uniprot_ids, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=2, explore_mode: Union[ExplorationMode, None]=ExplorationMode.undirected, confidence_cutoff: Union[float, None]=0.0, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Find "open ended" regulatory pathway that start/end in any of the provided protein targets, reachable in distance=`max_length`.
 
@@ -327,20 +499,18 @@ def path_regulatory_open (uniprot_ids, shortest_paths: Union[bool, None]=True, m
 
         - `confidence_cutoff`: only consider regulatory edges of confidence greater than equal to the provided value
 
-
-
     """
     
-    res_json = sg.path_regulatory_open (uniprot_ids, shortest_paths, max_length, explore_mode, confidence_cutoff, format)
+    res_json = await sga.path_regulatory_open (uniprot_ids, shortest_paths, max_length, explore_mode, confidence_cutoff, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'path_regulatory_open'))
 
     return (res_json)
 
 
 @router.get("/subgraph_target_induced/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Subgraphs"])
-def subgraph_target_induced (uniprot_ids: str, endnode_type: Union[EndNodeType, None]=EndNodeType.both, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, explore_mode: Union[ExplorationMode, None]=ExplorationMode.undirected, format: Union[ExportFormat, None] = ExportFormat.json):
+async def subgraph_target_induced (uniprot_ids: str, endnode_type: Union[EndNodeType, None]=EndNodeType.both, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, explore_mode: Union[ExplorationMode, None]=ExplorationMode.undirected, stream: Union[bool, None]=False, max_paths: Union[int, None] = None, max_expanded_edges: Union[int, None] = None, timeout: Union[float, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Extracts a subgraph induced by a set of provided protein targets so that these targets are one endpoints of paths that end in compounds/targets/both, and the lengths of paths is <= `max_length`.
 
@@ -355,6 +525,8 @@ def subgraph_target_induced (uniprot_ids: str, endnode_type: Union[EndNodeType,
             - 'both': endpoints are either compounds or targets
 
         - `shortest_paths`:  Boolean. If `True`, then the shortest paths will be returned. Otherwise, all paths between the compound and the target. Default: `True`.
+                    When the server answers by frontier expansion (`sg_subgraph_frontier`, unpaged requests without a budget), the all-paths subgraph
+                    may in rare cases hold a few more edges than the union of the paths: edges only on walks of at most `max_length` edges that use another edge twice.
 
         - `max_length`:  Integer. The maximal number of edges between the provided compound and the target. Default: 4 .
 
@@ -364,18 +536,33 @@ def subgraph_target_induced (uniprot_ids: str, endnode_type: Union[EndNodeType,
             - 'source': finds all paths starting from the provided protein targets that are reacheable within `max_length` of steps
             - 'target': finds all paths ending in the provided protein targets and are at most `max_length` length
 
+        - `stream`:  Boolean. If `True`, then the document is sent in chunks, recommended for large subgraphs (e.g. `shortest_paths=False`). JSON documents are sent while the result is read from the database, GraphML documents once the result is read. Not applicable to Arrow/Parquet. Default: `False`.
+
+        - `max_paths`:  Integer. Budget of the all-paths search (`shortest_paths=False`): at most `max_paths` paths are returned. Setting any of `max_paths`, `max_expanded_edges` and `timeout` bounds the search (the others get server defaults), the response then holds `truncated` (whether the budget ran out) and `path_stats` (or the `X-Truncated` and `X-Path-Stats` headers for non-JSON formats). Can not be combined with `page_size` / `cursor`. Default: not bounded.
+
+        - `max_expanded_edges`:  Integer. Budget of the all-paths search: maximal number of relationships followed. Only enforced by the graph snapshot (`sg_graph_snapshot`). Default: not bounded.
+
+        - `timeout`:  Float. Budget of the all-paths search: seconds after which the paths found so far are returned. Default: not bounded.
+
     """
 
-    res_json = sg.subgraph_target_induced (uniprot_ids, endnode_type, shortest_paths, max_length, explore_mode, format)
+    budget = path_budget.path_budget (max_paths, max_expanded_edges, timeout)
+
+    if stream and page_size is None and cursor is None and (budget is None or shortest_paths) and format in [ExportFormat.json, ExportFormat.graphml]:
+        chunks = await sga.stream_subgraph_target_induced (uniprot_ids, endnode_type, shortest_paths, max_length, explore_mode, format)
+
+        return (StreamingResponse(chunks, media_type = 'application/xml' if format == ExportFormat.graphml else 'application/json'))
+
+    res_json = await sga.subgraph_target_induced (uniprot_ids, endnode_type, shortest_paths, max_length, explore_mode, format, page = pagination.page_request (page_size, cursor), budget = budget)
  
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'subgraph_target_induced'))
    
     return (res_json)
 
 
 @router.get("/subgraph_compound_induced/{inchikeys}", response_class=CustomORJSONResponse, tags=["Subgraphs"])
-def subgraph_compound_induced (inchikeys: str, stereo: Union[bool, None]=True, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, format: Union[ExportFormat, None] = ExportFormat.json):
+async def subgraph_compound_induced (inchikeys: str, stereo: Union[bool, None]=True, shortest_paths: Union[bool, None]=True, max_length: Union[int, None]=4, stream: Union[bool, None]=False, max_paths: Union[int, None] = None, max_expanded_edges: Union[int, None] = None, timeout: Union[float, None] = None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Extracts a subgraph induced by a set of provided compounds so that paths starting from them are of length <= `max_length`.
 
@@ -390,22 +577,39 @@ def subgraph_compound_induced (inchikeys: str, stereo: Union[bool, None]=True, s
                    only the first section of the `inchikey` will be matched. Default: `True`.
 
         - `shortest_paths`:  Boolean. If `True`, then the shortest paths will be returned. Otherwise, all paths between the compound and the target. Default: `True`.
+                    When the server answers by frontier expansion (`sg_subgraph_frontier`, unpaged requests without a budget), the all-paths subgraph
+                    may in rare cases hold a few more edges than the union of the paths: edges only on walks of at most `max_length` edges that use another edge twice.
 
         - `max_length`:  Integer. The maiximal number of edges between the provided compound and the target. Default: 4 .
 
+        - `stream`:  Boolean. If `True`, then the document is sent in chunks, recommended for large subgraphs (e.g. `shortest_paths=False`). JSON documents are sent while the result is read from the database, GraphML documents once the result is read. Not applicable to Arrow/Parquet. Default: `False`.
+
+
+        - `max_paths`:  Integer. Budget of the all-paths search (`shortest_paths=False`): at most `max_paths` paths are returned. Setting any of `max_paths`, `max_expanded_edges` and `timeout` bounds the search (the others get server defaults), the response then holds `truncated` (whether the budget ran out) and `path_stats` (or the `X-Truncated` and `X-Path-Stats` headers for non-JSON formats). Can not be combined with `page_size` / `cursor`. Default: not bounded.
+
+        - `max_expanded_edges`:  Integer. Budget of the all-paths search: maximal number of relationships followed. Only enforced by the graph snapshot (`sg_graph_snapshot`). Default: not bounded.
+
+        - `timeout`:  Float. Budget of the all-paths search: seconds after which the paths found so far are returned. Default: not bounded.
 
     """
 
-    res_json = sg.subgraph_compound_induced (inchikeys, stereo, shortest_paths, max_length, format)
+    budget = path_budget.path_budget (max_paths, max_expanded_edges, timeout)
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if stream and page_size is None and cursor is None and (budget is None or shortest_paths) and format in [ExportFormat.json, ExportFormat.graphml]:
+        chunks = await sga.stream_subgraph_compound_induced (inchikeys, stereo, shortest_paths, max_length, format)
+
+        return (StreamingResponse(chunks, media_type = 'application/xml' if format == ExportFormat.graphml else 'application/json'))
+
+    res_json = await sga.subgraph_compound_induced (inchikeys, stereo, shortest_paths, max_length, format, page = pagination.page_request (page_size, cursor), budget = budget)
+
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'subgraph_compound_induced'))
 
     return (res_json)
 
 
 @router.get("/patterns_of_compounds/{inchikeys}", response_class=CustomORJSONResponse, tags=["Subgraphs"])
-def patterns_of_compounds (inchikeys: str, stereo: Union[bool, None]=True, pattern_type='scaffold', min_ratio: Union[float, None]=0.0, is_largest: Union[bool, None]=None, format: Union[ExportFormat, None] = ExportFormat.json):
+async def patterns_of_compounds (inchikeys: str, stereo: Union[bool, None]=True, pattern_type='scaffold', min_ratio: Union[float, None]=0.0, is_largest: Union[bool, None]=None, page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Returns the patterns associated with provided compounds.
 
@@ -425,19 +629,18 @@ def patterns_of_compounds (inchikeys: str, stereo: Union[bool, None]=True, patte
 
         - `is_largest`:  Boolean. If `True`, then only return the largest scaffold. This is relevant if hierarchical scaffolds (HierS) are generated. [Wilkens SJ, Janes J, Su AI (2005) HierS: hierarchical scaffold clustering using topological chemical graphs. J Med Chem 48(9):3182–3193, Jeremy JY. Google Code open source project, unm-biocomp-hscaf, Java library for HierS chemical scaffolds] Default: None, i.e. this is not taken into account by defult.
 
-
     """
 
-    res_json = sg.patterns_of_compounds (inchikeys, stereo, pattern_type, min_ratio, is_largest, format)
+    res_json = await sga.patterns_of_compounds (inchikeys, stereo, pattern_type, min_ratio, is_largest, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'patterns_of_compounds'))
 
     return (res_json)
 
 
 @router.get("/potent_patterns/{uniprot_ids}", response_class=CustomORJSONResponse, tags=["Bioactivities"])
-def potent_patterns (uniprot_ids: str, pattern_type: Union[str, None]='scaffold', format: Union[ExportFormat, None] = ExportFormat.json):
+async def potent_patterns (uniprot_ids: str, pattern_type: Union[str, None]='scaffold', page_size: Union[int, None] = None, cursor: Union[str, None] = None, format: Union[ExportFormat, None] = ExportFormat.json):
     """
         Returns the potent patterns of provided target proteins. Potent patterns are defined in context of SmartGraph.
 
@@ -451,16 +654,16 @@ def potent_patterns (uniprot_ids: str, pattern_type: Union[str, None]='scaffold'
     """
 
 
-    res_json = sg.potent_patterns (uniprot_ids, pattern_type, format)
+    res_json = await sga.potent_patterns (uniprot_ids, pattern_type, format, page = pagination.page_request (page_size, cursor))
 
-    if format == ExportFormat.graphml:
-        return (Response(content = res_json, media_type = 'application/xml'))
+    if format != ExportFormat.json:
+        return (export_response (res_json, format, 'potent_patterns'))
 
     return (res_json)
 
 
 @router.get("/smiles_compound/{inchikey}", response_class=CustomORJSONResponse, tags=["Utilities"])
-def smiles_compound (inchikey: str, stereo: Union[bool, None]=True):
+async def smiles_compound (inchikey: str, stereo: Union[bool, None]=True):
     """
 		Returns the SMILES of a compound based on its InChI-Key.
 
@@ -476,13 +679,13 @@ def smiles_compound (inchikey: str, stereo: Union[bool, None]=True):
                    only the first section of the `inchikey` will be matched. Default: `True`.
     """
 
-    res_json = sg.smiles_compound (inchikey, stereo)
+    res_json = await sga.smiles_compound (inchikey, stereo)
     
     return (res_json)
 
 
 @router.get("/smiles_pattern/{pattern_id}", response_class=CustomORJSONResponse, tags=["Utilities"])
-def smiles_pattern (pattern_id: str):
+async def smiles_pattern (pattern_id: str):
     """
 		Returns the SMILES of a compound based on its InChI-Key.
 
@@ -494,14 +697,59 @@ def smiles_pattern (pattern_id: str):
 
     """
     
-    res_json = sg.smiles_pattern (pattern_id)
+    res_json = await sga.smiles_pattern (pattern_id)
     
     return (res_json)
 
 
 
+# Bulk endpoints: the IDs are sent in the request body, the results are returned per ID as newline delimited JSON (see the bulk section of smartgraph_async.py)
+
+BULK_DESCRIPTION = """
+
+        The IDs are sent as JSON in the request body: `{"ids": ["...", "..."]}` . At most `sg_bulk_max_ids` (default: 100000) IDs per request.
+
+        The response is newline delimited JSON, one line per input ID in the order of the input: `{"id": "...", "result": ...}`, where `result` is the result of the GET endpoint for the ID alone. Lines are sent as the IDs are processed (in chunks of `sg_bulk_chunk_size` IDs).
+"""
+
+
+def bulk_response (chunks):
+    return (StreamingResponse(chunks, media_type = 'application/x-ndjson'))
+
+
+@router.post("/bioactivity_target", tags=["Bulk"], description = "Bulk variant of `/bioactivity_target/{target_uniprot_ids}`, `ids` are UniProt IDs." + BULK_DESCRIPTION)
+async def bulk_bioactivity_target (body: BulkIds, activity_cutoff: Union[float, None] = 0.0, activity_type: Union [str, None] = None):
+    return (bulk_response (await sga.bulk_bioactivity_target (body.ids, activity_cutoff, activity_type)))
+
+
+@router.post("/bioactivity_compound", tags=["Bulk"], description = "Bulk variant of `/bioactivity_compound/{inchikeys}`, `ids` are InChI-Keys (non-stereo InChI-Keys with `stereo=false`)." + BULK_DESCRIPTION)
+async def bulk_bioactivity_compound (body: BulkIds, stereo: Union[bool, None] = True, activity_cutoff: Union[float, None] = 0.0, activity_type: Union[str, None] = None):
+    return (bulk_response (await sga.bulk_bioactivity_compound (body.ids, stereo, activity_cutoff, activity_type)))
+
+
+@router.post("/potent_compounds", tags=["Bulk"], description = "Bulk variant of `/potent_compounds/{uniprot_ids}`, `ids` are UniProt IDs." + BULK_DESCRIPTION)
+async def bulk_potent_compounds (body: BulkIds, activity_type: Union[str, None] = None):
+    return (bulk_response (await sga.bulk_potent_compounds (body.ids, activity_type)))
+
+
+@router.post("/patterns_of_compounds", tags=["Bulk"], description = "Bulk variant of `/patterns_of_compounds/{inchikeys}`, `ids` are InChI-Keys (non-stereo InChI-Keys with `stereo=false`)." + BULK_DESCRIPTION)
+async def bulk_patterns_of_compounds (body: BulkIds, stereo: Union[bool, None]=True, pattern_type: Union[str, None]='scaffold', min_ratio: Union[float, None]=0.0, is_largest: Union[bool, None]=None):
+    return (bulk_response (await sga.bulk_patterns_of_compounds (body.ids, stereo, pattern_type, min_ratio, is_largest)))
+
+
+@router.post("/smiles_compound", tags=["Bulk"], description = "Bulk variant of `/smiles_compound/{inchikey}`, `ids` are InChI-Keys (non-stereo InChI-Keys with `stereo=false`). `result` is null for unknown compounds." + BULK_DESCRIPTION)
+async def bulk_smiles_compound (body: BulkIds, stereo: Union[bool, None]=True):
+    return (bulk_response (await sga.bulk_smiles_compound (body.ids, stereo)))
+
+
+@router.post("/smiles_pattern", tags=["Bulk"], description = "Bulk variant of `/smiles_pattern/{pattern_id}`, `ids` are pattern IDs. `result` is null for unknown patterns." + BULK_DESCRIPTION)
+async def bulk_smiles_pattern (body: BulkIds):
+    return (bulk_response (await sga.bulk_smiles_pattern (body.ids)))
+
+
+
 @router.get("/sg_stlye", response_class=CustomORJSONResponse, tags=["Utilities"])
-def sg_style_compound ():
+async def sg_style_compound ():
     """
         Returns the SmartGraph style for Cytoscape.
 
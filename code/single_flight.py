@@ -0,0 +1,139 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://pkg.go.dev/golang.org/x/sync/singleflight
+# Ref: https://docs.python.org/3/library/threading.html#event-objects
+# Ref: https://docs.python.org/3/library/asyncio-task.html#asyncio.shield
+#
+#
+# Request coalescing (single-flight) of the SmartGraph endpoints.
+#
+# Concurrent calls with the same key (see result_cache.make_key) wait on a single execution of the query and share its
+# result (or its exception). The first caller executes the query, the others are counted as coalesced. Unlike the
+# result cache, nothing is kept once the execution finished.
+#
+# The asyncio execution is shielded from the cancellation of the caller that started it (e.g. the client of the first
+# request disconnected), so the callers waiting on it still get the result.
+#
+
+import asyncio
+import threading
+
+
+class Flight:
+
+    def __init__ (self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_lock = threading.Lock()
+
+_flights = {}
+_async_flights = {}
+
+_metrics = {
+    'calls': 0,
+    'executions': 0,
+    'coalesced': 0,
+    'errors': 0
+}
+
+_endpoint_coalesced = {}
+
+
+def count_call (endpoint, coalesced):
+    # Must be called holding _lock
+    _metrics['calls'] += 1
+
+    if coalesced:
+        _metrics['coalesced'] += 1
+        _endpoint_coalesced[endpoint] = _endpoint_coalesced.get (endpoint, 0) + 1
+    else:
+        _metrics['executions'] += 1
+
+
+def count_error ():
+    with _lock:
+        _metrics['errors'] += 1
+
+
+def run (endpoint, key, fn):
+    with _lock:
+        flight = _flights.get (key)
+        leader = flight is None
+
+        if leader:
+            flight = Flight ()
+            _flights[key] = flight
+
+        count_call (endpoint, not leader)
+
+    if not leader:
+        flight.done.wait ()
+
+        if flight.error is not None:
+            raise flight.error
+
+        return (flight.result)
+
+    try:
+        flight.result = fn ()
+
+    except Exception as e:
+        flight.error = e
+        count_error ()
+        raise
+
+    finally:
+        with _lock:
+            del _flights[key]
+
+        flight.done.set ()
+
+    return (flight.result)
+
+
+async def run_async (endpoint, key, fn):
+    # fn is a coroutine function, the flights are kept per event loop as asyncio tasks can not be awaited across loops.
+    loop = asyncio.get_running_loop()
+    flight_key = (id(loop), key)
+
+    with _lock:
+        task = _async_flights.get (flight_key)
+        leader = task is None
+
+        if leader:
+            task = loop.create_task (fn ())
+            _async_flights[flight_key] = task
+
+        count_call (endpoint, not leader)
+
+    if leader:
+        task.add_done_callback (lambda t: finish_async_flight (flight_key, t))
+
+    return (await asyncio.shield (task))
+
+
+def finish_async_flight (flight_key, task):
+    with _lock:
+        _async_flights.pop (flight_key, None)
+
+        if not task.cancelled() and task.exception() is not None:
+            _metrics['errors'] += 1
+
+
+def get_metrics ():
+    with _lock:
+        metrics = dict (_metrics)
+        metrics['in_flight'] = len(_flights) + len(_async_flights)
+        metrics['coalesced_per_endpoint'] = dict (_endpoint_coalesced)
+
+    metrics['coalesced_ratio'] = metrics['coalesced'] / metrics['calls'] if metrics['calls'] > 0 else 0.0
+
+    return (metrics)
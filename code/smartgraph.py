@@ -39,6 +39,12 @@
 #
 
 import neo4j_utils
+import cypher_queries as cq
+import result_cache
+import single_flight
+import graphml_writer
+import columnar_export
+import graph_builder
 import sys
 
 
@@ -167,174 +173,122 @@ def parse_graph (graph_json):
     return (G)
 
 def to_graphml (G_json):
-    G_graphml = ''
-    G = parse_graph (G_json)
-    linefeed = chr(10)
-    #s = linefeed.join(nx.generate_graphml(G))
+    return (graphml_writer.to_graphml (G_json))
 
-    for line in nx.generate_graphml(G):
-        G_graphml += line
 
-    return (G_graphml)
 
 
 
+#G_graphml = to_graphml (G_json)
 
+#print (G_graphml)
 
-def extract_node_properties (node, nodes):
-    
-    node_properties = {}
-    
-    node_type = list(node.labels)[0]
-    #print (node_type)
 
-    raw_properties = node.items()
-    
-    
-    for k, v in raw_properties:
-        node_properties[k] = v
+### End of network parsing logic
 
-    node_properties['node_type'] = node_type.lower()
 
-    if node_properties['node_type'] == 'compound':
-        node_properties['node_id'] = node_properties['hash']
-        node_properties['inchikey'] = node_properties['hash']
-        node_properties['nsinchikey'] = node_properties['nostereo_hash']
+###
+### Query execution section
+###
 
-    elif node_properties['node_type'] == 'pattern':
-        node_properties['node_id'] = node_properties['pattern_id']
-        node_properties['inchikey'] = node_properties['hash']
+# All queries share the process-wide driver of neo4j_utils, i.e. no Bolt handshake per request.
+# The `*_query` functions below build the Cypher of an endpoint and are shared with the asyncio
+# implementation of the endpoints in smartgraph_async.py .
 
-    elif node_properties['node_type'] == 'target':
-        node_properties['node_id'] = node_properties['uniprot_id']
-    else:
-        raise Exception ("[ERROR] Invalid node type encountered in SmartGraph JSON.")
+def graph_to_json (g):
+    return (graph_builder.GraphBuilder().add_graph (g).to_json())
 
-    nodes.append (node_properties)
- 
-    return (nodes)
 
-def extract_specific_node_property (node, spec_prop):
-    props = node.items()
+def run_graph_query (query, parameters = None):
 
-    for k, v in props:
-        if k == spec_prop:
-            return (v)
+    # Use this in conjuction with Neo4j v4.x
+    #with neo4j_utils.neo4j_session(database="neo4j") as session:
 
-    return (None)
 
+    # Use this in conjuction with Neo4j v3.x
+    with neo4j_utils.neo4j_session() as session:
+        #print (query) 
+        g = session.execute_read(
+            lambda tx: tx.run(query, parameters).graph())
 
-def extract_edge_properties (edge, edges):
-       
-    edge_properties = {}
-    tmp = []
-    
-    raw_properties = edge.items()
-    
-    
-    mode_type = None
-
-    for k, v in raw_properties:
-        if k == 'edgeType':
-            edge_properties['action_type'] = v
-        elif k == 'unique_label':
-            edge_properties['edge_label'] = v
-        elif k == 'ppi_uid':
-            edge_properties['edge_label'] = v
-        elif k == 'edgeInfo':
-            edge_properties['mechanism_details'] = v
+        G_json = graph_to_json (g)
 
-        else:
-            edge_properties[k] = v
+    return (G_json)
 
-    
-    edge_properties['uuid'] = edge_properties['uuid'] + '_' + edge_properties['edge_label']
 
+def run_records_query (query, parameters = None):
+    with neo4j_utils.neo4j_session() as session:
+        records = session.execute_read(
+            lambda tx: list(tx.run(query, parameters)))
 
+    return (records)
 
 
+def format_graph (G_json, format = 'json'):
+    if format == 'graphml':
+        return (to_graphml(G_json))
 
+    if format in ['arrow', 'parquet']:
+        return (columnar_export.to_archive (G_json, format))
 
-    edge_properties['edge_type'] = edge.type.lower()
-    #print(edge.start_node.items())
+    return (G_json)
 
 
-    if edge_properties['edge_type'] == 'regulates':
-        start_node_id = extract_specific_node_property (edge.start_node, 'uniprot_id')
-        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
-    elif edge_properties['edge_type'] == 'tested_on':
-        start_node_id = extract_specific_node_property (edge.start_node, 'hash')
-        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
-    elif edge_properties['edge_type'] == 'pattern_of':
-        start_node_id = extract_specific_node_property (edge.start_node, 'pattern_id')
-        end_node_id = extract_specific_node_property (edge.end_node, 'hash')
-    elif edge_properties['edge_type'] == 'potent_pattern_of':
-        start_node_id = extract_specific_node_property (edge.start_node, 'pattern_id')
-        end_node_id = extract_specific_node_property (edge.end_node, 'uniprot_id')
-    else:
-        raise Exception ('[ERROR] Invalid edge type encountered in SmartGraph JSON.')
+def cached_endpoint (endpoint, key, execute):
+    # Results are looked up in the result cache first, identical concurrent executions are coalesced into one.
+    if not result_cache.is_enabled (endpoint):
+        return (single_flight.run (endpoint, key, execute))
 
+    hit, result = result_cache.lookup (endpoint, key)
 
-    edge_properties['start_node'] = start_node_id
-    edge_properties['end_node'] = end_node_id
-    
-    #edge_label = edge_properties['edge_label']
+    if hit:
+        return (result)
 
-    
-    
-    #tmp = edge_label.split('_')
-    
-    
+    def execute_and_store ():
+        result = execute ()
+        result_cache.store (endpoint, key, result)
 
-    
-    edges.append(edge_properties)
-    
-    return (edges)
+        return (result)
 
+    return (single_flight.run (endpoint, key, execute_and_store))
 
 
+def graph_endpoint (endpoint, query, parameters, format = 'json'):
+    key = result_cache.make_key (endpoint, query, parameters, format)
 
+    return (cached_endpoint (endpoint, key, lambda: format_graph (run_graph_query (query, parameters), format)))
 
-def aggregate_nodes(nodes):
-    aggregated_nodes = {}
-    
-    for node in nodes:
-        node_id = node['node_id']
-        aggregated_nodes[node_id] = node
-    
-    result = []
-    
-    #print (aggregated_nodes.keys())
-    
-    for v in aggregated_nodes.values():
-        result.append (v)
-        
-    return (result)
 
+def records_endpoint (endpoint, query, parameters, to_json, *options):
+    key = result_cache.make_key (endpoint, query, parameters, *options)
 
+    return (cached_endpoint (endpoint, key, lambda: to_json (run_records_query (query, parameters), *options)))
 
-def aggregate_edges(edges):
-    aggregated_edges = {}
-    
-    for edge in edges:
-        edge_id = edge['uuid']
-        aggregated_edges[edge_id] = edge
-    
-    result = []
-    
-    for v in aggregated_edges.values():
-        result.append (v)
-        
-    return (result)
 
+def split_ids (ids):
+    return (ids.split(','))
 
 
-#G_graphml = to_graphml (G_json)
+def compound_hash (inchikey, stereo = True):
+    if stereo:
+        return (inchikey)
 
-#print (G_graphml)
+    return (inchikey.split('-')[0].strip())
 
 
-### End of network parsing logic
+def compound_hashes (inchikeys, stereo = True):
+    l_inchikeys = []
+    l_nsinchikeys = []
+
+    l_inchikeys = inchikeys.split(',')
+
+    if stereo:
+        return (l_inchikeys)
+
+    for ik in l_inchikeys:
+        l_nsinchikeys.append(compound_hash (ik, stereo))
+
+    return (l_nsinchikeys)
 
 
 ###
@@ -359,857 +313,216 @@ def bibtex ():
 
 # find all bioactivities of a target
 
-def bioactivity_target (target_proteins, activity_cutoff = 0.0, activity_type = None, format = 'json'):
+def bioactivity_target_query (target_proteins, activity_cutoff = 0.0, activity_type = None):
     # target_protein: UniProtIDs
     # activity_cutoff: in uM units, if 0, then all activities will be reported
     # activity_type:string
 
-    conn = neo4j_utils.open_neo4j_connection()
-    
-    #query = "MATCH p = (ra:Substance)-[:PRODUCT_OF|REAGENT_OF|REACTANT_OF*.." + str(search_depth) + "]->(pr:Substance) where pr.inchikey='" + target_molecule + "' and pr.inchikey<>ra.inchikey return p"
-    
-
-    l_targets = []
-    l_targets = target_proteins.split(',')
+    return (cq.bioactivity_target (split_ids(target_proteins), activity_cutoff, activity_type))
 
-    
 
-    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id IN ['" + "', '".join(l_targets) + "']"
+def bioactivity_target (target_proteins, activity_cutoff = 0.0, activity_type = None, format = 'json'):
+    query, parameters = bioactivity_target_query (target_proteins, activity_cutoff, activity_type)
 
+    #print (query)
 
+    return (graph_endpoint ('bioactivity_target', query, parameters, format))
 
-    if activity_cutoff > 0.0:
-        query += " AND rel.activity<=" + str(activity_cutoff)
 
-    if activity_type != None:
-        query += " AND rel.activity_type='" + activity_type + "'"
-    
 
-    query += " RETURN c, t, rel"
 
-    #print (query)
+# find all bioactivities of a compound
 
-    all_nodes = []
-    all_edges = []
+def bioactivity_compound_query (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None):
+    # activity_cutoff: in uM units, if 0, then all activities will be reported
+    # activity_type:string
 
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
+    return (cq.bioactivity_compound (compound_hashes(inchikeys, stereo), stereo, activity_cutoff, activity_type))
 
 
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
+def bioactivity_compound (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None, format = 'json'):
+    query, parameters = bioactivity_compound_query (inchikeys, stereo, activity_cutoff, activity_type)
 
-      
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
+    #print (query)
 
+    return (graph_endpoint ('bioactivity_compound', query, parameters, format))
 
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
 
+# bioactivity between a specific compound and a specific target 
 
-    #print (result)
+def bioactivity_c2t_query (inchikeys, target_proteins, stereo = True, activity_type = None):
+    # target_proteins: UniProtIDs
+    # activity_type:string
 
-    #print (all_nodes)
-    #print (all_edges)
-  
-    
-    G_json = {}
+    return (cq.bioactivity_c2t (compound_hashes(inchikeys, stereo), split_ids(target_proteins), stereo, activity_type))
 
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-    
-    conn.close()
-    
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
-        
+def bioactivity_c2t (inchikeys, target_proteins, stereo = True, activity_type = None, format = 'json'):
+    query, parameters = bioactivity_c2t_query (inchikeys, target_proteins, stereo, activity_type)
 
-    return (G_json)
+    #print (query)
 
+    return (graph_endpoint ('bioactivity_c2t', query, parameters, format))
 
 
 
-# find all bioactivities of a compound
+# find potent compounds of a target
 
-def bioactivity_compound (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None, format = 'json'):
-    # activity_cutoff: in uM units, if 0, then all activities will be reported
+def potent_compounds_query (target_proteins, activity_type = None):
+    # target_proteins: UniProtIDs of target proteins, comma-separated
     # activity_type:string
 
+    return (cq.potent_compounds (split_ids(target_proteins), activity_type))
 
-    l_inchikeys = []
-    l_nsinchikeys = []
 
+def potent_compounds (target_proteins, activity_type = None, format = 'json'):
+    query, parameters = potent_compounds_query (target_proteins, activity_type)
+
+    #print (query)
 
-    l_inchikeys = inchikeys.split(',')
- 
+    return (graph_endpoint ('potent_compounds', query, parameters, format))
 
-    for ik in l_inchikeys:
-        l_nsinchikeys.append(ik.split('-')[0].strip())
 
 
 
-    conn = neo4j_utils.open_neo4j_connection()
-    
-    #query = "MATCH p = (ra:Substance)-[:PRODUCT_OF|REAGENT_OF|REACTANT_OF*.." + str(search_depth) + "]->(pr:Substance) where pr.inchikey='" + target_molecule + "' and pr.inchikey<>ra.inchikey return p"
-    
-    
-    
-  
 
-    if stereo:
-        query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c.hash IN ['" + "', '".join(l_inchikeys) + "']"
-    else:
-        query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c.nostereo_hash IN ['" + "', '".join(l_nsinchikeys) + "']"
-        
+# find N-length path between a set of source and a set of target proteins
 
-    if activity_cutoff > 0.0:
-        query += " AND rel.activity<=" + str(activity_cutoff)
+def path_regulatory_query (source_proteins, target_proteins, shortest_paths=True, max_length=4, confidence_cutoff=0.0, directed=True):
+    return (cq.path_regulatory (split_ids(source_proteins), split_ids(target_proteins), shortest_paths, max_length, confidence_cutoff, directed))
 
-    if activity_type != None:
-        query += " AND rel.activity_type='" + activity_type + "'"
-    
 
-    query += " RETURN c, t, rel"
+def path_regulatory (source_proteins, target_proteins, shortest_paths=True, max_length=4, confidence_cutoff=0.0, directed=True, format = 'json'):
+    query, parameters = path_regulatory_query (source_proteins, target_proteins, shortest_paths, max_length, confidence_cutoff, directed)
 
     #print (query)
 
-    all_nodes = []
-    all_edges = []
+    return (graph_endpoint ('path_regulatory', query, parameters, format))
 
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
 
 
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
+# find N-length path between a set of compounds and a set of targets
 
-      
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
+def path_c2t_query (inchikeys, target_proteins,  stereo=True, shortest_paths=True, max_length=4, activity_cutoff=0.0, activity_type=None, confidence_cutoff=0.0):
+    return (cq.path_c2t (compound_hashes(inchikeys, stereo), split_ids(target_proteins), stereo, shortest_paths, max_length, activity_cutoff, activity_type, confidence_cutoff))
 
 
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
+def path_c2t (inchikeys, target_proteins,  stereo=True, shortest_paths=True, max_length=4, activity_cutoff=0.0, activity_type=None, confidence_cutoff=0.0, format = 'json'):
+    query, parameters = path_c2t_query (inchikeys, target_proteins, stereo, shortest_paths, max_length, activity_cutoff, activity_type, confidence_cutoff)
 
+    #print (query)
 
-    #print (result)
+    return (graph_endpoint ('path_c2t', query, parameters, format))
 
-    #print (all_nodes)
-    #print (all_edges)
-  
-    
-    G_json = {}
 
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-    
-    conn.close()
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
-    
-    return (G_json)
+# get all targets available from a target in N steps
 
+def path_regulatory_open_query (protein_targets, shortest_paths=True, max_length=4, explore_mode='undirected', confidence_cutoff=0.0):
+    """
+        explore_mode:
+            - 'undirected': finds all paths that are reacheable from the target proteins in `max_length` of steps, regardless of the direction of the edges
+            - 'source': finds all paths starting from the provided protein targets that are reacheable within `max_length` of steps
+            - 'target': finds all paths  ending in the provided protein targets and are at most `max_length` length
+    """
 
-# bioactivity between a specific compound and a specific target 
+    acceptable_modes = ['undirected', 'source', 'target']
 
-def bioactivity_c2t (inchikeys, target_proteins, stereo = True, activity_type = None, format = 'json'):
-    # target_proteins: UniProtIDs
-    # activity_cutoff: in uM units, if 0, then all activities will be reported
-    # activity_type:string
+    if explore_mode not in acceptable_modes:
+        raise Exception ("[ERROR]: /path_regulatory_open encountered an invalide `explore_mode` parameter. Valid options: ['undirected', 'source', 'target']")
 
+    return (cq.path_regulatory_open (split_ids(protein_targets), shortest_paths, max_length, explore_mode, confidence_cutoff))
 
 
-    l_inchikeys = []
-    l_nsinchikeys = []
-    l_targets = []
+def path_regulatory_open (protein_targets, shortest_paths=True, max_length=4, explore_mode='undirected', confidence_cutoff=0.0, format = 'json'):
+    query, parameters = path_regulatory_open_query (protein_targets, shortest_paths, max_length, explore_mode, confidence_cutoff)
 
-    l_inchikeys = inchikeys.split(',')
-    l_targets = target_proteins.split(',')
- 
+    #print (query)
 
-    for ik in l_inchikeys:
-        l_nsinchikeys.append(ik.split('-')[0].strip())
+    return (graph_endpoint ('path_regulatory_open', query, parameters, format))
 
 
 
 
-    conn = neo4j_utils.open_neo4j_connection()
-    
-    #query = "MATCH p = (ra:Substance)-[:PRODUCT_OF|REAGENT_OF|REACTANT_OF*.." + str(search_depth) + "]->(pr:Substance) where pr.inchikey='" + target_molecule + "' and pr.inchikey<>ra.inchikey return p"
-    
- 
-    if stereo:
-        query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c.hash IN ['" + "', '".join(l_inchikeys) + "']"
+# get all compounds available from target proteins in N steps
 
-    else:
-        query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE c.nostereo_hash IN ['" + "', '".join(l_nsinchikeys) + "']"
-        
+def subgraph_target_induced_query (protein_targets, endpoint_type='both', shortest_paths=True, max_length=4, explore_mode='undirected', reachable=None):
+    """
+        Extracts a subgraph induced by a set of provided protein targets so that these targets are one endpoints of paths that end in compounds/targets/both, and the lengths of paths is <= `max_length`.
 
-    query += " AND t.uniprot_id IN ['" + "', '".join(l_targets) + "']"
- 
- 
-    if activity_type != None:
-        query += " AND rel.activity_type='" + activity_type + "'"
-    
+        explore_mode:
+            - 'undirected': finds all paths that are reacheable from the target proteins in `max_length` of steps, regardless of the direction of the edges
+            - 'source': finds all paths starting from the provided protein targets that are reacheable within `max_length` of steps
+            - 'target': finds all paths  ending in the provided protein targets and are at most `max_length` length
 
-    query += " RETURN c, t, rel"
+        endpoint_type:
+            - 'compound': endpoints are compounds
+            - 'target': endpoints are targets
+            - 'both': endpoints are either compounds or targets
 
-    #print (query)
+        reachable: optional, uniprot_id -> UniProt IDs of the targets within `max_length`, narrows the shortest path
+                   searches to targets (see regulatory_network.reachable_targets)
+    """
 
-    all_nodes = []
-    all_edges = []
+    acceptable_modes = ['undirected', 'source', 'target']
+    acceptable_endpoint_types = ['compound', 'target', 'both']
 
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
+    if explore_mode not in acceptable_modes:
+        raise Exception ("[ERROR]: /subgraph_target_induced encountered an invalid `explore_mode` parameter. Valid options: ['undirected', 'source', 'target']")
 
 
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
+    if endpoint_type not in acceptable_endpoint_types:
+        raise Exception ("[ERROR]: /subgraph_target_induced encountered an invalid `endpoint_type` parameter. Valid options: ['compound', 'target', 'both']")
 
-      
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
+    return (cq.subgraph_target_induced (split_ids(protein_targets), endpoint_type, shortest_paths, max_length, explore_mode, reachable))
 
 
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
+def subgraph_target_induced (protein_targets, endpoint_type='both', shortest_paths=True, max_length=4, explore_mode='undirected', format = 'json'):
+    query, parameters = subgraph_target_induced_query (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode)
 
+    #print (query)
 
-    #print (result)
+    return (graph_endpoint ('subgraph_target_induced', query, parameters, format))
 
-    #print (all_nodes)
-    #print (all_edges)
-  
-    
-    G_json = {}
 
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-    
-    conn.close()
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
+# get all targets available from a compound in N steps
 
-    return (G_json)
+def subgraph_compound_induced_query (inchikeys, stereo=True, shortest_paths=True, max_length=4):
+    """
+        Extracts a subgraph induced by a set of provided compounds so that paths starting from them are of length <= `max_length`.
+    """
 
+    return (cq.subgraph_compound_induced (compound_hashes(inchikeys, stereo), stereo, shortest_paths, max_length))
 
 
-# find potent compounds of a target
+def subgraph_compound_induced (inchikeys, stereo=True, shortest_paths=True, max_length=4, format = 'json'):
+    query, parameters = subgraph_compound_induced_query (inchikeys, stereo, shortest_paths, max_length)
 
-def potent_compounds (target_proteins, activity_type = None, format = 'json'):
-    # target_proteins: UniProtIDs of target proteins, comma-separated
-    # activity_cutoff: in uM units, if 0, then all activities will be reported
-    # activity_type:string
-    
-    l_targets = []
-    l_targets = target_proteins.split(',')
+    #print (query)
 
-    conn = neo4j_utils.open_neo4j_connection()
-    
-    #query = "MATCH p = (ra:Substance)-[:PRODUCT_OF|REAGENT_OF|REACTANT_OF*.." + str(search_depth) + "]->(pr:Substance) where pr.inchikey='" + target_molecule + "' and pr.inchikey<>ra.inchikey return p"
-    
-    
-    query = "MATCH (c:Compound)-[rel:TESTED_ON]->(t:Target) WHERE t.uniprot_id IN ['" + "', '".join(l_targets) + "'] AND rel.activity<=t.activity_cutoff"
+    return (graph_endpoint ('subgraph_compound_induced', query, parameters, format))
 
 
 
-    if activity_type != None:
-        query += " and rel.activity_type='" + activity_type + "'"
-    
-
-    query += " RETURN c, t, rel"
-
-    #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-
-
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-
-      
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    #print (result)
-
-    #print (all_nodes)
-    #print (all_edges)
-  
-    
-    G_json = {}
-
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-    
-    conn.close()
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-    
-    return (G_json)
-
-
-
-
-
-# find N-length path between a set of source and a set of target proteins
-
-def path_regulatory (source_proteins, target_proteins, shortest_paths=True, max_length=4, confidence_cutoff=0.0, directed=True, format = 'json'):
-
-    l_sources = []
-    l_targets = []
-
-    l_sources = source_proteins.split(',')
-    l_targets = target_proteins.split(',')
-
-    conn = neo4j_utils.open_neo4j_connection()
-
-    if directed:
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:REGULATES*.." + str(max_length) + "]->(t2:Target)) WHERE t1.uniprot_id IN ['" + "', '".join(l_sources) + "'] AND t2.uniprot_id IN ['" + "', '".join(l_targets) + "'] AND t1.uuid<>t2.uuid"
-        else:
-            query = "MATCH p=(t1:Target)-[r:REGULATES*.." + str(max_length) + "]->(t2:Target)  WHERE t1.uniprot_id IN ['" + "', '".join(l_sources) + "'] AND t2.uniprot_id IN ['" + "', '".join(l_targets) + "']"
-
-    else:
-
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:REGULATES*.." + str(max_length) + "]-(t2:Target)) WHERE t1.uniprot_id IN ['" + "', '".join(l_sources) + "'] AND t2.uniprot_id IN ['" + "', '".join(l_targets) + "'] AND t1.uuid<>t2.uuid"
-
-        else:
-            query = "MATCH p=(t1:Target)-[r:REGULATES*.." + str(max_length) + "]-(t2:Target) WHERE t1.uniprot_id IN ['" + "', '".join(l_sources) + "'] AND t2.uniprot_id IN ['" + "', '".join(l_targets) + "']"
-
-    if confidence_cutoff>0.0:
-        query += " AND ALL(rel in r WHERE rel.max_confidence_value>=" + str(confidence_cutoff) + ")"
-
-
-    query += " RETURN p"
-
-
-    #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-
-
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-
-      
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    #print (result)
-
-    #print (all_nodes)
-    #print (all_edges)
-  
-    
-    G_json = {}
-
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-    
-    conn.close()
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-    
-    return (G_json)
-
-
-
-# find N-length path between a set of compounds and a set of targets
-def path_c2t (inchikeys, target_proteins,  stereo=True, shortest_paths=True, max_length=4, activity_cutoff=0.0, activity_type=None, confidence_cutoff=0.0, format = 'json'):
-
-    l_inchikeys = []
-    l_nsinchikeys = []
-
-    l_targets = []
-
-    l_inchikeys = inchikeys.split(',')
-    l_targets = target_proteins.split(',')
-
-    for ik in l_inchikeys:
-        l_nsinchikeys.append(ik.split('-')[0].strip())
-
-
-    conn = neo4j_utils.open_neo4j_connection()
-
-    query = "MATCH (c:Compound)-[a:TESTED_ON]->(t1:Target)"
-     
-    first = True
-
-
-
-    if activity_cutoff > 0.0:
-        query+= " WHERE a.activity<=" + str(activity_cutoff)
-        first = False
-
-    if activity_type!=None:
-        if first:
-            query+= " WHERE a.activity_type='" + activity_type + "'"
-            first = False
-        else:
-            query+= " AND a.activity_type='" + activity_type + "'"
-
-    if first:
-        query += " WHERE "
-        first = False
-
-    else:
-        query += " AND "
-
-    if stereo:
-        query += " c.hash IN ['" + "', '".join(l_inchikeys) + "']"
-    else:
-        query += " c.nostereo_hash IN ['" + "', '".join(l_nsinchikeys) + "']"
-    query += " WITH t1, COLLECT(c) as compounds, COLLECT(t1) as targets"
-
-    if shortest_paths:
-        query += " MATCH p1=shortestPath((t1)-[r*.." + str(max_length) + "]->(q:Target))"
-    
-    else:
-        query += " MATCH p1=(t1)-[r*.." + str(max_length) + "]->(q:Target)"
-    
-    query += " WHERE q.uniprot_id IN ['" + "', '".join(l_targets) + "']"
-
-    query += " AND t1.uuid<>q.uuid"
-
-    if confidence_cutoff>0.0:
-         query += " AND ALL(rel in r WHERE rel.max_confidence_value>=" + str(confidence_cutoff) + ")"
-     
-
-    query += " UNWIND compounds as x"
-    query += " UNWIND targets as y"
-    query += " MATCH p2=shortestPath((x)-[z:TESTED_ON]-(y))"
-    query += " RETURN p1, p2"
-
-     #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-     # Use this in conjuction with Neo4j v4.x
-     #with conn.session(database="neo4j") as session:
-
-
-     # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-     
-    return (G_json)
-
-
-
-# get all targets available from a target in N steps
-
-
-def path_regulatory_open (protein_targets, shortest_paths=True, max_length=4, explore_mode='undirected', confidence_cutoff=0.0, format = 'json'):
-    """
-        explore_mode:
-            - 'undirected': finds all paths that are reacheable from the target proteins in `max_length` of steps, regardless of the direction of the edges
-            - 'source': finds all paths starting from the provided protein targets that are reacheable within `max_length` of steps
-            - 'target': finds all paths  ending in the provided protein targets and are at most `max_length` length
-    """
-
-    acceptable_modes = ['undirected', 'source', 'target']
-
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    l_targets = []
-    
-    l_targets = protein_targets.split(',')
-
-    if explore_mode not in acceptable_modes:
-        raise Exception ("[ERROR]: /path_regulatory_open encountered an invalide `explore_mode` parameter. Valid options: ['undirected', 'source', 'target']")
-
-    if explore_mode == 'undirected':
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:REGULATES*.." + str(max_length) + "]-(t2:Target)) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += " AND t1.uuid<>t2.uuid"
-
-        else:
-            query = "MATCH p=(t1:Target)-[r:REGULATES*.." + str(max_length) + "]-(t2:Target) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-
-    elif explore_mode == 'source':
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:REGULATES*.." + str(max_length) + "]->(t2:Target)) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += " AND t1.uuid<>t2.uuid"
-
-        else:
-            query = "MATCH p=(t1:Target)-[r:REGULATES*.." + str(max_length) + "]->(t2:Target) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-
-    elif explore_mode == 'target':
-
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)<-[r:REGULATES*.." + str(max_length) + "]-(t2:Target)) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += " AND t1.uuid<>t2.uuid"
-
-        else:
-            query = "MATCH p=(t1:Target)<-[r:REGULATES*.." + str(max_length) + "]-(t2:Target) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-
-     
-
-
-
-
- 
-    
-
-    if confidence_cutoff > 0.0:
-        query += " AND ALL(rel in r WHERE rel.max_confidence_value>=" + str(confidence_cutoff) + ")"
-
-     
-
-    query += " RETURN p"
-
-    #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-     # Use this in conjuction with Neo4j v4.x
-     #with conn.session(database="neo4j") as session:
-
-
-     # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
-
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-     
-    return (G_json)
-
-
-
-
-# get all compounds available from target proteins in N steps
-
-def subgraph_target_induced (protein_targets, endpoint_type='both', shortest_paths=True, max_length=4, explore_mode='undirected', format = 'json'):
-    """
-        Extracts a subgraph induced by a set of provided protein targets so that these targets are one endpoints of paths that end in compounds/targets/both, and the lengths of paths is <= `max_length`.
-
-        explore_mode:
-            - 'undirected': finds all paths that are reacheable from the target proteins in `max_length` of steps, regardless of the direction of the edges
-            - 'source': finds all paths starting from the provided protein targets that are reacheable within `max_length` of steps
-            - 'target': finds all paths  ending in the provided protein targets and are at most `max_length` length
-
-        endpoint_type:
-            - 'compound': endpoints are compounds
-            - 'target': endpoints are targets
-            - 'both': endpoints are either compounds or targets
-    """
-
-    acceptable_modes = ['undirected', 'source', 'target']
-    acceptable_endpoint_types = ['compound', 'target', 'both']
-
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    l_targets = []
-    
-    l_targets = protein_targets.split(',')
-
-    if explore_mode not in acceptable_modes:
-        raise Exception ("[ERROR]: /subgraph_target_induced encountered an invalid `explore_mode` parameter. Valid options: ['undirected', 'source', 'target']")
-
-
-    if endpoint_type not in acceptable_endpoint_types:
-        raise Exception ("[ERROR]: /subgraph_target_induced encountered an invalid `endpoint_type` parameter. Valid options: ['compound', 'target', 'both']")
-
-
-     
-    endpoint_constraint = ''
-    self_node_constraint = ''
-
-    if endpoint_type == 'compound':
-        endpoint_constraint = 'c:Compound'
-        self_node_constraint = ''
-
-    elif endpoint_type == 'target':
-        endpoint_constraint = 't2:Target'
-        self_node_constraint = ' AND t1.uuid<>t2.uuid'
-
-
-    elif endpoint_type == 'both':
-        endpoint_constraint = 'x'
-        self_node_constraint = ' AND t1.uuid<>x.uuid'
-
-
-    if explore_mode == 'undirected':
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]-(" + endpoint_constraint + ")) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += self_node_constraint
-
-        else:
-            query = "MATCH p=(t1:Target)-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]-(" + endpoint_constraint + ") WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-
-    elif explore_mode == 'source':
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]->(" + endpoint_constraint + ")) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += self_node_constraint
-
-        else:
-            query = "MATCH p=(t1:Target)-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]->(" + endpoint_constraint + ") WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-    
-    elif explore_mode == 'target':
-
-        if shortest_paths:
-            query = "MATCH p=shortestPath((t1:Target)<-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]-(" + endpoint_constraint + ")) WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
-            query += self_node_constraint
-        
-        else:
-            query = "MATCH p=(t1:Target)<-[r:TESTED_ON|REGULATES*.." + str(max_length) + "]-(" + endpoint_constraint + ") WHERE t1.uniprot_id IN ['" + "', '".join (l_targets) + "']"
- 
-
-    query += " RETURN p"
-
-    #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-
-
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-    
-    return (G_json)
-
-
-
-# get all targets available from a compound in N steps
-
-
-def subgraph_compound_induced (inchikeys, stereo=True, shortest_paths=True, max_length=4, format = 'json'):
-    """
-        Extracts a subgraph induced by a set of provided compounds so that paths starting from them are of length <= `max_length`.
-    """
-
-
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    l_inchikeys = []
-    l_nsinchikeys = []
-    
-    l_inchikeys = inchikeys.split(',')
-
-
-     
-    for ik in l_inchikeys:
-        l_nsinchikeys.append(ik.split('-')[0].strip())
-
-
-    hash_field = ''
-
-    compound_hashes = []
-
-    if stereo:
-        hash_field = 'hash'
-        compound_hashes = l_inchikeys
-    else:
-        hash_field = 'nostereo_hash'
-        compound_hashes = l_nsinchikeys
-
-    if shortest_paths:
-        query = "MATCH (c:Compound)-[r*.." + str(max_length) + "]->(t:Target) WHERE c." + hash_field + " IN ['" + "', '".join (compound_hashes) + "']"
-        query += " WITH COLLECT (DISTINCT t) AS targets, COLLECT (DISTINCT c) AS compounds"
-        query += " UNWIND compounds as compound"
-        query += " UNWIND targets as target"
-        query += " MATCH p=shortestPath((compound)-[r*.." + str(max_length) + "]->(target))"
-
-
-    else:
-        query = "MATCH (c:Compound)-[r*.." + str(max_length) + "]->(t:Target) WHERE c." + hash_field + " IN ['" + "', '".join (compound_hashes) + "']"
-        query += " WITH COLLECT (DISTINCT t) AS targets, COLLECT (DISTINCT c) AS compounds"
-        query += " UNWIND compounds as compound"
-        query += " UNWIND targets as target"
-        query += " MATCH p=(compound)-[r*.." + str(max_length) + "]->(target)"
- 
-
-    query += " RETURN p"
-
-    #print (query)
-
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-    
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
-
-    if format == 'graphml':
-        return (to_graphml(G_json))
-
-     
-    return (G_json)
-
 
+# get SMILES of a compound
 
+def smiles_compound_query (compound_inchikey, stereo=True):
+    return (cq.smiles_compound (compound_hashes(compound_inchikey, stereo)[0], stereo))
 
-# get SMILES of a compound
 
-def smiles_compound (compound_inchikey, stereo=True):
+def smiles_compound_json (records, stereo=True):
     compound_smiles = []
     compound_inchikeys = []
     compound_nsinchikeys = []
     res = {}
 
-
-    if stereo:
-        query = "MATCH (c:Compound) WHERE c.hash='" + compound_inchikey + "' RETURN c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey"
-    else:
-        compound_nsinchikey = compound_inchikey.split('-')[0].strip()
-        query = "MATCH (c:Compound) WHERE c.nostereo_hash='" + compound_nsinchikey + "' RETURN c.smiles as smiles, c.hash as inchikey, c.nostereo_hash as nsinchikey"
-
-    #print (query)
-    
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    session = conn.session()
-    results = session.run (query)
-
-    
-    for record in results:
+    for record in records:
         compound_smiles.append(record["smiles"])
         compound_inchikeys.append(record["inchikey"])
         compound_nsinchikeys.append(record["nsinchikey"])
 
-    session.close()
-    conn.close()
-    
     res['smiles'] = compound_smiles[0]
     res['inchikey'] = compound_inchikeys[0]
     res['nsinchikey'] = compound_nsinchikeys[0]
@@ -1222,12 +535,21 @@ def smiles_compound (compound_inchikey, stereo=True):
     return (final_json)
 
 
-# get SMILES of a pattern
+def smiles_compound (compound_inchikey, stereo=True):
+    query, parameters = smiles_compound_query (compound_inchikey, stereo)
 
+    #print (query)
 
+    return (records_endpoint ('smiles_compound', query, parameters, smiles_compound_json, stereo))
 
 
-def smiles_pattern (pattern_id):
+# get SMILES of a pattern
+
+def smiles_pattern_query (pattern_id):
+    return (cq.smiles_pattern (pattern_id))
+
+
+def smiles_pattern_json (records):
     smiles = []
     inchikeys = []
     p_ids = []
@@ -1235,27 +557,12 @@ def smiles_pattern (pattern_id):
 
     res = {}
 
-
-    query = "MATCH (p:Pattern) WHERE p.pattern_id='" + pattern_id + "' RETURN p.smiles as smiles, p.hash as inchikey, p.pattern_type as pattern_type, p.pattern_id as pattern_id, p.uuid as uuid"
-
-    #print (query)
-    
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    session = conn.session()
-    results = session.run (query)
-
-    
-    for record in results:
+    for record in records:
         smiles.append(record["smiles"])
         inchikeys.append(record["inchikey"])
         p_ids.append(record["pattern_id"])
         p_types.append(record["pattern_type"])
 
-    session.close()
-    conn.close()
-    
     res['smiles'] = smiles[0]
     res['inchikey'] = inchikeys[0]
     res['pattern_id'] = p_ids[0]
@@ -1266,203 +573,115 @@ def smiles_pattern (pattern_id):
     final_json ['pattern'] = res
     
     return (final_json)
-    
-    return (final_json)
+
+
+def smiles_pattern (pattern_id):
+    query, parameters = smiles_pattern_query (pattern_id)
+
+    #print (query)
+
+    return (records_endpoint ('smiles_pattern', query, parameters, smiles_pattern_json))
 
 
 
 # get patterns of a compound
 
-def patterns_of_compounds (inchikeys, stereo=True, pattern_type='scaffold', min_ratio=0.0, is_largest=None, format = 'json'):
+def patterns_of_compounds_query (inchikeys, stereo=True, pattern_type='scaffold', min_ratio=0.0, is_largest=None):
     """
         Returns the patterns associated with provided compounds.
     """
 
-
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    l_inchikeys = []
-    l_nsinchikeys = []
-    
-    l_inchikeys = inchikeys.split(',')
+    return (cq.patterns_of_compounds (compound_hashes(inchikeys, stereo), stereo, pattern_type, min_ratio, is_largest))
 
 
-     
-    for ik in l_inchikeys:
-        l_nsinchikeys.append(ik.split('-')[0].strip())
+def patterns_of_compounds (inchikeys, stereo=True, pattern_type='scaffold', min_ratio=0.0, is_largest=None, format = 'json'):
+    query, parameters = patterns_of_compounds_query (inchikeys, stereo, pattern_type, min_ratio, is_largest)
 
+    #print (query)
 
-    hash_field = ''
+    return (graph_endpoint ('patterns_of_compounds', query, parameters, format))
 
-    compound_hashes = []
 
-    if stereo:
-        hash_field = 'hash'
-        compound_hashes = l_inchikeys
-    else:
-        hash_field = 'nostereo_hash'
-        compound_hashes = l_nsinchikeys
 
-    query = "MATCH paths=shortestPath((c:Compound)<-[r:PATTERN_OF*..1]-(p:Pattern)) WHERE c." + hash_field + " IN ['" + "', '".join (compound_hashes) + "']"
- 
-    query += " AND p.pattern_type='" + pattern_type + "'"
+# get potent patterns of a target
 
-    if min_ratio > 0.0:
-        query += " AND ALL(rel in r WHERE rel.ratio>=" + str(min_ratio) + ")"
+def potent_patterns_query (targets, pattern_type='scaffold'):
+    """
+        Returns the potent patterns of provided target proteins. Potent patterns are defined in context of SmartGraph.
+    """
 
+    return (cq.potent_patterns (split_ids(targets), pattern_type))
 
-    if is_largest != None:
-         query += " AND ALL(rel in r WHERE rel.islargest='" + str(is_largest).lower() + "')"
 
-    query += " RETURN paths"
+def potent_patterns (targets, pattern_type='scaffold', format = 'json'):
+    query, parameters = potent_patterns_query (targets, pattern_type)
 
     #print (query)
 
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-    
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
-
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
+    return (graph_endpoint ('potent_patterns', query, parameters, format))
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
-
-     
-    return (G_json)
 
 
+# make prediction for repurposing
 
-# get potent patterns of a target
-
-def potent_patterns (targets, pattern_type='scaffold', format = 'json'):
+def predict_query (target, limit=300, offset=0):
     """
-        Returns the potent patterns of provided target proteins. Potent patterns are defined in context of SmartGraph.
+       Computes "potent pattern"-based bioactivity predictions. This can be used in a drug repositioning setting.
     """
 
-
-    conn = neo4j_utils.open_neo4j_connection()
-    
-
-    l_targets = []
-    l_targets = targets.split(',')
+    return (cq.predict (target, limit, offset))
 
 
-    query = "MATCH paths=shortestPath((p:Pattern)-[r:POTENT_PATTERN_OF*..1]->(t:Target)) WHERE t.uniprot_id IN ['" + "', '".join (l_targets) + "']"
- 
-    query += " AND p.pattern_type='" + pattern_type + "'"
-
-    query += " RETURN paths"
+def predict (target, limit=300, format = 'json', offset=0):
+    query, parameters = predict_query (target, limit, offset)
 
     #print (query)
 
-    all_nodes = []
-    all_edges = []
-
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-    
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
-
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
-
+    return (graph_endpoint ('predict', query, parameters, format))
 
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
+###
+### Bulk queries section
+###
 
-     
-    return (G_json)
+# Queries of the bulk (POST) variants of the endpoints, see the bulk section of smartgraph_async.py . Every function
+# returns the query, its parameters (without the IDs, set per chunk) and the values matched against the input IDs.
 
+def bioactivity_target_bulk_query (target_proteins, activity_cutoff = 0.0, activity_type = None):
+    query, parameters = cq.bulk_bioactivity_target (activity_cutoff, activity_type)
 
+    return (query, parameters, list (target_proteins))
 
-# make prediction for repurposing
 
-def predict (target, limit=300, format = 'json'):
-    """
-       Computes "potent pattern"-based bioactivity predictions. This can be used in a drug repositioning setting.
-    """
+def bioactivity_compound_bulk_query (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None):
+    query, parameters = cq.bulk_bioactivity_compound (stereo, activity_cutoff, activity_type)
 
+    return (query, parameters, [compound_hash (ik, stereo) for ik in inchikeys])
 
-    query = "MATCH (t:Target) WHERE t.uniprot_id='" + target +"' MATCH (t)<-[r1:POTENT_PATTERN_OF]-(p:Pattern) MATCH (p)-[r2:PATTERN_OF]->(c:Compound) WHERE NOT ((c)-[:TESTED_ON]->(t)) WITH {segments:[{start: startNode(r1), relationship:r1, end: endNode(r1)},{start: startNode(r2), relationship:r2, end: endNode(r2)}]} AS ret RETURN ret"
 
-    if limit > 0:
-        query += " LIMIT " + str(limit)
+def potent_compounds_bulk_query (target_proteins, activity_type = None):
+    query, parameters = cq.bulk_potent_compounds (activity_type)
 
-    #print (query)
+    return (query, parameters, list (target_proteins))
 
 
-    conn = neo4j_utils.open_neo4j_connection()
+def patterns_of_compounds_bulk_query (inchikeys, stereo = True, pattern_type = 'scaffold', min_ratio = 0.0, is_largest = None):
+    query, parameters = cq.bulk_patterns_of_compounds (stereo, pattern_type, min_ratio, is_largest)
 
+    return (query, parameters, [compound_hash (ik, stereo) for ik in inchikeys])
 
-    all_nodes = []
-    all_edges = []
 
-    # Use this in conjuction with Neo4j v4.x
-    #with conn.session(database="neo4j") as session:
-    
-    # Use this in conjuction with Neo4j v3.x
-    with conn.session() as session:
-        #print (query) 
-        g = session.read_transaction(
-            lambda tx: tx.run(query).graph())
-       
-        for n in g.nodes:
-            #print("id %s labels %s props %s" % (n.id, n.labels, n.items()))
-            all_nodes = extract_node_properties (n, all_nodes)
+def smiles_compound_bulk_query (inchikeys, stereo = True):
+    query, parameters = cq.bulk_smiles_compound (stereo)
 
-        for r in g.relationships:
-            #print("id %s type %s start %s end %s props %s" % (r.id, r.type, r.start_node.id, r.end_node.id, r.items()))
-            all_edges = extract_edge_properties (r, all_edges)
+    return (query, parameters, [compound_hash (ik, stereo) for ik in inchikeys])
 
 
-    G_json = {}
-    G_json['nodes'] = aggregate_nodes(all_nodes)
-    G_json['edges'] = aggregate_edges(all_edges)
-     
-    conn.close()
+def smiles_pattern_bulk_query (pattern_ids):
+    query, parameters = cq.bulk_smiles_pattern ()
 
-    if format == 'graphml':
-        return (to_graphml(G_json))
+    return (query, parameters, list (pattern_ids))
 
-     
-    return (G_json)
 
 
 # Return SmartGraph Cytoscape Style File
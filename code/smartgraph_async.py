@@ -0,0 +1,979 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://neo4j.com/docs/api/python-driver/current/async_api.html
+# Ref: https://fastapi.tiangolo.com/async/
+# Ref: https://docs.python.org/3/library/asyncio-task.html#asyncio.to_thread
+# Ref: https://fastapi.tiangolo.com/advanced/custom-response/#streamingresponse
+# Ref: https://docs.python.org/3/library/tempfile.html#tempfile.SpooledTemporaryFile
+# Ref: https://github.com/ndjson/ndjson-spec
+# Ref: https://neo4j.com/docs/cypher-manual/current/clauses/unwind/
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#neo4j.unit_of_work
+#
+#
+# asyncio implementation of the SmartGraph endpoints used by server.py .
+#
+# The Cypher of every endpoint is built by the `*_query` functions of smartgraph.py, and the results are converted
+# by the same functions, hence the responses are identical to the ones of the blocking functions in smartgraph.py
+# (which remain available for test.py and notebook users). Queries do not occupy a worker thread while waiting for
+# Neo4j, only the CPU bound GraphML/Arrow/Parquet conversion and the calls of the shared result cache backends are moved to a thread.
+#
+# With the graph snapshot (see graph_snapshot.py), every endpoint is answered from memory instead (see the graph
+# snapshot section), Neo4j is only read to load the snapshot.
+#
+
+import asyncio
+import bisect
+import os
+import tempfile
+
+import neo4j
+import orjson
+
+import cypher_queries as cq
+import frontier_subgraph
+import graph_builder
+import graph_records
+import graph_snapshot
+import graphml_writer
+import neo4j_utils
+import pagination
+import path_budget
+import prediction_store
+import regulatory_network
+import request_errors
+import result_cache
+import single_flight
+import smartgraph as sg
+import smiles_index
+
+
+###
+### Query execution section
+###
+
+async def run_graph_query (query, parameters = None):
+
+    async def work (tx):
+        result = await tx.run (query, parameters)
+
+        return (await result.graph())
+
+    async with neo4j_utils.neo4j_async_session() as session:
+        g = await session.execute_read (work)
+
+    return (sg.graph_to_json (g))
+
+
+async def run_records_query (query, parameters = None):
+
+    async def work (tx):
+        result = await tx.run (query, parameters)
+
+        return ([record async for record in result])
+
+    async with neo4j_utils.neo4j_async_session() as session:
+        records = await session.execute_read (work)
+
+    return (records)
+
+
+async def format_graph (G_json, format = 'json'):
+    if format != 'json':
+        return (await asyncio.to_thread (sg.format_graph, G_json, format))
+
+    return (G_json)
+
+
+async def cache_lookup (endpoint, key):
+    # The shared cache backends do blocking I/O, they are called from a worker thread.
+    if result_cache.is_in_process ():
+        return (result_cache.lookup (endpoint, key))
+
+    return (await asyncio.to_thread (result_cache.lookup, endpoint, key))
+
+
+async def cache_store (endpoint, key, result):
+    if result_cache.is_in_process ():
+        result_cache.store (endpoint, key, result)
+    else:
+        await asyncio.to_thread (result_cache.store, endpoint, key, result)
+
+
+async def cached_endpoint (endpoint, key, execute):
+    if not result_cache.is_enabled (endpoint):
+        return (await single_flight.run_async (endpoint, key, execute))
+
+    hit, result = await cache_lookup (endpoint, key)
+
+    if hit:
+        return (result)
+
+    async def execute_and_store ():
+        result = await execute ()
+        await cache_store (endpoint, key, result)
+
+        return (result)
+
+    return (await single_flight.run_async (endpoint, key, execute_and_store))
+
+
+async def graph_endpoint (endpoint, query, parameters, format = 'json', page = None):
+    # page: pagination.PageRequest of paged requests
+    if page is not None:
+        return (await paged_graph_endpoint (endpoint, query, parameters, format, page))
+
+    key = result_cache.make_key (endpoint, query, parameters, format)
+
+    async def execute ():
+        return (await format_graph (await run_graph_query (query, parameters), format))
+
+    return (await cached_endpoint (endpoint, key, execute))
+
+
+async def records_endpoint (endpoint, query, parameters, to_json, *options):
+    key = result_cache.make_key (endpoint, query, parameters, *options)
+
+    async def execute ():
+        return (to_json (await run_records_query (query, parameters), *options))
+
+    return (await cached_endpoint (endpoint, key, execute))
+
+
+
+
+###
+### Pagination section
+###
+
+# A page is the graph of a bounded, ordered slice of the rows of the endpoint query (see pagination.py), plus
+# `next_cursor`. Pages are cached like the complete results.
+
+def graph_result (records):
+    builder = graph_builder.GraphBuilder ()
+
+    for record in records:
+        builder.add_values (record.values())
+
+    return (builder.to_json ())
+
+
+async def paged_result (G_json, format):
+    if format == 'json':
+        return (G_json)
+
+    content = await format_graph ({'nodes': G_json['nodes'], 'edges': G_json['edges']}, format)
+
+    return (pagination.Page (content, G_json['next_cursor']))
+
+
+async def paged_graph_endpoint (endpoint, query, parameters, format, page):
+    query_fingerprint = pagination.fingerprint (endpoint, query, parameters)
+    after, page_size = pagination.resolve (page, query_fingerprint)
+
+    paged_query, paged_parameters = cq.paged (query, parameters, after, page_size)
+    key = result_cache.make_key (endpoint, paged_query, paged_parameters)
+
+    async def execute ():
+        records = await run_records_query (paged_query, paged_parameters)
+
+        G_json = graph_result (records[:page_size])
+        G_json['next_cursor'] = None
+
+        if len(records) > page_size:
+            G_json['next_cursor'] = pagination.encode_cursor (query_fingerprint, records[page_size - 1]['sg_cursor'], page_size)
+
+        return (G_json)
+
+    return (await paged_result (await cached_endpoint (endpoint, key, execute), format))
+
+
+async def paged_predict (target, format, page):
+    # The predictions are ranked (see cypher_queries.predict), the cursor holds the rank of the next page.
+    query_fingerprint = pagination.fingerprint ('predict', None, {'uniprot_id': target})
+    after, page_size = pagination.resolve (page, query_fingerprint)
+    offset = after if after is not None else 0
+
+    size = await asyncio.to_thread (prediction_store.size, target) if prediction_store.is_enabled () else None
+
+    if size is not None:
+        G_json = await asyncio.to_thread (prediction_store.page, target, offset, page_size)
+        more = offset + page_size < size
+    elif graph_snapshot.is_enabled ():
+        rows = await asyncio.to_thread (graph_snapshot.predict, {'uniprot_id': target, 'offset': offset, 'limit': page_size + 1})
+
+        G_json = rows_graph (rows[:page_size])
+        more = len(rows) > page_size
+    else:
+        query, parameters = sg.predict_query (target, page_size + 1, offset)
+        records = await run_records_query (query, parameters)
+
+        G_json = graph_result (records[:page_size])
+        more = len(records) > page_size
+
+    G_json['next_cursor'] = pagination.encode_cursor (query_fingerprint, offset + page_size, page_size) if more else None
+
+    return (await paged_result (G_json, format))
+
+
+
+###
+### Row endpoints section
+###
+
+# With the in-memory regulatory network (see regulatory_network.py) the regulatory path endpoints are answered locally,
+# and /path_c2t is otherwise answered by a two-phase plan (see below). Both return the rows (sort key, node records,
+# edge records) of the Cypher query of the endpoint, with the sort keys of its rows (see cypher_queries.CURSOR_KEYS), so
+# cursors and pages work as with the Cypher queries. The rows are computed and sorted once for all pages of a query (see
+# sorted_rows).
+
+def rows_graph (rows):
+    builder = graph_builder.GraphBuilder ()
+
+    for key, nodes, edges in rows:
+        builder.add_records (nodes, edges)
+
+    return (builder.to_json ())
+
+
+async def rows_graph_endpoint (endpoint, query, parameters, format, page, compute, *options):
+    # compute: coroutine function returning the rows of the query; options: search options changing the rows
+    if page is None:
+        key = result_cache.make_key (endpoint, query, parameters, format, 'rows', *options)
+
+        async def execute ():
+            return (await format_graph (rows_graph (await compute ()), format))
+
+        return (await cached_endpoint (endpoint, key, execute))
+
+    query_fingerprint = pagination.fingerprint (endpoint, query, parameters, *options)
+    after, page_size = pagination.resolve (page, query_fingerprint)
+
+    key = result_cache.make_key (endpoint, query, parameters, 'rows', after, page_size, *options)
+
+    async def execute_page ():
+        rows, keys = await sorted_rows (endpoint, query_fingerprint, compute)
+        start = bisect.bisect_right (keys, after) if after is not None else 0
+
+        G_json = rows_graph (rows[start:start + page_size])
+        G_json['next_cursor'] = None
+
+        if len(rows) > start + page_size:
+            G_json['next_cursor'] = pagination.encode_cursor (query_fingerprint, rows[start + page_size - 1][0], page_size)
+
+        return (G_json)
+
+    return (await paged_result (await cached_endpoint (endpoint, key, execute_page), format))
+
+
+async def sorted_rows (endpoint, query_fingerprint, compute):
+    # The rows of a query sorted by key and their keys, computed once for all pages of the query (see
+    # pagination.cached_rows)
+    entry = pagination.cached_rows (query_fingerprint)
+
+    if entry is not None:
+        return (entry)
+
+    async def execute ():
+        return (pagination.store_rows (query_fingerprint, sorted (await compute (), key = lambda row: row[0])))
+
+    return (await single_flight.run_async (endpoint, ('rows', query_fingerprint), execute))
+
+
+async def path_c2t_rows (parameters, stereo, shortest_paths, max_length, activity_cutoff, activity_type):
+    # Two-phase /path_c2t: the single Cypher query re-runs the TESTED_ON shortestPath for every path and every pair of a
+    # compound and a copy of the tested target (COLLECT(t1) repeats the target once per compound), i.e. compounds^2
+    # times per path. Instead, the bioactivities of the compounds are read once, the paths once per distinct tested
+    # target, and both are joined in Python (one bioactivity per compound and target).
+    #
+    # Unlike the single query, the TESTED_ON leg of a path is one of the bioactivities passing the activity cutoff and
+    # type (the first by element ID), the `p2 = shortestPath((x)-[z:TESTED_ON]-(y))` of the query is not filtered and
+    # can return any bioactivity of the compound on the target.
+    legs = await asyncio.to_thread (graph_builder.bioactivity_legs, await compound_bioactivities (parameters, stereo, activity_cutoff, activity_type))
+
+    if len(legs) == 0:
+        return ([])
+
+    path_records = await run_records_query (*cq.path_c2t_targets (legs.keys(), parameters['uniprot_ids'], shortest_paths, max_length, parameters['confidence_cutoff']))
+
+    return (await asyncio.to_thread (graph_builder.c2t_rows, legs, path_records))
+
+
+async def compound_bioactivities (parameters, stereo, activity_cutoff, activity_type):
+    # Bioactivities of the compounds of a /path_c2t query (see graph_builder.bioactivities)
+    if graph_snapshot.is_enabled ():
+        return (await asyncio.to_thread (graph_snapshot.bioactivities, parameters, stereo))
+
+    records = await run_records_query (*cq.bioactivity_compound (parameters['inchikeys'], stereo, activity_cutoff, activity_type))
+
+    return (graph_builder.bioactivities (records))
+
+
+def subgraph_reachable (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode):
+    # End targets of the directed target-target shortest path searches of /subgraph_target_induced, from the k-hop
+    # index. Targets only have outgoing REGULATES relationships, and incoming TESTED_ON ones only from compounds, so these
+    # paths are REGULATES paths. None if not applicable.
+    if not shortest_paths or cq.plain_value (endpoint_type) != 'target' or cq.plain_value (explore_mode) not in ['source', 'target']:
+        return (None)
+
+    return (regulatory_network.reachable_targets (sg.split_ids (protein_targets), explore_mode, cq.check_max_length (max_length)))
+
+
+
+###
+### Frontier subgraph section
+###
+
+# Unpaged /subgraph_target_induced and /subgraph_compound_induced requests without a budget are answered by frontier
+# expansion when enabled (see frontier_subgraph.py): one expansion query per level and batch of nodes instead of the
+# path enumeration.
+
+ENDPOINT_LABELS = {'compound': 'Compound', 'target': 'Target', 'both': None}
+
+
+async def frontier_subgraph_endpoint (endpoint, query, parameters, format, start, rel_types, direction, endpoint_label, shortest_paths, max_length):
+    # start: (query, parameters) of the start nodes
+    key = result_cache.make_key (endpoint, query, parameters, format, 'frontier')
+
+    async def execute ():
+        sources = [record['n'] for record in await run_records_query (*start)]
+        extractor = frontier_subgraph.FrontierSubgraph.from_nodes (sources, direction, max_length, endpoint_label, shortest_paths)
+
+        while len(extractor.pending ()) > 0:
+            for batch in frontier_subgraph.batches (extractor.pending ()):
+                extractor.add (await run_records_query (*cq.frontier_expansion (batch, rel_types, direction)))
+
+            extractor.next_level ()
+
+        return (await format_graph (await asyncio.to_thread (extractor.to_json), format))
+
+    return (await cached_endpoint (endpoint, key, execute))
+
+
+
+###
+### Graph snapshot section
+###
+
+# With the graph snapshot (see graph_snapshot.py), the endpoints are answered from the rows of its queries (sort key,
+# node records, edge records) like the ones of the in-memory regulatory network, with the same paging, caching and
+# request coalescing. The streaming and bulk variants serialise the rows of the snapshot.
+
+async def snapshot_endpoint (endpoint, query, parameters, format, page, compute, *options):
+    # compute: function of graph_snapshot.py returning the rows of the query from (parameters, *options)
+    async def rows ():
+        return (await asyncio.to_thread (compute, parameters, *options))
+
+    return (await rows_graph_endpoint (endpoint, query, parameters, format, page, rows, 'graph_snapshot', *options))
+
+
+async def snapshot_subgraph_endpoint (endpoint, query, parameters, format, page, budget, compute, shortest_paths, max_length, *options):
+    # compute: subgraph query of graph_snapshot.py, called as compute (parameters, *options, shortest_paths, max_length,
+    # frontier, state)
+    shortest_paths = bool(shortest_paths)
+    max_length = cq.check_max_length (max_length)
+
+    if budget is not None and not shortest_paths:
+        async def compute_bounded (state):
+            return (await asyncio.to_thread (compute, parameters, *options, False, max_length, False, state))
+
+        return (await bounded_graph_endpoint (endpoint, query, parameters, format, page, budget, compute_bounded, 'graph_snapshot'))
+
+    frontier = page is None and frontier_subgraph.is_enabled ()
+
+    return (await snapshot_endpoint (endpoint, query, parameters, format, page, compute, *options, shortest_paths, max_length, frontier))
+
+
+
+###
+### Path budget section
+###
+
+# All-paths searches with a budget (see path_budget.py) return the paths found until the budget ran out, plus
+# `truncated` and `path_stats`. The Cypher queries are limited to max_paths + 1 rows, their records are read until the
+# deadline and the transaction times out shortly after. Bounded results bypass the result cache.
+
+async def run_bounded_query (query, parameters, state):
+    limited_query, limited_parameters = cq.limited (query, parameters, state.budget.max_paths)
+    records = []
+
+    @neo4j.unit_of_work (timeout = state.budget.transaction_timeout ())
+    async def work (tx):
+        records.clear ()
+        result = await tx.run (limited_query, limited_parameters)
+
+        async for record in result:
+            records.append (record)
+            state.paths = len(records)
+
+            if state.exhausted ():
+                break
+
+    try:
+        async with neo4j_utils.neo4j_async_session() as session:
+            await session.execute_read (work)
+
+    except neo4j.exceptions.ClientError as e:
+        if 'TransactionTimedOut' not in str (e.code):
+            raise
+
+        state.truncate ('timeout')
+
+    return (records)
+
+
+async def bounded_graph_endpoint (endpoint, query, parameters, format, page, budget, compute = None, engine = 'regulatory_network'):
+    # compute: coroutine function returning the rows of the query from the in-memory regulatory network (or the engine
+    # named) for a path_budget.BudgetState, None for the Cypher query
+    if page is not None:
+        raise request_errors.InvalidRequest ("[ERROR]: Path budgets (`max_paths`, `max_expanded_edges`, `timeout`) can not be combined with pagination.")
+
+    key = result_cache.make_key (endpoint, query, parameters, 'path_budget', engine if compute is not None else None, *budget.options ())
+
+    async def execute ():
+        if compute is not None:
+            state = path_budget.BudgetState (budget, engine)
+            rows = await compute (state)
+
+            if len(rows) > budget.max_paths:
+                state.truncate ('max_paths')
+
+            rows = rows[:budget.max_paths]
+            G_json = rows_graph (rows)
+        else:
+            state = path_budget.BudgetState (budget, 'neo4j')
+            rows = await run_bounded_query (query, parameters, state)
+
+            rows = rows[:budget.max_paths]
+            G_json = graph_result (rows)
+
+        state.paths = len(rows)
+
+        G_json['truncated'] = state.truncated_by is not None
+        G_json['path_stats'] = state.stats ()
+
+        return (G_json)
+
+    G_json = await single_flight.run_async (endpoint, key, execute)
+
+    if format == 'json':
+        return (G_json)
+
+    content = await format_graph ({'nodes': G_json['nodes'], 'edges': G_json['edges']}, format)
+
+    return (path_budget.Bounded (content, G_json['truncated'], G_json['path_stats']))
+
+
+
+###
+### Streaming section
+###
+
+# The streaming variants of the endpoints serialise the nodes and edges of the result while the records arrive from
+# Neo4j, instead of materialising the whole graph first (see graph_to_json in smartgraph.py). Nodes and edges are
+# de-duplicated on the fly on their IDs, so only the IDs seen so far are kept in memory. The nodes are sent right
+# away, the edges are spooled (to disk above STREAM_SPOOL_SIZE bytes) until the last record, because the document
+# lists them after the nodes. Streamed results bypass the result cache and the request coalescing.
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+async def stream_graph_query (query, parameters = None):
+    builder = graph_builder.GraphBuilder (keep_records = False)
+
+    chunk = bytearray (b'{"nodes":[')
+    separator = b''
+
+    with tempfile.SpooledTemporaryFile (max_size = STREAM_SPOOL_SIZE) as edges:
+        edge_separator = b''
+
+        async with neo4j_utils.neo4j_async_session() as session:
+            result = await session.run (query, parameters)
+
+            async for record in result:
+                for value in record.values():
+                    for kind, r in builder.add (value):
+                        if kind == 'node':
+                            chunk += separator + orjson.dumps (r)
+                            separator = b','
+                        else:
+                            edges.write (edge_separator + orjson.dumps (r))
+                            edge_separator = b','
+
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    yield (bytes(chunk))
+                    chunk = bytearray()
+
+        chunk += b'],"edges":['
+        edges.seek (0)
+
+        while True:
+            data = edges.read (STREAM_CHUNK_SIZE)
+
+            if not data:
+                break
+
+            chunk += data
+            yield (bytes(chunk))
+            chunk = bytearray()
+
+    chunk += b']}'
+
+    yield (bytes(chunk))
+
+
+async def prefetched (chunks):
+    # The first chunk is produced before the response starts, so that errors of the query (e.g. Neo4j is not
+    # available) are still reported with an error status instead of a truncated document.
+    first = await chunks.__anext__ ()
+
+    async def all_chunks ():
+        yield (first)
+
+        async for c in chunks:
+            yield (c)
+
+    return (all_chunks ())
+
+
+async def stream_graph_endpoint (query, parameters):
+    return (await prefetched (stream_graph_query (query, parameters)))
+
+
+async def stream_graphml_endpoint (query, parameters):
+    # GraphML needs all keys before the graph, hence the graph is read first, only the document is streamed.
+    G_json = await run_graph_query (query, parameters)
+
+    return (graphml_writer.generate_graphml (G_json))
+
+
+async def stream_snapshot_rows (rows):
+    # The graph of rows of the graph snapshot, the document in chunks of STREAM_CHUNK_SIZE bytes
+    document = await asyncio.to_thread (lambda: orjson.dumps (rows_graph (rows), default = graph_records.default))
+
+    for start in range (0, len(document), STREAM_CHUNK_SIZE):
+        yield (document[start:start + STREAM_CHUNK_SIZE])
+
+
+async def stream_snapshot_endpoint (compute, parameters, format, *options):
+    # compute: function of graph_snapshot.py returning the rows of the query from (parameters, *options)
+    rows = await asyncio.to_thread (compute, parameters, *options)
+
+    if format == 'graphml':
+        return (graphml_writer.generate_graphml (rows_graph (rows)))
+
+    return (await prefetched (stream_snapshot_rows (rows)))
+
+
+
+###
+### Bulk section
+###
+
+# POST variants of the endpoints for many input IDs (e.g. a compound screen), see the bulk queries of
+# cypher_queries.py . The IDs are sent to Neo4j in chunks of BULK_CHUNK_SIZE IDs, every chunk in its own read
+# transaction, and the results of a chunk are sent as soon as it is read, one line of newline delimited JSON per
+# input ID, in the order of the input IDs:
+#
+#   {"id": "<input ID>", "result": <result of the GET endpoint for this ID alone>}
+#
+# IDs not found have an empty graph, or null for the SMILES endpoints. Like the streamed results, bulk results bypass
+# the result cache and the request coalescing. The SMILES endpoints are answered from the local SMILES index when it is
+# configured (see smiles_index.py), all endpoints from the graph snapshot when it is loaded.
+
+BULK_CHUNK_SIZE = int(os.environ.get('sg_bulk_chunk_size', 1000))
+BULK_MAX_IDS = int(os.environ.get('sg_bulk_max_ids', 100000))
+
+
+def check_bulk_ids (ids):
+    if len(ids) == 0 or len(ids) > BULK_MAX_IDS:
+        raise request_errors.InvalidRequest ("[ERROR]: The number of IDs has to be between 1 and %d." % (BULK_MAX_IDS))
+
+
+async def run_bulk_chunk (session, query, parameters, keys):
+    # Returns the records of the chunk grouped by the `id` column
+
+    async def work (tx):
+        result = await tx.run (query, dict (parameters, ids = keys))
+
+        return ([record async for record in result])
+
+    groups = {}
+
+    for record in await session.execute_read (work):
+        groups.setdefault (record['id'], []).append (record)
+
+    return (groups)
+
+
+async def bulk_query (query, parameters, ids, keys, to_json):
+    # ids: the input IDs, keys: the values matched by the query (e.g. non-stereo InChIKeys), to_json: converts the
+    # records of one input ID
+    check_bulk_ids (ids)
+
+    async with neo4j_utils.neo4j_async_session() as session:
+        for start in range (0, len(ids), BULK_CHUNK_SIZE):
+            chunk_keys = keys[start:start + BULK_CHUNK_SIZE]
+            groups = await run_bulk_chunk (session, query, parameters, list (dict.fromkeys (chunk_keys)))
+
+            lines = bytearray()
+
+            for i, key in enumerate (chunk_keys):
+                lines += orjson.dumps ({'id': ids[start + i], 'result': to_json (groups.get (key, []))}, default = graph_records.default)
+                lines += b'\n'
+
+            yield (bytes(lines))
+
+
+async def bulk_endpoint (bulk_query_fn, ids, *options, to_json = graph_result, snapshot = None):
+    # snapshot: (name of the ID parameter, query of graph_snapshot.py, its options) answering the GET endpoint from the
+    # graph snapshot, for the IDs of one line
+    query, parameters, keys = bulk_query_fn (ids, *options)
+
+    if snapshot is not None and graph_snapshot.is_enabled ():
+        id_parameter, compute, snapshot_options = snapshot
+        rows_of_key = lambda key: compute (dict (parameters, **{id_parameter: [key]}), *snapshot_options)
+
+        return (await prefetched (bulk_snapshot_lookup (ids, keys, rows_of_key)))
+
+    return (await prefetched (bulk_query (query, parameters, ids, keys, to_json)))
+
+
+async def bulk_index_lookup (ids, keys, lookup, to_json):
+    # Same lines as bulk_query, from the local SMILES index (see smiles_index.py). lookup: keys -> values (None if
+    # missing), to_json: converts the records of one input ID
+    check_bulk_ids (ids)
+
+    for start in range (0, len(ids), BULK_CHUNK_SIZE):
+        values = lookup (keys[start:start + BULK_CHUNK_SIZE])
+
+        lines = bytearray()
+
+        for i, value in enumerate (values):
+            lines += orjson.dumps ({'id': ids[start + i], 'result': to_json ([value] if value is not None else [])})
+            lines += b'\n'
+
+        yield (bytes(lines))
+
+
+def snapshot_chunk_lines (ids, keys, rows_of_key):
+    lines = bytearray()
+
+    for i, key in enumerate (keys):
+        lines += orjson.dumps ({'id': ids[i], 'result': rows_graph (rows_of_key (key))}, default = graph_records.default)
+        lines += b'\n'
+
+    return (bytes(lines))
+
+
+async def bulk_snapshot_lookup (ids, keys, rows_of_key):
+    # Same lines as bulk_query, from the graph snapshot (see graph_snapshot.py). rows_of_key: key -> rows of the query
+    # of the key
+    check_bulk_ids (ids)
+
+    for start in range (0, len(ids), BULK_CHUNK_SIZE):
+        yield (await asyncio.to_thread (snapshot_chunk_lines, ids[start:start + BULK_CHUNK_SIZE], keys[start:start + BULK_CHUNK_SIZE], rows_of_key))
+
+
+async def bulk_bioactivity_target (target_proteins, activity_cutoff = 0.0, activity_type = None):
+    return (await bulk_endpoint (sg.bioactivity_target_bulk_query, target_proteins, activity_cutoff, activity_type, snapshot = ('uniprot_ids', graph_snapshot.bioactivity_target, ())))
+
+
+async def bulk_bioactivity_compound (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None):
+    return (await bulk_endpoint (sg.bioactivity_compound_bulk_query, inchikeys, stereo, activity_cutoff, activity_type, snapshot = ('inchikeys', graph_snapshot.bioactivity_compound, (stereo,))))
+
+
+async def bulk_potent_compounds (target_proteins, activity_type = None):
+    return (await bulk_endpoint (sg.potent_compounds_bulk_query, target_proteins, activity_type, snapshot = ('uniprot_ids', graph_snapshot.potent_compounds, ())))
+
+
+async def bulk_patterns_of_compounds (inchikeys, stereo=True, pattern_type='scaffold', min_ratio=0.0, is_largest=None):
+    return (await bulk_endpoint (sg.patterns_of_compounds_bulk_query, inchikeys, stereo, pattern_type, min_ratio, is_largest, snapshot = ('inchikeys', graph_snapshot.patterns_of_compounds, (stereo,))))
+
+
+async def bulk_smiles_compound (inchikeys, stereo=True):
+    to_json = lambda records: sg.smiles_compound_json (records, stereo) if len(records) > 0 else None
+
+    if smiles_index.is_enabled ():
+        query, parameters, keys = sg.smiles_compound_bulk_query (inchikeys, stereo)
+        lookup = lambda hashes: smiles_index.smiles_compounds (hashes, stereo)
+
+        return (await prefetched (bulk_index_lookup (inchikeys, keys, lookup, to_json)))
+
+    if graph_snapshot.is_enabled ():
+        query, parameters, keys = sg.smiles_compound_bulk_query (inchikeys, stereo)
+        lookup = lambda hashes: graph_snapshot.smiles_compounds (hashes, stereo)
+
+        return (await prefetched (bulk_index_lookup (inchikeys, keys, lookup, to_json)))
+
+    return (await bulk_endpoint (sg.smiles_compound_bulk_query, inchikeys, stereo, to_json = to_json))
+
+
+async def bulk_smiles_pattern (pattern_ids):
+    to_json = lambda records: sg.smiles_pattern_json (records) if len(records) > 0 else None
+
+    if smiles_index.is_enabled ():
+        return (await prefetched (bulk_index_lookup (pattern_ids, list (pattern_ids), smiles_index.smiles_patterns, to_json)))
+
+    if graph_snapshot.is_enabled ():
+        return (await prefetched (bulk_index_lookup (pattern_ids, list (pattern_ids), graph_snapshot.smiles_patterns, to_json)))
+
+    return (await bulk_endpoint (sg.smiles_pattern_bulk_query, pattern_ids, to_json = to_json))
+
+
+
+###
+### Endpoints
+###
+
+async def bioactivity_target (target_proteins, activity_cutoff = 0.0, activity_type = None, format = 'json', page = None):
+    query, parameters = sg.bioactivity_target_query (target_proteins, activity_cutoff, activity_type)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('bioactivity_target', query, parameters, format, page, graph_snapshot.bioactivity_target))
+
+    return (await graph_endpoint ('bioactivity_target', query, parameters, format, page))
+
+
+async def bioactivity_compound (inchikeys, stereo = True, activity_cutoff = 0.0, activity_type = None, format = 'json', page = None):
+    query, parameters = sg.bioactivity_compound_query (inchikeys, stereo, activity_cutoff, activity_type)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('bioactivity_compound', query, parameters, format, page, graph_snapshot.bioactivity_compound, bool(stereo)))
+
+    return (await graph_endpoint ('bioactivity_compound', query, parameters, format, page))
+
+
+async def bioactivity_c2t (inchikeys, target_proteins, stereo = True, activity_type = None, format = 'json', page = None):
+    query, parameters = sg.bioactivity_c2t_query (inchikeys, target_proteins, stereo, activity_type)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('bioactivity_c2t', query, parameters, format, page, graph_snapshot.bioactivity_c2t, bool(stereo)))
+
+    return (await graph_endpoint ('bioactivity_c2t', query, parameters, format, page))
+
+
+async def potent_compounds (target_proteins, activity_type = None, format = 'json', page = None):
+    query, parameters = sg.potent_compounds_query (target_proteins, activity_type)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('potent_compounds', query, parameters, format, page, graph_snapshot.potent_compounds))
+
+    return (await graph_endpoint ('potent_compounds', query, parameters, format, page))
+
+
+def check_weighted (weighted, top_k):
+    # Weighted paths are only computed by the in-memory regulatory network
+    if not weighted:
+        return ((False, 1))
+
+    if not regulatory_network.is_enabled ():
+        raise request_errors.InvalidRequest ("[ERROR]: Weighted paths need the in-memory regulatory network (sg_regulatory_network or sg_graph_snapshot).")
+
+    return ((True, regulatory_network.check_top_k (top_k)))
+
+
+async def path_regulatory (source_proteins, target_proteins, shortest_paths=True, max_length=4, confidence_cutoff=0.0, directed=True, format = 'json', page = None, multi_source = None, weighted = False, top_k = 1, budget = None):
+    # multi_source: one BFS per source (True) or a search per source-target pair (False), by default chosen from the
+    # number of targets of a source (in-memory network only, see regulatory_network.RegulatoryNetwork.single_search)
+    # weighted: the top_k most confident paths per pair (in-memory network only)
+    # budget: path_budget.PathBudget of the all-paths search
+    query, parameters = sg.path_regulatory_query (source_proteins, target_proteins, shortest_paths, max_length, confidence_cutoff, directed)
+    weighted, top_k = check_weighted (weighted, top_k)
+
+    if budget is not None and not shortest_paths and not weighted:
+        compute_bounded = None
+
+        if regulatory_network.is_enabled ():
+            async def compute_bounded (state):
+                return (await asyncio.to_thread (regulatory_network.path_regulatory, parameters, False, max_length, directed, False, False, 1, state))
+
+        return (await bounded_graph_endpoint ('path_regulatory', query, parameters, format, page, budget, compute_bounded))
+
+    if regulatory_network.is_enabled ():
+        async def compute ():
+            return (await asyncio.to_thread (regulatory_network.path_regulatory, parameters, shortest_paths, max_length, directed, multi_source, weighted, top_k))
+
+        return (await rows_graph_endpoint ('path_regulatory', query, parameters, format, page, compute, 'regulatory_network', multi_source, weighted, top_k))
+
+    return (await graph_endpoint ('path_regulatory', query, parameters, format, page))
+
+
+async def path_c2t (inchikeys, target_proteins,  stereo=True, shortest_paths=True, max_length=4, activity_cutoff=0.0, activity_type=None, confidence_cutoff=0.0, format = 'json', page = None, multi_source = None, weighted = False, top_k = 1, budget = None):
+    query, parameters = sg.path_c2t_query (inchikeys, target_proteins, stereo, shortest_paths, max_length, activity_cutoff, activity_type, confidence_cutoff)
+    weighted, top_k = check_weighted (weighted, top_k)
+
+    if budget is not None and not shortest_paths and not weighted:
+        compute_bounded = None
+
+        if regulatory_network.is_enabled ():
+            async def compute_bounded (state):
+                bioactivities = await compound_bioactivities (parameters, stereo, activity_cutoff, activity_type)
+
+                return (await asyncio.to_thread (regulatory_network.path_c2t, bioactivities, parameters, False, max_length, False, False, 1, state))
+
+        return (await bounded_graph_endpoint ('path_c2t', query, parameters, format, page, budget, compute_bounded))
+
+    if regulatory_network.is_enabled ():
+        async def compute ():
+            # The bioactivities are read from Neo4j (or the graph snapshot), the target-target paths from the network
+            bioactivities = await compound_bioactivities (parameters, stereo, activity_cutoff, activity_type)
+
+            return (await asyncio.to_thread (regulatory_network.path_c2t, bioactivities, parameters, shortest_paths, max_length, multi_source, weighted, top_k))
+
+        return (await rows_graph_endpoint ('path_c2t', query, parameters, format, page, compute, 'regulatory_network', multi_source, weighted, top_k))
+
+    async def compute_two_phase ():
+        return (await path_c2t_rows (parameters, stereo, shortest_paths, max_length, activity_cutoff, activity_type))
+
+    return (await rows_graph_endpoint ('path_c2t', query, parameters, format, page, compute_two_phase, 'two_phase'))
+
+
+async def path_regulatory_open (protein_targets, shortest_paths=True, max_length=4, explore_mode='undirected', confidence_cutoff=0.0, format = 'json', page = None):
+    query, parameters = sg.path_regulatory_open_query (protein_targets, shortest_paths, max_length, explore_mode, confidence_cutoff)
+
+    if regulatory_network.is_enabled ():
+        async def compute ():
+            return (await asyncio.to_thread (regulatory_network.path_regulatory_open, parameters, shortest_paths, max_length, explore_mode))
+
+        return (await rows_graph_endpoint ('path_regulatory_open', query, parameters, format, page, compute, 'regulatory_network'))
+
+    return (await graph_endpoint ('path_regulatory_open', query, parameters, format, page))
+
+
+async def subgraph_target_induced (protein_targets, endpoint_type='both', shortest_paths=True, max_length=4, explore_mode='undirected', format = 'json', page = None, budget = None):
+    query, parameters = sg.subgraph_target_induced_query (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode, subgraph_reachable (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode))
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_subgraph_endpoint ('subgraph_target_induced', query, parameters, format, page, budget, graph_snapshot.subgraph_target_induced, shortest_paths, max_length, cq.plain_value (endpoint_type), cq.plain_value (explore_mode)))
+
+    if budget is not None and not shortest_paths:
+        return (await bounded_graph_endpoint ('subgraph_target_induced', query, parameters, format, page, budget))
+
+    if page is None and frontier_subgraph.is_enabled ():
+        endpoint_label = ENDPOINT_LABELS[cq.plain_value (endpoint_type)]
+        direction = cq.explore_mode_direction (cq.plain_value (explore_mode))
+
+        return (await frontier_subgraph_endpoint ('subgraph_target_induced', query, parameters, format, cq.frontier_start_targets (parameters['uniprot_ids']), ':TESTED_ON|REGULATES', direction, endpoint_label, bool(shortest_paths), cq.check_max_length (max_length)))
+
+    return (await graph_endpoint ('subgraph_target_induced', query, parameters, format, page))
+
+
+async def stream_subgraph_target_induced (protein_targets, endpoint_type='both', shortest_paths=True, max_length=4, explore_mode='undirected', format = 'json'):
+    query, parameters = sg.subgraph_target_induced_query (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode, subgraph_reachable (protein_targets, endpoint_type, shortest_paths, max_length, explore_mode))
+
+    if graph_snapshot.is_enabled ():
+        return (await stream_snapshot_endpoint (graph_snapshot.subgraph_target_induced, parameters, format, cq.plain_value (endpoint_type), cq.plain_value (explore_mode), bool(shortest_paths), cq.check_max_length (max_length), frontier_subgraph.is_enabled ()))
+
+    if format == 'graphml':
+        return (await stream_graphml_endpoint (query, parameters))
+
+    return (await stream_graph_endpoint (query, parameters))
+
+
+async def subgraph_compound_induced (inchikeys, stereo=True, shortest_paths=True, max_length=4, format = 'json', page = None, budget = None):
+    query, parameters = sg.subgraph_compound_induced_query (inchikeys, stereo, shortest_paths, max_length)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_subgraph_endpoint ('subgraph_compound_induced', query, parameters, format, page, budget, graph_snapshot.subgraph_compound_induced, shortest_paths, max_length, bool(stereo)))
+
+    if budget is not None and not shortest_paths:
+        return (await bounded_graph_endpoint ('subgraph_compound_induced', query, parameters, format, page, budget))
+
+    if page is None and frontier_subgraph.is_enabled ():
+        return (await frontier_subgraph_endpoint ('subgraph_compound_induced', query, parameters, format, cq.frontier_start_compounds (parameters['inchikeys'], stereo), '', 'out', 'Target', bool(shortest_paths), cq.check_max_length (max_length)))
+
+    return (await graph_endpoint ('subgraph_compound_induced', query, parameters, format, page))
+
+
+async def stream_subgraph_compound_induced (inchikeys, stereo=True, shortest_paths=True, max_length=4, format = 'json'):
+    query, parameters = sg.subgraph_compound_induced_query (inchikeys, stereo, shortest_paths, max_length)
+
+    if graph_snapshot.is_enabled ():
+        return (await stream_snapshot_endpoint (graph_snapshot.subgraph_compound_induced, parameters, format, bool(stereo), bool(shortest_paths), cq.check_max_length (max_length), frontier_subgraph.is_enabled ()))
+
+    if format == 'graphml':
+        return (await stream_graphml_endpoint (query, parameters))
+
+    return (await stream_graph_endpoint (query, parameters))
+
+
+async def smiles_compound (compound_inchikey, stereo=True):
+    if smiles_index.is_enabled ():
+        value = smiles_index.smiles_compounds (sg.compound_hashes (compound_inchikey, stereo)[:1], stereo)[0]
+
+        return (sg.smiles_compound_json ([value] if value is not None else [], stereo))
+
+    if graph_snapshot.is_enabled ():
+        value = graph_snapshot.smiles_compounds (sg.compound_hashes (compound_inchikey, stereo)[:1], stereo)[0]
+
+        return (sg.smiles_compound_json ([value] if value is not None else [], stereo))
+
+    query, parameters = sg.smiles_compound_query (compound_inchikey, stereo)
+
+    return (await records_endpoint ('smiles_compound', query, parameters, sg.smiles_compound_json, stereo))
+
+
+async def smiles_pattern (pattern_id):
+    if smiles_index.is_enabled ():
+        value = smiles_index.smiles_patterns ([pattern_id])[0]
+
+        return (sg.smiles_pattern_json ([value] if value is not None else []))
+
+    if graph_snapshot.is_enabled ():
+        value = graph_snapshot.smiles_patterns ([pattern_id])[0]
+
+        return (sg.smiles_pattern_json ([value] if value is not None else []))
+
+    query, parameters = sg.smiles_pattern_query (pattern_id)
+
+    return (await records_endpoint ('smiles_pattern', query, parameters, sg.smiles_pattern_json))
+
+
+async def patterns_of_compounds (inchikeys, stereo=True, pattern_type='scaffold', min_ratio=0.0, is_largest=None, format = 'json', page = None):
+    query, parameters = sg.patterns_of_compounds_query (inchikeys, stereo, pattern_type, min_ratio, is_largest)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('patterns_of_compounds', query, parameters, format, page, graph_snapshot.patterns_of_compounds, bool(stereo)))
+
+    return (await graph_endpoint ('patterns_of_compounds', query, parameters, format, page))
+
+
+async def potent_patterns (targets, pattern_type='scaffold', format = 'json', page = None):
+    query, parameters = sg.potent_patterns_query (targets, pattern_type)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('potent_patterns', query, parameters, format, page, graph_snapshot.potent_patterns))
+
+    return (await graph_endpoint ('potent_patterns', query, parameters, format, page))
+
+
+async def predict (target, limit=None, format = 'json', page = None):
+    # limit: the top-ranked predictions of an unpaged request (300 if None), pages are requested by cursor instead
+    if page is not None:
+        if limit is not None:
+            raise request_errors.InvalidRequest ("[ERROR]: `limit` can not be combined with pagination (`page_size`, `cursor`).")
+
+        return (await paged_predict (target, format, page))
+
+    if limit is None:
+        limit = 300
+
+    # Served from the precomputed prediction table when the target is in it (see prediction_store.py)
+    if prediction_store.is_enabled ():
+        G_json = await asyncio.to_thread (prediction_store.page, target, 0, limit)
+
+        if G_json is not None:
+            return (await format_graph (G_json, format))
+
+    query, parameters = sg.predict_query (target, limit)
+
+    if graph_snapshot.is_enabled ():
+        return (await snapshot_endpoint ('predict', query, parameters, format, None, graph_snapshot.predict))
+
+    return (await graph_endpoint ('predict', query, parameters, format))
@@ -0,0 +1,275 @@
+# Author: Gergely Zahoranszky-Kohalmi, PhD
+#
+# Organization: National Center for Advancing Translational Sciences (NCATS/NIH)
+#
+# Email: gergely.zahoranszky-kohalmi@nih.gov
+#
+#
+# Ref: https://docs.python.org/3/library/mmap.html
+# Ref: https://docs.python.org/3/library/struct.html
+# Ref: https://docs.python.org/3/library/stdtypes.html#memoryview.cast
+# Ref: https://neo4j.com/docs/api/python-driver/current/api.html#neo4j.Result
+#
+#
+# Local SMILES index of the SmartGraph compounds and patterns.
+#
+# The SMILES endpoints (single and bulk, see smartgraph_async.py) are answered from memory-mapped key-value files
+# instead of Neo4j, when the index is configured. The index has three tables (see SMILES_INDEX_TABLES in
+# cypher_queries.py): InChI-Key -> compound, non-stereo InChI-Key -> compound, pattern ID -> pattern. Values are the
+# rows of the SMILES queries, so the responses are the same as the ones built from Neo4j.
+#
+# The tables are exported from Neo4j at startup if their files do not exist yet (or sg_smiles_index_refresh is set),
+# otherwise the existing files are opened, i.e. the files have to be refreshed after a data load. The knowledge graph is
+# read-only between data loads, so a key missing from the index is not in Neo4j either.
+#
+# File layout of a table (little endian): the entries in ascending key order (key length: uint16, value length:
+# uint32, UTF-8 key, orjson value), padding to 8 bytes, the offsets of the entries (uint64 each), then the footer:
+# number of entries (uint64), position of the offsets (uint64), MAGIC. Keys are looked up by binary search on the
+# offsets, only the pages touched are read from disk and they are shared by the worker processes of the API.
+#
+# Configuration (environment):
+#
+#   - sg_smiles_index_dir: directory of the index files, empty disables the index. Default: '' (disabled)
+#   - sg_smiles_index_refresh: re-export the tables from Neo4j at startup even if the files exist. Default: false
+#
+
+import mmap
+import os
+import struct
+import threading
+
+import orjson
+
+import cypher_queries as cq
+import neo4j_utils
+
+
+MAGIC = b'SGSMI001'
+
+ENTRY_HEADER = struct.Struct ('<HI')
+FOOTER = struct.Struct ('<QQ8s')
+
+
+def read_smiles_index_config ():
+    index_par = {}
+    index_par['dir'] = os.environ.get('sg_smiles_index_dir', '').strip()
+    index_par['refresh'] = os.environ.get('sg_smiles_index_refresh', 'false').strip().lower() in ['true', '1', 'yes']
+
+    return (index_par)
+
+
+
+###
+### Index files section
+###
+
+def write_table (path, entries):
+    # entries: (key, value) tuples in ascending key order, the first value of repeated keys is kept. The file is written
+    # next to its final path and moved in place, so readers never see a partial file.
+    offsets = []
+    previous = None
+    position = 0
+
+    tmp_path = path + '.tmp'
+
+    with open (tmp_path, 'wb') as f:
+        for key, value in entries:
+            key = key.encode ('utf-8')
+
+            if previous is not None and key <= previous:
+                if key == previous:
+                    continue
+
+                raise Exception ("[ERROR]: SMILES index entries are not in ascending key order: %s." % (key.decode ('utf-8')))
+
+            value = orjson.dumps (value)
+            entry = ENTRY_HEADER.pack (len(key), len(value)) + key + value
+
+            offsets.append (position)
+            f.write (entry)
+            position += len(entry)
+            previous = key
+
+        padding = -position % 8
+        f.write (b'\0' * padding)
+        position += padding
+
+        f.write (struct.pack ('<%dQ' % (len(offsets)), *offsets))
+        f.write (FOOTER.pack (len(offsets), position, MAGIC))
+
+    os.replace (tmp_path, path)
+
+    return (len(offsets))
+
+
+
+class Table:
+
+    def __init__ (self, path):
+        self.path = path
+
+        with open (path, 'rb') as f:
+            self.mm = mmap.mmap (f.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if len(self.mm) < FOOTER.size:
+            raise Exception ("[ERROR]: SMILES index file is truncated: %s." % (path))
+
+        self.size, offsets_position, magic = FOOTER.unpack_from (self.mm, len(self.mm) - FOOTER.size)
+
+        if magic != MAGIC:
+            raise Exception ("[ERROR]: Not a SMILES index file: %s." % (path))
+
+        self.offsets = memoryview (self.mm)[offsets_position:offsets_position + 8 * self.size].cast ('Q')
+
+
+    def __len__ (self):
+        return (self.size)
+
+
+    def key_at (self, i):
+        offset = self.offsets[i]
+        key_length, value_length = ENTRY_HEADER.unpack_from (self.mm, offset)
+        start = offset + ENTRY_HEADER.size
+
+        return (self.mm[start:start + key_length], start + key_length, value_length)
+
+
+    def get (self, key):
+        key = key.encode ('utf-8')
+
+        lo = 0
+        hi = self.size
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, value_start, value_length = self.key_at (mid)
+
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return (orjson.loads (self.mm[value_start:value_start + value_length]))
+
+        return (None)
+
+
+    def close (self):
+        self.offsets.release ()
+        self.mm.close ()
+
+
+
+def table_path (directory, name):
+    return (os.path.join (directory, name + '.idx'))
+
+
+def export_table (path, query):
+    # Streams the rows from Neo4j into the file, the result is consumed within the transaction
+    def work (tx):
+        result = tx.run (query)
+        entries = ((record['key'], {k: v for k, v in record.items() if k != 'key'}) for record in result)
+
+        return (write_table (path, entries))
+
+    with neo4j_utils.neo4j_session() as session:
+        return (session.execute_read (work))
+
+
+
+###
+### Process-wide index section
+###
+
+_lock = threading.Lock()
+_tables = None
+
+_metrics = {
+    'lookups': 0,
+    'hits': 0
+}
+
+
+def load (index_par = None):
+    # Exports the missing (or all, on refresh) tables from Neo4j and opens them. Blocking, called at startup.
+    global _tables
+
+    if index_par is None:
+        index_par = read_smiles_index_config ()
+
+    if index_par['dir'] == '':
+        return (False)
+
+    os.makedirs (index_par['dir'], exist_ok = True)
+
+    tables = {}
+
+    for name, query in cq.SMILES_INDEX_TABLES.items():
+        path = table_path (index_par['dir'], name)
+
+        if index_par['refresh'] or not os.path.exists (path):
+            export_table (path, query)
+
+        tables[name] = Table (path)
+
+    with _lock:
+        previous = _tables
+        _tables = tables
+
+    if previous is not None:
+        for table in previous.values():
+            table.close ()
+
+    return (True)
+
+
+def close ():
+    global _tables
+
+    with _lock:
+        tables = _tables
+        _tables = None
+
+    if tables is not None:
+        for table in tables.values():
+            table.close ()
+
+
+def is_enabled ():
+    return (_tables is not None)
+
+
+def lookup (table, keys):
+    # Returns the values of the keys (None if missing) of a table
+    values = [_tables[table].get (key) for key in keys]
+
+    with _lock:
+        _metrics['lookups'] += len(values)
+        _metrics['hits'] += sum ([1 for v in values if v is not None])
+
+    return (values)
+
+
+def compound_table (stereo):
+    if stereo:
+        return ('compound_hash')
+
+    return ('compound_nostereo_hash')
+
+
+def smiles_compounds (hashes, stereo = True):
+    # hashes: InChI-Keys, or non-stereo InChI-Keys if not stereo (see smartgraph.compound_hash)
+    return (lookup (compound_table (stereo), hashes))
+
+
+def smiles_patterns (pattern_ids):
+    return (lookup ('pattern_id', pattern_ids))
+
+
+def get_metrics ():
+    with _lock:
+        metrics = dict (_metrics)
+        metrics['enabled'] = _tables is not None
+        metrics['entries'] = {name: len(table) for name, table in _tables.items()} if _tables is not None else {}
+
+    return (metrics)
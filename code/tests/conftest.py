@@ -0,0 +1,32 @@
+# The modules of the API are imported by their bare names (see server.py), the tests run them from the code directory.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert (0, os.path.dirname (os.path.dirname (os.path.abspath (__file__))))
+
+
+# Environment server.py needs to be imported, no Neo4j server is contacted: the startup events are not run
+SERVER_ENVIRONMENT = {
+    'neo4j_host': 'localhost',
+    'neo4j_port_bolt': '7687',
+    'neo4j_user': 'neo4j',
+    'neo4j_password': 'neo4j',
+    'SMARTGRAPH_UI_URL': '',
+    'SMARTGRAPH_API_SWAGGER_URL': '',
+    'SMARTGRAPH_API_BASE_PATH': '/api'
+}
+
+
+@pytest.fixture
+def client (monkeypatch):
+    # Test client of the API, the routes are under /api
+    for name, value in SERVER_ENVIRONMENT.items():
+        monkeypatch.setenv (name, value)
+
+    server = pytest.importorskip ('server')
+    testclient = pytest.importorskip ('fastapi.testclient')
+
+    return (testclient.TestClient (server.app))
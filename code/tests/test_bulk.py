@@ -0,0 +1,173 @@
+# Tests of the bulk (POST) endpoints (see the bulk section of smartgraph_async.py), answered from a stand-in Neo4j
+# session: one line of newline delimited JSON per input ID, in the order of the input IDs, read in chunks of IDs.
+
+import contextlib
+import re
+
+import neo4j
+import orjson
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+import neo4j_utils
+import smartgraph_async as sga
+
+
+# hash -> (non-stereo hash, SMILES) of the compounds
+COMPOUNDS = {
+    'AAAA-BBBB-N': ('AAAA', 'C'),
+    'AAAA-CCCC-N': ('AAAA', 'CC'),
+    'DDDD-EEEE-N': ('DDDD', 'CCC')
+}
+
+# (compound, target) of the bioactivities
+BIOACTIVITIES = [('AAAA-BBBB-N', 'P1'), ('DDDD-EEEE-N', 'P1'), ('AAAA-CCCC-N', 'P2')]
+
+
+class Result:
+
+    def __init__ (self, records):
+        self.records = records
+
+    def __aiter__ (self):
+        return (self.iterate ())
+
+    async def iterate (self):
+        for record in self.records:
+            yield (record)
+
+
+
+class Session:
+
+    # Answers the bulk SMILES and bioactivity queries, every read transaction is a chunk of IDs
+
+    def __init__ (self):
+        hydrator = _GraphHydrator ()
+
+        self.compounds = {}
+        self.targets = {}
+        self.relationships = []
+        self.chunks = []
+
+        for k, (inchikey, (nostereo_hash, smiles)) in enumerate (COMPOUNDS.items()):
+            properties = {'hash': inchikey, 'nostereo_hash': nostereo_hash, 'smiles': smiles, 'uuid': 'c%d' % (k)}
+            self.compounds[inchikey] = hydrator.hydrate_node (k, ['Compound'], properties, '4:x:%d' % (k))
+
+        for k, uniprot_id in enumerate (['P1', 'P2']):
+            self.targets[uniprot_id] = hydrator.hydrate_node (100 + k, ['Target'], {'uniprot_id': uniprot_id, 'uuid': 't%d' % (k)}, '4:x:%d' % (100 + k))
+
+        for k, (inchikey, uniprot_id) in enumerate (BIOACTIVITIES):
+            c = list (COMPOUNDS.keys()).index (inchikey)
+            t = 100 + ['P1', 'P2'].index (uniprot_id)
+            properties = {'uuid': 'b%d' % (k), 'edge_label': 'l', 'activity': 1.0}
+            self.relationships.append (hydrator.hydrate_relationship (200 + k, c, t, 'TESTED_ON', properties, '5:x:%d' % (k), '4:x:%d' % (c), '4:x:%d' % (t)))
+
+
+    async def run (self, query, parameters):
+        ids = parameters['ids']
+        m = re.match (r'UNWIND \$ids AS id MATCH \(c:Compound\) WHERE c\.(\w+) = id', query)
+
+        if m:
+            records = [neo4j.Record ({'id': i, 'smiles': c['smiles'], 'inchikey': c['hash'], 'nsinchikey': c['nostereo_hash']})
+                       for i in ids for c in self.compounds.values() if c[m.group (1)] == i]
+
+            return (Result (records))
+
+        assert 'WHERE t.uniprot_id = id' in query
+        records = [neo4j.Record ({'id': i, 'c': r.start_node, 't': r.end_node, 'rel': r}) for i in ids for r in self.relationships if r.end_node['uniprot_id'] == i]
+
+        return (Result (records))
+
+
+    async def execute_read (self, work):
+        self.chunks.append (None)
+
+        return (await work (self))
+
+
+
+@pytest.fixture
+def session (monkeypatch):
+    session = Session ()
+
+    @contextlib.asynccontextmanager
+    async def neo4j_async_session ():
+        yield (session)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_async_session', neo4j_async_session)
+    monkeypatch.setattr (sga, 'BULK_CHUNK_SIZE', 2)
+
+    return (session)
+
+
+def lines (response):
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith ('application/x-ndjson')
+
+    return ([orjson.loads (line) for line in response.content.splitlines ()])
+
+
+
+###
+### SMILES section
+###
+
+def test_bulk_smiles_compound (client, session):
+    ids = ['DDDD-EEEE-N', 'XXXX-YYYY-N', 'AAAA-BBBB-N', 'DDDD-EEEE-N', 'AAAA-CCCC-N']
+    result = lines (client.post ('/api/smiles_compound', json = {'ids': ids}))
+
+    # One line per input ID in input order, also for repeated IDs, null for unknown IDs
+    assert [line['id'] for line in result] == ids
+    assert [line['result']['compound']['smiles'] if line['result'] is not None else None for line in result] == ['CCC', None, 'C', 'CCC', 'CC']
+    assert result[0]['result']['compound']['stereo'] is True
+
+    # 5 IDs in chunks of 2
+    assert len(session.chunks) == 3
+
+
+def test_bulk_smiles_compound_non_stereo (client, session):
+    # Non-stereo lookups by the first block of the InChIKey, one result per ID (the first compound found)
+    ids = ['AAAA-BBBB-N', 'AAAA', 'DDDD']
+    result = lines (client.post ('/api/smiles_compound', params = {'stereo': 'false'}, json = {'ids': ids}))
+
+    assert [line['id'] for line in result] == ids
+    assert [line['result']['compound']['nsinchikey'] for line in result] == ['AAAA', 'AAAA', 'DDDD']
+    assert result[0]['result']['compound']['smiles'] in ['C', 'CC']
+    assert result[0]['result']['compound']['stereo'] is False
+
+
+
+###
+### Graphs section
+###
+
+def test_bulk_bioactivity_target (client, session):
+    ids = ['P2', 'P9', 'P1']
+    result = lines (client.post ('/api/bioactivity_target', json = {'ids': ids}))
+
+    assert [line['id'] for line in result] == ids
+    assert sorted ([n['node_id'] for n in result[0]['result']['nodes']]) == ['AAAA-CCCC-N', 'P2']
+    assert result[1]['result'] == {'nodes': [], 'edges': []}
+    assert sorted ([n['node_id'] for n in result[2]['result']['nodes']]) == ['AAAA-BBBB-N', 'DDDD-EEEE-N', 'P1']
+    assert len(result[2]['result']['edges']) == 2
+    assert len(session.chunks) == 2
+
+
+
+###
+### Errors section
+###
+
+def test_bulk_ids_bad_request (client, session, monkeypatch):
+    response = client.post ('/api/bioactivity_target', json = {'ids': []})
+
+    assert response.status_code == 400
+    assert 'number of IDs' in response.json ()['detail']
+
+    monkeypatch.setattr (sga, 'BULK_MAX_IDS', 2)
+    response = client.post ('/api/smiles_compound', json = {'ids': ['A', 'B', 'C']})
+
+    assert response.status_code == 400
+    assert len(session.chunks) == 0
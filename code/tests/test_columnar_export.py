@@ -0,0 +1,82 @@
+# Tests of the Arrow and Parquet export (see columnar_export.py): column types, and the layout of the archive with the
+# nodes and edges tables.
+
+import io
+import zipfile
+
+import pytest
+
+pa = pytest.importorskip ('pyarrow')
+
+import pyarrow.feather
+import pyarrow.parquet
+
+import columnar_export
+
+
+G_JSON = {
+    'nodes': [
+        {'uniprot_id': 'P1', 'synonyms': ['A', 'B'], 'node_type': 'target', 'node_id': 'P1'},
+        {'uniprot_id': 'P2', 'synonyms': [], 'node_type': 'target', 'node_id': 'P2'},
+        {'hash': 'C-A-N', 'smiles': 'C', 'node_type': 'compound', 'node_id': 'C-A-N'},
+        {'pattern_id': 'S1', 'islargest': 'True', 'ratio': '0.5', 'node_type': 'pattern', 'node_id': 'S1'},
+        {'pattern_id': 'S2', 'islargest': 'false', 'ratio': 1, 'node_type': 'pattern', 'node_id': 'S2'}
+    ],
+    'edges': [
+        {'uuid': 'a1', 'activity': 5, 'activity_type': 'IC50', 'edge_type': 'tested_on', 'start_node': 'C-A-N', 'end_node': 'P1'},
+        {'uuid': 'a2', 'activity': '0.25', 'edge_type': 'tested_on', 'start_node': 'C-A-N', 'end_node': 'P2'},
+        {'uuid': 'r1', 'max_confidence_value': 1, 'mixed': 'x', 'edge_type': 'regulates', 'start_node': 'P1', 'end_node': 'P2'},
+        {'uuid': 'r2', 'max_confidence_value': 0.5, 'mixed': 2, 'edge_type': 'regulates', 'start_node': 'P2', 'end_node': 'P1'}
+    ]
+}
+
+
+def read_archive (content, format):
+    archive = zipfile.ZipFile (io.BytesIO (content))
+    read = pyarrow.parquet.read_table if format == 'parquet' else pyarrow.feather.read_table
+
+    return (archive, {name: read (archive.open (name)) for name in archive.namelist()})
+
+
+def test_column_types ():
+    nodes, edges = columnar_export.to_tables (G_JSON)
+
+    assert edges.schema.field ('activity').type == pa.float64()
+    assert edges.column ('activity').to_pylist () == [5.0, 0.25, None, None]
+    assert edges.schema.field ('max_confidence_value').type == pa.float64()
+    assert nodes.schema.field ('islargest').type == pa.bool_()
+    assert nodes.column ('islargest').to_pylist () == [None, None, None, True, False]
+    assert nodes.schema.field ('ratio').type == pa.float64()
+
+    # List properties are list columns, mixed values fall back to strings, missing properties are nulls
+    assert nodes.schema.field ('synonyms').type == pa.list_ (pa.string())
+    assert nodes.column ('synonyms').to_pylist () == [['A', 'B'], [], None, None, None]
+    assert edges.column ('mixed').to_pylist () == [None, None, 'x', '2']
+    assert nodes.column_names == ['uniprot_id', 'synonyms', 'node_type', 'node_id', 'hash', 'smiles', 'pattern_id', 'islargest', 'ratio']
+
+
+@pytest.mark.parametrize ('format', ['arrow', 'parquet'])
+def test_archive (format):
+    archive, tables = read_archive (columnar_export.to_archive (G_JSON, format), format)
+
+    assert archive.namelist () == ['nodes.' + format, 'edges.' + format]
+    assert all ([info.compress_type == zipfile.ZIP_STORED for info in archive.infolist ()])
+
+    nodes = tables['nodes.' + format]
+    edges = tables['edges.' + format]
+
+    assert nodes.num_rows == 5
+    assert edges.num_rows == 4
+    assert edges.column ('start_node').to_pylist () == ['C-A-N', 'C-A-N', 'P1', 'P2']
+    assert edges.schema.field ('activity').type == pa.float64()
+    assert nodes.schema.field ('islargest').type == pa.bool_()
+    assert nodes.schema.field ('synonyms').type == pa.list_ (pa.string())
+
+
+@pytest.mark.parametrize ('format', ['arrow', 'parquet'])
+def test_empty_graph (format):
+    archive, tables = read_archive (columnar_export.to_archive ({'nodes': [], 'edges': []}, format), format)
+
+    assert archive.namelist () == ['nodes.' + format, 'edges.' + format]
+    assert tables['nodes.' + format].num_rows == 0
+    assert tables['edges.' + format].num_columns == 0
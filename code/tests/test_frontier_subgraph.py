@@ -0,0 +1,188 @@
+# Tests of the frontier expansion engine (see frontier_subgraph.py) against the union of the paths of the Cypher queries
+# of /subgraph_target_induced and /subgraph_compound_induced, enumerated by brute force with relationship uniqueness.
+
+import random
+
+import pytest
+
+import frontier_subgraph
+
+
+# Nodes 0 .. 5 are targets, 6 and 7 compounds; relationship ID -> (start node, end node)
+RELATIONSHIPS = {
+    'r0': (0, 1), 'r1': (1, 2), 'r2': (2, 0), 'r3': (2, 3), 'r4': (3, 3), 'r5': (3, 4),
+    'r6': (4, 1), 'r7': (1, 5), 'r8': (6, 0), 'r9': (6, 3), 'r10': (7, 3), 'r11': (7, 5)
+}
+N_TARGETS = 6
+
+
+def labels (i, n_targets):
+    return (['Target'] if i < n_targets else ['Compound'])
+
+
+def steps (relationships, i, direction):
+    # (relationship, neighbour) of node i in the direction of the search, an undirected self-loop once
+    for e, (a, b) in relationships.items():
+        if direction in ['out', 'both'] and a == i:
+            yield ((e, b))
+
+        elif direction in ['in', 'both'] and b == i:
+            yield ((e, a))
+
+
+def expand (relationships, sources, direction, max_length, endpoint_label, shortest_paths, n_targets = N_TARGETS):
+    # Drives the engine as the endpoints do, level by level
+    extractor = frontier_subgraph.FrontierSubgraph ([(i, labels (i, n_targets)) for i in sources], direction, max_length, endpoint_label, shortest_paths)
+
+    while extractor.pending ():
+        for i in extractor.pending ():
+            for e, j in steps (relationships, i, direction):
+                extractor.add_relationship (i, e, j, labels (j, n_targets))
+
+        extractor.next_level ()
+
+    return (extractor.edges ())
+
+
+def path_union (relationships, sources, direction, max_length, endpoint_label, n_targets = N_TARGETS):
+    # The relationships of the paths of 1 .. max_length relationships, none of them twice, from a start node to an end
+    # node of the endpoint type
+    union = set ()
+
+    def walk (i, path):
+        if len(path) > 0 and (endpoint_label is None or endpoint_label in labels (i, n_targets)):
+            union.update (path)
+
+        if len(path) == max_length:
+            return
+
+        for e, j in steps (relationships, i, direction):
+            if e not in path:
+                walk (j, path + [e])
+
+    for source in sources:
+        walk (source, [])
+
+    return (union)
+
+
+def distances (relationships, source, direction, max_length, allowed = None):
+    d = {source: 0}
+    frontier = [source]
+
+    for depth in range (max_length):
+        next_frontier = []
+
+        for i in frontier:
+            for e, j in steps (relationships, i, direction):
+                if (allowed is None or e in allowed) and j not in d:
+                    d[j] = depth + 1
+                    next_frontier.append (j)
+
+        frontier = next_frontier
+
+    return (d)
+
+
+def random_network (seed, n_targets = 8, n_compounds = 3):
+    rnd = random.Random (seed)
+    relationships = {}
+
+    for k in range (rnd.randint (0, 3 * n_targets)):
+        relationships['r%d' % (k)] = (rnd.randrange (n_targets), rnd.randrange (n_targets))
+
+    for c in range (n_targets, n_targets + n_compounds):
+        for k in range (rnd.randint (1, 3)):
+            relationships['c%d_%d' % (c, k)] = (c, rnd.randrange (n_targets))
+
+    return (relationships)
+
+
+
+###
+### All paths section
+###
+
+@pytest.mark.parametrize ('direction', ['out', 'in', 'both'])
+@pytest.mark.parametrize ('endpoint_label', [None, 'Target', 'Compound'])
+@pytest.mark.parametrize ('max_length', [1, 2, 3, 4])
+def test_all_paths (direction, endpoint_label, max_length):
+    for sources in [[0], [3], [0, 4], [6], [6, 7]]:
+        edges = expand (RELATIONSHIPS, sources, direction, max_length, endpoint_label, False)
+
+        assert set(edges) == path_union (RELATIONSHIPS, sources, direction, max_length, endpoint_label)
+
+        if direction != 'both':
+            assert all (RELATIONSHIPS[e] == ((i, j) if direction == 'out' else (j, i)) for e, (i, j) in edges.items())
+
+
+def test_all_paths_compound_tested_on_one_target ():
+    # A compound tested on a single target does not connect the target to itself (relationship uniqueness)
+    relationships = {'r0': (6, 0), 'r1': (0, 1)}
+
+    assert set(expand (relationships, [0], 'both', 2, 'Target', False)) == {'r1'}
+    assert set(expand (relationships, [0], 'both', 2, None, False)) == {'r0', 'r1'}
+
+
+def test_all_paths_random_networks ():
+    # Never fewer relationships than the union of the paths, more only in the case documented in frontier_subgraph.py
+    n_differences = 0
+
+    for seed in range (300):
+        relationships = random_network (seed)
+        rnd = random.Random (seed)
+
+        max_length = rnd.randint (1, 4)
+        direction = rnd.choice (['out', 'in', 'both'])
+        endpoint_label = rnd.choice ([None, 'Target', 'Compound'])
+        sources = rnd.sample (range (11), rnd.randint (1, 2))
+
+        edges = set(expand (relationships, sources, direction, max_length, endpoint_label, False, 8))
+        union = path_union (relationships, sources, direction, max_length, endpoint_label, 8)
+
+        assert edges >= union
+        n_differences += edges != union
+
+    assert n_differences <= 10
+
+
+def test_all_paths_reusing_a_relationship ():
+    # The documented deviation: r1 and r2 are only on the walk 0 -r0-> 1 -r1-> 2 -r2-> 0 -r0-> 1 -r3-> 3, which takes r0
+    # twice. The distances without r1 (0 -> 1 and 2 -> 0 -> 1 -> 3) add up to 5 relationships, hence r1 is kept.
+    relationships = {'r0': (0, 1), 'r1': (1, 2), 'r2': (2, 0), 'r3': (1, 3)}
+    n_targets = 3
+
+    assert path_union (relationships, [0], 'out', 5, 'Compound', n_targets) == {'r0', 'r3'}
+    assert set(expand (relationships, [0], 'out', 5, 'Compound', False, n_targets)) == {'r0', 'r1', 'r2', 'r3'}
+
+    # Within 4 relationships, the walk does not fit
+    assert set(expand (relationships, [0], 'out', 4, 'Compound', False, n_targets)) == {'r0', 'r3'}
+
+
+
+###
+### Shortest paths section
+###
+
+def test_shortest_paths_random_networks ():
+    # Every end node within max_length is reached by the subgraph at its shortest distance, and the subgraph is part of
+    # the all paths subgraph
+    for seed in range (300):
+        relationships = random_network (seed)
+        rnd = random.Random (seed + 1)
+
+        max_length = rnd.randint (1, 4)
+        direction = rnd.choice (['out', 'in', 'both'])
+        endpoint_label = rnd.choice ([None, 'Target', 'Compound'])
+        sources = rnd.sample (range (11), rnd.randint (1, 2))
+
+        edges = set(expand (relationships, sources, direction, max_length, endpoint_label, True, 8))
+
+        for source in sources:
+            reached = distances (relationships, source, direction, max_length, edges)
+
+            for j, d in distances (relationships, source, direction, max_length).items():
+                if j != source and (endpoint_label is None or endpoint_label in labels (j, 8)):
+                    assert reached.get (j) == d
+
+        assert edges <= path_union (relationships, sources, direction, max_length, endpoint_label, 8)
@@ -0,0 +1,58 @@
+# Tests of the single-pass graph builder (see graph_builder.py) against the extract/aggregate pipeline it replaces
+
+import orjson
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+from neo4j.graph import Path
+
+import benchmark
+import graph_builder
+
+
+@pytest.mark.parametrize ('n_relationships', [100, 5000])
+def test_same_graph_as_aggregate (n_relationships):
+    g = benchmark.synthetic_neo4j_graph (n_relationships)
+
+    assert orjson.dumps (graph_builder.GraphBuilder().add_graph (g).to_json ()) == orjson.dumps (benchmark.graph_to_json_aggregate (g))
+
+
+def test_add_values_deduplicates ():
+    hydrator = _GraphHydrator ()
+    t1 = hydrator.hydrate_node (1, ['Target'], {'uniprot_id': 'P1', 'uuid': 't1'}, '4:x:1')
+    t2 = hydrator.hydrate_node (2, ['Target'], {'uniprot_id': 'P2', 'uuid': 't2'}, '4:x:2')
+    t3 = hydrator.hydrate_node (3, ['Target'], {'uniprot_id': 'P3', 'uuid': 't3'}, '4:x:3')
+    r1 = hydrator.hydrate_relationship (10, 1, 2, 'REGULATES', {'uuid': 'r10', 'ppi_uid': 'l10'}, '5:x:10', '4:x:1', '4:x:2')
+    r2 = hydrator.hydrate_relationship (11, 2, 3, 'REGULATES', {'uuid': 'r11', 'ppi_uid': 'l11'}, '5:x:11', '4:x:2', '4:x:3')
+
+    builder = graph_builder.GraphBuilder ()
+    builder.add_values ([Path (t1, r1, r2), [t2, r1], {'t': t3}])
+
+    streamed = list (graph_builder.GraphBuilder(keep_records = False).add ([Path (t1, r1, r2), [t2, r1], {'t': t3}]))
+    G_json = builder.to_json ()
+
+    assert [node['node_id'] for node in G_json['nodes']] == ['P1', 'P2', 'P3']
+    assert [(edge['uuid'], edge['start_node'], edge['end_node']) for edge in G_json['edges']] == [('r10_l10', 'P1', 'P2'), ('r11_l11', 'P2', 'P3')]
+    assert [kind for kind, record in streamed] == ['node', 'node', 'node', 'edge', 'edge']
+
+
+def test_end_nodes_not_returned ():
+    # The ends of a relationship whose nodes were not returned are resolved from their properties
+    hydrator = _GraphHydrator ()
+    hydrator.hydrate_node (1, ['Compound'], {'hash': 'H1', 'nostereo_hash': 'N1'}, '4:x:1')
+    hydrator.hydrate_node (2, ['Target'], {'uniprot_id': 'P2'}, '4:x:2')
+    r = hydrator.hydrate_relationship (10, 1, 2, 'TESTED_ON', {'uuid': 'r10', 'unique_label': 'l10'}, '5:x:10', '4:x:1', '4:x:2')
+
+    builder = graph_builder.GraphBuilder ()
+    builder.add_values ([r])
+
+    assert builder.to_json ()['edges'][0]['start_node'] == 'H1'
+    assert builder.to_json ()['edges'][0]['end_node'] == 'P2'
+
+
+def test_invalid_edge_type ():
+    hydrator = _GraphHydrator ()
+    r = hydrator.hydrate_relationship (10, 1, 2, 'UNKNOWN', {'uuid': 'r10', 'unique_label': 'l10'}, '5:x:10', '4:x:1', '4:x:2')
+
+    with pytest.raises (Exception, match = 'Invalid edge type'):
+        graph_builder.GraphBuilder().add_values ([r])
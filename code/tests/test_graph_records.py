@@ -0,0 +1,83 @@
+# Tests of the compact node and edge records (see graph_records.py) and of the records built by graph_builder.py
+
+import gc
+
+import orjson
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+import graph_builder
+import graph_records
+
+
+def neo4j_graph ():
+    hydrator = _GraphHydrator ()
+
+    hydrator.hydrate_node (1, ['Target'], {'uniprot_id': 'P1', 'synonyms': ['A', 'B'], 'uuid': 't1'}, '4:x:1')
+    hydrator.hydrate_node (2, ['Target'], {'uniprot_id': 'P2', 'uuid': 't2'}, '4:x:2')
+    hydrator.hydrate_node (3, ['Compound'], {'hash': 'H3', 'nostereo_hash': 'N3', 'uuid': 'c3'}, '4:x:3')
+    hydrator.hydrate_relationship (10, 1, 2, 'REGULATES', {'uuid': 'r10', 'ppi_uid': 'l10', 'edgeType': 'activation'}, '5:x:10', '4:x:1', '4:x:2')
+    hydrator.hydrate_relationship (11, 3, 1, 'TESTED_ON', {'uuid': 'r11', 'unique_label': 'l11', 'activity': 7.5}, '5:x:11', '4:x:3', '4:x:1')
+
+    return (hydrator.graph)
+
+
+def test_record_mapping ():
+    record = graph_records.Node.from_dict ({'node_id': 'P1', 'synonyms': ['A'], 'node_type': 'target'})
+
+    assert record['node_id'] == 'P1'
+    assert record.get ('missing', 0) == 0
+    assert 'synonyms' in record
+    assert list (record.keys()) == ['node_id', 'synonyms', 'node_type']
+    assert record == {'node_id': 'P1', 'synonyms': ['A'], 'node_type': 'target'}
+    assert graph_records.to_dict (record) == record.to_dict ()
+
+
+def test_record_hash ():
+    record_1 = graph_records.Node.from_dict ({'node_id': 'P1', 'synonyms': ['A'], 'node_type': 'target'})
+    record_2 = graph_records.Node.from_dict ({'node_id': 'P1', 'synonyms': ['A'], 'node_type': 'target'})
+    record_3 = graph_records.Node.from_dict ({'node_id': 'P2', 'synonyms': ['A'], 'node_type': 'target'})
+
+    assert record_1 == record_2 and hash (record_1) == hash (record_2)
+    assert len ({record_1, record_2, record_3}) == 2
+
+
+def test_schemas_are_shared_and_released ():
+    names = ('node_id', 'test_schemas_are_shared_and_released')
+    record_1 = graph_records.Node.from_dict (dict.fromkeys (names, 'x'))
+    record_2 = graph_records.Edge.from_dict (dict.fromkeys (names, 'y'))
+
+    assert record_1.schema is record_2.schema
+    assert names in graph_records._schemas
+
+    del record_1, record_2
+    gc.collect ()
+
+    assert names not in graph_records._schemas
+
+
+def test_builder_records ():
+    g = neo4j_graph ()
+
+    G_json = graph_builder.GraphBuilder().add_graph (g).to_json ()
+    G_compact = graph_builder.GraphBuilder(compact = True).add_graph (g).to_json ()
+
+    # The graphs of the responses are plain dicts, serialised without the default hook
+    assert all ([type (record) is dict for record in G_json['nodes'] + G_json['edges']])
+    assert all ([isinstance (record, graph_records.Record) for record in G_compact['nodes'] + G_compact['edges']])
+    assert orjson.dumps (G_json) == orjson.dumps (G_compact, default = graph_records.default)
+
+    edges = {edge['uuid']: edge for edge in G_json['edges']}
+    assert edges['r10_l10'] == {'uuid': 'r10_l10', 'edge_label': 'l10', 'action_type': 'activation', 'edge_type': 'regulates', 'start_node': 'P1', 'end_node': 'P2'}
+    assert edges['r11_l11']['start_node'] == 'H3'
+
+
+def test_add_records_returns_dicts ():
+    G_compact = graph_builder.GraphBuilder(compact = True).add_graph (neo4j_graph ()).to_json ()
+
+    builder = graph_builder.GraphBuilder ()
+    builder.add_records (G_compact['nodes'], G_compact['edges'])
+    G_json = builder.to_json ()
+
+    assert all ([type (record) is dict for record in G_json['nodes'] + G_json['edges']])
+    assert G_json == G_compact
@@ -0,0 +1,173 @@
+# Tests of the loading of the graph snapshot (see graph_snapshot.py) from a stand-in Neo4j session, with data loads
+# committed while the snapshot is read.
+
+import contextlib
+import re
+import types
+
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+import graph_snapshot
+import neo4j_utils
+import pagination
+
+
+class Database:
+
+    def __init__ (self):
+        self.hydrator = _GraphHydrator ()
+        self.nodes = []
+        self.relationships = []
+
+        # Changes committed while a snapshot is read, one per read transaction, after its nodes were read
+        self.changes = []
+        self.change = None
+        self.reads = 0
+
+
+    def add_target (self, i):
+        self.nodes.append (self.hydrator.hydrate_node (i, ['Target'], {'uniprot_id': 'P%d' % (i), 'uuid': 't%d' % (i)}, '4:x:%d' % (i)))
+
+
+    def add_regulates (self, k, start, end):
+        properties = {'uuid': 'r%d' % (k), 'edge_label': 'l', 'max_confidence_value': 0.5}
+        self.relationships.append (self.hydrator.hydrate_relationship (1000 + k, start, end, 'REGULATES', properties, '5:x:%d' % (k), '4:x:%d' % (start), '4:x:%d' % (end)))
+
+
+    def run (self, query, parameters = None):
+        m = re.match (r'MATCH \(n:(\w+)\) RETURN count', query)
+
+        if m:
+            return (types.SimpleNamespace (single = lambda: {'count': sum ([m.group (1) in n.labels for n in self.nodes])}))
+
+        m = re.match (r'MATCH \(\)-\[r:(\w+)\]->\(\) RETURN count', query)
+
+        if m:
+            return (types.SimpleNamespace (single = lambda: {'count': sum ([r.type == m.group (1) for r in self.relationships])}))
+
+        m = re.match (r'MATCH \(n:(\w+)\) RETURN n', query)
+
+        if m:
+            return ([{'n': n} for n in self.nodes if m.group (1) in n.labels])
+
+        m = re.match (r'MATCH \(:\w+\)-\[r:(\w+)\]', query)
+
+        if self.change is not None:
+            self.change (self)
+            self.change = None
+
+        return ([{'r': r} for r in self.relationships if r.type == m.group (1)])
+
+
+
+class Session:
+
+    def __init__ (self, database):
+        self.database = database
+
+
+    def run (self, query, parameters = None):
+        return (self.database.run (query, parameters))
+
+
+    def execute_read (self, work):
+        self.database.reads += 1
+
+        if self.database.changes:
+            self.database.change = self.database.changes.pop (0)
+
+        return (work (self.database))
+
+
+
+@pytest.fixture
+def database (monkeypatch):
+    database = Database ()
+
+    for i in range (3):
+        database.add_target (i)
+
+    database.add_regulates (0, 0, 1)
+    database.add_regulates (1, 1, 2)
+
+    @contextlib.contextmanager
+    def neo4j_session ():
+        yield (Session (database))
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_session', neo4j_session)
+
+    return (database)
+
+
+def concurrent_load (database):
+    # A target and a relationship to it, committed after the targets were read
+    i = len(database.nodes)
+    database.add_target (i)
+    database.add_regulates (len(database.relationships), 0, i)
+
+
+
+###
+### Loading section
+###
+
+def test_fetch_snapshot (database):
+    snapshot = graph_snapshot.fetch_snapshot ()
+
+    assert database.reads == 1
+    assert len(snapshot.nodes['Target']) == 3
+    assert len(snapshot.relationships['REGULATES']) == 2
+    assert snapshot.fingerprint == (3, 0, 0, 2, 0, 0, 0)
+
+
+def test_fetch_snapshot_concurrent_load (database):
+    # The relationship to the target not read is skipped, and the snapshot read again
+    database.changes = [concurrent_load]
+    snapshot = graph_snapshot.fetch_snapshot ()
+
+    assert database.reads == 2
+    assert len(snapshot.nodes['Target']) == 4
+    assert len(snapshot.relationships['REGULATES']) == 3
+    assert snapshot.fingerprint == graph_snapshot.fetch_fingerprint (database)
+
+
+def test_fetch_snapshot_changed_fingerprint (database):
+    # A target without relationships, the fingerprint read with the snapshot is out of date
+    database.changes = [lambda database: database.add_target (len(database.nodes))]
+    snapshot = graph_snapshot.fetch_snapshot ()
+
+    assert database.reads == 2
+    assert len(snapshot.nodes['Target']) == 4
+
+
+def test_fetch_snapshot_data_keeps_changing (database, monkeypatch):
+    monkeypatch.setenv ('sg_graph_snapshot_load_attempts', '2')
+    database.changes = [concurrent_load] * 2
+
+    with pytest.raises (Exception, match = 'changed while the graph snapshot was read'):
+        graph_snapshot.fetch_snapshot ()
+
+    assert database.reads == 2
+
+
+
+###
+### Cursors section
+###
+
+def test_cursor_fingerprint_of_snapshot (monkeypatch):
+    fingerprints = []
+
+    for snapshot in [None, types.SimpleNamespace (fingerprint = (3, 2)), types.SimpleNamespace (fingerprint = (2, 3))]:
+        monkeypatch.setattr (graph_snapshot, '_snapshot', snapshot)
+        fingerprints.append (pagination.fingerprint ('path_regulatory', 'q', {'ids': ['P1']}))
+
+    assert len(set(fingerprints)) == 3
+
+    # A cursor issued before a reload is rejected
+    cursor = pagination.encode_cursor (fingerprints[1], 'k', 10)
+
+    with pytest.raises (Exception, match = 'different query'):
+        pagination.decode_cursor (cursor, fingerprints[2])
@@ -0,0 +1,96 @@
+# Tests of the incremental GraphML serialiser (see graphml_writer.py) against the networkx based serialisation it
+# replaces (benchmark.to_graphml_networkx): both have to write the same document, except for line breaks in values.
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import benchmark
+import graphml_writer
+
+
+def target (uniprot_id, **properties):
+    return (dict ({'uniprot_id': uniprot_id, 'uuid': 'u-' + uniprot_id, 'node_type': 'target', 'node_id': uniprot_id}, **properties))
+
+
+def regulates (uuid, start_node, end_node, **properties):
+    return (dict ({'uuid': uuid, 'edge_label': 'l-' + uuid, 'edge_type': 'regulates', 'start_node': start_node, 'end_node': end_node}, **properties))
+
+
+def assert_same_graphml (G_json):
+    assert graphml_writer.to_graphml (G_json) == benchmark.to_graphml_networkx (G_json)
+
+
+def test_empty_graph ():
+    assert_same_graphml ({'nodes': [], 'edges': []})
+
+
+def test_list_values ():
+    G_json = {'nodes': [target ('P1', synonyms = ['A', 'B', 'C']), target ('P2', synonyms = [])],
+              'edges': [regulates ('r1', 'P1', 'P2', sources = ['SIGNOR', 'Reactome'])]}
+
+    assert_same_graphml (G_json)
+    assert '>A,B,C</data>' in graphml_writer.to_graphml (G_json)
+
+
+def test_xml_escaping ():
+    G_json = {'nodes': [target ('P<1>&"', fullname = 'a < b & c > "d"\te'), target ('P2', fullname = '')],
+              'edges': [regulates ('r1', 'P<1>&"', 'P2', mechanism_details = '<x>&amp;</x>')]}
+
+    assert_same_graphml (G_json)
+
+
+def test_line_breaks_kept ():
+    # networkx dropped the line breaks of text values (joined lines of the document), the writer keeps them
+    G_json = {'nodes': [target ('P1', fullname = 'a\nb\r\nc')], 'edges': []}
+    root = ET.fromstring (graphml_writer.to_graphml (G_json))
+    ns = {'g': graphml_writer.NS_GRAPHML}
+
+    fullname_key = [key.get ('id') for key in root.findall ('g:key', ns) if key.get ('attr.name') == 'fullname'][0]
+    values = [data.text for data in root.iter ('{%s}data' % (graphml_writer.NS_GRAPHML)) if data.get ('key') == fullname_key]
+
+    # XML parsers normalise \r\n to \n
+    assert values == ['a\nb\nc']
+    assert 'abc</data>' in benchmark.to_graphml_networkx (G_json)
+
+
+def test_value_types ():
+    G_json = {'nodes': [target ('P1', score = 1, weight = 0.5, reviewed = True), target ('P2', score = 1.5, weight = 2, reviewed = 'yes')],
+              'edges': [regulates ('r1', 'P1', 'P2', max_confidence_value = 0.9, count = 3, directed = False)]}
+
+    assert_same_graphml (G_json)
+
+
+def test_merged_parallel_edges ():
+    # Edges with the same start and end node are one edge, properties of later edges win; repeated nodes are merged
+    G_json = {'nodes': [target ('P1', fullname = 'first'), target ('P2'), target ('P1', synonyms = ['X'])],
+              'edges': [regulates ('r1', 'P1', 'P2', action_type = 'activation'),
+                        regulates ('r2', 'P2', 'P1'),
+                        regulates ('r3', 'P1', 'P2', source = 'SIGNOR')]}
+
+    assert_same_graphml (G_json)
+    assert graphml_writer.to_graphml (G_json).count ('<edge ') == 2
+
+
+def test_nodes_referenced_by_edges_only ():
+    G_json = {'nodes': [target ('P1')],
+              'edges': [regulates ('r1', 'P1', 'P9'), regulates ('r2', 'P8', 'P1'), regulates ('r3', 'P8', 'P9')]}
+
+    assert_same_graphml (G_json)
+    assert '<node id="P9" />' in graphml_writer.to_graphml (G_json)
+
+
+@pytest.mark.parametrize ('chunk_size', [1, 100, 1000, graphml_writer.CHUNK_SIZE])
+def test_chunk_boundaries (chunk_size):
+    G_json = benchmark.synthetic_graph (200)
+    chunks = list (graphml_writer.generate_graphml (G_json, chunk_size = chunk_size))
+
+    assert b''.join (chunks).decode ('utf-8') == benchmark.to_graphml_networkx (G_json)
+
+    if chunk_size < 1000:
+        assert len(chunks) > 10
+
+
+@pytest.mark.parametrize ('n_edges', [1, 50, 2000])
+def test_synthetic_graphs (n_edges):
+    assert_same_graphml (benchmark.synthetic_graph (n_edges))
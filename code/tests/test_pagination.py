@@ -0,0 +1,142 @@
+# Tests of the keyset pagination (see pagination.py and the pagination section of cypher_queries.py).
+
+import asyncio
+
+import pytest
+
+import cypher_queries as cq
+import pagination
+import request_errors
+import result_cache
+import smartgraph_async as sga
+
+
+
+###
+### Paged queries section
+###
+
+def test_paged_per_start_node ():
+    query, parameters = cq.bioactivity_target (['P1', 'P2'])
+    paged_query, paged_parameters = cq.paged (query, parameters, None, 10)
+
+    assert cq.start_node (query) == ('t', 'Target', 'uniprot_id', 'uniprot_ids')
+    assert paged_query.startswith ("MATCH (sg_start:Target) WHERE sg_start.uniprot_id IN $uniprot_ids ")
+    assert "CALL { WITH sg_start, sg_start_key WITH sg_start AS t, sg_start_key MATCH " in paged_query
+    assert "sg_start_key + elementId(rel) AS sg_cursor" in paged_query
+    assert paged_query.endswith ("ORDER BY sg_cursor LIMIT $page_limit } RETURN c, t, rel, sg_cursor LIMIT $page_limit")
+    assert paged_parameters['page_limit'] == 11
+    assert paged_parameters['after'] is None
+    assert paged_parameters['after_start'] is None
+
+
+def test_paged_after_start ():
+    query, parameters = cq.path_regulatory (['P1'], ['P2'])
+    paged_query, paged_parameters = cq.paged (query, parameters, '4:x:12|4:x:12,5:x:3', 10)
+
+    assert cq.start_node (query)[:3] == ('t1', 'Target', 'uniprot_id')
+    assert paged_parameters['after_start'] == '4:x:12|'
+
+    # The start nodes are ordered as the prefixes of the keys of their rows, also if an element ID is a prefix of another
+    keys = ['4:x:123|4:x:123,5:x:1', '4:x:12|4:x:12,5:x:2', '4:x:2|4:x:2,5:x:0']
+    start_keys = [key[:key.index ('|') + 1] for key in keys]
+
+    assert [key[:key.index ('|') + 1] for key in sorted (keys)] == sorted (start_keys)
+
+
+def test_paged_aggregating_query_as_whole ():
+    query, parameters = cq.subgraph_compound_induced (['K1'])
+    paged_query, paged_parameters = cq.paged (query, parameters, None, 10)
+
+    assert cq.start_node (query) is None
+    assert "CALL {" not in paged_query
+    assert paged_query.startswith (query[:query.rindex (" RETURN ")])
+    assert paged_query.endswith ("RETURN p, sg_cursor ORDER BY sg_cursor LIMIT $page_limit")
+
+
+def test_cursor_round_trip ():
+    cursor = pagination.encode_cursor ('f1', '4:x:1|5:x:2', 20)
+
+    assert pagination.decode_cursor (cursor, 'f1') == ('4:x:1|5:x:2', 20)
+
+    with pytest.raises (request_errors.InvalidRequest, match = 'different query'):
+        pagination.decode_cursor (cursor, 'f2')
+
+
+@pytest.mark.parametrize ('parameters, message', [
+    ({'page_size': 0}, 'at least 1'),
+    ({'cursor': 'not a cursor'}, 'Invalid cursor'),
+    ({'cursor': pagination.encode_cursor ('0123456789abcdef', 'k', 10)}, 'different query')
+])
+def test_invalid_page_request_is_bad_request (client, parameters, message):
+    response = client.get ('/api/bioactivity_target/P1', params = parameters)
+
+    assert response.status_code == 400
+    assert message in response.json ()['detail']
+
+
+@pytest.mark.parametrize ('parameters', [
+    {'limit': 10, 'page_size': 5},
+    {'limit': 0, 'cursor': pagination.encode_cursor ('0123456789abcdef', 300, 10)}
+])
+def test_predict_limit_and_page_is_bad_request (client, parameters):
+    # /predict pages by cursor, `limit` only bounds unpaged requests
+    response = client.get ('/api/predict/P1', params = parameters)
+
+    assert response.status_code == 400
+    assert '`limit`' in response.json ()['detail']
+
+
+
+###
+### Row endpoints section
+###
+
+def rows (n):
+    nodes = [{'node_id': 'n%d' % (i)} for i in range(n)]
+
+    return ([('k%03d' % (i), [nodes[i]], [{'uuid': 'e%d' % (i)}]) for i in reversed(range(n))])
+
+
+def test_rows_pages_computed_once (monkeypatch):
+    monkeypatch.setattr (result_cache, 'is_enabled', lambda endpoint: False)
+    pagination.clear_rows ()
+
+    calls = []
+
+    async def compute ():
+        calls.append (1)
+        return (rows (7))
+
+    async def walk ():
+        node_ids = []
+        cursor = None
+
+        while True:
+            G_json = await sga.rows_graph_endpoint ('path_regulatory', 'q', {'ids': ['P1']}, 'json', pagination.page_request (3, cursor), compute, 'test')
+            node_ids.append ([n['node_id'] for n in G_json['nodes']])
+            cursor = G_json['next_cursor']
+
+            if cursor is None:
+                return (node_ids)
+
+    assert asyncio.run (walk ()) == [['n0', 'n1', 'n2'], ['n3', 'n4', 'n5'], ['n6']]
+    assert len(calls) == 1
+
+    # Another query computes its own rows
+    asyncio.run (sga.rows_graph_endpoint ('path_regulatory', 'q', {'ids': ['P2']}, 'json', pagination.page_request (3), compute, 'test'))
+    assert len(calls) == 2
+
+
+def test_row_lists_lru (monkeypatch):
+    monkeypatch.setitem (pagination.pagination_par, 'page_rows_entries', 2)
+    pagination.clear_rows ()
+
+    pagination.store_rows ('a', rows (1))
+    pagination.store_rows ('b', rows (2))
+    pagination.cached_rows ('a')
+    pagination.store_rows ('c', rows (3))
+
+    assert pagination.cached_rows ('a') == (rows (1), ['k000'])
+    assert pagination.cached_rows ('b') is None
+    assert pagination.cached_rows ('c')[1] == ['k002', 'k001', 'k000']
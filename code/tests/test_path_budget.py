@@ -0,0 +1,270 @@
+# Tests of the budgets of the all-paths searches (see path_budget.py): the searches of the in-memory regulatory network,
+# the Cypher queries read from a stand-in Neo4j session, and the `truncated` / `path_stats` fields and headers.
+
+import asyncio
+import contextlib
+import math
+import types
+
+import neo4j
+import orjson
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+import neo4j_utils
+import path_budget
+import regulatory_network
+import request_errors
+import smartgraph_async as sga
+
+
+# A chain 0 -> 1 -> 2 -> 3 with a shortcut 0 -> 2: the trails from 0 are found depth-first
+RELATIONSHIPS = [(0, 1), (1, 2), (2, 3), (0, 2)]
+N_NODES = 4
+
+
+def make_network ():
+    nodes = [{'node_id': 'P%d' % (i), 'uniprot_id': 'P%d' % (i), 'uuid': 't%d' % (i), 'node_type': 'target'} for i in range(N_NODES)]
+    edges = [{'uuid': 'r%d' % (e), 'edge_label': 'l', 'edge_type': 'regulates', 'start_node': 'P%d' % (s), 'end_node': 'P%d' % (t)} for e, (s, t) in enumerate (RELATIONSHIPS)]
+
+    return (regulatory_network.RegulatoryNetwork (
+        nodes, ['4:x:%d' % (i) for i in range(N_NODES)],
+        edges, ['5:x:%d' % (e) for e in range(len(RELATIONSHIPS))],
+        [s for s, t in RELATIONSHIPS], [t for s, t in RELATIONSHIPS], [0.9] * len(RELATIONSHIPS)))
+
+
+class Clock:
+
+    # time.monotonic of path_budget.py, one second later at every call
+
+    def __init__ (self):
+        self.now = 0.0
+
+    def monotonic (self):
+        self.now += 1.0
+        return (self.now)
+
+
+def trails (budget):
+    state = path_budget.BudgetState (budget, 'regulatory_network')
+    paths = list (make_network ().trails (0, None, 'out', 4, 0.0, state))
+
+    return (paths, state)
+
+
+
+###
+### Budget section
+###
+
+def test_path_budget ():
+    assert path_budget.path_budget () is None
+
+    budget = path_budget.path_budget (max_paths = 5)
+    assert budget.options () == (5, path_budget.budget_par['max_expanded_edges'], path_budget.budget_par['timeout'])
+    assert budget.transaction_timeout () == path_budget.budget_par['timeout'] + path_budget.budget_par['timeout_grace']
+
+
+@pytest.mark.parametrize ('arguments', [
+    {'max_paths': 0},
+    {'max_expanded_edges': -1},
+    {'timeout': 0.0},
+    {'timeout': math.nan},
+    {'max_paths': 'x'}
+])
+def test_invalid_budget (arguments):
+    with pytest.raises (request_errors.InvalidRequest, match = 'have to be positive'):
+        path_budget.path_budget (**arguments)
+
+
+
+###
+### Regulatory network section
+###
+
+def test_trails_max_paths ():
+    # The search stops once it found max_paths + 1 paths, the extra path tells that the result is truncated
+    paths, state = trails (path_budget.PathBudget (max_paths = 2))
+
+    assert len(paths) == 3
+    assert state.truncated_by == 'max_paths'
+
+    # All 5 trails fit
+    paths, state = trails (path_budget.PathBudget (max_paths = 5))
+
+    assert len(paths) == 5
+    assert state.truncated_by is None
+    assert state.expanded_edges == 5
+
+
+def test_trails_max_expanded_edges ():
+    paths, state = trails (path_budget.PathBudget (max_expanded_edges = 3))
+
+    assert state.expanded_edges == 3
+    assert state.truncated_by == 'max_expanded_edges'
+    assert [edges for nodes, edges in paths] == [[0], [0, 1], [0, 1, 2]]
+
+
+def test_trails_timeout (monkeypatch):
+    # BudgetState reads the clock once when started (1 s, deadline 3.5 s), then once before every step of the search:
+    # at 2 s and 3 s a relationship is followed (a path each), at 4 s the deadline passed
+    monkeypatch.setattr (path_budget, 'time', types.SimpleNamespace (monotonic = Clock ().monotonic))
+
+    paths, state = trails (path_budget.PathBudget (timeout = 2.5))
+
+    assert state.truncated_by == 'timeout'
+    assert len(paths) == 2
+    assert state.stats ()['truncated_by'] == 'timeout'
+
+
+def test_bounded_rows ():
+    network = make_network ()
+    budget = path_budget.PathBudget (max_paths = 2)
+
+    async def compute (state):
+        return (network.rows (network.trails (0, None, 'out', 4, 0.0, state)))
+
+    G_json = asyncio.run (sga.bounded_graph_endpoint ('path_regulatory_test', 'q', {'ids': ['P0']}, 'json', None, budget, compute))
+
+    assert G_json['truncated'] is True
+    assert len(G_json['edges']) == 2
+    assert G_json['path_stats']['paths'] == 2
+    assert G_json['path_stats']['truncated_by'] == 'max_paths'
+    assert G_json['path_stats']['engine'] == 'regulatory_network'
+
+
+def test_bounded_page_is_invalid ():
+    with pytest.raises (request_errors.InvalidRequest, match = 'pagination'):
+        asyncio.run (sga.bounded_graph_endpoint ('path_regulatory', 'q', {}, 'json', object (), path_budget.PathBudget ()))
+
+
+
+###
+### Neo4j section
+###
+
+class Result:
+
+    def __init__ (self, records):
+        self.records = records
+
+    def __aiter__ (self):
+        return (self.iterate ())
+
+    async def iterate (self):
+        for record in self.records:
+            yield (record)
+
+
+
+class Session:
+
+    # Answers every query with the records, or raises error
+
+    def __init__ (self, records, error = None):
+        self.records = records
+        self.error = error
+        self.queries = []
+
+    async def run (self, query, parameters = None):
+        self.queries.append ((query, parameters))
+        return (Result (self.records))
+
+    async def execute_read (self, work):
+        if self.error is not None:
+            raise self.error
+
+        return (await work (self))
+
+
+
+@pytest.fixture
+def session (monkeypatch):
+    hydrator = _GraphHydrator ()
+    nodes = [hydrator.hydrate_node (i, ['Target'], {'uniprot_id': 'P%d' % (i), 'uuid': 't%d' % (i)}, '4:x:%d' % (i)) for i in range(10)]
+    session = Session ([{'n': n} for n in nodes])
+
+    @contextlib.asynccontextmanager
+    async def neo4j_async_session ():
+        yield (session)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_async_session', neo4j_async_session)
+
+    return (session)
+
+
+def test_bounded_query_max_paths (session):
+    budget = path_budget.PathBudget (max_paths = 3)
+    G_json = asyncio.run (sga.bounded_graph_endpoint ('path_regulatory', 'MATCH (n) RETURN n', {}, 'json', None, budget))
+
+    # The query is limited to max_paths + 1 rows, the records are read until the extra row
+    query, parameters = session.queries[0]
+    assert parameters['path_limit'] == 4
+
+    assert G_json['truncated'] is True
+    assert [n['node_id'] for n in G_json['nodes']] == ['P0', 'P1', 'P2']
+    assert G_json['path_stats']['truncated_by'] == 'max_paths'
+    assert G_json['path_stats']['engine'] == 'neo4j'
+    assert G_json['path_stats']['expanded_edges'] is None
+
+
+def test_bounded_query_not_truncated (session):
+    G_json = asyncio.run (sga.bounded_graph_endpoint ('path_regulatory', 'MATCH (n) RETURN n', {}, 'json', None, path_budget.PathBudget (max_paths = 10)))
+
+    assert G_json['truncated'] is False
+    assert G_json['path_stats']['paths'] == 10
+
+
+def test_bounded_query_transaction_timeout (session):
+    session.error = neo4j.exceptions.Neo4jError.hydrate (message = 'timed out', code = 'Neo.ClientError.Transaction.TransactionTimedOut')
+    G_json = asyncio.run (sga.bounded_graph_endpoint ('path_regulatory', 'MATCH (n) RETURN n', {}, 'json', None, path_budget.PathBudget (max_paths = 10)))
+
+    assert G_json['truncated'] is True
+    assert G_json['path_stats']['truncated_by'] == 'timeout'
+
+    # Other client errors are not budgets running out
+    session.error = neo4j.exceptions.Neo4jError.hydrate (message = 'syntax', code = 'Neo.ClientError.Statement.SyntaxError')
+
+    with pytest.raises (neo4j.exceptions.ClientError):
+        asyncio.run (sga.bounded_graph_endpoint ('path_regulatory', 'MATCH (n) RETURN n', {}, 'json', None, path_budget.PathBudget (max_paths = 10)))
+
+
+
+###
+### API section
+###
+
+@pytest.fixture
+def loaded_network (monkeypatch):
+    monkeypatch.setattr (regulatory_network, '_network', make_network ())
+
+
+def test_bounded_response (client, loaded_network):
+    response = client.get ('/api/path_regulatory/P0/P2,P3', params = {'shortest_paths': 'false', 'max_paths': 2})
+    G_json = response.json ()
+
+    assert response.status_code == 200
+    assert G_json['truncated'] is True
+    assert G_json['path_stats']['paths'] == 2
+    assert 'X-Truncated' not in response.headers
+
+
+def test_bounded_response_headers (client, loaded_network):
+    response = client.get ('/api/path_regulatory/P0/P2,P3', params = {'shortest_paths': 'false', 'max_paths': 10, 'format': 'graphml'})
+
+    assert response.status_code == 200
+    assert response.headers['X-Truncated'] == 'false'
+    assert orjson.loads (response.headers['X-Path-Stats'])['paths'] == 4
+    assert response.text.startswith ('<graphml')
+
+
+@pytest.mark.parametrize ('parameters', [
+    {'shortest_paths': 'false', 'max_paths': 0},
+    {'shortest_paths': 'false', 'timeout': -1},
+    {'shortest_paths': 'false', 'max_paths': 2, 'page_size': 10}
+])
+def test_invalid_budget_is_bad_request (client, loaded_network, parameters):
+    response = client.get ('/api/path_regulatory/P0/P3', params = parameters)
+
+    assert response.status_code == 400
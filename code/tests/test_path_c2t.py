@@ -0,0 +1,163 @@
+# Tests of the two-phase /path_c2t (see smartgraph_async.path_c2t_rows): the bioactivities of the compounds and the
+# target-target paths of the tested targets are read separately (here from fake records) and joined in Python.
+
+import asyncio
+
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+from neo4j.graph import Path
+
+import cypher_queries as cq
+import graph_builder
+import pagination
+import smartgraph as sg
+import smartgraph_async as sga
+
+
+class Graph:
+
+    # Targets T1, T2, T3 regulating the query target Q (and T1 -> T2), compounds C1 and C2 tested on T1 and T2; T3 has
+    # no bioactivity. C1 has two bioactivities on T1.
+
+    def __init__ (self):
+        hydrator = _GraphHydrator ()
+
+        self.nodes = {}
+        ids = {}
+
+        for i, uniprot_id in enumerate (['T1', 'T2', 'T3', 'Q'], 1):
+            self.nodes[uniprot_id] = hydrator.hydrate_node (i, ['Target'], {'uniprot_id': uniprot_id, 'uuid': 'u-' + uniprot_id}, '4:x:%d' % (i))
+            ids[uniprot_id] = i
+
+        for i, inchikey in enumerate (['C1-A-N', 'C2-B-N'], 10):
+            self.nodes[inchikey] = hydrator.hydrate_node (i, ['Compound'], {'hash': inchikey, 'nostereo_hash': inchikey[:2], 'uuid': 'u-' + inchikey}, '4:x:%d' % (i))
+            ids[inchikey] = i
+
+        def relationship (k, start, end, rel_type, properties):
+            properties = dict ({'uuid': 'r%d' % (k)}, **properties)
+
+            return (hydrator.hydrate_relationship (k, ids[start], ids[end], rel_type, properties, '5:x:%d' % (k), '4:x:%d' % (ids[start]), '4:x:%d' % (ids[end])))
+
+        self.bioactivities = {
+            'C1-T1-late': relationship (20, 'C1-A-N', 'T1', 'TESTED_ON', {'unique_label': 'a20', 'activity': 1.0}),
+            'C1-T1': relationship (11, 'C1-A-N', 'T1', 'TESTED_ON', {'unique_label': 'a11', 'activity': 5.0}),
+            'C2-T1': relationship (12, 'C2-B-N', 'T1', 'TESTED_ON', {'unique_label': 'a12', 'activity': 2.0}),
+            'C1-T2': relationship (13, 'C1-A-N', 'T2', 'TESTED_ON', {'unique_label': 'a13', 'activity': 3.0})
+        }
+
+        regulates = {}
+
+        for k, start, end in [(30, 'T1', 'Q'), (31, 'T2', 'Q'), (32, 'T3', 'Q'), (33, 'T1', 'T2')]:
+            regulates[(start, end)] = relationship (k, start, end, 'REGULATES', {'ppi_uid': 'l%d' % (k)})
+
+        self.paths = [
+            Path (self.nodes['T1'], regulates[('T1', 'Q')]),
+            Path (self.nodes['T2'], regulates[('T2', 'Q')]),
+            Path (self.nodes['T3'], regulates[('T3', 'Q')]),
+            Path (self.nodes['T1'], regulates[('T1', 'T2')], regulates[('T2', 'Q')])
+        ]
+
+
+    def bioactivity_records (self):
+        return ([{'c': r.start_node, 't': r.end_node, 'rel': r} for r in self.bioactivities.values()])
+
+
+    def path_records (self, source_element_ids = None):
+        return ([{'p1': p} for p in self.paths if source_element_ids is None or p.start_node.element_id in source_element_ids])
+
+
+    def expected_keys (self):
+        # The keys of the paged path_c2t query (PATH_CURSOR_KEY of p1 and p2), with p2 the path of the bioactivity
+        keys = []
+
+        for p1, bioactivity in [(0, 'C1-T1'), (0, 'C2-T1'), (1, 'C1-T2'), (3, 'C1-T1'), (3, 'C2-T1')]:
+            rel = self.bioactivities[bioactivity]
+            keys.append (graph_builder.path_key (self.paths[p1]) + '|' + graph_builder.path_key (Path (rel.start_node, rel)))
+
+        return (keys)
+
+
+
+@pytest.fixture
+def graph ():
+    return (Graph ())
+
+
+def test_bioactivity_legs (graph):
+    legs = graph_builder.bioactivity_legs (graph_builder.bioactivities (graph.bioactivity_records ()))
+
+    # One bioactivity per compound and target, the first by element ID of the relationship
+    assert sorted (legs.keys()) == [graph.nodes['T1'].element_id, graph.nodes['T2'].element_id]
+    assert [(compound['node_id'], bioactivity['edge_label']) for key, compound, bioactivity in legs[graph.nodes['T1'].element_id]] == [('C1-A-N', 'a11'), ('C2-B-N', 'a12')]
+    assert [key for key, compound, bioactivity in legs[graph.nodes['T2'].element_id]] == ['4:x:10,5:x:13']
+
+
+def test_c2t_rows (graph):
+    legs = graph_builder.bioactivity_legs (graph_builder.bioactivities (graph.bioactivity_records ()))
+
+    # The path from T3 (no bioactivity) is skipped
+    rows = graph_builder.c2t_rows (legs, graph.path_records ())
+
+    assert [key for key, nodes, edges in rows] == graph.expected_keys ()
+    assert [[n['node_id'] for n in nodes] for key, nodes, edges in rows][3] == ['T1', 'T2', 'Q', 'C1-A-N']
+    assert [e['edge_label'] for e in rows[3][2]] == ['l33', 'l31', 'a11']
+
+
+def test_cursor_keys_of_the_paged_query ():
+    # The rows of the paged path_c2t query are ordered by the key of p1, '|' and the key of p2
+    query, parameters = cq.path_c2t (['C1-A-N'], ['Q'])
+
+    assert cq.CURSOR_KEYS['p1'] + " + '|' + " + cq.CURSOR_KEYS['p2'] + " AS sg_cursor" in cq.paged (query, parameters, None, 10)[0]
+
+
+
+###
+### Endpoint section
+###
+
+@pytest.fixture
+def records (graph, monkeypatch):
+    queries = []
+
+    async def run_records_query (query, parameters = None):
+        queries.append (parameters)
+
+        if 'source_element_ids' in parameters:
+            return (graph.path_records (parameters['source_element_ids']))
+
+        return (graph.bioactivity_records ())
+
+    monkeypatch.setattr (sga, 'run_records_query', run_records_query)
+    pagination.clear_rows ()
+
+    return (queries)
+
+
+def test_path_c2t_two_phase (graph, records):
+    G_json = asyncio.run (sga.path_c2t ('C1-A-N,C2-B-N', 'Q', shortest_paths = False))
+
+    # The paths are read from the tested targets only
+    assert sorted (records[1]['source_element_ids']) == [graph.nodes['T1'].element_id, graph.nodes['T2'].element_id]
+
+    assert sorted ([n['node_id'] for n in G_json['nodes']]) == ['C1-A-N', 'C2-B-N', 'Q', 'T1', 'T2']
+    assert sorted ([e['edge_label'] for e in G_json['edges']]) == ['a11', 'a12', 'a13', 'l30', 'l31', 'l33']
+
+
+def test_path_c2t_two_phase_pages (graph, records):
+    edges = []
+    page = pagination.page_request (2)
+
+    while True:
+        G_json = asyncio.run (sga.path_c2t ('C1-A-N,C2-B-N', 'Q', shortest_paths = False, page = page))
+        edges.extend ([e['edge_label'] for e in G_json['edges']])
+
+        if G_json['next_cursor'] is None:
+            break
+
+        page = pagination.page_request (2, G_json['next_cursor'])
+        after, page_size = pagination.decode_cursor (G_json['next_cursor'], pagination.fingerprint ('path_c2t', *sg.path_c2t_query ('C1-A-N,C2-B-N', 'Q', shortest_paths = False), 'two_phase'))
+
+        assert after in graph.expected_keys ()
+
+    assert sorted (set (edges)) == ['a11', 'a12', 'a13', 'l30', 'l31', 'l33']
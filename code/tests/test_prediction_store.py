@@ -0,0 +1,94 @@
+# Tests of the refresh of the prediction table (see prediction_store.py), with the Neo4j queries replaced by a fake
+# session
+
+import contextlib
+
+import pytest
+
+import cypher_queries as cq
+import neo4j_utils
+import prediction_store
+
+
+class FakeSession:
+
+    def __init__ (self, fingerprints):
+        self.fingerprints = fingerprints
+
+    def run (self, query, **parameters):
+        assert query == cq.PREDICTION_TARGETS
+
+        return ([{'uniprot_id': t, 'potent_patterns': f[0], 'tested_compounds': f[1]} for t, f in self.fingerprints.items()])
+
+
+@pytest.fixture
+def graph (monkeypatch):
+    # uniprot_id -> fingerprint of the targets with potent patterns
+    fingerprints = {}
+    computed = []
+
+    @contextlib.contextmanager
+    def neo4j_session ():
+        yield (FakeSession (fingerprints))
+
+    def compute_target (session, uniprot_id):
+        computed.append (uniprot_id)
+        rows = [('S1', 'H1', 0.5, 'r1_l1', 'r2_l2')]
+        nodes = {uniprot_id: {'node_id': uniprot_id}, 'S1': {'node_id': 'S1'}, 'H1': {'node_id': 'H1'}}
+        edges = {'r1_l1': {'uuid': 'r1_l1'}, 'r2_l2': {'uuid': 'r2_l2'}}
+
+        return (rows, nodes, edges)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_session', neo4j_session)
+    monkeypatch.setattr (prediction_store, 'compute_target', compute_target)
+
+    return (fingerprints, computed)
+
+
+def test_stale_refresh (tmp_path, graph):
+    fingerprints, computed = graph
+    store = prediction_store.PredictionStore (str(tmp_path / 'predictions.sqlite'))
+
+    fingerprints.update ({'P1': (1, 2), 'P2': (3, 4)})
+    assert sorted (prediction_store.refresh ('stale', store = store)) == ['P1', 'P2']
+    assert store.size ('P1') == 1
+    assert [node['node_id'] for node in store.page ('P1')['nodes']] == ['S1', 'P1', 'H1']
+
+    # Nothing changed
+    assert prediction_store.refresh ('stale', store = store) == []
+
+    fingerprints['P1'] = (2, 2)
+    assert prediction_store.refresh ('stale', store = store) == ['P1']
+
+
+def test_target_without_potent_patterns_is_removed (tmp_path, graph):
+    fingerprints, computed = graph
+    store = prediction_store.PredictionStore (str(tmp_path / 'predictions.sqlite'))
+
+    fingerprints.update ({'P1': (1, 2), 'P2': (3, 4)})
+    prediction_store.refresh ('all', store = store)
+    del computed[:]
+
+    del fingerprints['P2']
+    assert prediction_store.refresh ('stale', store = store) == ['P2']
+
+    # P2 is removed without being computed, and is not seen as stale by the next refreshes
+    assert computed == []
+    assert store.size ('P2') is None
+    assert store.page ('P2') is None
+    assert 'P2' not in store.fingerprints ()
+    assert prediction_store.refresh ('stale', store = store) == []
+
+    assert store.connection ().execute ("SELECT COUNT(*) FROM predictions WHERE uniprot_id = 'P2'").fetchone ()[0] == 0
+
+
+def test_refresh_given_targets (tmp_path, graph):
+    fingerprints, computed = graph
+    store = prediction_store.PredictionStore (str(tmp_path / 'predictions.sqlite'))
+
+    fingerprints.update ({'P1': (1, 2)})
+    assert prediction_store.refresh ('targets', ['P1', 'P3'], store = store) == ['P1', 'P3']
+
+    assert computed == ['P1']
+    assert store.size ('P1') == 1
+    assert store.size ('P3') is None
@@ -0,0 +1,609 @@
+# Tests of the path engine of the in-memory regulatory network (see regulatory_network.py).
+#
+# The searches are run on a small hand-built network and compared with a brute-force enumeration of the paths without
+# repeated relationships (the relationship uniqueness of Cypher), from which the shortest paths follow.
+
+import math
+import random
+
+import pytest
+
+import regulatory_network
+
+
+# (start, end, max_confidence_value) of the relationships, NaN: no confidence value
+RELATIONSHIPS = [
+    (0, 1, 0.9),
+    (1, 2, 0.6),
+    (2, 3, 0.95),
+    (0, 2, 0.3),
+    (3, 1, 0.8),
+    (4, 4, 0.7),
+    (4, 0, math.nan),
+    (1, 0, 0.5),
+    (5, 6, 0.9),
+    (2, 3, 0.4),
+    (3, 3, 0.9)
+]
+
+N_NODES = 8
+
+
+def make_network (relationships = RELATIONSHIPS, n_nodes = N_NODES):
+    nodes = [{'node_id': 'P%d' % (i), 'uuid': 't%d' % (i)} for i in range(n_nodes)]
+    edges = [{'uuid': 'r%d' % (e), 'start_node': 'P%d' % (s), 'end_node': 'P%d' % (t)} for e, (s, t, c) in enumerate (relationships)]
+
+    return (regulatory_network.RegulatoryNetwork (
+        nodes, ['4:x:%d' % (i) for i in range(n_nodes)],
+        edges, ['5:x:%d' % (e) for e in range(len(relationships))],
+        [s for s, t, c in relationships], [t for s, t, c in relationships], [c for s, t, c in relationships]))
+
+
+@pytest.fixture
+def network ():
+    return (make_network ())
+
+
+def steps (network, i, direction, cutoff):
+    # (relationship, neighbour) pairs of node i, an undirected search follows a self-loop once
+    pairs = []
+
+    for e in range(len(network.starts)):
+        if cutoff > 0.0 and not network.confidence[e] >= cutoff:
+            continue
+
+        if direction in ['out', 'both'] and network.starts[e] == i:
+            pairs.append ((e, network.ends[e]))
+
+        if direction in ['in', 'both'] and network.ends[e] == i and not (direction == 'both' and network.starts[e] == i):
+            pairs.append ((e, network.starts[e]))
+
+    return (pairs)
+
+
+def brute_trails (network, source, direction, max_length, cutoff = 0.0):
+    # Every path of 1 .. max_length relationships from source without repeated relationships: (nodes, relationships)
+    trails = []
+
+    def extend (nodes, edges):
+        if len(edges) == max_length:
+            return
+
+        for e, j in steps (network, nodes[-1], direction, cutoff):
+            if e in edges:
+                continue
+
+            trails.append ((tuple (nodes + [j]), tuple (edges + [e])))
+            extend (nodes + [j], edges + [e])
+
+    extend ([source], [])
+
+    return (trails)
+
+
+def brute_distances (network, source, direction, max_length, cutoff = 0.0):
+    distances = {}
+
+    for nodes, edges in brute_trails (network, source, direction, max_length, cutoff):
+        distances[nodes[-1]] = min (distances.get (nodes[-1], len(edges)), len(edges))
+
+    return (distances)
+
+
+def check_path (network, path, direction):
+    # The relationships of a path connect its consecutive nodes in the direction of the search
+    nodes, edges = path
+    assert len(nodes) == len(edges) + 1
+
+    for k, e in enumerate (edges):
+        forward = (network.starts[e], network.ends[e]) == (nodes[k], nodes[k + 1])
+        backward = (network.ends[e], network.starts[e]) == (nodes[k], nodes[k + 1])
+
+        assert (direction == 'out' and forward) or (direction == 'in' and backward) or (direction == 'both' and (forward or backward))
+
+
+def as_set (paths):
+    return (set ([(tuple (nodes), tuple (edges)) for nodes, edges in paths]))
+
+
+
+###
+### CSR section
+###
+
+def test_build_csr ():
+    offsets, edges = regulatory_network.build_csr (4, [2, 0, 2, 3, 0])
+
+    assert list (offsets) == [0, 2, 2, 4, 5]
+    assert list (edges) == [1, 4, 0, 2, 3]
+
+
+def test_network_csr (network):
+    for direction, ends in [('out', network.starts), ('in', network.ends)]:
+        offsets, edges, neighbours = network.csr[direction]
+
+        for i in range(N_NODES):
+            assert list (edges[offsets[i]:offsets[i + 1]]) == [e for e in range(len(ends)) if ends[e] == i]
+
+
+def test_filter_csr (network):
+    offsets, edges, neighbours = network.csr['out']
+    keep = [value >= 0.7 for value in network.confidence]
+
+    filtered_offsets, filtered_edges = regulatory_network.filter_csr (offsets, edges, keep)
+
+    for i in range(N_NODES):
+        assert list (filtered_edges[filtered_offsets[i]:filtered_offsets[i + 1]]) == [e for e in edges[offsets[i]:offsets[i + 1]] if keep[e]]
+
+
+
+###
+### Shortest paths section
+###
+
+@pytest.mark.parametrize ('direction', ['out', 'in', 'both'])
+@pytest.mark.parametrize ('max_length', [1, 2, 3, 5])
+@pytest.mark.parametrize ('cutoff', [0.0, 0.55])
+def test_bfs_distances (network, direction, max_length, cutoff):
+    for source in range(N_NODES):
+        parents = network.bfs (source, direction, max_length, cutoff)
+        distances = brute_distances (network, source, direction, max_length, cutoff)
+
+        assert set (parents.keys()) - {source} == set (distances.keys()) - {source}
+
+        for target in parents.keys():
+            if target == source:
+                continue
+
+            path = regulatory_network.tree_path (parents, target)
+            check_path (network, path, direction)
+
+            assert path[0][0] == source
+            assert len(path[1]) == distances[target]
+
+
+def test_bfs_stops_at_targets (network):
+    # Node 1 is reached on the first level, node 3 (two levels away) is not searched for
+    parents = network.bfs (0, 'out', 4, targets = {1})
+
+    assert 1 in parents
+    assert 3 not in parents
+
+
+@pytest.mark.parametrize ('direction', ['out', 'in', 'both'])
+@pytest.mark.parametrize ('max_length', [1, 2, 3, 5])
+@pytest.mark.parametrize ('cutoff', [0.0, 0.55])
+def test_bidirectional_shortest_path (network, direction, max_length, cutoff):
+    for source in range(N_NODES):
+        distances = brute_distances (network, source, direction, max_length, cutoff)
+
+        for target in range(N_NODES):
+            path = network.shortest_path (source, target, direction, max_length, cutoff)
+
+            if source == target or target not in distances:
+                assert path is None
+                continue
+
+            check_path (network, path, direction)
+
+            assert path[0][0] == source
+            assert path[0][-1] == target
+            assert len(path[1]) == distances[target]
+
+
+def test_shortest_path_directions (network):
+    # 0 -> 2 -> 3 directed, 3 <- 2 <- 0 against the direction of the relationships
+    assert len(network.shortest_path (0, 3, 'out', 4)[1]) == 2
+    assert network.shortest_path (3, 0, 'in', 4)[0] == [3, 2, 0]
+    assert network.shortest_path (6, 5, 'out', 4) is None
+    assert network.shortest_path (6, 5, 'both', 4) == ([6, 5], [8])
+
+
+
+###
+### All paths section
+###
+
+@pytest.mark.parametrize ('direction', ['out', 'in', 'both'])
+@pytest.mark.parametrize ('max_length', [1, 2, 3, 4])
+def test_trails (network, direction, max_length):
+    for source in range(N_NODES):
+        trails = list (network.trails (source, None, direction, max_length))
+
+        for nodes, edges in trails:
+            check_path (network, (nodes, edges), direction)
+
+            # Relationships are not repeated, nodes may be
+            assert 1 <= len(edges) <= max_length
+            assert len(set (edges)) == len(edges)
+
+        assert len(as_set (trails)) == len(trails)
+        assert as_set (trails) == set (brute_trails (network, source, direction, max_length))
+
+
+def test_trails_repeat_nodes (network):
+    # 0 -> 1 -> 0 uses two distinct relationships, 0 -> 1 -> 2 -> 3 -> 1 revisits node 1
+    trails = as_set (network.trails (0, None, 'out', 4))
+
+    assert ((0, 1, 0), (0, 7)) in trails
+    assert ((0, 1, 2, 3, 1), (0, 1, 2, 4)) in trails
+
+
+def test_trails_targets (network):
+    trails = list (network.trails (0, {3}, 'out', 3))
+
+    assert all ([nodes[-1] == 3 for nodes, edges in trails])
+    assert as_set (trails) == set ([trail for trail in brute_trails (network, 0, 'out', 3) if trail[0][-1] == 3])
+
+
+def test_self_loops (network):
+    # A self-loop is a path of one relationship, followed once in an undirected search
+    for direction in ['out', 'in', 'both']:
+        trails = list (network.trails (4, {4}, direction, 1))
+        assert trails == [([4, 4], [5])]
+
+    # Shortest paths are between distinct nodes, the loop is not needed to reach them
+    parents = network.bfs (3, 'both', 2)
+    assert 10 not in [parent[1] for parent in parents.values() if parent is not None]
+
+    assert ((3, 3, 2), (10, 2)) in as_set (network.trails (3, {2}, 'both', 2))
+
+
+
+###
+### Multi-source search section
+###
+
+def random_network (seed, n_nodes = 40, n_relationships = 120):
+    rng = random.Random (seed)
+    relationships = []
+
+    for e in range(n_relationships):
+        start = rng.randrange (n_nodes)
+        end = rng.randrange (n_nodes) if rng.random () < 0.95 else start
+        relationships.append ((start, end, rng.choice ([0.2, 0.6, 0.95, math.nan])))
+
+    return (make_network (relationships, n_nodes))
+
+
+def pairs (paths):
+    # (start, end, length) of the paths: a pair has one shortest path, possibly another one of the same length
+    return (sorted ([(nodes[0], nodes[-1], len(edges)) for nodes, edges in paths]))
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2, 3])
+@pytest.mark.parametrize ('khop', [False, True])
+def test_multi_source_equivalence (seed, khop):
+    network = make_network () if seed is None else random_network (seed)
+    sources = list (range(len(network.nodes)))
+    targets = sources[::2]
+
+    if khop:
+        network.build_khop_index (4)
+
+    for direction in ['out', 'in', 'both']:
+        for max_length in [1, 2, 4]:
+            for cutoff in [0.0, 0.55]:
+                per_pair = network.paths (sources, targets, direction, True, max_length, cutoff, False)
+                multi_source = network.paths (sources, targets, direction, True, max_length, cutoff, True)
+                auto = network.paths (sources, targets, direction, True, max_length, cutoff)
+
+                for path in multi_source:
+                    check_path (network, path, direction)
+
+                assert pairs (multi_source) == pairs (per_pair)
+                assert pairs (auto) == pairs (per_pair)
+
+
+def test_single_search (network):
+    network.multi_source_min_targets = 3
+
+    assert not network.single_search (None, 2)
+    assert network.single_search (None, 3)
+    assert network.single_search (True, 1)
+    assert not network.single_search (False, 10)
+
+
+
+###
+### k-hop index section
+###
+
+@pytest.mark.parametrize ('seed', [None, 1, 2])
+def test_khop_index (seed):
+    network = make_network () if seed is None else random_network (seed)
+    network.build_khop_index (3)
+
+    assert network.khop.covers (3)
+    assert not network.khop.covers (4)
+
+    for direction in ['out', 'in', 'both']:
+        for source in range(len(network.nodes)):
+            for k in [1, 2, 3]:
+                # The index also holds the source if a walk returns to it, the paths are between distinct nodes
+                within = set (regulatory_network.bitset_members (network.khop.within (source, k, direction))) - {source}
+
+                assert within == set (brute_distances (network, source, direction, k).keys()) - {source}
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2, 3])
+@pytest.mark.parametrize ('cutoff', [0.0, 0.55, 0.9])
+def test_khop_pruning (seed, cutoff):
+    # The pruned searches return exactly the paths of the unpruned ones, the index ignores the confidence cutoff
+    network = make_network () if seed is None else random_network (seed)
+    sources = list (range(len(network.nodes)))
+    targets = sources[1::3]
+
+    for direction in ['out', 'in', 'both']:
+        for max_length in [1, 2, 3]:
+            network.khop = None
+            expected = {multi_source: network.paths (sources, targets, direction, True, max_length, cutoff, multi_source) for multi_source in [False, True]}
+            expected_trails = network.paths (sources, targets, direction, False, max_length, cutoff)
+
+            network.build_khop_index (3)
+
+            for multi_source in [False, True]:
+                assert network.paths (sources, targets, direction, True, max_length, cutoff, multi_source) == expected[multi_source]
+
+            assert network.paths (sources, targets, direction, False, max_length, cutoff) == expected_trails
+
+
+def test_khop_pruning_beyond_depth ():
+    # Searches longer than the index are not pruned
+    network = random_network (4)
+    unpruned = random_network (4)
+    network.build_khop_index (2)
+    sources = list (range(len(network.nodes)))
+
+    assert network.reachable (0, 'out', 3) is None
+    assert network.paths (sources, sources[::4], 'out', False, 3) == unpruned.paths (sources, sources[::4], 'out', False, 3)
+
+
+
+###
+### Confidence views section
+###
+
+def confident (network, paths, cutoff):
+    # Post-filter of the Cypher queries: every relationship of the path has a confidence >= cutoff
+    return ([(nodes, edges) for nodes, edges in paths if all ([network.confidence[e] >= cutoff for e in edges])])
+
+
+def test_sort_csr (network):
+    for direction in ['out', 'in']:
+        offsets, edges, neighbours = network.csr[direction]
+        sorted_offsets, sorted_edges, sorted_confidence = regulatory_network.sort_csr (offsets, edges, network.confidence)
+
+        for i in range(N_NODES):
+            node_edges = list (sorted_edges[sorted_offsets[i]:sorted_offsets[i + 1]])
+            node_confidence = list (sorted_confidence[sorted_offsets[i]:sorted_offsets[i + 1]])
+
+            # The same relationships, by decreasing confidence, without confidence last
+            assert sorted (node_edges) == sorted (edges[offsets[i]:offsets[i + 1]])
+            assert node_confidence == sorted (node_confidence, reverse = True)
+            assert node_confidence == [network.confidence[e] if not math.isnan (network.confidence[e]) else -math.inf for e in node_edges]
+
+
+def test_confidence_views (network):
+    network.build_confidence_views ([0.0, 0.55, 0.9])
+
+    # No view without a cutoff
+    assert sorted (network.bands.keys()) == [0.55, 0.9]
+    assert network.view ('out', 0.55)[2] is None
+    assert network.view ('out', 0.7)[2] is not None
+
+    for cutoff in [0.55, 0.9]:
+        for direction in ['out', 'in']:
+            offsets, edges = network.bands[cutoff][direction]
+
+            assert sorted (edges) == sorted ([e for e in range(len(network.starts)) if network.confidence[e] >= cutoff])
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2, 3])
+@pytest.mark.parametrize ('cutoff', [0.55, 0.9])
+@pytest.mark.parametrize ('khop', [False, True])
+def test_confidence_views_paths (seed, cutoff, khop):
+    # The paths of the band view and of the sorted relationships are the ones of an unfiltered search, post-filtered
+    network = make_network () if seed is None else random_network (seed)
+    sources = list (range(len(network.nodes)))
+    targets = sources[::2]
+
+    if khop:
+        network.build_khop_index (3)
+
+    for direction in ['out', 'in', 'both']:
+        for max_length in [1, 2, 3]:
+            found = {}
+
+            for mode in ['sorted', 'band']:
+                network.build_confidence_views ([cutoff] if mode == 'band' else [])
+
+                found[mode] = {
+                    'trails': network.paths (sources, targets, direction, False, max_length, cutoff),
+                    'open_trails': network.paths (sources, None, direction, False, max_length, cutoff),
+                    'shortest': network.paths (sources, targets, direction, True, max_length, cutoff, False),
+                    'open_shortest': network.paths (sources, None, direction, True, max_length, cutoff)
+                }
+
+            expected_trails = confident (network, network.paths (sources, targets, direction, False, max_length, 0.0), cutoff)
+            expected_open_trails = confident (network, network.paths (sources, None, direction, False, max_length, 0.0), cutoff)
+
+            for mode in ['sorted', 'band']:
+                assert as_set (found[mode]['trails']) == as_set (expected_trails)
+                assert as_set (found[mode]['open_trails']) == as_set (expected_open_trails)
+
+                # Shortest paths of the filtered network: the shortest of the post-filtered paths, as the predicate of
+                # the Cypher shortestPath
+                shortest = {}
+
+                for nodes, edges in expected_open_trails:
+                    if nodes[-1] != nodes[0]:
+                        shortest[(nodes[0], nodes[-1])] = min (shortest.get ((nodes[0], nodes[-1]), len(edges)), len(edges))
+
+                assert pairs (found[mode]['open_shortest']) == sorted ([(s, t, length) for (s, t), length in shortest.items()])
+                assert pairs (found[mode]['shortest']) == sorted ([(s, t, length) for (s, t), length in shortest.items() if t in targets])
+
+
+
+###
+### Weighted paths section
+###
+
+def brute_simple_paths (network, source, target, direction, max_length, cutoff = 0.0, banned_nodes = (), banned_edges = ()):
+    # Every path of 1 .. max_length followed relationships from source to target without repeated nodes, cheapest
+    # (then shortest) first: (cost, nodes, relationships)
+    paths = []
+
+    def extend (nodes, edges, cost):
+        for e, j in steps (network, nodes[-1], direction, cutoff):
+            if j in nodes or j in banned_nodes or e in banned_edges or network.cost[e] == math.inf:
+                continue
+
+            if j == target:
+                paths.append ((cost + network.cost[e], nodes + [j], edges + [e]))
+            elif len(edges) + 1 < max_length:
+                extend (nodes + [j], edges + [e], cost + network.cost[e])
+
+    if source != target:
+        extend ([source], [], 0.0)
+
+    paths.sort (key = lambda path: (path[0], len(path[2])))
+
+    return (paths)
+
+
+def path_cost (network, edges):
+    return (sum ([network.cost[e] for e in edges]))
+
+
+def check_weighted_path (network, path, source, target, direction, max_length):
+    cost, nodes, edges = path
+    check_path (network, (nodes, edges), direction)
+
+    assert nodes[0] == source and nodes[-1] == target
+    assert len(set (nodes)) == len(nodes)
+    assert 1 <= len(edges) <= max_length
+    assert cost == pytest.approx (path_cost (network, edges))
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2])
+@pytest.mark.parametrize ('direction', ['out', 'both'])
+@pytest.mark.parametrize ('max_length', [1, 2, 4])
+def test_cheapest_paths (seed, direction, max_length):
+    network = make_network () if seed is None else random_network (seed, 12, 40)
+    nodes = list (range(len(network.nodes)))
+
+    for cutoff in [0.0, 0.55]:
+        for source in nodes:
+            found = network.cheapest_paths (source, nodes, direction, max_length, cutoff)
+
+            # The source is not a target
+            assert source not in found
+
+            for target in nodes:
+                expected = brute_simple_paths (network, source, target, direction, max_length, cutoff)
+
+                if len(expected) == 0:
+                    assert target not in found
+                    continue
+
+                check_weighted_path (network, found[target], source, target, direction, max_length)
+                assert found[target][0] == pytest.approx (expected[0][0])
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2])
+@pytest.mark.parametrize ('direction', ['out', 'both'])
+def test_cheapest_paths_banned (seed, direction):
+    network = make_network () if seed is None else random_network (seed, 12, 40)
+    nodes = list (range(len(network.nodes)))
+
+    for source in nodes:
+        banned_nodes = frozenset (nodes[source % 3::3]) - {source}
+        banned_edges = frozenset (range(source % 2, len(network.starts), 4))
+
+        found = network.cheapest_paths (source, nodes, direction, 3, 0.0, banned_nodes, banned_edges)
+
+        for target in nodes:
+            expected = brute_simple_paths (network, source, target, direction, 3, 0.0, banned_nodes, banned_edges)
+
+            if len(expected) == 0:
+                assert target not in found
+                continue
+
+            cost, path_nodes, edges = found[target]
+            check_weighted_path (network, found[target], source, target, direction, 3)
+
+            assert not set (path_nodes) & banned_nodes
+            assert not set (edges) & banned_edges
+            assert cost == pytest.approx (expected[0][0])
+
+
+@pytest.mark.parametrize ('seed', [None, 1, 2, 3])
+@pytest.mark.parametrize ('direction', ['out', 'both'])
+@pytest.mark.parametrize ('max_length', [2, 3, 4])
+def test_top_paths (seed, direction, max_length):
+    # The top k paths are the k cheapest simple paths of the brute-force enumeration, in order, without duplicates
+    network = make_network () if seed is None else random_network (seed, 10, 30)
+    nodes = list (range(len(network.nodes)))
+    top_k = 6
+
+    for source in nodes:
+        for target in nodes:
+            top = network.top_paths (source, target, direction, max_length, top_k)
+            expected = brute_simple_paths (network, source, target, direction, max_length)
+
+            assert len(top) == min (top_k, len(expected))
+            assert len(set ([tuple (edges) for cost, path_nodes, edges in top])) == len(top)
+            assert [cost for cost, path_nodes, edges in top] == pytest.approx ([cost for cost, path_nodes, edges in expected[:len(top)]])
+
+            for path in top:
+                check_weighted_path (network, path, source, target, direction, max_length)
+
+
+def test_top_paths_ties ():
+    # Paths of the same cost (confidence 1: cost 0) are ordered by their number of relationships
+    network = make_network ([(0, 1, 1.0), (0, 2, 1.0), (2, 1, 1.0), (2, 3, 1.0), (3, 1, 1.0), (0, 1, 0.5)], 4)
+
+    top = network.top_paths (0, 1, 'out', 3, 10)
+
+    assert [(cost, path_nodes) for cost, path_nodes, edges in top[:3]] == [(0.0, [0, 1]), (0.0, [0, 2, 1]), (0.0, [0, 2, 3, 1])]
+    assert top[3][2] == [5]
+    assert len(top) == 4
+
+    # A path beyond max_length is not returned
+    assert [path_nodes for cost, path_nodes, edges in network.top_paths (0, 1, 'out', 2, 10)] == [[0, 1], [0, 2, 1], [0, 1]]
+
+
+def test_weighted_paths_skip_unconfident (network):
+    # 4 -> 0 has no confidence value and is not followed
+    assert network.top_paths (4, 0, 'out', 4, 3) == []
+    assert network.cheapest_paths (4, [0, 1], 'out', 4) == {}
+
+
+def test_check_weighted (monkeypatch):
+    import request_errors
+    import smartgraph_async
+
+    assert smartgraph_async.check_weighted (False, 50) == (False, 1)
+
+    monkeypatch.setattr (regulatory_network, 'is_enabled', lambda: False)
+
+    with pytest.raises (request_errors.InvalidRequest, match = 'in-memory regulatory network'):
+        smartgraph_async.check_weighted (True, 1)
+
+    monkeypatch.setattr (regulatory_network, 'is_enabled', lambda: True)
+
+    assert smartgraph_async.check_weighted (True, 3) == (True, 3)
+
+    for top_k in [0, regulatory_network.MAX_TOP_K + 1, 'x']:
+        with pytest.raises (request_errors.InvalidRequest):
+            smartgraph_async.check_weighted (True, top_k)
+
+
+def test_weighted_request_is_bad_request (client, monkeypatch):
+    # The validation errors of the weighted paths are answered with HTTP 400
+    monkeypatch.setattr (regulatory_network, 'is_enabled', lambda: False)
+    response = client.get ('/api/path_regulatory/P1/P2', params = {'weighted': 'true'})
+
+    assert response.status_code == 400
+    assert 'in-memory regulatory network' in response.json ()['detail']
@@ -0,0 +1,36 @@
+# Tests of the answers to invalid request arguments (see request_errors.py): HTTP 400 with the message of the error.
+
+import pytest
+
+import cypher_queries as cq
+import regulatory_network
+import request_errors
+
+
+def test_check_max_length ():
+    assert cq.check_max_length ('4') == 4
+
+    for max_length in [0, -1, cq.MAX_PATH_LENGTH + 1, 'x', None]:
+        with pytest.raises (request_errors.InvalidRequest, match = '`max_length`'):
+            cq.check_max_length (max_length)
+
+
+def test_check_top_k ():
+    assert regulatory_network.check_top_k (3) == 3
+
+    for top_k in [0, regulatory_network.MAX_TOP_K + 1, 'x', None]:
+        with pytest.raises (request_errors.InvalidRequest, match = '`top_k`'):
+            regulatory_network.check_top_k (top_k)
+
+
+@pytest.mark.parametrize ('url, parameters', [
+    ('/api/path_regulatory/P1/P2', {'max_length': 0}),
+    ('/api/path_c2t/K1/P2', {'max_length': cq.MAX_PATH_LENGTH + 1}),
+    ('/api/subgraph_target_induced/P1', {'max_length': 0}),
+    ('/api/subgraph_compound_induced/K1', {'max_length': 0, 'shortest_paths': 'false'})
+])
+def test_invalid_max_length_is_bad_request (client, url, parameters):
+    response = client.get (url, params = parameters)
+
+    assert response.status_code == 400
+    assert '`max_length`' in response.json ()['detail']
@@ -0,0 +1,72 @@
+# Tests of the response compression middleware (see response_encoding.py).
+
+import asyncio
+import gzip
+import threading
+
+import pytest
+
+import response_encoding
+
+
+def run_app (body_chunks, compression_par):
+    # Runs a JSON response made of `body_chunks` through CompressingSender, returns the messages sent downstream and
+    # the threads the chunks were compressed in.
+    messages = []
+    threads = []
+
+    async def downstream (message):
+        messages.append (message)
+
+    compress = response_encoding.compress
+
+    def recording_compress (*args):
+        threads.append (threading.get_ident ())
+        return (compress (*args))
+
+    async def main ():
+        sender = response_encoding.CompressingSender (downstream, 'gzip', compression_par)
+        await sender.send ({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+
+        for i, chunk in enumerate(body_chunks):
+            await sender.send ({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(body_chunks) - 1})
+
+    response_encoding.compress = recording_compress
+
+    try:
+        asyncio.run (main ())
+    finally:
+        response_encoding.compress = compress
+
+    return (messages, threads)
+
+
+@pytest.mark.parametrize ('size, thread_min_size', [(2000, 10 ** 6), (300000, 1024)])
+def test_compressed_body (size, thread_min_size):
+    body = b'{"nodes": [%s]}' % (b','.join([b'1'] * size))
+    compression_par = dict (response_encoding.read_compression_config (), thread_min_size = thread_min_size)
+
+    messages, threads = run_app ([body], compression_par)
+
+    assert (b'content-encoding', b'gzip') in messages[0]['headers']
+    assert gzip.decompress (messages[1]['body']) == body
+
+    # Bodies above the threshold are compressed outside of the event loop thread
+    assert (threads[0] != threading.get_ident ()) == (len(body) >= thread_min_size)
+
+
+def test_compressed_stream ():
+    chunks = [b'{"a": %d}\n' % (i) * 1000 for i in range(5)]
+    compression_par = dict (response_encoding.read_compression_config (), thread_min_size = 4096)
+
+    messages, threads = run_app (chunks, compression_par)
+
+    assert gzip.decompress (b''.join([m['body'] for m in messages[1:]])) == b''.join(chunks)
+    assert messages[-1]['more_body'] is False
+
+
+def test_small_body_is_not_compressed ():
+    messages, threads = run_app ([b'{}'], response_encoding.read_compression_config ())
+
+    assert all ([k != b'content-encoding' for k, v in messages[0]['headers']])
+    assert messages[1]['body'] == b'{}'
@@ -0,0 +1,396 @@
+# Tests of the result cache backends (see result_cache.py).
+#
+# The Redis backend is run against a stand-in server speaking the subset of RESP2 the backend uses (AUTH, SELECT, GET,
+# SET PX, SCAN, DEL), so that the framing of the hand-written client is checked without a Redis server.
+
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+import types
+
+import pytest
+
+import result_cache
+
+
+class Clock:
+
+    def __init__ (self):
+        self.now = 1000.0
+
+    def monotonic (self):
+        return (self.now)
+
+    def time (self):
+        return (self.now)
+
+
+@pytest.fixture
+def clock (monkeypatch):
+    clock = Clock ()
+    monkeypatch.setattr (result_cache, 'time', types.SimpleNamespace (monotonic = clock.monotonic, time = clock.time))
+
+    return (clock)
+
+
+
+###
+### Serialisation section
+###
+
+@pytest.mark.parametrize ('value', [
+    {'nodes': [{'id': 1, 'labels': ['Target'], 'properties': {'uniprot_id': 'P1'}}], 'edges': []},
+    [{'smiles': 'c1ccccc1', 'hash': 'H1'}],
+    '<graphml>é</graphml>',
+    b'PAR1\x00\r\n\xff',
+    b'',
+    ''
+])
+def test_encode_decode_round_trip (value):
+    assert result_cache.decode (result_cache.encode (value)) == value
+
+
+def test_normalise_value ():
+    assert result_cache.normalise_value (['P2', 'P1', 'P2']) == ('P1', 'P2')
+    assert result_cache.normalise_value (['a', 1]) == result_cache.normalise_value ([1, 'a', 'a'])
+    assert result_cache.normalise_value ({'b': [2, 1], 'a': 'x'}) == (('a', 'x'), ('b', (1, 2)))
+    assert result_cache.normalise_value ([[2, 1], [1, 2]]) == ((1, 2),)
+
+
+def test_make_key_ignores_id_order ():
+    key_1 = result_cache.make_key ('ep', 'q', {'ids': ['a', 1], 'cutoff': 0.5}, 'json')
+    key_2 = result_cache.make_key ('ep', 'q', {'cutoff': 0.5, 'ids': [1, 'a']}, 'json')
+
+    assert key_1 == key_2
+    assert result_cache.make_key ('ep', 'q', {'ids': ['a']}, 'json') != key_1
+
+
+
+###
+### Memory backend section
+###
+
+def test_memory_backend_stores_decoded_values ():
+    cache = result_cache.ResultCache (result_cache.MemoryBackend (16), ttl = 60.0)
+    value = {'nodes': [], 'edges': [{'id': 1}]}
+
+    cache.put ('ep', ('k',), value)
+    hit, result = cache.get ('ep', ('k',))
+
+    assert hit
+    assert result is value
+    assert cache.metrics ()['bytes'] == len(result_cache.encode (value))
+
+
+def test_memory_backend_ttl (clock):
+    backend = result_cache.MemoryBackend (16)
+    backend.set ('k', b'value', 10.0)
+
+    clock.now += 9.0
+    assert backend.get ('k') == b'value'
+
+    clock.now += 2.0
+    assert backend.get ('k') is None
+    assert backend.info ()['expirations'] == 1
+    assert backend.info ()['bytes'] == 0
+
+
+def test_memory_backend_lru_by_entries ():
+    backend = result_cache.MemoryBackend (2)
+    backend.set ('a', b'1', 60.0)
+    backend.set ('b', b'2', 60.0)
+
+    # 'a' becomes the most recently used entry, 'b' is evicted
+    backend.get ('a')
+    backend.set ('c', b'3', 60.0)
+
+    assert backend.get ('a') == b'1'
+    assert backend.get ('b') is None
+    assert backend.get ('c') == b'3'
+    assert backend.info ()['evictions'] == 1
+
+
+def test_memory_backend_lru_by_bytes ():
+    backend = result_cache.MemoryBackend (100, max_bytes = 10)
+    backend.set ('a', b'1234', 60.0)
+    backend.set ('b', b'1234', 60.0)
+    backend.set ('c', b'1234', 60.0)
+
+    assert backend.get ('a') is None
+    assert backend.get ('b') == b'1234'
+    assert backend.info ()['bytes'] == 8
+
+    # Replacing an entry releases its previous size, a result larger than the cache is not stored
+    backend.set ('b', b'12', 60.0)
+    assert backend.info ()['bytes'] == 6
+
+    backend.set ('d', b'x' * 11, 60.0)
+    assert backend.get ('d') is None
+    assert backend.info ()['entries'] == 2
+
+
+
+###
+### SQLite backend section
+###
+
+def test_sqlite_backend_ttl (tmp_path, clock):
+    backend = result_cache.SQLiteBackend (str(tmp_path / 'cache.sqlite'), 16)
+    backend.set ('k', b'value', 10.0)
+
+    assert backend.get ('k') == b'value'
+
+    clock.now += 11.0
+    assert backend.get ('k') is None
+    assert backend.info ()['expirations'] == 1
+    assert backend.info ()['entries'] == 0
+
+
+def test_sqlite_backend_trim (tmp_path, clock, monkeypatch):
+    monkeypatch.setattr (result_cache.SQLiteBackend, 'trim_interval', 4)
+    backend = result_cache.SQLiteBackend (str(tmp_path / 'cache.sqlite'), 2)
+
+    backend.set ('expired', b'0', 1.0)
+    clock.now += 2.0
+
+    backend.set ('a', b'1', 60.0)
+    clock.now += 1.0
+    backend.set ('b', b'2', 60.0)
+    clock.now += 1.0
+
+    # 'a' is accessed after 'b' was written, hence the least recently used entry left is 'b'
+    assert backend.get ('a') == b'1'
+    clock.now += 1.0
+
+    # The 4th write trims the table to its 2 most recently accessed entries
+    backend.set ('c', b'3', 60.0)
+
+    info = backend.info ()
+    assert info['entries'] == 2
+    assert info['expirations'] == 1
+    assert info['evictions'] == 1
+    assert backend.get ('a') == b'1'
+    assert backend.get ('b') is None
+    assert backend.get ('c') == b'3'
+
+
+def test_sqlite_backend_shared_between_threads (tmp_path):
+    backend = result_cache.SQLiteBackend (str(tmp_path / 'cache.sqlite'), 16)
+    backend.set ('k', b'value', 60.0)
+
+    results = []
+    thread = threading.Thread (target = lambda: results.append (backend.get ('k')))
+    thread.start ()
+    thread.join ()
+
+    assert results == [b'value']
+
+
+
+###
+### Redis backend section
+###
+
+class RESPHandler (socketserver.StreamRequestHandler):
+
+    def read_command (self):
+        line = self.rfile.readline()
+
+        if line == b'':
+            return (None)
+
+        assert line[:1] == b'*' and line.endswith (b'\r\n')
+
+        args = []
+
+        for i in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            assert header[:1] == b'$' and header.endswith (b'\r\n')
+
+            data = self.rfile.read (int(header[1:-2]) + 2)
+            assert data.endswith (b'\r\n')
+
+            args.append (data[:-2])
+
+        return (args)
+
+
+    def bulk (self, value):
+        if value is None:
+            return (b'$-1\r\n')
+
+        return (b'$%d\r\n%s\r\n' % (len(value), value))
+
+
+    def handle (self):
+        server = self.server
+        server.connections.append (self.request)
+
+        while True:
+            args = self.read_command ()
+
+            if args is None:
+                return
+
+            name = args[0].upper()
+            server.commands.append ([name] + args[1:])
+
+            with server.lock:
+                if name == b'AUTH':
+                    reply = b'+OK\r\n' if args[1] == server.password else b'-ERR invalid password\r\n'
+
+                elif name == b'SELECT':
+                    reply = b'+OK\r\n'
+
+                elif name == b'GET':
+                    entry = server.data.get (args[1])
+
+                    if entry is not None and entry[1] <= time.monotonic():
+                        del server.data[args[1]]
+                        entry = None
+
+                    reply = self.bulk (entry[0] if entry is not None else None)
+
+                elif name == b'SET':
+                    assert args[3].upper() == b'PX'
+                    server.data[args[1]] = (args[2], time.monotonic() + int(args[4]) / 1000.0)
+                    reply = b'+OK\r\n'
+
+                elif name == b'SCAN':
+                    # A single-step scan: every matching key, then the end cursor
+                    pattern = args[3].decode ('utf-8')
+                    keys = [k for k in server.data.keys() if fnmatch.fnmatchcase (k.decode ('utf-8'), pattern)]
+                    reply = b'*2\r\n' + self.bulk (b'0') + b'*%d\r\n' % (len(keys)) + b''.join([self.bulk (k) for k in keys])
+
+                elif name == b'DEL':
+                    deleted = 0
+
+                    for key in args[1:]:
+                        deleted += server.data.pop (key, None) is not None
+
+                    reply = b':%d\r\n' % (deleted)
+
+                else:
+                    reply = b'-ERR unknown command\r\n'
+
+            self.wfile.write (reply)
+            self.wfile.flush ()
+
+
+
+@pytest.fixture
+def redis_server ():
+    server = socketserver.ThreadingTCPServer (('127.0.0.1', 0), RESPHandler)
+    server.daemon_threads = True
+    server.data = {}
+    server.commands = []
+    server.connections = []
+    server.password = b'secret'
+    server.lock = threading.Lock()
+
+    thread = threading.Thread (target = server.serve_forever, daemon = True)
+    thread.start ()
+
+    yield (server)
+
+    server.shutdown ()
+    server.server_close ()
+
+
+def redis_backend (server, **kwargs):
+    return (result_cache.RedisBackend ('127.0.0.1', server.server_address[1], **kwargs))
+
+
+def test_redis_encode_command ():
+    backend = result_cache.RedisBackend ()
+
+    assert backend.encode_command (('SET', 'k', b'a\r\nb', 'PX', 5)) == b'*5\r\n$3\r\nSET\r\n$1\r\nk\r\n$4\r\na\r\nb\r\n$2\r\nPX\r\n$1\r\n5\r\n'
+    assert backend.encode_command (('GET', 'é')) == b'*2\r\n$3\r\nGET\r\n$2\r\n\xc3\xa9\r\n'
+
+
+def test_redis_round_trip (redis_server):
+    backend = redis_backend (redis_server, db = 2, password = 'secret')
+
+    # Binary values with line breaks, and empty values, have to survive the bulk string framing
+    values = {'sg:a': b'j{"nodes":[]}', 'sg:b': b'b\x00\r\n\xff\r\n', 'sg:c': b''}
+
+    for key, value in values.items():
+        backend.set (key, value, 60.0)
+
+    for key, value in values.items():
+        assert backend.get (key) == value
+
+    assert backend.get ('sg:missing') is None
+    assert redis_server.commands[0] == [b'AUTH', b'secret']
+    assert redis_server.commands[1] == [b'SELECT', b'2']
+
+
+def test_redis_result_cache (redis_server):
+    cache = result_cache.ResultCache (redis_backend (redis_server), ttl = 60.0)
+    value = {'nodes': [{'id': 1}], 'edges': []}
+
+    assert cache.get ('ep', ('k',)) == (False, None)
+
+    cache.put ('ep', ('k',), value)
+    assert cache.get ('ep', ('k',)) == (True, value)
+
+    metrics = cache.metrics ()
+    assert metrics['hits'] == 1
+    assert metrics['misses'] == 1
+    assert metrics['backend_errors'] == 0
+
+
+def test_redis_ttl (redis_server):
+    backend = redis_backend (redis_server)
+    backend.set ('sg:k', b'value', 0.05)
+
+    assert redis_server.commands[-1] == [b'SET', b'sg:k', b'value', b'PX', b'50']
+    assert backend.get ('sg:k') == b'value'
+
+    time.sleep (0.1)
+    assert backend.get ('sg:k') is None
+
+
+def test_redis_clear_keeps_other_namespaces (redis_server):
+    backend = redis_backend (redis_server)
+    backend.set ('sg:a', b'1', 60.0)
+    backend.set ('sg:b', b'2', 60.0)
+    backend.set ('other:a', b'3', 60.0)
+
+    backend.clear ()
+
+    assert backend.get ('sg:a') is None
+    assert backend.get ('sg:b') is None
+    assert backend.get ('other:a') == b'3'
+
+
+def test_redis_error_reply (redis_server):
+    backend = redis_backend (redis_server, password = 'wrong')
+
+    with pytest.raises (Exception, match = 'invalid password'):
+        backend.get ('sg:k')
+
+
+def test_redis_reconnects (redis_server):
+    backend = redis_backend (redis_server)
+    backend.set ('sg:k', b'value', 60.0)
+
+    # A connection closed by the server fails the current command only
+    for connection in redis_server.connections:
+        connection.shutdown (socket.SHUT_RDWR)
+
+    with pytest.raises ((OSError, ConnectionError)):
+        backend.get ('sg:k')
+
+    assert backend.get ('sg:k') == b'value'
+
+
+def test_backend_errors_are_misses ():
+    cache = result_cache.ResultCache (result_cache.RedisBackend ('127.0.0.1', 1, timeout = 0.1), ttl = 60.0)
+
+    cache.put ('ep', ('k',), {'nodes': []})
+
+    assert cache.get ('ep', ('k',)) == (False, None)
+    assert cache.metrics ()['backend_errors'] == 2
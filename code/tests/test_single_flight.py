@@ -0,0 +1,178 @@
+# Tests of the request coalescing (see single_flight.py): concurrent calls with the same key share one execution, its
+# result or its exception.
+
+import asyncio
+import threading
+import time
+
+import single_flight
+
+
+N_CALLERS = 8
+
+
+def metrics_delta (before):
+    after = single_flight.get_metrics ()
+
+    return ({name: after[name] - before[name] for name in ['calls', 'executions', 'coalesced', 'errors']})
+
+
+async def concurrent_calls (key, fn, n = N_CALLERS):
+    # Starts n calls, lets all of them join the flight before the execution finishes
+    release = asyncio.Event ()
+
+    async def execute ():
+        await release.wait ()
+
+        return (await fn ())
+
+    tasks = [asyncio.ensure_future (single_flight.run_async ('test_endpoint', key, execute)) for i in range(n)]
+
+    for i in range(n):
+        await asyncio.sleep (0)
+
+    release.set ()
+
+    return (tasks, await asyncio.gather (*tasks, return_exceptions = True))
+
+
+
+###
+### asyncio section
+###
+
+def test_run_async_coalesces ():
+    before = single_flight.get_metrics ()
+    executions = []
+
+    async def fn ():
+        executions.append (None)
+        return ({'nodes': [], 'edges': []})
+
+    tasks, results = asyncio.run (concurrent_calls ('coalesces', fn))
+
+    assert len(executions) == 1
+    assert all ([result is results[0] for result in results])
+    assert metrics_delta (before) == {'calls': N_CALLERS, 'executions': 1, 'coalesced': N_CALLERS - 1, 'errors': 0}
+
+    after = single_flight.get_metrics ()
+    assert after['in_flight'] == 0
+    assert after['coalesced_per_endpoint']['test_endpoint'] - before['coalesced_per_endpoint'].get ('test_endpoint', 0) == N_CALLERS - 1
+
+
+def test_run_async_error_reaches_every_caller ():
+    before = single_flight.get_metrics ()
+
+    async def fn ():
+        raise ValueError ('failed')
+
+    tasks, results = asyncio.run (concurrent_calls ('error', fn))
+
+    assert all ([isinstance (result, ValueError) for result in results])
+    assert metrics_delta (before) == {'calls': N_CALLERS, 'executions': 1, 'coalesced': N_CALLERS - 1, 'errors': 1}
+
+
+def test_run_async_nothing_kept ():
+    executions = []
+
+    async def fn ():
+        executions.append (None)
+        return (len(executions))
+
+    async def calls ():
+        return ([await single_flight.run_async ('test_endpoint', 'sequential', fn) for i in range(3)])
+
+    assert asyncio.run (calls ()) == [1, 2, 3]
+
+
+def test_run_async_leader_cancelled ():
+    # The callers waiting on the execution get its result when the caller that started it is cancelled
+    executions = []
+
+    async def calls ():
+        release = asyncio.Event ()
+
+        async def fn ():
+            executions.append (None)
+            await release.wait ()
+            return ('result')
+
+        tasks = [asyncio.ensure_future (single_flight.run_async ('test_endpoint', 'cancelled', fn)) for i in range(3)]
+        await asyncio.sleep (0)
+
+        tasks[0].cancel ()
+        await asyncio.sleep (0)
+        release.set ()
+
+        return (await asyncio.gather (*tasks, return_exceptions = True))
+
+    results = asyncio.run (calls ())
+
+    assert isinstance (results[0], asyncio.CancelledError)
+    assert results[1:] == ['result', 'result']
+    assert len(executions) == 1
+
+
+
+###
+### Threads section
+###
+
+def run_threads (key, fn):
+    # Starts N_CALLERS threads, the execution finishes once every thread joined the flight
+    before = single_flight.get_metrics ()
+    release = threading.Event ()
+    results = [None] * N_CALLERS
+
+    def execute ():
+        release.wait (10)
+        return (fn ())
+
+    def call (i):
+        try:
+            results[i] = single_flight.run ('test_endpoint', key, execute)
+
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread (target = call, args = (i,)) for i in range(N_CALLERS)]
+
+    for thread in threads:
+        thread.start ()
+
+    deadline = time.monotonic () + 10
+
+    while metrics_delta (before)['calls'] < N_CALLERS and time.monotonic () < deadline:
+        time.sleep (0.001)
+
+    release.set ()
+
+    for thread in threads:
+        thread.join ()
+
+    return (results, metrics_delta (before))
+
+
+def test_run_coalesces ():
+    executions = []
+
+    def fn ():
+        executions.append (None)
+        return ([1, 2, 3])
+
+    results, delta = run_threads ('threads', fn)
+
+    assert len(executions) == 1
+    assert all ([result is results[0] for result in results])
+    assert delta == {'calls': N_CALLERS, 'executions': 1, 'coalesced': N_CALLERS - 1, 'errors': 0}
+
+
+def test_run_error_reaches_every_caller ():
+    def fn ():
+        raise ValueError ('failed')
+
+    results, delta = run_threads ('threads_error', fn)
+
+    assert all ([isinstance (result, ValueError) for result in results])
+    assert delta == {'calls': N_CALLERS, 'executions': 1, 'coalesced': N_CALLERS - 1, 'errors': 1}
+    assert single_flight.get_metrics ()['in_flight'] == 0
@@ -0,0 +1,253 @@
+# Tests of the local SMILES index (see smiles_index.py), exported from a stand-in Neo4j session, and of the SMILES
+# lookups of the graph snapshot (see graph_snapshot.smiles_compounds / smiles_patterns) used without the index.
+
+import contextlib
+import re
+import types
+
+import orjson
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+
+import cypher_queries as cq
+import graph_snapshot
+import neo4j_utils
+import smiles_index
+
+
+# Two compounds with the same non-stereo InChI-Key, the first by InChI-Key is its value
+COMPOUNDS = [
+    {'hash': 'BBBB-CCCC-N', 'nostereo_hash': 'BBBB', 'smiles': 'CO', 'uuid': 'c1'},
+    {'hash': 'AAAA-DDDD-N', 'nostereo_hash': 'AAAA', 'smiles': 'C[C@H](N)O', 'uuid': 'c2'},
+    {'hash': 'AAAA-CCCC-N', 'nostereo_hash': 'AAAA', 'smiles': 'C[C@@H](N)O', 'uuid': 'c3'}
+]
+
+PATTERNS = [
+    {'pattern_id': 'S2', 'hash': 'PPPP-QQQQ-N', 'smiles': 'c1ccccc1', 'pattern_type': 'scaffold', 'uuid': 'p2'},
+    {'pattern_id': 'S1', 'hash': 'RRRR-SSSS-N', 'smiles': 'C1CC1', 'pattern_type': 'scaffold', 'uuid': 'p1'}
+]
+
+
+def index_rows (name):
+    # The rows of the SMILES_INDEX_TABLES query of a table
+    if name == 'pattern_id':
+        rows = [{'key': p['pattern_id'], 'smiles': p['smiles'], 'inchikey': p['hash'], 'pattern_type': p['pattern_type'], 'pattern_id': p['pattern_id'], 'uuid': p['uuid']} for p in PATTERNS]
+
+        return (sorted (rows, key = lambda row: row['key']))
+
+    key = 'hash' if name == 'compound_hash' else 'nostereo_hash'
+    rows = [{'key': c[key], 'smiles': c['smiles'], 'inchikey': c['hash'], 'nsinchikey': c['nostereo_hash']} for c in COMPOUNDS]
+
+    return (sorted (rows, key = lambda row: (row['key'], row['inchikey'])))
+
+
+class IndexSession:
+
+    def __init__ (self):
+        self.exports = []
+
+    def run (self, query):
+        name = [name for name, table_query in cq.SMILES_INDEX_TABLES.items() if table_query == query][0]
+        self.exports.append (name)
+
+        return (index_rows (name))
+
+    def execute_read (self, work):
+        return (work (self))
+
+
+
+@pytest.fixture
+def index_session (monkeypatch):
+    session = IndexSession ()
+
+    @contextlib.contextmanager
+    def neo4j_session ():
+        yield (session)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_session', neo4j_session)
+
+    yield (session)
+
+    smiles_index.close ()
+
+
+@pytest.fixture
+def index (index_session, tmp_path):
+    assert smiles_index.load ({'dir': str (tmp_path), 'refresh': False})
+
+    return (index_session)
+
+
+
+###
+### Index files section
+###
+
+def test_write_table (tmp_path):
+    path = str (tmp_path / 't.idx')
+
+    # Repeated keys keep their first value
+    assert smiles_index.write_table (path, [('a', 1), ('b', {'x': 'y'}), ('b', 3), ('é', [1])]) == 3
+
+    table = smiles_index.Table (path)
+
+    assert len(table) == 3
+    assert [table.get (key) for key in ['a', 'b', 'é', 'c', '', 'zz']] == [1, {'x': 'y'}, [1], None, None, None]
+
+    table.close ()
+
+
+def test_write_table_empty (tmp_path):
+    path = str (tmp_path / 't.idx')
+    smiles_index.write_table (path, [])
+    table = smiles_index.Table (path)
+
+    assert len(table) == 0
+    assert table.get ('a') is None
+
+    table.close ()
+
+
+def test_write_table_unordered (tmp_path):
+    with pytest.raises (Exception, match = 'ascending key order'):
+        smiles_index.write_table (str (tmp_path / 't.idx'), [('b', 1), ('a', 2)])
+
+
+def test_not_an_index_file (tmp_path):
+    path = tmp_path / 't.idx'
+    path.write_bytes (b'x' * 64)
+
+    with pytest.raises (Exception, match = 'Not a SMILES index file'):
+        smiles_index.Table (str (path))
+
+
+
+###
+### Index section
+###
+
+def test_load (index, tmp_path):
+    assert sorted (index.exports) == sorted (cq.SMILES_INDEX_TABLES.keys())
+    assert smiles_index.is_enabled ()
+
+    # The files exist, they are opened without exporting them again
+    assert smiles_index.load ({'dir': str (tmp_path), 'refresh': False})
+    assert len(index.exports) == 3
+
+    assert smiles_index.load ({'dir': str (tmp_path), 'refresh': True})
+    assert len(index.exports) == 6
+
+    assert smiles_index.load ({'dir': '', 'refresh': False}) is False
+
+
+def test_smiles_compounds (index):
+    before = smiles_index.get_metrics ()
+    values = smiles_index.smiles_compounds (['AAAA-DDDD-N', 'XXXX-YYYY-N', 'BBBB-CCCC-N'])
+
+    assert values == [{'smiles': 'C[C@H](N)O', 'inchikey': 'AAAA-DDDD-N', 'nsinchikey': 'AAAA'}, None, {'smiles': 'CO', 'inchikey': 'BBBB-CCCC-N', 'nsinchikey': 'BBBB'}]
+
+    # Non-stereo keys: the first compound by InChI-Key
+    values = smiles_index.smiles_compounds (['AAAA', 'AAAA-DDDD-N', 'XXXX'], stereo = False)
+
+    assert values == [{'smiles': 'C[C@@H](N)O', 'inchikey': 'AAAA-CCCC-N', 'nsinchikey': 'AAAA'}, None, None]
+
+    metrics = smiles_index.get_metrics ()
+
+    assert (metrics['lookups'] - before['lookups'], metrics['hits'] - before['hits']) == (6, 3)
+    assert metrics['entries'] == {'compound_hash': 3, 'compound_nostereo_hash': 2, 'pattern_id': 2}
+
+
+def test_smiles_patterns (index):
+    values = smiles_index.smiles_patterns (['S1', 'S9', 'S2'])
+
+    assert [v['pattern_id'] if v is not None else None for v in values] == ['S1', None, 'S2']
+    assert values[0] == {'smiles': 'C1CC1', 'inchikey': 'RRRR-SSSS-N', 'pattern_type': 'scaffold', 'pattern_id': 'S1', 'uuid': 'p1'}
+
+
+def test_smiles_endpoints (index, client):
+    response = client.get ('/api/smiles_compound/AAAA-DDDD-N', params = {'stereo': 'false'})
+
+    assert response.json () == {'compound': {'smiles': 'C[C@@H](N)O', 'inchikey': 'AAAA-CCCC-N', 'nsinchikey': 'AAAA', 'stereo': False}}
+
+    response = client.post ('/api/smiles_pattern', json = {'ids': ['S9', 'S2']})
+    lines = [orjson.loads (line) for line in response.content.splitlines ()]
+
+    assert [line['id'] for line in lines] == ['S9', 'S2']
+    assert lines[0]['result'] is None
+    assert lines[1]['result']['pattern']['smiles'] == 'c1ccccc1'
+
+
+
+###
+### Graph snapshot section
+###
+
+class SnapshotDatabase:
+
+    # The compounds and patterns, without relationships
+
+    def __init__ (self):
+        hydrator = _GraphHydrator ()
+        self.nodes = []
+
+        for i, properties in enumerate (COMPOUNDS):
+            self.nodes.append (hydrator.hydrate_node (i, ['Compound'], properties, '4:x:%d' % (i)))
+
+        for i, properties in enumerate (PATTERNS, len(COMPOUNDS)):
+            self.nodes.append (hydrator.hydrate_node (i, ['Pattern'], properties, '4:x:%d' % (i)))
+
+
+    def run (self, query, parameters = None):
+        m = re.match (r'MATCH \(n:(\w+)\) RETURN count', query)
+
+        if m:
+            return (types.SimpleNamespace (single = lambda: {'count': sum ([m.group (1) in n.labels for n in self.nodes])}))
+
+        if re.match (r'MATCH \(\)-\[r:(\w+)\]->\(\) RETURN count', query):
+            return (types.SimpleNamespace (single = lambda: {'count': 0}))
+
+        m = re.match (r'MATCH \(n:(\w+)\) RETURN n', query)
+
+        if m:
+            return ([{'n': n} for n in self.nodes if m.group (1) in n.labels])
+
+        return ([])
+
+
+    def execute_read (self, work):
+        return (work (self))
+
+
+
+@pytest.fixture
+def snapshot (monkeypatch):
+    database = SnapshotDatabase ()
+
+    @contextlib.contextmanager
+    def neo4j_session ():
+        yield (database)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_session', neo4j_session)
+    monkeypatch.setattr (graph_snapshot, '_snapshot', graph_snapshot.fetch_snapshot ())
+
+
+def test_snapshot_smiles_compounds (snapshot):
+    # The same values as the index
+    assert graph_snapshot.smiles_compounds (['AAAA-DDDD-N', 'XXXX-YYYY-N']) == [{'smiles': 'C[C@H](N)O', 'inchikey': 'AAAA-DDDD-N', 'nsinchikey': 'AAAA'}, None]
+    assert graph_snapshot.smiles_compounds (['AAAA', 'XXXX'], stereo = False) == [{'smiles': 'C[C@@H](N)O', 'inchikey': 'AAAA-CCCC-N', 'nsinchikey': 'AAAA'}, None]
+
+
+def test_snapshot_smiles_patterns (snapshot):
+    values = graph_snapshot.smiles_patterns (['S1', 'S9'])
+
+    assert values == [{'smiles': 'C1CC1', 'inchikey': 'RRRR-SSSS-N', 'pattern_type': 'scaffold', 'pattern_id': 'S1', 'uuid': 'p1'}, None]
+
+
+def test_snapshot_smiles_endpoints (snapshot, client):
+    response = client.post ('/api/smiles_compound', params = {'stereo': 'false'}, json = {'ids': ['BBBB-XXXX-N', 'ZZZZ']})
+    lines = [orjson.loads (line) for line in response.content.splitlines ()]
+
+    assert lines[0]['result']['compound']['inchikey'] == 'BBBB-CCCC-N'
+    assert lines[1]['result'] is None
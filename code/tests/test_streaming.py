@@ -0,0 +1,137 @@
+# Tests of the streamed JSON responses (see the streaming section of smartgraph_async.py), read from a stand-in Neo4j
+# session: the streamed document is the graph of the non-streamed response, with the nodes and edges repeated across
+# records sent once.
+
+import asyncio
+import contextlib
+
+import orjson
+import pytest
+
+from neo4j._codec.hydration.v1.hydration_handler import _GraphHydrator
+from neo4j.graph import Path
+
+import graph_snapshot
+import neo4j_utils
+import smartgraph_async as sga
+
+
+class Result:
+
+    def __init__ (self, records, graph):
+        self.records = records
+        self.graph_ = graph
+
+    def __aiter__ (self):
+        return (self.iterate ())
+
+    async def iterate (self):
+        for record in self.records:
+            yield (record)
+
+    async def graph (self):
+        return (self.graph_)
+
+
+
+class Session:
+
+    # Answers every query with paths from compounds C0, C1 through targets T0 - T3, sharing nodes and relationships
+
+    def __init__ (self):
+        hydrator = _GraphHydrator ()
+        nodes = {}
+        ids = {}
+
+        for i in range(4):
+            nodes['T%d' % (i)] = hydrator.hydrate_node (i, ['Target'], {'uniprot_id': 'T%d' % (i), 'uuid': 't%d' % (i), 'fullname': 'Target <%d> & "x"' % (i)}, '4:x:%d' % (i))
+            ids['T%d' % (i)] = i
+
+        for i in range(2):
+            inchikey = 'C%d-A-N' % (i)
+            nodes['C%d' % (i)] = hydrator.hydrate_node (10 + i, ['Compound'], {'hash': inchikey, 'nostereo_hash': 'C%d' % (i), 'uuid': 'c%d' % (i)}, '4:x:%d' % (10 + i))
+            ids['C%d' % (i)] = 10 + i
+
+        relationships = {}
+
+        for k, (start, end) in enumerate ([('C0', 'T0'), ('C1', 'T0'), ('T0', 'T1'), ('T1', 'T2'), ('T0', 'T3'), ('T3', 'T2')], 20):
+            rel_type = 'TESTED_ON' if start.startswith ('C') else 'REGULATES'
+            properties = {'uuid': 'r%d' % (k), 'unique_label' if rel_type == 'TESTED_ON' else 'ppi_uid': 'l%d' % (k)}
+            relationships[(start, end)] = hydrator.hydrate_relationship (k, ids[start], ids[end], rel_type, properties, '5:x:%d' % (k), '4:x:%d' % (ids[start]), '4:x:%d' % (ids[end]))
+
+        def path (*names):
+            return (Path (nodes[names[0]], *[relationships[(names[i], names[i + 1])] for i in range(len(names) - 1)]))
+
+        self.records = [
+            {'p': path ('C0', 'T0', 'T1', 'T2')},
+            {'p': path ('C0', 'T0', 'T3', 'T2')},
+            {'p': path ('C1', 'T0', 'T1', 'T2')},
+            {'p': path ('C1', 'T0', 'T3')}
+        ]
+        self.graph = hydrator.graph
+
+
+    async def run (self, query, parameters = None):
+        return (Result (self.records, self.graph))
+
+
+    async def execute_read (self, work):
+        return (await work (self))
+
+
+
+@pytest.fixture
+def session (monkeypatch):
+    session = Session ()
+
+    @contextlib.asynccontextmanager
+    async def neo4j_async_session ():
+        yield (session)
+
+    monkeypatch.setattr (neo4j_utils, 'neo4j_async_session', neo4j_async_session)
+    monkeypatch.setattr (graph_snapshot, '_snapshot', None)
+
+    return (session)
+
+
+def sorted_graph (G_json):
+    return ((sorted (G_json['nodes'], key = lambda n: n['node_id']), sorted (G_json['edges'], key = lambda e: e['uuid'])))
+
+
+async def read_chunks (chunks):
+    return ([chunk async for chunk in chunks])
+
+
+@pytest.mark.parametrize ('chunk_size, spool_size', [(sga.STREAM_CHUNK_SIZE, sga.STREAM_SPOOL_SIZE), (16, 64)])
+def test_stream_graph_query (session, monkeypatch, chunk_size, spool_size):
+    # Small chunks and spool: many chunks, the edges spilled to disk
+    monkeypatch.setattr (sga, 'STREAM_CHUNK_SIZE', chunk_size)
+    monkeypatch.setattr (sga, 'STREAM_SPOOL_SIZE', spool_size)
+
+    chunks = asyncio.run (read_chunks (sga.stream_graph_query ('MATCH p=() RETURN p')))
+    streamed = orjson.loads (b''.join (chunks))
+
+    if chunk_size == 16:
+        assert len(chunks) > 10
+
+    # Every node and edge once
+    assert len(streamed['nodes']) == 6
+    assert len(streamed['edges']) == 6
+    assert sorted_graph (streamed) == sorted_graph (asyncio.run (sga.run_graph_query ('MATCH p=() RETURN p')))
+
+
+def test_streamed_response (session, client):
+    streamed = client.get ('/api/subgraph_compound_induced/C0-A-N,C1-A-N', params = {'stream': 'true'})
+    response = client.get ('/api/subgraph_compound_induced/C0-A-N,C1-A-N', params = {'stream': 'false'})
+
+    assert streamed.status_code == 200
+    assert streamed.headers['content-type'] == 'application/json'
+    assert sorted_graph (orjson.loads (streamed.content)) == sorted_graph (response.json ())
+
+
+def test_streamed_graphml_response (session, client):
+    streamed = client.get ('/api/subgraph_target_induced/T0', params = {'stream': 'true', 'format': 'graphml'})
+    response = client.get ('/api/subgraph_target_induced/T0', params = {'format': 'graphml'})
+
+    assert streamed.status_code == 200
+    assert streamed.text == response.text